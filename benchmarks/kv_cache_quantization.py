@@ -0,0 +1,169 @@
+import argparse
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import jax
+import numpy as np
+from flax import nnx as nn
+from jax import numpy as jnp
+
+import easydel as ed
+from easydel.layers._decode_attention import decode_attention
+from easydel.layers.caching.transformer_cache import dequantize_kv, quantize_kv
+
+METHODS = {
+	"float": ed.EasyDeLQuantizationMethods.NONE,
+	"int8": ed.EasyDeLQuantizationMethods.A8Q,
+}
+
+
+def build_model(args, method):
+	config = ed.LlamaConfig(
+		vocab_size=args.vocab_size,
+		hidden_size=args.hidden_size,
+		intermediate_size=2 * args.hidden_size,
+		num_hidden_layers=args.num_layers,
+		num_attention_heads=args.num_heads,
+		num_key_value_heads=args.num_kv_heads,
+		max_position_embeddings=args.max_length,
+		attn_mechanism=ed.AttentionMechanisms.VANILLA,
+		kv_cache_quantization_method=method,
+	)
+	return ed.LlamaForCausalLM(
+		config=config,
+		dtype=jnp.float32,
+		param_dtype=jnp.float32,
+		rngs=nn.Rngs(0),
+	)
+
+
+def cache_nbytes(cache):
+	return sum(
+		leaf.nbytes
+		for view in cache.views
+		for leaf in jax.tree_util.tree_leaves(
+			(view.key, view.value, view.key_scale, view.value_scale)
+		)
+	)
+
+
+def run(args, method):
+	model = build_model(args, method)
+	graphdef, graphstate = nn.split(model)
+
+	@jax.jit
+	def step(graphstate, input_ids, model_kwargs):
+		model = nn.merge(graphdef, graphstate)
+		outputs = model(input_ids=input_ids, **model_kwargs)
+		return outputs.logits[:, -1], model.update_inputs_for_generation(
+			outputs, model_kwargs
+		)
+
+	input_ids = jnp.asarray(
+		np.random.RandomState(0).randint(
+			0, args.vocab_size, (args.batch_size, args.context)
+		)
+	)
+	model_kwargs = model.prepare_inputs_for_generation(
+		input_ids, max_length=args.max_length
+	)
+	logits, model_kwargs = step(graphstate, input_ids, model_kwargs)
+	next_tokens = jnp.argmax(logits, axis=-1)[:, None]
+
+	all_logits = []
+	jax.block_until_ready(step(graphstate, next_tokens, model_kwargs))
+	start = time.perf_counter()
+	for _ in range(args.steps):
+		logits, model_kwargs = step(graphstate, next_tokens, model_kwargs)
+		# teacher-forced tokens keep every method on the same sequence.
+		next_tokens = (next_tokens + 1) % args.vocab_size
+		all_logits.append(logits)
+	jax.block_until_ready(logits)
+	step_ms = (time.perf_counter() - start) / args.steps * 1e3
+	return cache_nbytes(model_kwargs["past_key_values"]), step_ms, jnp.stack(all_logits)
+
+
+def round_trip_step(cache, scale, token, index, query):
+	"""One layer's decode step as it ran before: dequantize, write, requantize it all."""
+	cache = dequantize_kv(cache, scale, jnp.float32)
+	cache = cache.at[:, index].set(token)
+	mask = jnp.arange(cache.shape[1]) <= index
+	scores = jnp.einsum("bhd,bmhd->bhm", query, cache)
+	weights = jax.nn.softmax(jnp.where(mask, scores, -jnp.inf), axis=-1)
+	cache, scale = quantize_kv(cache)
+	return jnp.einsum(
+		"bhm,bmhd->bhd", weights, dequantize_kv(cache, scale, jnp.float32)
+	), (
+		cache,
+		scale,
+	)
+
+
+def in_place_step(cache, scale, token, index, query):
+	"""One layer's decode step now: quantize the token, write it, attend blockwise."""
+	token, token_scale = quantize_kv(token)
+	cache = cache.at[:, index].set(token)
+	scale = scale.at[:, index].set(token_scale)
+	mask = jnp.broadcast_to(jnp.arange(cache.shape[1]) <= index, cache.shape[:2])
+	outputs = decode_attention(
+		query[:, None],
+		cache,
+		cache,
+		mask,
+		key_scale=scale,
+		value_scale=scale,
+	)
+	return outputs[:, 0], (cache, scale)
+
+
+def run_layer(args):
+	rng = np.random.RandomState(0)
+	head_dim = args.hidden_size // args.num_heads
+	shape = (args.batch_size, args.max_length, args.num_kv_heads, head_dim)
+	cache, scale = quantize_kv(jnp.asarray(rng.randn(*shape), jnp.float32))
+	token = jnp.asarray(rng.randn(args.batch_size, args.num_kv_heads, head_dim))
+	query = jnp.asarray(rng.randn(args.batch_size, args.num_kv_heads, head_dim))
+	print(f"{'layer step':>11} {'ms/step':>9}")
+	for name, fn in (("round trip", round_trip_step), ("in place", in_place_step)):
+		fn = jax.jit(fn)
+		jax.block_until_ready(fn(cache, scale, token, args.context, query))
+		start = time.perf_counter()
+		for _ in range(args.steps):
+			outputs = fn(cache, scale, token, args.context, query)
+		jax.block_until_ready(outputs)
+		step_ms = (time.perf_counter() - start) / args.steps * 1e3
+		print(f"{name:>11} {step_ms:>9.2f}")
+
+
+def main():
+	parser = argparse.ArgumentParser(
+		description="Float vs int8 KV cache decoding, and in-place vs round-trip writes."
+	)
+	parser.add_argument("--batch-size", type=int, default=4)
+	parser.add_argument("--max-length", type=int, default=4096)
+	parser.add_argument("--context", type=int, default=512)
+	parser.add_argument("--steps", type=int, default=32)
+	parser.add_argument("--hidden-size", type=int, default=512)
+	parser.add_argument("--num-layers", type=int, default=4)
+	parser.add_argument("--num-heads", type=int, default=8)
+	parser.add_argument("--num-kv-heads", type=int, default=8)
+	parser.add_argument("--vocab-size", type=int, default=1024)
+	parser.add_argument("--methods", nargs="+", default=list(METHODS))
+	args = parser.parse_args()
+
+	print(f"{'cache':>6} {'MiB':>9} {'ms/step':>9} {'max |dlogit|':>13}")
+	reference = None
+	for name in args.methods:
+		nbytes, step_ms, logits = run(args, METHODS[name])
+		if reference is None:
+			reference = logits
+		error = float(jnp.abs(logits - reference).max())
+		print(f"{name:>6} {nbytes / 2**20:>9.1f} {step_ms:>9.2f} {error:>13.2e}")
+	print()
+	run_layer(args)
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,115 @@
+import argparse
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import jax
+from jax import lax
+from jax import numpy as jnp
+
+from easydel.inference.logits_process import (
+	FlaxTopKLogitsWarper,
+	FlaxTopPLogitsWarper,
+)
+
+TOP_P = 0.9
+TOP_K = 50
+
+
+def sorted_top_p(scores):
+	"""The sort-based nucleus filter `FlaxTopPLogitsWarper` used to run."""
+	topk_scores, topk_indices = lax.top_k(scores, scores.shape[-1])
+	cumulative_probs = jax.nn.softmax(topk_scores, axis=-1).cumsum(axis=-1)
+	score_mask = jnp.roll(cumulative_probs < TOP_P, 1)
+	score_mask = score_mask.at[:, 0].set(True)
+	topk_scores = jnp.where(score_mask, topk_scores, -jnp.inf)
+	return lax.sort_key_val(topk_indices, topk_scores)[-1]
+
+
+def scattered_top_k(scores):
+	"""The top-k filter `FlaxTopKLogitsWarper` used to run (top-k, then scatter)."""
+	batch_size, vocab_size = scores.shape
+	topk_scores, topk_indices = lax.top_k(scores, TOP_K)
+	shift = jnp.broadcast_to(
+		(jnp.arange(batch_size) * vocab_size)[:, None], (batch_size, TOP_K)
+	).flatten()
+	next_scores = jnp.full(batch_size * vocab_size, -jnp.inf)
+	next_scores = next_scores.at[topk_indices.flatten() + shift].set(
+		topk_scores.flatten()
+	)
+	return next_scores.reshape(batch_size, vocab_size)
+
+
+def sorted_per_row_top_k(scores):
+	"""Per-row top-k through a full sort of the vocabulary."""
+	top_k = jnp.full((scores.shape[0], 1), TOP_K)
+	sorted_scores = lax.top_k(scores, scores.shape[-1])[0]
+	kth_scores = jnp.take_along_axis(sorted_scores, top_k - 1, axis=-1)
+	return jnp.where(scores < kth_scores, -jnp.inf, scores)
+
+
+PROVIDERS = {
+	"top_p": (
+		sorted_top_p,
+		lambda scores: FlaxTopPLogitsWarper(TOP_P)(None, scores, 0),
+	),
+	"top_k": (
+		scattered_top_k,
+		lambda scores: FlaxTopKLogitsWarper(TOP_K)(None, scores, 0),
+	),
+	"per_row_top_k": (
+		sorted_per_row_top_k,
+		lambda scores: FlaxTopKLogitsWarper(jnp.full((scores.shape[0],), TOP_K))(
+			None, scores, 0
+		),
+	),
+}
+
+
+def timeit(fn, scores, iters):
+	jax.block_until_ready(fn(scores))
+	start = time.perf_counter()
+	for _ in range(iters):
+		jax.block_until_ready(fn(scores))
+	return (time.perf_counter() - start) / iters * 1e3
+
+
+def main():
+	parser = argparse.ArgumentParser(
+		description="Sort-based vs sort-free sampling warpers."
+	)
+	parser.add_argument(
+		"--vocab-sizes", type=int, nargs="+", default=[32000, 128256, 256000]
+	)
+	parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8, 64])
+	parser.add_argument("--iters", type=int, default=10)
+	args = parser.parse_args()
+
+	print(
+		f"{'warper':>14} {'vocab':>7} {'batch':>5} {'sort ms':>10} "
+		f"{'sort-free ms':>12} {'speedup':>8} {'max TV':>8}"
+	)
+	for name, (reference_fn, sort_free_fn) in PROVIDERS.items():
+		reference_fn, sort_free_fn = jax.jit(reference_fn), jax.jit(sort_free_fn)
+		for vocab_size in args.vocab_sizes:
+			for batch_size in args.batch_sizes:
+				scores = 3 * jax.random.normal(
+					jax.random.PRNGKey(vocab_size + batch_size),
+					(batch_size, vocab_size),
+				)
+				# total variation distance between the sampling distributions.
+				distance = 0.5 * jnp.abs(
+					jax.nn.softmax(reference_fn(scores)) - jax.nn.softmax(sort_free_fn(scores))
+				).sum(-1)
+				reference_ms = timeit(reference_fn, scores, args.iters)
+				sort_free_ms = timeit(sort_free_fn, scores, args.iters)
+				print(
+					f"{name:>14} {vocab_size:>7} {batch_size:>5} {reference_ms:>10.2f} "
+					f"{sort_free_ms:>12.2f} {reference_ms / sort_free_ms:>7.1f}x "
+					f"{float(distance.max()):>8.1e}"
+				)
+
+
+if __name__ == "__main__":
+	main()
@@ -90,9 +90,14 @@ from . import escale
 # fmt: on
 from .escale import PartitionAxis
 from .inference.vinference import (
+	IncrementalDetokenizer,
+	RadixPrefixCache,
+	SamplingParams,
 	vInference,
 	vInferenceApiServer,
 	vInferenceConfig,
+	vInferenceRequest,
+	vInferenceScheduler,
 )
 from .inference.whisper_inference import (
 	vWhisperInference,
@@ -347,21 +352,26 @@ from .modules.xerxes2 import (
 
 from .trainers import (
 	BaseTrainer,
+	DevicePrefetchLoader,
 	DPOConfig,
 	DPOTrainer,
 	JaxDistributedConfig,
+	NumpyDataLoader,
 	ORPOConfig,
 	ORPOTrainer,
 	SFTConfig,
 	SFTTrainer,
 	Trainer,
 	TrainingArguments,
+	pack_examples,
 	pack_sequences,
 )
 from .utils import traversals
 from .utils.parameters_transformation import (
+	convert_safetensors_checkpoint,
 	module_to_huggingface_model,
 	module_to_torch,
+	safetensors_to_easydel_params,
 	torch_dict_to_easydel_params,
 )
 
@@ -39,6 +39,9 @@ LOG_SHARDING_MOVE = os.environ.get("LOG_SHARDING_MOVE", "false") in [
 	"1",
 	"on",
 ]
+# parameters of layers run with `jax.lax.scan` live under this path element and carry a
+# leading (unsharded) layer axis in front of the shape the partition rules describe.
+STACKED_LAYERS_KEY = "stacked"
 
 
 def make_shard_and_gather_fns(
@@ -222,6 +225,8 @@ def match_partition_rules(
 							stacklevel=1,
 						)
 					return PartitionSpec()
+				if re.search(rf"(^|/){STACKED_LAYERS_KEY}(/|$)", name) is not None:
+					ps = PartitionSpec(None, *ps)
 				if len(ps) > leaf.ndim:
 					ps = PartitionSpec(*tuple(ps[: leaf.ndim]))
 					if LOG_SHARDING_MOVE:
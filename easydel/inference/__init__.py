@@ -12,13 +12,27 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from .vinference import vInference, vInferenceApiServer, vInferenceConfig
+from .vinference import (
+	IncrementalDetokenizer,
+	RadixPrefixCache,
+	SamplingParams,
+	vInference,
+	vInferenceApiServer,
+	vInferenceConfig,
+	vInferenceRequest,
+	vInferenceScheduler,
+)
 from .whisper_inference import vWhisperInference, vWhisperInferenceConfig
 
 __all__ = [
+	"SamplingParams",
 	"vInference",
 	"vInferenceConfig",
 	"vInferenceApiServer",
+	"vInferenceRequest",
+	"vInferenceScheduler",
+	"RadixPrefixCache",
+	"IncrementalDetokenizer",
 	"vWhisperInference",
 	"vWhisperInferenceConfig",
 ]
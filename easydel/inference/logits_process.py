@@ -14,10 +14,12 @@
 
 
 import inspect
+import typing as tp
 
 import jax
 import jax.lax as lax
 import jax.numpy as jnp
+import numpy as np
 from jax.experimental import sparse
 
 from easydel.utils.compiling_utils import get_safe_hash_int, hash_fn
@@ -35,6 +37,103 @@ def add_start_docstrings(*docstr):
 logger = get_logger(__name__)
 
 
+def _is_per_row(value) -> bool:
+	"""Whether a processor argument holds one value per row instead of a shared one."""
+	return isinstance(value, (jax.Array, np.ndarray)) and value.ndim > 0
+
+
+def _per_row(value, dtype):
+	"""Broadcasts a shared or per-row `(batch_size,)` value against `(batch_size, vocab_size)` scores."""
+	if _is_per_row(value):
+		return jnp.asarray(value, dtype=dtype).reshape(-1, 1)
+	return value
+
+
+def _sortable_bits(x: jnp.ndarray) -> jnp.ndarray:
+	"""Maps float32 values to int32 keys that compare in the same order."""
+	bits = lax.bitcast_convert_type(x.astype(jnp.float32), jnp.int32)
+	return jnp.where(bits < 0, bits ^ jnp.int32(0x7FFFFFFF), bits)
+
+
+def _top_k_mask(scores: jnp.ndarray, top_k) -> jnp.ndarray:
+	"""
+	Marks the scores that are at least the `top_k`-th largest score of their row.
+
+	A static `top_k` takes the threshold from a partial `lax.top_k`. A per-row
+	`(batch_size, 1)` `top_k` bisects the threshold over the int32 keys of the
+	scores, counting the scores above it; 32 steps resolve every float32 exactly.
+	"""
+	if not _is_per_row(top_k):
+		kth_scores = jnp.min(lax.top_k(scores, top_k)[0], axis=-1, keepdims=True)
+		return scores >= kth_scores
+	keys = _sortable_bits(scores)
+
+	def _bisect(_, bounds):
+		# invariant: at least `top_k` keys are >= lo, fewer than `top_k` are >= hi.
+		lo, hi = bounds
+		mid = (lo >> 1) + (hi >> 1) + (lo & hi & 1)
+		enough = jnp.sum(keys >= mid, axis=-1, keepdims=True) >= top_k
+		return jnp.where(enough, mid, lo), jnp.where(enough, hi, mid)
+
+	lo, _ = lax.fori_loop(
+		0,
+		32,
+		_bisect,
+		(
+			jnp.min(keys, axis=-1, keepdims=True),
+			jnp.max(keys, axis=-1, keepdims=True) + 1,
+		),
+	)
+	return keys >= lo
+
+
+def _top_p_mask(probs: jnp.ndarray, top_p) -> jnp.ndarray:
+	"""
+	Marks the nucleus of every row: tokens whose strictly more probable tokens hold
+	less than `top_p` of the mass.
+
+	Instead of sorting and accumulating the probabilities, the smallest kept
+	probability is bisected over its (non-negative, hence ordered) float32 bits,
+	each step summing the mass above the candidate; 31 steps are exact.
+	"""
+	keys = lax.bitcast_convert_type(probs, jnp.int32)
+
+	def _bisect(_, bounds):
+		# invariant: the mass above lo is >= top_p, the mass above hi is < top_p.
+		lo, hi = bounds
+		mid = lo + (hi - lo) // 2
+		mass = jnp.sum(jnp.where(keys > mid, probs, 0), axis=-1, keepdims=True)
+		below = mass < top_p
+		return jnp.where(below, lo, mid), jnp.where(below, mid, hi)
+
+	_, hi = lax.fori_loop(
+		0,
+		31,
+		_bisect,
+		(
+			jnp.full((probs.shape[0], 1), -1, dtype=jnp.int32),
+			jnp.max(keys, axis=-1, keepdims=True),
+		),
+	)
+	return keys >= hi
+
+
+def _seen_tokens_mask(input_ids: jnp.ndarray, vocab_size: int, cur_len) -> jnp.ndarray:
+	"""
+	Marks, per row, the vocabulary entries that occur in `input_ids[:, :cur_len]`.
+
+	`cur_len` is either shared by every row or given per row as a `(batch_size,)` array.
+	"""
+	batch_size, seq_len = input_ids.shape
+	valid = jnp.arange(seq_len)[None, :] < jnp.reshape(cur_len, (-1, 1))
+	rows = jnp.broadcast_to(jnp.arange(batch_size)[:, None], input_ids.shape)
+	return (
+		jnp.zeros((batch_size, vocab_size), dtype=jnp.bool_)
+		.at[rows, input_ids]
+		.max(jnp.broadcast_to(valid, input_ids.shape), mode="drop")
+	)
+
+
 LOGITS_PROCESSOR_INPUTS_DOCSTRING = r"""
     Args:
         input_ids (`jnp.ndarray` of shape `(batch_size, sequence_length)`):
@@ -122,12 +221,14 @@ class FlaxTemperatureLogitsWarper(FlaxLogitsWarper):
 	[`FlaxLogitsWarper`] for temperature (exponential scaling output probability distribution).
 
 	Args:
-	    temperature (`float`):
-	        The value used to module the logits distribution.
+	    temperature (`float` or `jax.Array` of shape `(batch_size,)`):
+	        The value used to module the logits distribution, shared or per row.
 	"""
 
-	def __init__(self, temperature: float):
-		if not isinstance(temperature, float) or not (temperature > 0):
+	def __init__(self, temperature: tp.Union[float, jax.Array]):
+		if not _is_per_row(temperature) and (
+			not isinstance(temperature, float) or not (temperature > 0)
+		):
 			raise ValueError(
 				f"`temperature` has to be a strictly positive float, but is {temperature}"
 			)
@@ -137,7 +238,7 @@ class FlaxTemperatureLogitsWarper(FlaxLogitsWarper):
 	def __call__(
 		self, input_ids: jnp.ndarray, scores: jnp.ndarray, cur_len: int
 	) -> jnp.ndarray:
-		scores = scores / self.temperature
+		scores = scores / _per_row(self.temperature, scores.dtype)
 		return scores
 
 
@@ -145,10 +246,14 @@ class FlaxTopPLogitsWarper(FlaxLogitsWarper):
 	"""
 	[`FlaxLogitsWarper`] that performs top-p, i.e. restricting to top tokens summing to prob_cut_off <= prob_cut_off.
 
+	The nucleus is found without sorting the vocabulary: a token is kept when the probability mass of the
+	strictly more probable tokens is below `top_p`, and the smallest kept probability is bisected on (see
+	`_top_p_mask`). Unlike a sort, tokens tied at the boundary are all kept or all filtered.
+
 	Args:
-	    top_p (`float`):
+	    top_p (`float` or `jax.Array` of shape `(batch_size,)`):
 	        If set to < 1, only the smallest set of most probable tokens with probabilities that add up to `top_p` or
-	        higher are kept for generation.
+	        higher are kept for generation. Rows with a per-row `top_p >= 1` keep every token.
 	    filter_value (`float`, *optional*, defaults to -inf):
 	        All filtered values will be set to this float value.
 	    min_tokens_to_keep (`int`, *optional*, defaults to 1):
@@ -161,7 +266,9 @@ class FlaxTopPLogitsWarper(FlaxLogitsWarper):
 		filter_value: float = -float("Inf"),
 		min_tokens_to_keep: int = 1,
 	):
-		if not isinstance(top_p, float) or (top_p < 0 or top_p > 1.0):
+		if not _is_per_row(top_p) and (
+			not isinstance(top_p, float) or (top_p < 0 or top_p > 1.0)
+		):
 			raise ValueError(f"`top_p` has to be a float > 0 and < 1, but is {top_p}")
 		if not isinstance(min_tokens_to_keep, int) or (min_tokens_to_keep < 1):
 			raise ValueError(
@@ -175,32 +282,31 @@ class FlaxTopPLogitsWarper(FlaxLogitsWarper):
 	def __call__(
 		self, input_ids: jnp.ndarray, scores: jnp.ndarray, cur_len: int
 	) -> jnp.ndarray:
-		topk_scores, topk_indices = lax.top_k(scores, scores.shape[-1])
-
-		mask_scores = jnp.full_like(scores, self.filter_value)
-		cumulative_probs = jax.nn.softmax(topk_scores, axis=-1).cumsum(axis=-1)
-		score_mask = cumulative_probs < self.top_p
-
-		# include the token that is higher than top_p as well
-		score_mask = jnp.roll(score_mask, 1)
-		score_mask |= score_mask.at[:, 0].set(True)
+		probs = jax.nn.softmax(scores.astype(jnp.float32), axis=-1)
+		top_p = _per_row(self.top_p, probs.dtype)
+		score_mask = _top_p_mask(probs, top_p)
+		if _is_per_row(self.top_p):
+			# rounding must not drop the tail of rows that disabled top-p.
+			score_mask |= top_p >= 1.0
 
 		# min tokens to keep
-		score_mask = score_mask.at[:, : self.min_tokens_to_keep].set(True)
+		if self.min_tokens_to_keep > 1:
+			score_mask |= _top_k_mask(scores, min(self.min_tokens_to_keep, scores.shape[-1]))
 
-		topk_next_scores = jnp.where(score_mask, topk_scores, mask_scores)
-		next_scores = jax.lax.sort_key_val(topk_indices, topk_next_scores)[-1]
-
-		return next_scores
+		return jnp.where(score_mask, scores, self.filter_value)
 
 
 class FlaxTopKLogitsWarper(FlaxLogitsWarper):
 	r"""
 	[`FlaxLogitsWarper`] that performs top-k, i.e. restricting to the k highest probability elements.
 
+	Scores below the k-th largest one are filtered in place, without scattering the top-k back into the
+	vocabulary; per-row `top_k` finds that threshold without sorting (see `_top_k_mask`).
+
 	Args:
-	    top_k (`int`):
-	        The number of highest probability vocabulary tokens to keep for top-k-filtering.
+	    top_k (`int` or `jax.Array` of shape `(batch_size,)`):
+	        The number of highest probability vocabulary tokens to keep for top-k-filtering. Rows with a per-row
+	        `top_k <= 0` keep every token; tokens tied with the k-th score are kept as well.
 	    filter_value (`float`, *optional*, defaults to -inf):
 	        All filtered values will be set to this float value.
 	    min_tokens_to_keep (`int`, *optional*, defaults to 1):
@@ -213,6 +319,11 @@ class FlaxTopKLogitsWarper(FlaxLogitsWarper):
 		filter_value: float = -float("Inf"),
 		min_tokens_to_keep: int = 1,
 	):
+		if _is_per_row(top_k):
+			self.top_k = top_k
+			self.min_tokens_to_keep = min_tokens_to_keep
+			self.filter_value = filter_value
+			return
 		if not isinstance(top_k, int) or top_k <= 0:
 			raise ValueError(f"`top_k` has to be a strictly positive integer, but is {top_k}")
 
@@ -222,20 +333,69 @@ class FlaxTopKLogitsWarper(FlaxLogitsWarper):
 	def __call__(
 		self, input_ids: jnp.ndarray, scores: jnp.ndarray, cur_len: int
 	) -> jnp.ndarray:
-		batch_size, vocab_size = scores.shape
-		next_scores_flat = jnp.full(batch_size * vocab_size, self.filter_value)
-
-		topk = min(self.top_k, scores.shape[-1])  # Safety check
-		topk_scores, topk_indices = lax.top_k(scores, topk)
-		shift = jnp.broadcast_to(
-			(jnp.arange(batch_size) * vocab_size)[:, None], (batch_size, topk)
-		).flatten()
-		topk_scores_flat = topk_scores.flatten()
-		topk_indices_flat = topk_indices.flatten() + shift
-
-		next_scores_flat = next_scores_flat.at[topk_indices_flat].set(topk_scores_flat)
-		next_scores = next_scores_flat.reshape(batch_size, vocab_size)
-		return next_scores
+		vocab_size = scores.shape[-1]
+		if _is_per_row(self.top_k):
+			top_k = jnp.asarray(self.top_k, dtype=jnp.int32).reshape(-1, 1)
+			top_k = jnp.where(top_k > 0, top_k, vocab_size)
+			top_k = jnp.clip(top_k, self.min_tokens_to_keep, vocab_size)
+		else:
+			top_k = min(self.top_k, vocab_size)  # Safety check
+		return jnp.where(_top_k_mask(scores, top_k), scores, self.filter_value)
+
+
+class FlaxRepetitionPenaltyLogitsProcessor(FlaxLogitsProcessor):
+	r"""
+	[`FlaxLogitsProcessor`] that penalizes tokens already present in the sequence, as in
+	[CTRL](https://arxiv.org/abs/1909.05858): positive scores of seen tokens are divided by the penalty and
+	negative ones multiplied by it.
+
+	Args:
+	    penalty (`float` or `jax.Array` of shape `(batch_size,)`):
+	        The repetition penalty, shared or per row. `1.0` means no penalty.
+	"""
+
+	def __init__(self, penalty: tp.Union[float, jax.Array]):
+		if not _is_per_row(penalty) and (
+			not isinstance(penalty, float) or not (penalty > 0)
+		):
+			raise ValueError(
+				f"`penalty` has to be a strictly positive float, but is {penalty}"
+			)
+
+		self.penalty = penalty
+
+	def __call__(
+		self, input_ids: jnp.ndarray, scores: jnp.ndarray, cur_len: int
+	) -> jnp.ndarray:
+		seen = _seen_tokens_mask(input_ids, scores.shape[-1], cur_len)
+		penalty = _per_row(self.penalty, scores.dtype)
+		penalized = jnp.where(scores < 0, scores * penalty, scores / penalty)
+		return jnp.where(seen, penalized, scores)
+
+
+class FlaxPresencePenaltyLogitsProcessor(FlaxLogitsProcessor):
+	r"""
+	[`FlaxLogitsProcessor`] that subtracts a constant from the scores of tokens already present in the
+	sequence (the OpenAI `presence_penalty`).
+
+	Args:
+	    presence_penalty (`float` or `jax.Array` of shape `(batch_size,)`):
+	        The value subtracted from seen tokens, shared or per row. `0.0` means no penalty.
+	"""
+
+	def __init__(self, presence_penalty: tp.Union[float, jax.Array]):
+		if not _is_per_row(presence_penalty) and not isinstance(presence_penalty, float):
+			raise ValueError(
+				f"`presence_penalty` has to be a float, but is {presence_penalty}"
+			)
+
+		self.presence_penalty = presence_penalty
+
+	def __call__(
+		self, input_ids: jnp.ndarray, scores: jnp.ndarray, cur_len: int
+	) -> jnp.ndarray:
+		seen = _seen_tokens_mask(input_ids, scores.shape[-1], cur_len)
+		return scores - seen * _per_row(self.presence_penalty, scores.dtype)
 
 
 class FlaxForcedBOSTokenLogitsProcessor(FlaxLogitsProcessor):
@@ -0,0 +1,123 @@
+# Copyright 2023 The EASYDEL Author @erfanzar (Erfan Zare Chavoshi).
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import jax
+import numpy as np
+import pytest
+from jax import lax
+from jax import numpy as jnp
+
+from .logits_process import (
+	FlaxPresencePenaltyLogitsProcessor,
+	FlaxRepetitionPenaltyLogitsProcessor,
+	FlaxTemperatureLogitsWarper,
+	FlaxTopKLogitsWarper,
+	FlaxTopPLogitsWarper,
+)
+
+
+def scores(batch_size=3, vocab_size=32, seed=0):
+	return jnp.asarray(
+		np.random.RandomState(seed).randn(batch_size, vocab_size), jnp.float32
+	)
+
+
+def sorted_top_p(scores, top_p, min_tokens_to_keep=1):
+	"""The former sort-based nucleus filter, used as the reference."""
+	topk_scores, topk_indices = lax.top_k(scores, scores.shape[-1])
+	cumulative_probs = jax.nn.softmax(topk_scores, axis=-1).cumsum(axis=-1)
+	score_mask = jnp.roll(cumulative_probs < top_p, 1)
+	score_mask = score_mask.at[:, :min_tokens_to_keep].set(True)
+	topk_scores = jnp.where(score_mask, topk_scores, -jnp.inf)
+	return lax.sort_key_val(topk_indices, topk_scores)[-1]
+
+
+@pytest.mark.parametrize("vocab_size", [7, 256, 4096])
+@pytest.mark.parametrize("top_p", [0.0, 0.3, 0.9, 0.999])
+@pytest.mark.parametrize("min_tokens_to_keep", [1, 5])
+def test_sort_free_top_p_matches_sorting(vocab_size, top_p, min_tokens_to_keep):
+	logits = 3 * scores(batch_size=8, vocab_size=vocab_size, seed=vocab_size)
+	warped = FlaxTopPLogitsWarper(top_p, min_tokens_to_keep=min_tokens_to_keep)(
+		None, logits, 0
+	)
+	np.testing.assert_array_equal(warped, sorted_top_p(logits, top_p, min_tokens_to_keep))
+
+
+@pytest.mark.parametrize("vocab_size", [7, 256, 4096])
+@pytest.mark.parametrize("top_k", [1, 5, 50])
+def test_sort_free_top_k_matches_sorting(vocab_size, top_k):
+	logits = scores(batch_size=8, vocab_size=vocab_size, seed=vocab_size)
+	kth = jnp.sort(logits, axis=-1)[:, ::-1][
+		:, min(top_k, vocab_size) - 1 : min(top_k, vocab_size)
+	]
+	expected = jnp.where(logits < kth, -jnp.inf, logits)
+	for warper in (
+		FlaxTopKLogitsWarper(top_k),
+		FlaxTopKLogitsWarper(jnp.full((8,), top_k)),
+	):
+		np.testing.assert_array_equal(warper(None, logits, 0), expected)
+	# negative, infinite and tied scores keep their order.
+	logits = jnp.array([[-jnp.inf, -3.0, 2.0, 2.0, -0.0, 5.0, -1e30]])
+	for top_k, kept in ((1, [5]), (2, [2, 3, 5]), (4, [2, 3, 4, 5])):
+		warped = FlaxTopKLogitsWarper(jnp.array([top_k]))(None, logits, 0)
+		assert np.flatnonzero(np.isfinite(warped[0])).tolist() == kept
+
+
+@pytest.mark.parametrize(
+	"warper_class, values",
+	[
+		(FlaxTemperatureLogitsWarper, [0.5, 1.3, 2.0]),
+		(FlaxTopKLogitsWarper, [1, 5, 20]),
+		(FlaxTopPLogitsWarper, [0.1, 0.5, 0.9]),
+	],
+)
+def test_per_row_warpers_match_shared_warpers(warper_class, values):
+	logits = scores()
+	warped = warper_class(jnp.asarray(values))(None, logits, 0)
+	for row, value in enumerate(values):
+		expected = warper_class(value)(None, logits[row : row + 1], 0)
+		np.testing.assert_allclose(warped[row : row + 1], expected, rtol=1e-6)
+
+
+def test_per_row_warpers_can_be_disabled():
+	logits = scores()
+	np.testing.assert_array_equal(
+		FlaxTopKLogitsWarper(jnp.array([0, 0, 0]))(None, logits, 0), logits
+	)
+	np.testing.assert_array_equal(
+		FlaxTopPLogitsWarper(jnp.array([1.0, 1.0, 1.0]))(None, logits, 0), logits
+	)
+
+
+def test_penalties_only_touch_seen_tokens():
+	logits = jnp.array([[2.0, -2.0, 1.0, 0.5], [2.0, -2.0, 1.0, 0.5]])
+	# the second row has seen token 2 only; position 2 is past `cur_len`.
+	input_ids = jnp.array([[0, 1, 3], [2, 2, 0]])
+	cur_len = jnp.array([3, 2])
+
+	penalized = FlaxRepetitionPenaltyLogitsProcessor(jnp.array([2.0, 4.0]))(
+		input_ids, logits, cur_len
+	)
+	np.testing.assert_allclose(
+		penalized, [[1.0, -4.0, 1.0, 0.25], [2.0, -2.0, 0.25, 0.5]]
+	)
+
+	penalized = FlaxPresencePenaltyLogitsProcessor(jnp.array([1.0, 0.5]))(
+		input_ids, logits, cur_len
+	)
+	np.testing.assert_allclose(penalized, [[1.0, -3.0, 1.0, -0.5], [2.0, -2.0, 0.5, 0.5]])
+
+	# a shared length and a shared penalty behave the same way.
+	penalized = FlaxPresencePenaltyLogitsProcessor(1.0)(input_ids, logits, 2)
+	np.testing.assert_allclose(penalized, [[1.0, -3.0, 1.0, 0.5], [2.0, -2.0, 0.0, 0.5]])
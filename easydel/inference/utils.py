@@ -20,6 +20,7 @@ import jax
 import jax.experimental
 import jax.experimental.pallas
 import jax.random
+import numpy as np
 from jax import core, random, sharding
 from jax import numpy as jnp
 
@@ -29,6 +30,8 @@ from .logits_process import (
 	FlaxLogitsProcessorList,
 	FlaxMinLengthLogitsProcessor,
 	FlaxNoRepeatNGramLogitsProcessor,
+	FlaxPresencePenaltyLogitsProcessor,
+	FlaxRepetitionPenaltyLogitsProcessor,
 	FlaxSuppressTokensLogitsProcessor,
 	FlaxTemperatureLogitsWarper,
 	FlaxTopKLogitsWarper,
@@ -119,7 +122,6 @@ class vInferenceConfig:
 			warpers.append(FlaxTopKLogitsWarper(top_k=self.top_k, min_tokens_to_keep=1))
 		if self.top_p is not None and self.top_p < 1.0:
 			warpers.append(FlaxTopPLogitsWarper(top_p=self.top_p, min_tokens_to_keep=1))
-		print(hash(warpers))
 		if len(warpers) == 0:
 			return None
 
@@ -232,6 +234,162 @@ def compile_function(
 	).compile()
 
 
+@chex.dataclass
+class SamplingParams:
+	"""
+	Per-row sampling settings, carried as traced `(batch_size,)` arrays.
+
+	Unlike the fields of `vInferenceConfig`, which are static and compiled into the
+	generation functions, these are ordinary inputs, so rows of one batch can use
+	different settings and changing them never triggers a recompilation.
+
+	Rows with `temperature <= 0` decode greedily, `top_k <= 0` and `top_p >= 1`
+	disable the corresponding filter. Every row samples from its own key derived
+	from `seed` and its number of generated tokens, so a seeded row produces the
+	same tokens whatever the other rows of the batch are.
+
+	`repetition_penalty` and `presence_penalty` only apply to the tokens the row has
+	generated so far, never to its prompt, in `vInference.generate` and in the
+	continuous-batching scheduler alike.
+	"""
+
+	temperature: jax.Array
+	top_p: jax.Array
+	top_k: jax.Array
+	repetition_penalty: jax.Array
+	presence_penalty: jax.Array
+	seed: jax.Array
+
+	@classmethod
+	def create(
+		cls,
+		batch_size: int,
+		temperature: tp.Union[float, tp.Sequence[float]] = 1.0,
+		top_p: tp.Union[float, tp.Sequence[float]] = 1.0,
+		top_k: tp.Union[int, tp.Sequence[int]] = 0,
+		repetition_penalty: tp.Union[float, tp.Sequence[float]] = 1.0,
+		presence_penalty: tp.Union[float, tp.Sequence[float]] = 0.0,
+		seed: tp.Optional[tp.Union[int, tp.Sequence[int]]] = None,
+		rng: tp.Optional[jax.random.PRNGKey] = None,
+	) -> "SamplingParams":
+		"""
+		Builds the params of `batch_size` rows from shared values or per-row sequences.
+
+		Args:
+		    batch_size: Number of rows.
+		    temperature: Softmax temperature; `<= 0` means greedy decoding.
+		    top_p: Nucleus sampling probability mass; `>= 1` disables it.
+		    top_k: Number of candidate tokens; `<= 0` disables it.
+		    repetition_penalty: CTRL-style penalty of generated tokens; `1` disables it.
+		    presence_penalty: Value subtracted from generated tokens; `0` disables it.
+		    seed: Sampling seed of every row, drawn from `rng` (or numpy) when None.
+		    rng: Key used to draw the seeds when `seed` is None.
+
+		Returns:
+		    SamplingParams: The per-row params.
+		"""
+
+		def _rows(value, dtype):
+			value = jnp.asarray(value, dtype=dtype)
+			if value.ndim > 1 or value.size not in (1, batch_size):
+				raise ValueError(
+					f"sampling params must be scalars or hold {batch_size} values, "
+					f"got shape {value.shape}."
+				)
+			return jnp.broadcast_to(value.reshape(-1), (batch_size,))
+
+		if seed is None:
+			if rng is None:
+				seed = np.random.randint(0, np.iinfo(np.int32).max, size=(batch_size,))
+			else:
+				seed = jax.random.randint(
+					rng, (batch_size,), 0, jnp.iinfo(jnp.int32).max, dtype=jnp.int32
+				)
+		return cls(
+			temperature=_rows(temperature, jnp.float32),
+			top_p=_rows(top_p, jnp.float32),
+			top_k=_rows(top_k, jnp.int32),
+			repetition_penalty=_rows(repetition_penalty, jnp.float32),
+			presence_penalty=_rows(presence_penalty, jnp.float32),
+			seed=_rows(seed, jnp.int32),
+		)
+
+	@classmethod
+	def from_generation_config(
+		cls,
+		generation_config: vInferenceConfig,
+		batch_size: int,
+		rng: tp.Optional[jax.random.PRNGKey] = None,
+		seed: tp.Optional[tp.Union[int, tp.Sequence[int]]] = None,
+	) -> "SamplingParams":
+		"""Builds params applying the sampling settings of `generation_config` to every row."""
+		temperature = generation_config.temperature
+		return cls.create(
+			batch_size=batch_size,
+			temperature=(temperature if temperature is not None else 1.0)
+			if generation_config.do_sample
+			else 0.0,
+			top_p=generation_config.top_p if generation_config.top_p is not None else 1.0,
+			top_k=generation_config.top_k if generation_config.top_k is not None else 0,
+			seed=seed,
+			rng=rng,
+		)
+
+	def get_logits_processor(self) -> FlaxLogitsProcessorList:
+		return FlaxLogitsProcessorList(
+			[
+				FlaxRepetitionPenaltyLogitsProcessor(self.repetition_penalty),
+				FlaxPresencePenaltyLogitsProcessor(self.presence_penalty),
+			]
+		)
+
+	def get_logits_warper(self) -> FlaxLogitsProcessorList:
+		return FlaxLogitsProcessorList(
+			[
+				FlaxTemperatureLogitsWarper(
+					jnp.where(self.temperature > 0, self.temperature, 1.0)
+				),
+				FlaxTopKLogitsWarper(top_k=self.top_k, min_tokens_to_keep=1),
+				FlaxTopPLogitsWarper(top_p=self.top_p, min_tokens_to_keep=1),
+			]
+		)
+
+	def sample(
+		self,
+		sequences: jax.Array,
+		logits: jax.Array,
+		cur_len: jax.Array,
+		step: jax.Array,
+	) -> jax.Array:
+		"""
+		Applies the per-row penalties and warpers to `logits` and picks one token per row.
+
+		Args:
+		    sequences: Token buffer `[batch, buffer_length]`, whose generated tokens are
+		      `sequences[:, cur_len - step:cur_len]`.
+		    logits: Next-token logits `[batch, vocab_size]`.
+		    cur_len: Number of valid tokens of `sequences`, shared or per row.
+		    step: Number of tokens generated so far, shared or per row; only they are
+		      penalized, and the step is folded into the key of every row.
+
+		Returns:
+		    jax.Array: The next token of every row `[batch]`.
+		"""
+		positions = jnp.arange(sequences.shape[-1])[None, :]
+		end = jnp.reshape(cur_len, (-1, 1))
+		generated = (positions >= end - jnp.reshape(step, (-1, 1))) & (positions < end)
+		# prompt tokens become an out-of-vocabulary id the penalties ignore.
+		generated_ids = jnp.where(generated, sequences, logits.shape[-1])
+		logits = self.get_logits_processor()(generated_ids, logits, cur_len)
+		logits = self.get_logits_warper()(sequences, logits, cur_len)
+		keys = jax.vmap(lambda seed, idx: random.fold_in(random.PRNGKey(seed), idx))(
+			self.seed,
+			jnp.broadcast_to(step, self.seed.shape).astype(jnp.int32),
+		)
+		sampled = jax.vmap(random.categorical)(keys, logits)
+		return jnp.where(self.temperature > 0, sampled, jnp.argmax(logits, axis=-1))
+
+
 @chex.dataclass
 class SampleState:
 	"""
@@ -251,6 +409,23 @@ class SampleState:
 	tokens_pre_second: tp.Optional[float] = float("-inf")
 	generated_tokens: tp.Optional[int] = 0
 
+	# Speculative decoding
+	draft_model_kwargs: tp.Optional[
+		tp.Union[tp.Dict[str, jax.Array], sharding.NamedSharding]
+	] = None
+	num_draft_tokens: tp.Optional[int] = 0
+	num_accepted_draft_tokens: tp.Optional[int] = 0
+
+	# Per-row sampling
+	sampling_params: tp.Optional[SamplingParams] = None
+
+	@property
+	def draft_acceptance_rate(self) -> float:
+		"""Fraction of the draft-model proposals accepted by the target model."""
+		return float(self.num_accepted_draft_tokens) / max(
+			float(self.num_draft_tokens), 1.0
+		)
+
 	def __repr__(self):
 		"""
 		Args:
@@ -276,6 +451,28 @@ class SampleState:
 	__str__ = __repr__
 
 
+@chex.dataclass
+class SlotsState:
+	"""
+	Device-side state of a continuous-batching decode batch.
+
+	Every row is a decode slot that can hold one request at a time; free and
+	finished slots are marked as finished and only carry padding.
+	"""
+
+	sequences: tp.Union[jax.Array, sharding.NamedSharding]
+	generated_tokens: tp.Union[jax.Array, sharding.NamedSharding]
+	max_new_tokens: tp.Union[jax.Array, sharding.NamedSharding]
+	running_token: tp.Union[jax.Array, sharding.NamedSharding]
+	is_sequence_finished: tp.Union[jax.Array, sharding.NamedSharding]
+	prng_key: tp.Union[random.PRNGKey, sharding.NamedSharding]
+	model_kwargs: tp.Union[tp.Dict[str, jax.Array], sharding.NamedSharding]
+	sampling_params: tp.Optional[SamplingParams] = None
+
+	__repr__ = SampleState.__repr__
+	__str__ = __repr__
+
+
 def create_sampling_step(
 	logits_processor: FlaxLogitsProcessorList,
 	logits_warper: FlaxLogitsProcessorList,
@@ -295,9 +492,8 @@ def create_sampling_step(
 		Returns:
 				inference_utils.SampleState: The updated generation state.
 		"""
-		model_outputs = model(
+		model_outputs = model.forward_selected_logits(
 			input_ids=state.running_token,
-			return_dict=True,
 			**state.model_kwargs,
 		)
 
@@ -305,7 +501,14 @@ def create_sampling_step(
 		if logits_processor is not None:
 			logits = logits_processor(state.sequences, logits, state.current_length)
 
-		if do_sample:
+		if state.sampling_params is not None:
+			next_token = state.sampling_params.sample(
+				state.sequences,
+				logits,
+				state.current_length,
+				state.generated_tokens,
+			)
+		elif do_sample:
 			if logits_warper is not None:
 				logits = logits_warper(logits, logits, state.current_length)
 			next_token = jax.random.categorical(state.prng_key, logits, axis=-1)
@@ -341,3 +544,58 @@ def create_sampling_step(
 		)
 
 	return sampling_step
+
+
+def propose_prompt_lookup_tokens(
+	sequences: jax.Array,
+	current_length: jax.Array,
+	num_speculative_tokens: int,
+	max_ngram_size: int,
+	min_ngram_size: int = 1,
+	pad_token_id: int = 0,
+) -> jax.Array:
+	"""
+	Proposes speculative tokens by prompt lookup, without a draft model.
+
+	The trailing n-gram of every row (`sequences[:, current_length - n:current_length]`)
+	is matched against all earlier windows of the row, prompt and generated tokens
+	alike, and the `num_speculative_tokens` tokens that followed the latest match are
+	proposed. N-gram sizes are tried from `max_ngram_size` down to `min_ngram_size`;
+	rows without any match, and proposals past `current_length`, get `pad_token_id`.
+
+	Args:
+	    sequences: Token ids `[batch, buffer_length]`.
+	    current_length: Number of valid tokens in `sequences`.
+	    num_speculative_tokens: Number of tokens to propose.
+	    max_ngram_size: Longest n-gram to match.
+	    min_ngram_size: Shortest n-gram to match.
+	    pad_token_id: Token proposed where nothing matched.
+
+	Returns:
+	    jax.Array: The proposed tokens `[batch, num_speculative_tokens]`.
+	"""
+	batch_size, buffer_length = sequences.shape
+	positions = jnp.arange(buffer_length)
+	continuation = jnp.full((batch_size,), -1, dtype=jnp.int32)
+	for ngram_size in range(max_ngram_size, min_ngram_size - 1, -1):
+		ngram = jax.lax.dynamic_slice_in_dim(
+			sequences,
+			current_length - ngram_size,
+			ngram_size,
+			axis=1,
+		)
+		matches = positions[None, :] < current_length - ngram_size
+		for offset in range(ngram_size):
+			matches &= jnp.roll(sequences, -offset, axis=1) == ngram[:, offset, None]
+		start = jnp.max(jnp.where(matches, positions[None, :], -1), axis=1)
+		continuation = jnp.where(
+			(continuation < 0) & (start >= 0),
+			start + ngram_size,
+			continuation,
+		)
+	indices = continuation[:, None] + jnp.arange(num_speculative_tokens)[None, :]
+	tokens = jnp.take_along_axis(
+		sequences, jnp.clip(indices, 0, buffer_length - 1), axis=1
+	)
+	found = (continuation[:, None] >= 0) & (indices < current_length)
+	return jnp.where(found, tokens, pad_token_id).astype(jnp.int32)
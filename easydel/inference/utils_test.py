@@ -0,0 +1,115 @@
+# Copyright 2023 The EASYDEL Author @erfanzar (Erfan Zare Chavoshi).
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import jax
+import numpy as np
+import pytest
+from jax import numpy as jnp
+
+from .utils import SamplingParams, propose_prompt_lookup_tokens
+
+PAD = 0
+
+
+def propose(sequences, current_length, **kwargs):
+	kwargs = {
+		"num_speculative_tokens": 3,
+		"max_ngram_size": 2,
+		"pad_token_id": PAD,
+		**kwargs,
+	}
+	fn = jax.jit(
+		propose_prompt_lookup_tokens,
+		static_argnames=tuple(kwargs),
+	)
+	return np.asarray(fn(jnp.asarray(sequences, jnp.int32), current_length, **kwargs))
+
+
+def test_proposes_the_continuation_of_the_latest_match():
+	sequences = [
+		[5, 6, 7, 8, 9, 5, 6, 1, 2, 3, 5, 6, 0, 0],
+		# the bigram (7, 4) never occurred before, the unigram 4 did.
+		[4, 1, 2, 3, 7, 7, 7, 7, 7, 7, 7, 4, 0, 0],
+	]
+	np.testing.assert_array_equal(propose(sequences, 12), [[1, 2, 3], [1, 2, 3]])
+
+
+def test_prefers_longer_ngrams():
+	sequences = [[1, 2, 9, 9, 9, 3, 2, 8, 8, 8, 1, 2]]
+	# the unigram 2 last occurred before 8, the bigram (1, 2) before 9.
+	np.testing.assert_array_equal(propose(sequences, 12), [[9, 9, 9]])
+	np.testing.assert_array_equal(propose(sequences, 12, max_ngram_size=1), [[8, 8, 8]])
+
+
+def test_pads_missing_proposals():
+	sequences = [
+		[1, 2, 3, 4, 5, 6, 0, 0],
+		[3, 4, 5, 3, 4, 0, 0, 0],
+	]
+	proposals = propose(sequences, 5)
+	# no match at all, and a continuation running into the trailing n-gram.
+	np.testing.assert_array_equal(proposals, [[PAD, PAD, PAD], [5, 3, 4]])
+	np.testing.assert_array_equal(propose([[7, 7, 0]], 1), [[PAD, PAD, PAD]])
+
+
+def sample(params, logits, step=0):
+	sequences = jnp.zeros((logits.shape[0], 1), jnp.int32)
+	return np.asarray(jax.jit(SamplingParams.sample)(params, sequences, logits, 0, step))
+
+
+def test_sampling_params_mix_greedy_and_sampled_rows():
+	logits = jnp.asarray(np.random.RandomState(0).randn(4, 64), jnp.float32)
+	params = SamplingParams.create(
+		batch_size=4,
+		temperature=[0.0, 1.0, 0.0, 1.0],
+		top_k=[0, 1, 0, 0],
+		seed=0,
+	)
+	tokens = sample(params, logits)
+	argmax = np.asarray(jnp.argmax(logits, axis=-1))
+	# greedy rows and the top-1 row pick the argmax.
+	np.testing.assert_array_equal(tokens[:3], argmax[:3])
+
+
+def test_seeded_rows_do_not_depend_on_the_batch():
+	logits = jnp.asarray(np.random.RandomState(1).randn(3, 64), jnp.float32)
+	params = SamplingParams.create(batch_size=3, temperature=2.0, seed=[7, 8, 9])
+	tokens = sample(params, logits, step=5)
+	row = SamplingParams.create(batch_size=1, temperature=2.0, seed=8)
+	assert sample(row, logits[1:2], step=5)[0] == tokens[1]
+	# a new step draws from a new key.
+	steps = [sample(row, logits[1:2], step=step)[0] for step in range(16)]
+	assert len(set(steps)) > 1
+
+
+def test_penalties_only_look_at_generated_tokens():
+	logits = jnp.asarray(np.random.RandomState(2).randn(1, 64), jnp.float32)
+	top = int(jnp.argmax(logits))
+	params = SamplingParams.create(batch_size=1, temperature=0.0, presence_penalty=100.0)
+
+	def greedy(sequence, cur_len, step):
+		sequences = jnp.asarray([sequence], jnp.int32)
+		return int(
+			jax.jit(SamplingParams.sample)(params, sequences, logits, cur_len, step)[0]
+		)
+
+	# `top` in the prompt, then among the tokens generated after it.
+	assert greedy([top, 3, 4, 0], cur_len=3, step=1) == top
+	assert greedy([3, top, 4, 0], cur_len=3, step=2) != top
+	assert greedy([top, 0, 0, 0], cur_len=0, step=0) == top
+
+
+def test_sampling_params_validate_their_rows():
+	with pytest.raises(ValueError):
+		SamplingParams.create(batch_size=2, temperature=[0.5, 1.0, 2.0])
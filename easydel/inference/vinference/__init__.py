@@ -13,6 +13,18 @@
 # limitations under the License.
 
 from .api_server import vInferenceApiServer
-from .vinference import vInference, vInferenceConfig
+from .detokenizer import IncrementalDetokenizer
+from .prefix_cache import RadixPrefixCache
+from .scheduler import vInferenceRequest, vInferenceScheduler
+from .vinference import SamplingParams, vInference, vInferenceConfig
 
-__all__ = ["vInference", "vInferenceConfig", "vInferenceApiServer"]
+__all__ = [
+	"SamplingParams",
+	"vInference",
+	"vInferenceConfig",
+	"vInferenceApiServer",
+	"vInferenceRequest",
+	"vInferenceScheduler",
+	"RadixPrefixCache",
+	"IncrementalDetokenizer",
+]
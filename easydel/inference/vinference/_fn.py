@@ -22,13 +22,18 @@ import jax
 from flax import nnx as nn
 from jax import numpy as jnp
 
+from easydel.layers.caching import SlidingWindowCacheView
+
 if tp.TYPE_CHECKING:
 	from easydel.infra import EasyDeLBaseModule
 else:
 	EasyDeLBaseModule = object
 from ..utils import (
 	SampleState,
+	SamplingParams,
+	SlotsState,
 	create_sampling_step,
+	propose_prompt_lookup_tokens,
 	vInferenceConfig,
 )
 
@@ -132,6 +137,559 @@ def basic_generation_iter_fn(
 	return state
 
 
+def _rewind_inputs(model_kwargs: dict, num_tokens: jax.Array) -> dict:
+	"""
+	Drops the last `num_tokens` tokens fed to a model from its generation inputs: every
+	view of the cache moves its write index back, so the dropped positions are masked
+	out and overwritten by the next forward, and the position ids move back with it.
+	"""
+	model_kwargs = dict(model_kwargs)
+	views = []
+	for view in model_kwargs["past_key_values"].views:
+		# a ring buffer has already overwritten the slots the dropped tokens evicted.
+		if getattr(view, "index", None) is None or isinstance(view, SlidingWindowCacheView):
+			raise NotImplementedError(
+				f"speculative decoding can not rewind `{type(view).__name__}` caches."
+			)
+		views.append(view.replace(index=view.index - num_tokens))
+	model_kwargs["past_key_values"] = model_kwargs["past_key_values"].replace(views=views)
+	model_kwargs["position_ids"] = model_kwargs["position_ids"] - num_tokens
+	return model_kwargs
+
+
+def _speculative_distribution(
+	logits: jax.Array,
+	sequences: jax.Array,
+	cur_len: jax.Array,
+	logits_processor,
+	logits_warper,
+	do_sample: bool,
+) -> tp.Tuple[jax.Array, jax.Array]:
+	"""
+	Applies the generation logits processors (and warpers when sampling) and returns
+	the processed logits with the distribution tokens are drawn from; greedy decoding
+	is the one-hot distribution of the argmax.
+	"""
+	if logits_processor is not None:
+		logits = logits_processor(sequences, logits, cur_len)
+	if do_sample:
+		if logits_warper is not None:
+			logits = logits_warper(sequences, logits, cur_len)
+		return logits, jax.nn.softmax(logits.astype(jnp.float32), axis=-1)
+	return logits, jax.nn.one_hot(
+		jnp.argmax(logits, axis=-1),
+		logits.shape[-1],
+		dtype=jnp.float32,
+	)
+
+
+def _speculative_generation_loop(
+	model: EasyDeLBaseModule,
+	propose_fn: tp.Callable,
+	state: SampleState,
+	generation_config: vInferenceConfig,
+	num_speculative_tokens: int,
+	loop_max_tokens: int,
+) -> SampleState:
+	"""
+	Runs speculative decoding steps until `loop_max_tokens` tokens were generated or
+	every sequence finished.
+
+	Every loop step `propose_fn(state, prng_key)` returns `num_speculative_tokens`
+	proposals `[batch, k]`, the distributions they were drawn from `[batch, k, vocab]`
+	and the updated draft model kwargs (or `None`). The target model scores the running
+	token and every proposal in a single forward pass, and the proposals are accepted
+	with the speculative sampling rule (accept `d` with probability
+	`min(1, p(d) / q(d))`, otherwise resample from `max(p - q, 0)`, and sample one extra
+	token from `p` when every proposal is accepted), which keeps the output
+	distribution of the target model. With `do_sample=False` the target distribution
+	is one-hot, so proposals are accepted while they match the target argmax.
+
+	All rows of the batch advance together by the number of tokens every row accepted
+	(plus one), which keeps `current_length` shared; the extra tokens a row accepted
+	are dropped and proposed again. The caches of the target model (and of the draft
+	model) are rolled back to the accepted prefix with `_rewind_inputs`.
+	"""
+	num_draft = num_speculative_tokens
+	eos_token_id = jnp.array(generation_config.eos_token_id, dtype=jnp.int32)
+	pad_token_id = jnp.array(generation_config.pad_token_id, dtype=jnp.int32)
+	logits_processor = generation_config.get_logits_processor()
+	logits_warper = (
+		generation_config.get_logits_warper() if generation_config.do_sample else None
+	)
+	do_sample = generation_config.do_sample
+	batch_size, buffer_length = state.sequences.shape
+	rows = jnp.arange(batch_size)
+	offsets = jnp.arange(num_draft + 1)
+
+	tlen = state.current_length + loop_max_tokens
+
+	def cond_fn(state):
+		"""state termination condition fn."""
+		all_sequence_finished = jnp.all(state.is_sequence_finished)
+		max_length_reached = state.current_length >= jnp.minimum(tlen, buffer_length)
+		return ~jnp.logical_or(all_sequence_finished, max_length_reached)
+
+	def body_fn(state):
+		current_length = state.current_length
+		finished = state.is_sequence_finished
+		prng_key, propose_key, accept_key, residual_key = jax.random.split(
+			state.prng_key,
+			4,
+		)
+		draft_tokens, draft_probs, draft_kwargs = propose_fn(state, propose_key)
+		sequences = state.sequences.at[:, current_length + offsets[:-1]].set(
+			draft_tokens,
+			mode="drop",
+		)
+
+		# score the running token and every proposal with one target forward pass.
+		position_ids = state.model_kwargs["position_ids"][:, -1:]
+		model_outputs = model(
+			input_ids=jnp.concatenate([state.running_token, draft_tokens], axis=1),
+			return_dict=True,
+			**{**state.model_kwargs, "position_ids": position_ids + offsets[None, :]},
+		)
+		target_probs = jnp.stack(
+			[
+				_speculative_distribution(
+					model_outputs.logits[:, step],
+					sequences,
+					current_length + step,
+					logits_processor,
+					logits_warper,
+					do_sample,
+				)[1]
+				for step in range(num_draft + 1)
+			],
+			axis=1,
+		)
+
+		def prob_of(probs, tokens):
+			return jnp.take_along_axis(probs, tokens[..., None], axis=-1)[..., 0]
+
+		uniform = jax.random.uniform(accept_key, draft_tokens.shape)
+		accepted = uniform * prob_of(draft_probs, draft_tokens) < prob_of(
+			target_probs[:, :num_draft],
+			draft_tokens,
+		)
+		num_accepted = jnp.sum(jnp.cumprod(accepted, axis=1), axis=1)
+		num_accepted = jnp.where(finished, num_draft, num_accepted)
+
+		# the token after the accepted proposals comes from the residual distribution
+		# (which is the target distribution when nothing was rejected).
+		draft_probs = jnp.pad(draft_probs, ((0, 0), (0, 1), (0, 0)))
+		residual = jnp.maximum(
+			target_probs[rows, num_accepted] - draft_probs[rows, num_accepted],
+			0,
+		)
+		residual = jnp.where(
+			jnp.sum(residual, axis=-1, keepdims=True) > 0,
+			residual,
+			target_probs[rows, num_accepted],
+		)
+		if do_sample:
+			residual_token = jax.random.categorical(residual_key, jnp.log(residual), axis=-1)
+		else:
+			residual_token = jnp.argmax(residual, axis=-1)
+
+		num_emitted = jnp.minimum(
+			jnp.min(num_accepted) + 1,
+			buffer_length - current_length,
+		)
+		next_tokens = jnp.pad(draft_tokens, ((0, 0), (0, 1)))
+		next_tokens = jnp.where(
+			offsets[None, :] == num_accepted[:, None],
+			residual_token[:, None],
+			next_tokens,
+		)
+		emitted = offsets < num_emitted
+		is_eos = jnp.isin(next_tokens, eos_token_id) & emitted[None, :]
+		after_eos = (jnp.cumsum(is_eos, axis=1) - is_eos) > 0
+		next_tokens = jnp.where(
+			finished[:, None] | after_eos | ~emitted[None, :],
+			pad_token_id,
+			next_tokens,
+		).astype(jnp.int32)
+		next_sequences = state.sequences.at[
+			:, jnp.where(emitted, current_length + offsets, buffer_length)
+		].set(next_tokens, mode="drop")
+
+		# the caches hold the running token and every proposal, keep the accepted ones.
+		num_rejected = num_draft + 1 - num_emitted
+		model_kwargs = model.update_inputs_for_generation(
+			model_outputs,
+			dict(state.model_kwargs),
+		)
+		model_kwargs["position_ids"] = position_ids + num_draft + 1
+		if draft_kwargs is not None:
+			draft_kwargs = _rewind_inputs(draft_kwargs, num_rejected)
+
+		active = ~finished
+		return state.replace(
+			current_length=current_length + num_emitted,
+			sequences=next_sequences,
+			running_token=next_tokens[:, num_emitted - 1][:, None],
+			is_sequence_finished=finished | jnp.any(is_eos, axis=1),
+			prng_key=prng_key,
+			model_kwargs=_rewind_inputs(model_kwargs, num_rejected),
+			draft_model_kwargs=draft_kwargs,
+			generated_tokens=state.generated_tokens + num_emitted,
+			num_draft_tokens=state.num_draft_tokens + num_draft * jnp.sum(active),
+			num_accepted_draft_tokens=state.num_accepted_draft_tokens
+			+ jnp.sum(jnp.where(active, num_accepted, 0)),
+		)
+
+	return jax.lax.while_loop(cond_fn, body_fun=body_fn, init_val=state)
+
+
+def speculative_generation_first_iter_fn(
+	graphdef: EasyDeLBaseModule,
+	graphstate: dict,
+	draft_graphdef: EasyDeLBaseModule,
+	draft_graphstate: dict,
+	state: SampleState,
+	generation_config: vInferenceConfig,
+) -> SampleState:
+	"""
+	Prefills the prompt into the cache of the draft model and then performs the
+	initial generation step of the target model (see `basic_generation_first_iter_fn`).
+
+	Returns:
+		SampleState: The initial generation state after the first sampling step.
+	"""
+	draft_model = nn.merge(draft_graphdef, draft_graphstate)
+	with draft_model.config.mesh:
+		if state.running_token.shape[-1] > 1:
+			draft_outputs = draft_model.forward_selected_logits(
+				input_ids=state.running_token,
+				**state.draft_model_kwargs,
+			)
+			state = state.replace(
+				draft_model_kwargs=draft_model.update_inputs_for_generation(
+					draft_outputs,
+					state.draft_model_kwargs,
+				)
+			)
+	return basic_generation_first_iter_fn(
+		graphdef,
+		graphstate,
+		state,
+		generation_config,
+	)
+
+
+def speculative_generation_iter_fn(
+	graphdef: EasyDeLBaseModule,
+	graphstate: dict,
+	draft_graphdef: EasyDeLBaseModule,
+	draft_graphstate: dict,
+	state: SampleState,
+	generation_config: vInferenceConfig,
+	num_speculative_tokens: int,
+	loop_max_tokens: int,
+) -> SampleState:
+	"""
+	Speculative counterpart of `basic_generation_iter_fn`: every loop step the draft
+	model proposes `num_speculative_tokens` tokens one by one, which the target model
+	verifies in a single forward pass (see `_speculative_generation_loop`).
+
+	Returns:
+		SampleState: The updated generation state after the interval generation steps.
+	"""
+	model = nn.merge(graphdef, graphstate)
+	draft_model = nn.merge(draft_graphdef, draft_graphstate)
+	logits_processor = generation_config.get_logits_processor()
+	logits_warper = (
+		generation_config.get_logits_warper() if generation_config.do_sample else None
+	)
+
+	def propose_fn(state, prng_key):
+		# the last draft forward only writes the final proposal into the draft cache.
+		sequences = state.sequences
+		draft_kwargs = dict(state.draft_model_kwargs)
+		token = state.running_token
+		draft_tokens, draft_probs = [], []
+		keys = jax.random.split(prng_key, num_speculative_tokens)
+		for step in range(num_speculative_tokens + 1):
+			draft_outputs = draft_model.forward_selected_logits(
+				input_ids=token,
+				**draft_kwargs,
+			)
+			draft_kwargs = draft_model.update_inputs_for_generation(
+				draft_outputs,
+				draft_kwargs,
+			)
+			if step == num_speculative_tokens:
+				break
+			logits, probs = _speculative_distribution(
+				draft_outputs.logits[:, -1],
+				sequences,
+				state.current_length + step,
+				logits_processor,
+				logits_warper,
+				generation_config.do_sample,
+			)
+			if generation_config.do_sample:
+				token = jax.random.categorical(keys[step], logits, axis=-1)
+			else:
+				token = jnp.argmax(logits, axis=-1)
+			token = token.astype(jnp.int32)
+			sequences = sequences.at[:, state.current_length + step].set(token, mode="drop")
+			draft_tokens.append(token)
+			draft_probs.append(probs)
+			token = token[:, None]
+		return jnp.stack(draft_tokens, axis=1), jnp.stack(draft_probs, axis=1), draft_kwargs
+
+	with model.config.mesh:
+		state = _speculative_generation_loop(
+			model=model,
+			propose_fn=propose_fn,
+			state=state,
+			generation_config=generation_config,
+			num_speculative_tokens=num_speculative_tokens,
+			loop_max_tokens=loop_max_tokens,
+		)
+	return state
+
+
+def prompt_lookup_generation_iter_fn(
+	graphdef: EasyDeLBaseModule,
+	graphstate: dict,
+	state: SampleState,
+	generation_config: vInferenceConfig,
+	num_speculative_tokens: int,
+	max_ngram_size: int,
+	loop_max_tokens: int,
+) -> SampleState:
+	"""
+	Draft-free speculative counterpart of `basic_generation_iter_fn`: every loop step
+	proposes the `num_speculative_tokens` tokens that followed the latest earlier
+	occurrence of the trailing n-gram of each sequence (see
+	`propose_prompt_lookup_tokens`), which the model verifies in a single forward pass
+	(see `_speculative_generation_loop`).
+
+	Returns:
+		SampleState: The updated generation state after the interval generation steps.
+	"""
+	model = nn.merge(graphdef, graphstate)
+	vocab_size = model.config.vocab_size
+
+	def propose_fn(state, prng_key):
+		draft_tokens = propose_prompt_lookup_tokens(
+			sequences=state.sequences,
+			current_length=state.current_length,
+			num_speculative_tokens=num_speculative_tokens,
+			max_ngram_size=max_ngram_size,
+			pad_token_id=generation_config.pad_token_id,
+		)
+		# the proposals are deterministic, so their distribution is one-hot.
+		draft_probs = jax.nn.one_hot(draft_tokens, vocab_size, dtype=jnp.float32)
+		return draft_tokens, draft_probs, None
+
+	with model.config.mesh:
+		state = _speculative_generation_loop(
+			model=model,
+			propose_fn=propose_fn,
+			state=state,
+			generation_config=generation_config,
+			num_speculative_tokens=num_speculative_tokens,
+			loop_max_tokens=loop_max_tokens,
+		)
+	return state
+
+
+def continuous_batching_prefill_fn(
+	graphdef: EasyDeLBaseModule,
+	graphstate: dict,
+	input_ids: jax.Array,
+	model_kwargs: dict,
+	prng_key: jax.Array,
+	generation_config: vInferenceConfig,
+	sampling_params: tp.Optional[SamplingParams] = None,
+) -> tp.Tuple[jax.Array, jax.Array, dict]:
+	"""
+	Prefills `input_ids` on top of an already populated cache and samples one token.
+
+	Used for requests whose prompt prefix was restored from a prefix cache, so only
+	the uncached suffix goes through the model. With `sampling_params`, the token is
+	sampled with the request's own settings instead of `generation_config`'s.
+
+	Returns:
+		tp.Tuple[jax.Array, jax.Array, dict]: The sampled token `[batch, 1]`, whether
+			it finished the sequence, and the updated model kwargs.
+	"""
+	model = nn.merge(graphdef, graphstate)
+	with model.config.mesh:
+		model_outputs = model.forward_selected_logits(input_ids=input_ids, **model_kwargs)
+		logits = model_outputs.logits[:, -1]
+		if sampling_params is not None:
+			# nothing was generated yet, so the penalties have no tokens to look at.
+			next_token = sampling_params.sample(input_ids, logits, 0, 0)
+		elif generation_config.do_sample:
+			logits_warper = generation_config.get_logits_warper()
+			if logits_warper is not None:
+				logits = logits_warper(input_ids, logits, input_ids.shape[-1])
+			next_token = jax.random.categorical(prng_key, logits, axis=-1)
+		else:
+			next_token = jnp.argmax(logits, axis=-1)
+		next_token = next_token.astype(jnp.int32)
+		is_finished = jnp.isin(
+			next_token,
+			jnp.array(generation_config.eos_token_id, dtype=jnp.int32),
+		)
+		model_kwargs = model.update_inputs_for_generation(model_outputs, model_kwargs)
+	return next_token[:, None], is_finished, model_kwargs
+
+
+def continuous_batching_insert_fn(
+	slots_state: SlotsState,
+	model_kwargs: dict,
+	running_token: jax.Array,
+	is_finished: jax.Array,
+	slot: jax.Array,
+	max_new_tokens: jax.Array,
+	sampling_params: tp.Optional[SamplingParams] = None,
+) -> SlotsState:
+	"""
+	Places a freshly prefilled single-row request into decode slot `slot`.
+
+	The cache, attention mask and position ids of the request overwrite the slot's
+	row, and the token sampled during prefill becomes the first generated token.
+	The request's `sampling_params` (one row) replace those of the slot.
+
+	Returns:
+		SlotsState: The slots state holding the admitted request.
+	"""
+
+	def _insert_row(batch_leaf, row_leaf):
+		if not hasattr(batch_leaf, "ndim") or batch_leaf.ndim == 0:
+			return batch_leaf
+		return jax.lax.dynamic_update_slice_in_dim(
+			batch_leaf,
+			row_leaf.astype(batch_leaf.dtype),
+			slot,
+			axis=0,
+		)
+
+	model_kwargs = jax.tree_util.tree_map(
+		_insert_row,
+		slots_state.model_kwargs,
+		model_kwargs,
+	)
+	if sampling_params is not None:
+		slots_state = slots_state.replace(
+			sampling_params=jax.tree_util.tree_map(
+				_insert_row,
+				slots_state.sampling_params,
+				sampling_params,
+			)
+		)
+	first_token = running_token[:, -1:].astype(slots_state.running_token.dtype)
+	sequences = jax.lax.dynamic_update_slice(
+		slots_state.sequences,
+		jnp.zeros((1, slots_state.sequences.shape[1]), dtype=slots_state.sequences.dtype)
+		.at[0, 0]
+		.set(first_token[0, 0]),
+		(slot, 0),
+	)
+	is_finished = is_finished[0] | (max_new_tokens <= 1)
+	return slots_state.replace(
+		sequences=sequences,
+		generated_tokens=slots_state.generated_tokens.at[slot].set(1),
+		max_new_tokens=slots_state.max_new_tokens.at[slot].set(max_new_tokens),
+		running_token=jax.lax.dynamic_update_slice(
+			slots_state.running_token,
+			first_token,
+			(slot, 0),
+		),
+		is_sequence_finished=slots_state.is_sequence_finished.at[slot].set(is_finished),
+		model_kwargs=model_kwargs,
+	)
+
+
+def continuous_batching_iter_fn(
+	graphdef: EasyDeLBaseModule,
+	graphstate: dict,
+	slots_state: SlotsState,
+	generation_config: vInferenceConfig,
+	loop_max_tokens: int,
+) -> SlotsState:
+	"""
+	Runs up to `loop_max_tokens` decode steps over every slot of a continuous batch.
+
+	Each slot tracks its own number of generated tokens and its own token budget,
+	so rows finish independently; the loop exits early once every slot is done.
+	When the state carries `sampling_params`, every slot samples with its own
+	settings and `generation_config`'s sampling fields are ignored.
+
+	Returns:
+		SlotsState: The updated slots state after the interval.
+	"""
+	model = nn.merge(graphdef, graphstate)
+	eos_token_id = jnp.array(generation_config.eos_token_id, dtype=jnp.int32)
+	pad_token_id = jnp.array(generation_config.pad_token_id, dtype=jnp.int32)
+	logits_warper = (
+		generation_config.get_logits_warper() if generation_config.do_sample else None
+	)
+	num_slots, buffer_length = slots_state.sequences.shape
+	rows = jnp.arange(num_slots)
+
+	def cond_fn(carry):
+		step, state = carry
+		return ~jnp.logical_or(jnp.all(state.is_sequence_finished), step >= loop_max_tokens)
+
+	def body_fn(carry):
+		step, state = carry
+		model_outputs = model.forward_selected_logits(
+			input_ids=state.running_token,
+			**state.model_kwargs,
+		)
+		logits = model_outputs.logits[:, -1]
+		if state.sampling_params is not None:
+			next_token = state.sampling_params.sample(
+				state.sequences,
+				logits,
+				state.generated_tokens,
+				state.generated_tokens,
+			)
+		elif generation_config.do_sample:
+			if logits_warper is not None:
+				logits = logits_warper(state.sequences, logits, state.generated_tokens)
+			next_token = jax.random.categorical(state.prng_key, logits, axis=-1)
+		else:
+			next_token = jnp.argmax(logits, axis=-1)
+		finished = state.is_sequence_finished
+		next_token = jnp.where(finished, pad_token_id, next_token).astype(jnp.int32)
+		write_index = jnp.where(finished, buffer_length, state.generated_tokens)
+		sequences = state.sequences.at[rows, write_index].set(next_token, mode="drop")
+		generated_tokens = state.generated_tokens + (~finished).astype(jnp.int32)
+		next_finished = (
+			finished
+			| jnp.isin(next_token, eos_token_id)
+			| (generated_tokens >= state.max_new_tokens)
+		)
+		return step + 1, state.replace(
+			sequences=sequences,
+			generated_tokens=generated_tokens,
+			running_token=next_token[:, None],
+			is_sequence_finished=next_finished,
+			prng_key=jax.random.split(state.prng_key, 2)[0],
+			model_kwargs=model.update_inputs_for_generation(
+				model_outputs,
+				state.model_kwargs,
+			),
+		)
+
+	with model.config.mesh:
+		_, slots_state = jax.lax.while_loop(
+			cond_fn,
+			body_fun=body_fn,
+			init_val=(jnp.array(0, dtype=jnp.int32), slots_state),
+		)
+	return slots_state
+
+
 COMPILED_FUNCS = {}
 
 
@@ -20,6 +20,7 @@ from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from http import HTTPStatus
 
+import numpy as np
 import uvicorn
 from fastapi import APIRouter, FastAPI
 from fastapi.responses import JSONResponse, StreamingResponse
@@ -38,6 +39,7 @@ from .api_models import (
 	DeltaMessage,
 	UsageInfo,
 )
+from .detokenizer import IncrementalDetokenizer
 
 TIMEOUT_KEEP_ALIVE = 5.0
 
@@ -55,12 +57,44 @@ def create_error_response(status_code: HTTPStatus, message: str) -> JSONResponse
 	return JSONResponse({"message": message}, status_code=status_code.value)
 
 
+def create_prefill_buckets(max_length: int, min_length: int = 64) -> tp.List[int]:
+	"""
+	Powers of two from `min_length` up to (and always including) `max_length`.
+
+	Args:
+	    max_length: The longest prompt the inference accepts (`model_prefill_length`).
+	    min_length: The smallest bucket.
+
+	Returns:
+	    tp.List[int]: Sorted prefill lengths.
+	"""
+	buckets = []
+	length = min(min_length, max_length)
+	while length < max_length:
+		buckets.append(length)
+		length *= 2
+	buckets.append(max_length)
+	return buckets
+
+
 class vInferenceApiServer:
 	def __init__(
 		self,
 		inference_map: Dict[str, "vInference"] = None,  # noqa #type:ignore
 		max_workers: int = 10,
+		prefill_buckets: tp.Optional[
+			tp.Union[tp.Sequence[int], tp.Dict[str, tp.Sequence[int]]]
+		] = None,
 	) -> None:
+		"""
+		Arguments:
+		  inference_map: Mapping of model names to their `vInference`.
+		  max_workers: Number of worker threads used for generation.
+		  prefill_buckets: Padded prompt lengths to route requests to, either one list
+		    for every model or a list per model name. Each request is left-padded to
+		    the smallest bucket that fits it instead of `model_prefill_length`.
+		    Defaults to `create_prefill_buckets(inference.model_prefill_length)`.
+		"""
 		from .vinference import vInference
 
 		assert inference_map is not None, "`inference_map` can not be None."
@@ -71,6 +105,21 @@ class vInferenceApiServer:
 
 		self.thread_pool = ThreadPoolExecutor(max_workers=max_workers)
 		self.inference_map = inference_map
+		self.prefill_buckets = {}
+		for name, inference in inference_map.items():
+			buckets = prefill_buckets
+			if isinstance(buckets, dict):
+				buckets = buckets.get(name)
+			if buckets is None:
+				buckets = create_prefill_buckets(inference.model_prefill_length)
+			buckets = sorted(set(int(b) for b in buckets))
+			if buckets[-1] > inference.model_prefill_length:
+				raise ValueError(
+					f"prefill bucket {buckets[-1]} exceeds `model_prefill_length` "
+					f"({inference.model_prefill_length}) of {name}."
+				)
+			self.prefill_buckets[name] = buckets
+		self.detokenizers: tp.Dict[str, IncrementalDetokenizer] = {}
 		self.router = APIRouter()
 		self._endpoints = [
 			EndpointConfig(
@@ -118,7 +167,11 @@ class vInferenceApiServer:
 		try:
 			# Get model and tokenize input asynchronously
 			inference = self._get_inference_model(request.model)
-			ids = self._prepare_tokenized_input(request=request, inference=inference)
+			ids = self._prepare_tokenized_input(
+				request=request,
+				inference=inference,
+				buckets=self.prefill_buckets[request.model],
+			)
 
 			if not request.stream:
 				return await self._handle_non_streaming_response_async(request, inference, ids)
@@ -135,22 +188,70 @@ class vInferenceApiServer:
 			raise RuntimeError(f"Invalid model name: {model_name} is not available")
 		return inference
 
+	def _get_detokenizer(
+		self,
+		model_name: str,
+		inference: "vInference",  # noqa #type:ignore
+	) -> IncrementalDetokenizer:
+		"""Get the incremental detokenizer shared by the streams of a model."""
+		if model_name not in self.detokenizers:
+			self.detokenizers[model_name] = IncrementalDetokenizer(inference.tokenizer)
+		return self.detokenizers[model_name]
+
 	def _prepare_tokenized_input(
 		self,
 		request: ChatCompletionRequest,
 		inference: "vInference",  # noqa #type:ignore
+		buckets: tp.Sequence[int],
 	) -> dict:
-		"""Prepare tokenized input for the model."""
+		"""Tokenize the conversation and left-pad it to the smallest fitting bucket."""
 
-		return inference.tokenizer.apply_chat_template(
+		ids = inference.tokenizer.apply_chat_template(
 			conversation=request.messages,
 			return_dict=True,
 			tokenize=True,
 			return_tensors="np",
 			add_generation_prompt=True,
-			max_length=inference.model_prefill_length,
-			padding="max_length",
 		)
+		return self._pad_to_bucket(
+			input_ids=ids["input_ids"],
+			attention_mask=ids["attention_mask"],
+			buckets=buckets,
+			pad_token_id=inference.generation_config.pad_token_id,
+		)
+
+	@staticmethod
+	def _pad_to_bucket(
+		input_ids: np.ndarray,
+		attention_mask: np.ndarray,
+		buckets: tp.Sequence[int],
+		pad_token_id: int,
+	) -> dict:
+		"""Left-pads `input_ids`/`attention_mask` to the smallest bucket that fits them."""
+		input_ids = np.asarray(input_ids)
+		attention_mask = np.asarray(attention_mask)
+		length = input_ids.shape[-1]
+		bucket = next((b for b in buckets if b >= length), None)
+		if bucket is None:
+			raise ValueError(
+				f"prompt has {length} tokens but the largest prefill bucket is {buckets[-1]}."
+			)
+		num_pads = bucket - length
+		return {
+			"input_ids": np.pad(
+				input_ids,
+				((0, 0), (num_pads, 0)),
+				constant_values=pad_token_id,
+			),
+			"attention_mask": np.pad(attention_mask, ((0, 0), (num_pads, 0))),
+		}
+
+	def precompile_buckets(self):
+		"""Precompiles every prefill bucket of every inference (batch size 1)."""
+		for name, inference in self.inference_map.items():
+			for bucket in self.prefill_buckets[name]:
+				self.logger.info(f"precompiling {name} for prefill length {bucket}")
+				inference.precompile(batch_size=1, input_tokens_length=bucket)
 
 	def _create_usage_info(
 		self,
@@ -192,7 +293,7 @@ class vInferenceApiServer:
 		processing_time = time.perf_counter() - start
 
 		final_response = inference.tokenizer.decode(
-			response.sequences[0][inference.model_prefill_length :],
+			response.sequences[0][ids["input_ids"].shape[-1] :],
 			skip_special_tokens=True,
 		)
 
@@ -239,7 +340,12 @@ class vInferenceApiServer:
 		async def stream_results() -> tp.AsyncGenerator[bytes, tp.Any]:
 			prompt_tokens = inference.count_tokens(request.model_dump()["messages"])
 			start = time.perf_counter()
-			padded_sequence_length = inference.model_prefill_length
+			padded_sequence_length = ids["input_ids"].shape[-1]
+			detokenizer = self._get_detokenizer(request.model, inference)
+			stream = detokenizer.new_stream(
+				ids["input_ids"][0][ids["attention_mask"][0].astype(bool)]
+			)
+			num_streamed_tokens = 0
 
 			# Create generator in thread pool to not block the event loop
 			async def generate_tokens():
@@ -252,22 +358,23 @@ class vInferenceApiServer:
 
 			index = 0
 			async for response in self._aiter_generator(await generate_tokens()):
-				# Process each chunk asynchronously
-				next_slice = slice(
-					padded_sequence_length,
-					padded_sequence_length + inference.generation_config.streaming_chunks,
-				)
-				padded_sequence_length += inference.generation_config.streaming_chunks
+				# Only the tokens generated since the previous chunk are detokenized.
+				num_generated_tokens = int(response.generated_tokens)
+				generated = np.asarray(response.sequences[0, padded_sequence_length:])
+				new_tokens = generated[num_streamed_tokens:num_generated_tokens].tolist()
+				num_streamed_tokens = num_generated_tokens
 
 				processing_time = time.perf_counter() - start
 
 				# Decode tokens in thread pool to avoid blocking
-				decoded_response = await asyncio.get_event_loop().run_in_executor(
-					None,
-					inference.tokenizer.decode,
-					response.sequences[0][next_slice],
-					True,  # skip_special_tokens
-				)
+				decoded_response = (
+					await asyncio.get_event_loop().run_in_executor(
+						None,
+						detokenizer.decode,
+						[stream],
+						[new_tokens],
+					)
+				)[0]
 
 				stream_resp = ChatCompletionStreamResponse(
 					model=request.model,
@@ -304,7 +411,10 @@ class vInferenceApiServer:
 				choices=[
 					ChatCompletionStreamResponseChoice(
 						index=index,
-						delta=DeltaMessage(role="assistant", content=""),
+						delta=DeltaMessage(
+							role="assistant",
+							content=detokenizer.flush([stream])[0],
+						),
 						finish_reason=finish_reason,
 					)
 				],
@@ -397,7 +507,10 @@ class vInferenceApiServer:
 		port=11556,
 		metrics_port: tp.Optional[int] = None,
 		log_level="debug",
+		precompile: bool = True,
 	):
+		if precompile:
+			self.precompile_buckets()
 		metrics_port = metrics_port or (port + 1)
 		start_http_server(metrics_port)
 		uvicorn.run(
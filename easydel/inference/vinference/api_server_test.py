@@ -3,6 +3,10 @@ import json
 import typing as tp
 
 import aiohttp
+import numpy as np
+import pytest
+
+from .api_server import create_prefill_buckets, vInferenceApiServer
 
 
 class ChatCompletionClient:
@@ -32,6 +36,52 @@ class ChatCompletionClient:
 						yield data
 
 
+@pytest.mark.parametrize(
+	"max_length, min_length, expected",
+	[
+		(512, 64, [64, 128, 256, 512]),
+		(100, 16, [16, 32, 64, 100]),
+		(64, 64, [64]),
+		(32, 64, [32]),
+	],
+)
+def test_create_prefill_buckets(max_length, min_length, expected):
+	assert create_prefill_buckets(max_length, min_length) == expected
+
+
+def pad(length, buckets=(4, 8, 16)):
+	input_ids = np.arange(1, length + 1)[None]
+	return vInferenceApiServer._pad_to_bucket(
+		input_ids=input_ids,
+		attention_mask=np.ones_like(input_ids),
+		buckets=buckets,
+		pad_token_id=-1,
+	)
+
+
+@pytest.mark.parametrize("length, bucket", [(1, 4), (4, 4), (5, 8), (9, 16), (16, 16)])
+def test_pad_to_bucket_picks_the_smallest_fitting_bucket(length, bucket):
+	padded = pad(length)
+	assert padded["input_ids"].shape == padded["attention_mask"].shape == (1, bucket)
+
+
+def test_pad_to_bucket_left_pads_the_prompt():
+	padded = pad(5)
+	np.testing.assert_array_equal(padded["input_ids"], [[-1, -1, -1, 1, 2, 3, 4, 5]])
+	np.testing.assert_array_equal(padded["attention_mask"], [[0, 0, 0, 1, 1, 1, 1, 1]])
+
+
+def test_pad_to_bucket_keeps_a_prompt_at_a_bucket_edge_unpadded():
+	padded = pad(8)
+	np.testing.assert_array_equal(padded["input_ids"], np.arange(1, 9)[None])
+	assert padded["attention_mask"].all()
+
+
+def test_pad_to_bucket_rejects_prompts_longer_than_the_largest_bucket():
+	with pytest.raises(ValueError, match="largest prefill bucket is 16"):
+		pad(17)
+
+
 async def main():
 	client = ChatCompletionClient("http://127.0.0.1:7680")
 	messages = [
@@ -0,0 +1,140 @@
+# Copyright 2023 The EASYDEL Author @erfanzar (Erfan Zare Chavoshi).
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Incremental detokenization of streamed token ids."""
+
+import typing as tp
+
+# emitted by byte-level and byte-fallback decoders for incomplete UTF-8 sequences.
+_REPLACEMENT_CHARACTER = "\ufffd"
+
+
+class DetokenizerStream:
+	"""
+	Detokenization state of one sequence.
+
+	`token_ids` only holds the tokens still needed: those of the last emitted delta
+	(`[:read_offset]`), re-decoded as context so merges and leading spaces of the
+	following tokens come out as in a full decode, and those not emitted yet.
+	"""
+
+	__slots__ = ("token_ids", "read_offset")
+
+	def __init__(self, token_ids: tp.List[int], read_offset: int):
+		self.token_ids: tp.List[int] = token_ids
+		self.read_offset: int = read_offset
+
+
+class IncrementalDetokenizer:
+	"""
+	Turns growing token-id sequences into text deltas without re-decoding them.
+
+	Every stream only re-decodes a short window: the tokens of the previous delta
+	plus the new ones. Text is emitted once it is stable, i.e. once the window no
+	longer ends in a replacement character left by a multi-byte character split
+	over several (byte-level or byte-fallback) tokens. All streams updated together
+	are decoded in a single batched call, which fast tokenizers run natively.
+
+	Example:
+	    >>> detokenizer = IncrementalDetokenizer(tokenizer)
+	    >>> stream = detokenizer.new_stream(prompt_ids)
+	    >>> for new_ids in chunks:
+	    ...   print(detokenizer.decode([stream], [new_ids])[0], end="")
+	    >>> print(detokenizer.flush([stream])[0])
+	"""
+
+	def __init__(
+		self,
+		tokenizer,
+		skip_special_tokens: bool = True,
+		num_context_tokens: int = 5,
+	):
+		"""
+		Arguments:
+		  tokenizer: A Hugging Face (fast or slow) tokenizer.
+		  skip_special_tokens: Whether special tokens are dropped from the text.
+		  num_context_tokens: Number of prompt tokens decoded ahead of the first
+		    generated ones, so their leading spaces come out right.
+		"""
+		self.tokenizer = tokenizer
+		self.skip_special_tokens = skip_special_tokens
+		self.num_context_tokens = num_context_tokens
+		self._backend = getattr(tokenizer, "backend_tokenizer", None)
+
+	def new_stream(self, prompt_ids: tp.Sequence[int] = ()) -> DetokenizerStream:
+		"""Starts a stream whose text begins after `prompt_ids`."""
+		context = [int(token) for token in prompt_ids][-self.num_context_tokens :]
+		if self.num_context_tokens == 0:
+			context = []
+		return DetokenizerStream(context, read_offset=len(context))
+
+	def _decode_batch(self, sequences: tp.List[tp.List[int]]) -> tp.List[str]:
+		if self._backend is not None:
+			return self._backend.decode_batch(
+				sequences,
+				skip_special_tokens=self.skip_special_tokens,
+			)
+		return [
+			self.tokenizer.decode(sequence, skip_special_tokens=self.skip_special_tokens)
+			for sequence in sequences
+		]
+
+	def decode(
+		self,
+		streams: tp.Sequence[DetokenizerStream],
+		new_token_ids: tp.Sequence[tp.Sequence[int]],
+	) -> tp.List[str]:
+		"""
+		Appends `new_token_ids[i]` to `streams[i]` and returns the newly stable text of each.
+
+		Args:
+		    streams: Streams to update.
+		    new_token_ids: Tokens generated since the previous update, per stream.
+
+		Returns:
+		    tp.List[str]: The text delta of every stream (possibly empty).
+		"""
+		if len(streams) != len(new_token_ids):
+			raise ValueError(
+				f"got {len(new_token_ids)} token sequences for {len(streams)} streams."
+			)
+		for stream, token_ids in zip(streams, new_token_ids):
+			stream.token_ids.extend(int(token) for token in token_ids)
+		return self._emit(streams, final=False)
+
+	def flush(self, streams: tp.Sequence[DetokenizerStream]) -> tp.List[str]:
+		"""Returns the text still held back by every stream, e.g. once generation ended."""
+		return self._emit(streams, final=True)
+
+	def _emit(self, streams: tp.Sequence[DetokenizerStream], final: bool) -> tp.List[str]:
+		windows = []
+		for stream in streams:
+			windows.append(stream.token_ids[: stream.read_offset])
+			windows.append(stream.token_ids)
+		texts = self._decode_batch(windows)
+
+		deltas = []
+		for idx, stream in enumerate(streams):
+			prefix_text, text = texts[2 * idx], texts[2 * idx + 1]
+			if len(stream.token_ids) == stream.read_offset or (
+				not final
+				and (len(text) <= len(prefix_text) or text.endswith(_REPLACEMENT_CHARACTER))
+			):
+				deltas.append("")
+				continue
+			deltas.append(text[len(prefix_text) :])
+			# the emitted tokens become the context of the next window.
+			stream.token_ids = stream.token_ids[stream.read_offset :]
+			stream.read_offset = len(stream.token_ids)
+		return deltas
@@ -0,0 +1,130 @@
+# Copyright 2023 The EASYDEL Author @erfanzar (Erfan Zare Chavoshi).
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import numpy as np
+import pytest
+
+from .detokenizer import IncrementalDetokenizer
+
+tokenizers = pytest.importorskip("tokenizers")
+transformers = pytest.importorskip("transformers")
+
+TEXT = "Hello wörld! 你好，世界 🙂🚀 naïve café — done."
+
+
+def byte_level_tokenizer():
+	tokenizer = tokenizers.Tokenizer(tokenizers.models.BPE())
+	tokenizer.pre_tokenizer = tokenizers.pre_tokenizers.ByteLevel(add_prefix_space=False)
+	tokenizer.decoder = tokenizers.decoders.ByteLevel()
+	tokenizer.train_from_iterator(
+		["Hello world, hello there."] * 8,
+		tokenizers.trainers.BpeTrainer(
+			vocab_size=300,
+			special_tokens=["<eos>"],
+			initial_alphabet=tokenizers.pre_tokenizers.ByteLevel.alphabet(),
+		),
+	)
+	return transformers.PreTrainedTokenizerFast(
+		tokenizer_object=tokenizer, eos_token="<eos>"
+	)
+
+
+def byte_fallback_tokenizer():
+	# llama-style: metaspace pieces, unknown characters fall back to byte tokens.
+	pieces = ["<unk>", "<eos>"] + [f"<0x{byte:02X}>" for byte in range(256)]
+	pieces += ["▁", "▁Hello", "▁w", "▁done"] + sorted(set("Helowrd!.,—nacf"))
+	tokenizer = tokenizers.Tokenizer(
+		tokenizers.models.BPE(
+			vocab={piece: idx for idx, piece in enumerate(pieces)},
+			merges=[("▁", "w")],
+			unk_token="<unk>",
+			byte_fallback=True,
+		)
+	)
+	tokenizer.pre_tokenizer = tokenizers.pre_tokenizers.Metaspace()
+	tokenizer.decoder = tokenizers.decoders.Sequence(
+		[
+			tokenizers.decoders.Replace("▁", " "),
+			tokenizers.decoders.ByteFallback(),
+			tokenizers.decoders.Fuse(),
+			tokenizers.decoders.Strip(" ", 1, 0),
+		]
+	)
+	tokenizer.add_special_tokens(["<eos>"])
+	return transformers.PreTrainedTokenizerFast(
+		tokenizer_object=tokenizer, eos_token="<eos>"
+	)
+
+
+class SlowTokenizer:
+	"""Exposes only `decode`, like slow tokenizers without a native backend."""
+
+	def __init__(self, tokenizer):
+		self.decode = tokenizer.decode
+
+
+@pytest.fixture(params=[byte_level_tokenizer, byte_fallback_tokenizer])
+def tokenizer(request):
+	return request.param()
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 5])
+@pytest.mark.parametrize("slow", [False, True])
+def test_streamed_text_matches_full_decode(tokenizer, chunk_size, slow):
+	token_ids = tokenizer.encode(TEXT) + [tokenizer.eos_token_id]
+	detokenizer = IncrementalDetokenizer(SlowTokenizer(tokenizer) if slow else tokenizer)
+	stream = detokenizer.new_stream()
+	deltas = []
+	for start in range(0, len(token_ids), chunk_size):
+		deltas += detokenizer.decode([stream], [token_ids[start : start + chunk_size]])
+	deltas += detokenizer.flush([stream])
+	# multi-byte characters are split over several tokens but never emitted partially.
+	assert not any("�" in delta for delta in deltas)
+	assert "".join(deltas) == tokenizer.decode(token_ids, skip_special_tokens=True)
+	assert len(stream.token_ids) < len(token_ids)
+
+
+def test_prompt_context_keeps_leading_spaces():
+	tokenizer = byte_fallback_tokenizer()
+	prompt_ids = tokenizer.encode("Hello")
+	generated = tokenizer.encode(" world")
+	# decoded alone, the generated tokens lose their leading space.
+	assert tokenizer.decode(generated) == "world"
+	detokenizer = IncrementalDetokenizer(tokenizer)
+	stream = detokenizer.new_stream(prompt_ids)
+	text = "".join(detokenizer.decode([stream], [[token]])[0] for token in generated)
+	assert text == " world"
+
+
+def test_decodes_many_streams_in_one_batch(tokenizer):
+	texts = [TEXT, "🙂 Hello", "naïve", ""]
+	token_ids = [tokenizer.encode(text) for text in texts]
+	detokenizer = IncrementalDetokenizer(tokenizer)
+	streams = [detokenizer.new_stream() for _ in texts]
+	outputs = [""] * len(texts)
+	rng = np.random.RandomState(0)
+	offsets = [0] * len(texts)
+	while any(offset < len(ids) for offset, ids in zip(offsets, token_ids)):
+		chunks = []
+		for idx, ids in enumerate(token_ids):
+			size = rng.randint(0, 3)
+			chunks.append(ids[offsets[idx] : offsets[idx] + size])
+			offsets[idx] += size
+		for idx, delta in enumerate(detokenizer.decode(streams, chunks)):
+			outputs[idx] += delta
+	for idx, delta in enumerate(detokenizer.flush(streams)):
+		outputs[idx] += delta
+	assert outputs == [tokenizer.decode(ids) for ids in token_ids]
+	with pytest.raises(ValueError):
+		detokenizer.decode(streams, [[1]])
@@ -101,6 +101,19 @@ class vInferenceMetrics:
 			),
 		)
 
+		# Speculative decoding metrics
+		self.speculative_draft_tokens = Counter(
+			f"{model_name}_model_speculative_draft_tokens_total",
+			"Number of draft tokens proposed and accepted in speculative decoding",
+			["model_name", "status"],  # status: proposed, accepted
+		)
+
+		self.speculative_acceptance_rate = Gauge(
+			f"{model_name}_model_speculative_acceptance_rate",
+			"Fraction of draft tokens accepted in the last speculative request",
+			["model_name"],
+		)
+
 		# Compilation metrics
 		self.compilation_time = Histogram(
 			f"{model_name}_model_compilation_time_seconds",
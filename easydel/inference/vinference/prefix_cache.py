@@ -0,0 +1,230 @@
+# Copyright 2023 The EASYDEL Author @erfanzar (Erfan Zare Chavoshi).
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Host-side radix tree that retains KV-cache segments for shared prompt prefixes."""
+
+import itertools
+import typing as tp
+
+import jax
+from jax import numpy as jnp
+
+
+def _segment_nbytes(segment) -> int:
+	return sum(getattr(leaf, "nbytes", 0) for leaf in jax.tree_util.tree_leaves(segment))
+
+
+def _slice_segment(segment, start: int, stop: tp.Optional[int] = None):
+	return jax.tree_util.tree_map(lambda leaf: leaf[start:stop], segment)
+
+
+def concatenate_segments(segments: tp.Sequence[tp.Any]):
+	"""Concatenates segments returned by `RadixPrefixCache.match_prefix` along the token axis."""
+	if len(segments) == 1:
+		return segments[0]
+	return jax.tree_util.tree_map(
+		lambda *leaves: jnp.concatenate(leaves, axis=0),
+		*segments,
+	)
+
+
+class _RadixNode:
+	__slots__ = ("tokens", "segment", "children", "parent", "last_access", "nbytes")
+
+	def __init__(self, tokens, segment, parent):
+		self.tokens: tp.Tuple[int, ...] = tokens
+		self.segment = segment
+		self.children: tp.Dict[int, "_RadixNode"] = {}
+		self.parent: tp.Optional["_RadixNode"] = parent
+		self.last_access: int = 0
+		self.nbytes: int = _segment_nbytes(segment) if segment is not None else 0
+
+
+class RadixPrefixCache:
+	"""
+	Radix tree keyed by token ids whose edges own the KV-cache segment of their tokens.
+
+	A segment is any pytree whose leaves share a leading token axis (for vInference a
+	list of per-layer `(key, value)` arrays of shape `[tokens, heads, dim]`). Looking up
+	a prompt returns the segments covering its longest cached prefix; inserting a
+	prompt stores only the part that is not cached yet. When the retained segments
+	exceed `capacity_bytes`, least-recently-used leaves are evicted.
+
+	Example:
+	    >>> cache = RadixPrefixCache(capacity_bytes=2**30)
+	    >>> cache.insert(prompt_ids, segment)
+	    >>> matched, segments = cache.match_prefix(other_prompt_ids)
+	"""
+
+	def __init__(self, capacity_bytes: int):
+		"""
+		Arguments:
+		  capacity_bytes: Memory budget for the retained segments.
+		"""
+		if capacity_bytes <= 0:
+			raise ValueError("`capacity_bytes` must be positive.")
+		self.capacity_bytes = capacity_bytes
+		self._root = _RadixNode((), None, None)
+		self._clock = itertools.count(1)
+		self.total_bytes = 0
+		self.num_queries = 0
+		self.num_hits = 0
+		self.query_tokens = 0
+		self.hit_tokens = 0
+
+	@property
+	def hit_rate(self) -> float:
+		return self.num_hits / self.num_queries if self.num_queries else 0.0
+
+	@property
+	def token_hit_rate(self) -> float:
+		return self.hit_tokens / self.query_tokens if self.query_tokens else 0.0
+
+	@property
+	def num_cached_tokens(self) -> int:
+		return sum(len(node.tokens) for node in self._iter_nodes())
+
+	def match_prefix(
+		self,
+		token_ids: tp.Sequence[int],
+	) -> tp.Tuple[int, tp.List[tp.Any]]:
+		"""
+		Finds the longest cached prefix of `token_ids`.
+
+		Returns:
+		    tp.Tuple[int, tp.List]: The matched length and the segments covering it
+		    (in order); use `concatenate_segments` to merge them.
+		"""
+		token_ids = tuple(int(t) for t in token_ids)
+		now = next(self._clock)
+		node, position, segments = self._root, 0, []
+		while position < len(token_ids):
+			child = node.children.get(token_ids[position])
+			if child is None:
+				break
+			shared = _common_length(child.tokens, token_ids[position:])
+			child.last_access = now
+			if shared < len(child.tokens):
+				segments.append(_slice_segment(child.segment, 0, shared))
+				position += shared
+				break
+			segments.append(child.segment)
+			position += shared
+			node = child
+		self._touch(node, now)
+		self.num_queries += 1
+		self.query_tokens += len(token_ids)
+		if position > 0:
+			self.num_hits += 1
+			self.hit_tokens += position
+		return position, segments
+
+	def insert(self, token_ids: tp.Sequence[int], segment, start: int = 0) -> int:
+		"""
+		Retains the KV segment of `token_ids`.
+
+		Arguments:
+		    token_ids: Tokens of the full prefix.
+		    segment: Segment whose leading axis covers `token_ids[start:]`.
+		    start: Offset of `segment` within `token_ids`; `token_ids[:start]` must
+		      already be cached (typically the length returned by `match_prefix`).
+
+		Returns:
+		    int: Number of newly cached tokens.
+		"""
+		token_ids = tuple(int(t) for t in token_ids)
+		now = next(self._clock)
+		node, position = self._root, 0
+		while position < len(token_ids):
+			child = node.children.get(token_ids[position])
+			if child is None:
+				break
+			shared = _common_length(child.tokens, token_ids[position:])
+			if shared < len(child.tokens):
+				child = self._split(child, shared)
+			child.last_access = now
+			node = child
+			position += shared
+		if position < start or position == len(token_ids):
+			self._touch(node, now)
+			return 0
+		leaf = _RadixNode(
+			token_ids[position:],
+			_slice_segment(segment, position - start),
+			node,
+		)
+		leaf.last_access = now
+		node.children[leaf.tokens[0]] = leaf
+		self.total_bytes += leaf.nbytes
+		self._touch(node, now)
+		self.evict()
+		return len(leaf.tokens) if leaf.parent is not None else 0
+
+	def evict(self, target_bytes: tp.Optional[int] = None):
+		"""Evicts least-recently-used leaves until at most `target_bytes` are retained."""
+		target_bytes = self.capacity_bytes if target_bytes is None else target_bytes
+		while self.total_bytes > target_bytes:
+			leaves = [node for node in self._iter_nodes() if not node.children]
+			if not leaves:
+				break
+			victim = min(leaves, key=lambda node: node.last_access)
+			del victim.parent.children[victim.tokens[0]]
+			victim.parent = None
+			self.total_bytes -= victim.nbytes
+
+	def reset(self):
+		"""Drops every cached segment and clears the hit statistics."""
+		self._root = _RadixNode((), None, None)
+		self.total_bytes = 0
+		self.num_queries = 0
+		self.num_hits = 0
+		self.query_tokens = 0
+		self.hit_tokens = 0
+
+	def _split(self, node: _RadixNode, length: int) -> _RadixNode:
+		parent = node.parent
+		head = _RadixNode(
+			node.tokens[:length], _slice_segment(node.segment, 0, length), parent
+		)
+		head.last_access = node.last_access
+		parent.children[head.tokens[0]] = head
+		node.tokens = node.tokens[length:]
+		node.segment = _slice_segment(node.segment, length)
+		node.parent = head
+		self.total_bytes -= node.nbytes
+		node.nbytes = _segment_nbytes(node.segment)
+		self.total_bytes += node.nbytes + head.nbytes
+		head.children[node.tokens[0]] = node
+		return head
+
+	def _touch(self, node: _RadixNode, now: int):
+		while node is not None and node is not self._root:
+			node.last_access = now
+			node = node.parent
+
+	def _iter_nodes(self) -> tp.Iterator[_RadixNode]:
+		stack = list(self._root.children.values())
+		while stack:
+			node = stack.pop()
+			yield node
+			stack.extend(node.children.values())
+
+
+def _common_length(a: tp.Sequence[int], b: tp.Sequence[int]) -> int:
+	length = 0
+	for x, y in zip(a, b):
+		if x != y:
+			break
+		length += 1
+	return length
@@ -0,0 +1,142 @@
+# Copyright 2023 The EASYDEL Author @erfanzar (Erfan Zare Chavoshi).
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import numpy as np
+import pytest
+from flax import nnx as nn
+from jax import numpy as jnp
+
+import easydel as ed
+
+from .prefix_cache import RadixPrefixCache, concatenate_segments
+from .scheduler import vInferenceScheduler
+
+
+def segment_for(tokens):
+	# a fake KV segment: row i stores token i, 4 bytes per token.
+	return np.asarray(tokens, dtype=np.int32)
+
+
+class TestRadixPrefixCache:
+	def test_miss_then_hit(self):
+		cache = RadixPrefixCache(capacity_bytes=1024)
+		assert cache.match_prefix([1, 2, 3]) == (0, [])
+		cache.insert([1, 2, 3, 4], segment_for([1, 2, 3, 4]))
+		matched, segments = cache.match_prefix([1, 2, 3, 9])
+		assert matched == 3
+		np.testing.assert_array_equal(concatenate_segments(segments), [1, 2, 3])
+		assert cache.num_hits == 1
+		assert cache.num_queries == 2
+		assert cache.hit_rate == 0.5
+
+	def test_split_and_shared_prefix(self):
+		cache = RadixPrefixCache(capacity_bytes=1024)
+		cache.insert([1, 2, 3, 4], segment_for([1, 2, 3, 4]))
+		assert cache.insert([1, 2, 7, 8], segment_for([1, 2, 7, 8])) == 2
+		assert cache.num_cached_tokens == 6
+		assert cache.total_bytes == 6 * 4
+		for prompt in ([1, 2, 3, 4], [1, 2, 7, 8]):
+			matched, segments = cache.match_prefix(prompt)
+			assert matched == 4
+			np.testing.assert_array_equal(concatenate_segments(segments), prompt)
+
+	def test_insert_with_offset(self):
+		cache = RadixPrefixCache(capacity_bytes=1024)
+		cache.insert([1, 2], segment_for([1, 2]))
+		assert cache.insert([1, 2, 5, 6], segment_for([5, 6]), start=2) == 2
+		# a gap before `start` stores nothing.
+		assert cache.insert([8, 9, 10], segment_for([10]), start=2) == 0
+		matched, segments = cache.match_prefix([1, 2, 5, 6])
+		np.testing.assert_array_equal(concatenate_segments(segments), [1, 2, 5, 6])
+
+	def test_lru_eviction(self):
+		cache = RadixPrefixCache(capacity_bytes=3 * 4 * 2)
+		cache.insert([1, 2, 3], segment_for([1, 2, 3]))
+		cache.insert([4, 5, 6], segment_for([4, 5, 6]))
+		cache.match_prefix([1, 2, 3])
+		cache.insert([7, 8, 9], segment_for([7, 8, 9]))
+		assert cache.total_bytes <= cache.capacity_bytes
+		assert cache.match_prefix([4, 5, 6])[0] == 0
+		assert cache.match_prefix([1, 2, 3])[0] == 3
+		assert cache.match_prefix([7, 8, 9])[0] == 3
+
+	def test_reset(self):
+		cache = RadixPrefixCache(capacity_bytes=1024)
+		cache.insert([1, 2, 3], segment_for([1, 2, 3]))
+		cache.match_prefix([1, 2, 3])
+		cache.reset()
+		assert cache.total_bytes == 0
+		assert cache.num_queries == cache.num_hits == 0
+		assert cache.hit_rate == cache.token_hit_rate == 0.0
+		assert cache.match_prefix([1, 2, 3]) == (0, [])
+
+	def test_invalid_capacity(self):
+		with pytest.raises(ValueError):
+			RadixPrefixCache(capacity_bytes=0)
+
+
+def test_scheduler_reuses_cached_prefix():
+	config = ed.LlamaConfig(
+		vocab_size=128,
+		hidden_size=64,
+		intermediate_size=128,
+		num_hidden_layers=2,
+		num_attention_heads=4,
+		num_key_value_heads=2,
+		max_position_embeddings=128,
+		attn_mechanism=ed.AttentionMechanisms.VANILLA,
+	)
+	model = ed.LlamaForCausalLM(
+		config=config,
+		dtype=jnp.float32,
+		param_dtype=jnp.float32,
+		rngs=nn.Rngs(0),
+	)
+	inference = ed.vInference(
+		model=model,
+		processor_class=None,
+		inference_name="prefix-cache-test",
+		generation_config=ed.vInferenceConfig(
+			max_new_tokens=6,
+			streaming_chunks=3,
+			do_sample=False,
+			bos_token_id=0,
+			eos_token_id=1,
+			pad_token_id=2,
+		),
+	)
+	prefix_cache = RadixPrefixCache(capacity_bytes=2**20)
+	scheduler = vInferenceScheduler(
+		inference,
+		max_batch_size=2,
+		prefill_length=16,
+		prefix_cache=prefix_cache,
+	)
+	system_prompt = [5, 6, 7, 8, 9, 10, 11, 12]
+	prompts = [
+		system_prompt + [20, 21],
+		system_prompt + [30],
+		system_prompt + [40, 41, 42],
+	]
+	requests = [scheduler.submit(prompt) for prompt in prompts]
+	for _ in scheduler.run():
+		...
+
+	assert prefix_cache.hit_tokens >= 2 * len(system_prompt)
+	for prompt, request in zip(prompts, requests):
+		sequence = list(prompt)
+		for _ in range(len(request.generated_ids)):
+			logits = model(input_ids=jnp.array([sequence])).logits
+			sequence.append(int(jnp.argmax(logits[0, -1])))
+		assert request.generated_ids == sequence[len(prompt) :]
@@ -0,0 +1,432 @@
+# Copyright 2023 The EASYDEL Author @erfanzar (Erfan Zare Chavoshi).
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Iteration-level (continuous batching) request scheduler for vInference."""
+
+import collections
+import itertools
+import threading
+import time
+import typing as tp
+from dataclasses import dataclass, field
+from uuid import uuid4
+
+import jax
+import numpy as np
+from jax import numpy as jnp
+
+from easydel.utils.helpers import get_logger
+
+from ..utils import SamplingParams, SlotsState
+from ._fn import (
+	continuous_batching_insert_fn,
+	continuous_batching_iter_fn,
+	continuous_batching_prefill_fn,
+	get_compiled_funcs,
+)
+from .prefix_cache import RadixPrefixCache, concatenate_segments
+
+if tp.TYPE_CHECKING:
+	from .vinference import vInference
+else:
+	vInference = tp.Any
+
+logger = get_logger(__name__)
+
+# cache view arrays retained by the prefix cache, each with a leading token axis per row.
+_SEGMENT_FIELDS = ("key", "value", "key_scale", "value_scale")
+
+
+@dataclass
+class vInferenceRequest:
+	"""
+	A single generation request tracked by `vInferenceScheduler`.
+
+	Attributes:
+	    prompt_ids: Prompt token ids (unpadded).
+	    max_new_tokens: Token budget of this request.
+	    request_id: Unique identifier of the request.
+	    generated_ids: Tokens generated so far, updated after every interval.
+	    finished: Whether the request has been evicted from its slot.
+	    finish_reason: `"stop"` if an eos token was produced, `"length"` otherwise.
+	    sampling_params: Sampling settings of this request (a single row).
+	"""
+
+	prompt_ids: tp.List[int]
+	max_new_tokens: int
+	sampling_params: tp.Optional[SamplingParams] = None
+	request_id: str = field(default_factory=lambda: uuid4().hex)
+	generated_ids: tp.List[int] = field(default_factory=list)
+	finished: bool = False
+	finish_reason: tp.Optional[str] = None
+	submitted_at: float = field(default_factory=time.perf_counter)
+	finished_at: tp.Optional[float] = None
+
+
+class vInferenceScheduler:
+	"""
+	Continuous-batching scheduler on top of a `vInference` instance.
+
+	The scheduler owns a fixed batch of `max_batch_size` decode slots. Between
+	`streaming_chunks` intervals, queued requests are prefilled (with the
+	precompiled `basic_generation_first_iter_fn` of the wrapped `vInference`)
+	and spliced into free slots, and rows that produced an eos token or reached
+	their own `max_new_tokens` are evicted so their slot can be reused.
+
+	Every request carries its own `SamplingParams` (temperature, top-k/top-p,
+	penalties and seed, defaulting to `generation_config`), which live in the
+	slots state as traced arrays; heterogeneous requests therefore share a single
+	compiled decode function.
+
+	With a `prefix_cache`, the KV of every prefilled prompt is retained in a radix
+	tree; later prompts sharing a cached prefix restore it into their cache and
+	only prefill the uncached suffix (padded to a power-of-two bucket).
+
+	Example:
+	    >>> scheduler = vInferenceScheduler(inference, max_batch_size=8)
+	    >>> request = scheduler.submit(tokenizer.encode("hello"), max_new_tokens=32)
+	    >>> for finished in scheduler.run():
+	    ...   print(finished.request_id, tokenizer.decode(finished.generated_ids))
+	"""
+
+	def __init__(
+		self,
+		inference: vInference,
+		max_batch_size: int = 8,
+		prefill_length: tp.Optional[int] = None,
+		prefix_cache: tp.Optional[RadixPrefixCache] = None,
+		seed: int = 0,
+	):
+		"""
+		Arguments:
+		  inference: The vInference used for prefill and holding the model.
+		  max_batch_size: Number of concurrent decode slots.
+		  prefill_length: Padded prompt length used for prefill
+		    (defaults to `inference.model_prefill_length`).
+		  prefix_cache: Optional radix tree retaining prompt KV segments for reuse
+		    (not available for models with sliding-window caches).
+		  seed: Base seed of the requests submitted without one; their seeds are
+		    derived from it and the submission order, so runs are reproducible.
+		"""
+		if max_batch_size <= 0:
+			raise ValueError("`max_batch_size` must be positive.")
+		if inference.is_speculative:
+			raise ValueError("`vInferenceScheduler` does not support speculative decoding.")
+		if prefix_cache is not None and any(
+			window is not None
+			for window in inference.model._get_cache_sliding_windows() or ()
+		):
+			raise ValueError(
+				"`prefix_cache` can not reuse the ring-buffer caches of sliding-window layers."
+			)
+		self.inference = inference
+		self.max_batch_size = max_batch_size
+		self.prefill_length = prefill_length or inference.model_prefill_length
+		self.generation_config = inference.generation_config
+		self.prefix_cache = prefix_cache
+		self.seed = seed
+		self._num_submitted = itertools.count()
+		self._queue: tp.Deque[vInferenceRequest] = collections.deque()
+		self._lock = threading.Lock()
+		self._slots: tp.List[tp.Optional[vInferenceRequest]] = [None] * max_batch_size
+		self._slots_state: tp.Optional[SlotsState] = None
+		self._init_slots_state = jax.jit(self._init_slots_state_non_jit)
+		self._init_prefill_kwargs = jax.jit(self._prepare_model_kwargs, static_argnums=(0,))
+		self._prefill_fn = jax.jit(continuous_batching_prefill_fn, static_argnums=(0, 5))
+		self._insert_fn = jax.jit(continuous_batching_insert_fn, donate_argnums=(0,))
+		self._iter_fn = jax.jit(
+			continuous_batching_iter_fn,
+			static_argnums=(0, 3, 4),
+			donate_argnums=(2,),
+		)
+
+	@property
+	def num_active(self) -> int:
+		return sum(request is not None for request in self._slots)
+
+	@property
+	def num_pending(self) -> int:
+		with self._lock:
+			return len(self._queue)
+
+	@property
+	def has_unfinished_requests(self) -> bool:
+		return self.num_active > 0 or self.num_pending > 0
+
+	def submit(
+		self,
+		prompt_ids: tp.Sequence[int],
+		max_new_tokens: tp.Optional[int] = None,
+		temperature: tp.Optional[float] = None,
+		top_p: tp.Optional[float] = None,
+		top_k: tp.Optional[int] = None,
+		repetition_penalty: float = 1.0,
+		presence_penalty: float = 0.0,
+		seed: tp.Optional[int] = None,
+	) -> vInferenceRequest:
+		"""
+		Queues a request for admission at the next scheduling step (thread-safe).
+
+		Args:
+		    prompt_ids: Prompt token ids.
+		    max_new_tokens: Token budget for this request, at most
+		      `generation_config.max_new_tokens`.
+		    temperature: Sampling temperature (`0` decodes greedily), defaults to
+		      `generation_config`'s.
+		    top_p: Nucleus sampling mass, defaults to `generation_config`'s.
+		    top_k: Number of candidate tokens, defaults to `generation_config`'s.
+		    repetition_penalty: Penalty of tokens this request already generated.
+		    presence_penalty: Value subtracted from tokens this request already generated.
+		    seed: Sampling seed, derived from the scheduler's `seed` when None.
+
+		Returns:
+		    vInferenceRequest: The tracked request object.
+		"""
+		prompt_ids = [int(token) for token in np.asarray(prompt_ids).reshape(-1)]
+		if max_new_tokens is None:
+			max_new_tokens = self.generation_config.max_new_tokens
+		if len(prompt_ids) == 0 or len(prompt_ids) > self.prefill_length:
+			raise ValueError(
+				f"prompt length must be in [1, {self.prefill_length}], got {len(prompt_ids)}."
+			)
+		if not 0 < max_new_tokens <= self.generation_config.max_new_tokens:
+			raise ValueError(
+				"`max_new_tokens` must be in "
+				f"[1, {self.generation_config.max_new_tokens}], got {max_new_tokens}."
+			)
+		if seed is None:
+			seed = self._request_seed(next(self._num_submitted))
+		defaults = SamplingParams.from_generation_config(
+			self.generation_config,
+			1,
+			seed=seed,
+		)
+		sampling_params = SamplingParams.create(
+			batch_size=1,
+			temperature=defaults.temperature if temperature is None else temperature,
+			top_p=defaults.top_p if top_p is None else top_p,
+			top_k=defaults.top_k if top_k is None else top_k,
+			repetition_penalty=repetition_penalty,
+			presence_penalty=presence_penalty,
+			seed=seed,
+		)
+		request = vInferenceRequest(
+			prompt_ids=prompt_ids,
+			max_new_tokens=max_new_tokens,
+			sampling_params=sampling_params,
+		)
+		with self._lock:
+			self._queue.append(request)
+		self.inference._metrics_increase_queue()
+		return request
+
+	def _request_seed(self, index: int) -> int:
+		state = np.random.SeedSequence([self.seed, index]).generate_state(1)
+		return int(state[0] >> 1)
+
+	def step(self) -> tp.List[vInferenceRequest]:
+		"""
+		Runs one scheduling iteration: admit, decode one interval, evict.
+
+		Returns:
+		    tp.List[vInferenceRequest]: Requests that finished during this iteration.
+		"""
+		self._admit()
+		if self.num_active == 0:
+			return []
+		with self.inference.mesh:
+			self._slots_state = self._iter_fn(
+				self.inference.graphdef,
+				self.inference.graphstate,
+				self._slots_state,
+				self.generation_config,
+				self.generation_config.streaming_chunks,
+			)
+		return self._evict()
+
+	def run(self) -> tp.Generator[vInferenceRequest, None, None]:
+		"""Steps until every submitted request is done, yielding them as they finish."""
+		while self.has_unfinished_requests:
+			yield from self.step()
+
+	def _prepare_model_kwargs(self, batch_size: int) -> dict:
+		input_ids = jnp.full(
+			(batch_size, self.prefill_length),
+			self.generation_config.pad_token_id,
+			dtype=jnp.int32,
+		)
+		model_kwargs = self.inference.model.prepare_inputs_for_generation(
+			input_ids=input_ids,
+			max_length=self.prefill_length + self.generation_config.max_new_tokens,
+			attention_mask=jnp.ones_like(input_ids),
+		)
+		model_kwargs["position_ids"] = model_kwargs["position_ids"][:, -1:]
+		return model_kwargs
+
+	def _init_slots_state_non_jit(self, rng) -> SlotsState:
+		pad_token_id = self.generation_config.pad_token_id
+		max_new_tokens = self.generation_config.max_new_tokens
+		model_kwargs = self._prepare_model_kwargs(self.max_batch_size)
+		return SlotsState(
+			sequences=jnp.full(
+				(self.max_batch_size, max_new_tokens),
+				pad_token_id,
+				dtype=jnp.int32,
+			),
+			generated_tokens=jnp.zeros((self.max_batch_size,), dtype=jnp.int32),
+			max_new_tokens=jnp.zeros((self.max_batch_size,), dtype=jnp.int32),
+			running_token=jnp.full((self.max_batch_size, 1), pad_token_id, dtype=jnp.int32),
+			is_sequence_finished=jnp.ones((self.max_batch_size,), dtype=jnp.bool_),
+			prng_key=rng,
+			model_kwargs=model_kwargs,
+			sampling_params=SamplingParams.create(self.max_batch_size, rng=rng),
+		)
+
+	def _prefill(self, request: vInferenceRequest):
+		if self.prefix_cache is not None:
+			# keep at least one prompt token for prefill to produce the next-token logits.
+			matched, segments = self.prefix_cache.match_prefix(request.prompt_ids[:-1])
+			if matched > 0:
+				return self._prefill_suffix(request, matched, concatenate_segments(segments))
+		num_pads = self.prefill_length - len(request.prompt_ids)
+		input_ids = np.full((1, self.prefill_length), self.generation_config.pad_token_id)
+		input_ids[0, num_pads:] = request.prompt_ids
+		attention_mask = np.zeros((1, self.prefill_length), dtype=np.int32)
+		attention_mask[0, num_pads:] = 1
+		self.inference.precompile(batch_size=1, input_tokens_length=self.prefill_length)
+		generate_func, _ = get_compiled_funcs(
+			batch_size=1,
+			input_tokens_length=self.prefill_length,
+			id=self.inference._uuid4,
+		)
+		state = self.inference._prepare_generation_state(
+			input_ids=jnp.asarray(input_ids, dtype=jnp.int32),
+			attention_mask=jnp.asarray(attention_mask, dtype=jnp.int32),
+			batch_size=1,
+			sequence_length=self.prefill_length,
+			model_kwargs={"sampling_params": request.sampling_params},
+		)
+		state = generate_func(
+			*self.inference._prepare_function_inputs(state, generate_func)
+		)
+		if self.prefix_cache is not None:
+			self._retain_prompt(
+				request.prompt_ids,
+				state.model_kwargs["past_key_values"],
+				np.arange(num_pads, self.prefill_length),
+			)
+		return state.model_kwargs, state.running_token, state.is_sequence_finished
+
+	def _prefill_suffix(self, request: vInferenceRequest, matched: int, segment):
+		prompt_length = len(request.prompt_ids)
+		suffix_length = prompt_length - matched
+		bucket = min(
+			1 << (suffix_length - 1).bit_length(),
+			self.prefill_length - matched,
+		)
+		num_pads = bucket - suffix_length
+		model_kwargs = self._init_prefill_kwargs(1)
+		cache = model_kwargs["past_key_values"]
+		for view, arrays in zip(cache.views, segment):
+			for name, array in arrays.items():
+				setattr(view, name, getattr(view, name).at[0, :matched].set(array))
+			view.index = jnp.full_like(view.index, matched)
+		model_kwargs["attention_mask"] = (
+			model_kwargs["attention_mask"].at[0, matched : matched + num_pads].set(0)
+		)
+		model_kwargs["position_ids"] = jnp.array(
+			[[matched] * num_pads + list(range(matched, prompt_length))],
+			dtype=jnp.int32,
+		)
+		input_ids = jnp.array(
+			[[self.generation_config.pad_token_id] * num_pads + request.prompt_ids[matched:]],
+			dtype=jnp.int32,
+		)
+		with self.inference.mesh:
+			running_token, is_finished, model_kwargs = self._prefill_fn(
+				self.inference.graphdef,
+				self.inference.graphstate,
+				input_ids,
+				model_kwargs,
+				self.inference._rng_generator.rng,
+				self.generation_config,
+				request.sampling_params,
+			)
+		self._retain_prompt(
+			request.prompt_ids,
+			model_kwargs["past_key_values"],
+			np.arange(matched + num_pads, matched + bucket),
+			start=matched,
+		)
+		return model_kwargs, running_token, is_finished
+
+	def _retain_prompt(self, prompt_ids, cache, positions: np.ndarray, start: int = 0):
+		positions = jnp.asarray(positions, dtype=jnp.int32)
+		# int8 caches also retain their per-token scales.
+		segment = [
+			{
+				name: getattr(view, name)[0, positions]
+				for name in _SEGMENT_FIELDS
+				if getattr(view, name) is not None
+			}
+			for view in cache.views
+		]
+		self.prefix_cache.insert(prompt_ids, segment, start=start)
+
+	def _admit(self):
+		free_slots = [slot for slot, request in enumerate(self._slots) if request is None]
+		for slot in free_slots:
+			with self._lock:
+				if not self._queue:
+					break
+				request = self._queue.popleft()
+			if self._slots_state is None:
+				self._slots_state = self._init_slots_state(self.inference._rng_generator.rng)
+			model_kwargs, running_token, is_finished = self._prefill(request)
+			with self.inference.mesh:
+				self._slots_state = self._insert_fn(
+					self._slots_state,
+					model_kwargs,
+					running_token,
+					is_finished,
+					jnp.array(slot, dtype=jnp.int32),
+					jnp.array(request.max_new_tokens, dtype=jnp.int32),
+					request.sampling_params,
+				)
+			self._slots[slot] = request
+			logger.debug(f"admitted request {request.request_id} into slot {slot}")
+
+	def _evict(self) -> tp.List[vInferenceRequest]:
+		sequences, generated_tokens, is_finished = jax.device_get(
+			(
+				self._slots_state.sequences,
+				self._slots_state.generated_tokens,
+				self._slots_state.is_sequence_finished,
+			)
+		)
+		eos_token_id = np.asarray(self.generation_config.eos_token_id).reshape(-1)
+		finished = []
+		for slot, request in enumerate(self._slots):
+			if request is None:
+				continue
+			request.generated_ids = sequences[slot, : generated_tokens[slot]].tolist()
+			if is_finished[slot]:
+				request.finished = True
+				request.finished_at = time.perf_counter()
+				last_token = request.generated_ids[-1] if request.generated_ids else None
+				request.finish_reason = "stop" if last_token in eos_token_id else "length"
+				self._slots[slot] = None
+				self.inference._metrics_decrease_queue()
+				finished.append(request)
+		return finished
@@ -0,0 +1,164 @@
+# Copyright 2023 The EASYDEL Author @erfanzar (Erfan Zare Chavoshi).
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import numpy as np
+import pytest
+from flax import nnx as nn
+from jax import numpy as jnp
+
+import easydel as ed
+
+from .scheduler import vInferenceScheduler
+
+PREFILL_LENGTH = 8
+EOS_TOKEN_ID = 1
+PAD_TOKEN_ID = 2
+
+
+@pytest.fixture(scope="module")
+def inference():
+	config = ed.LlamaConfig(
+		vocab_size=128,
+		hidden_size=64,
+		intermediate_size=128,
+		num_hidden_layers=2,
+		num_attention_heads=4,
+		num_key_value_heads=2,
+		max_position_embeddings=128,
+		attn_mechanism=ed.AttentionMechanisms.VANILLA,
+	)
+	model = ed.LlamaForCausalLM(
+		config=config,
+		dtype=jnp.float32,
+		param_dtype=jnp.float32,
+		rngs=nn.Rngs(0),
+	)
+	return ed.vInference(
+		model=model,
+		processor_class=None,
+		inference_name="scheduler-test",
+		generation_config=ed.vInferenceConfig(
+			max_new_tokens=12,
+			streaming_chunks=4,
+			do_sample=False,
+			bos_token_id=0,
+			eos_token_id=EOS_TOKEN_ID,
+			pad_token_id=PAD_TOKEN_ID,
+		),
+	)
+
+
+def greedy_reference(model, prompt, max_new_tokens):
+	sequence = list(prompt)
+	for _ in range(max_new_tokens):
+		logits = model(input_ids=jnp.array([sequence])).logits
+		next_token = int(jnp.argmax(logits[0, -1]))
+		sequence.append(next_token)
+		if next_token == EOS_TOKEN_ID:
+			break
+	return sequence[len(prompt) :]
+
+
+def test_scheduler_matches_greedy_reference(inference):
+	scheduler = vInferenceScheduler(
+		inference,
+		max_batch_size=2,
+		prefill_length=PREFILL_LENGTH,
+	)
+	rng = np.random.RandomState(0)
+	budgets = [12, 3, 7, 12, 5]
+	prompts = [
+		rng.randint(3, 128, size=rng.randint(2, PREFILL_LENGTH + 1)).tolist()
+		for _ in budgets
+	]
+	requests = [scheduler.submit(p, b) for p, b in zip(prompts, budgets)]
+	finished = list(scheduler.run())
+
+	assert len(finished) == len(requests)
+	assert not scheduler.has_unfinished_requests
+	# the 3-token request must leave its slot before the first 12-token one.
+	order = [request.request_id for request in finished]
+	assert order.index(requests[1].request_id) < order.index(requests[0].request_id)
+	for prompt, budget, request in zip(prompts, budgets, requests):
+		assert request.finished
+		assert len(request.generated_ids) <= budget
+		expected = greedy_reference(inference.model, prompt, budget)
+		assert request.generated_ids == expected
+		expected_reason = "stop" if expected[-1] == EOS_TOKEN_ID else "length"
+		assert request.finish_reason == expected_reason
+
+
+def test_scheduler_admits_between_intervals(inference):
+	scheduler = vInferenceScheduler(
+		inference,
+		max_batch_size=2,
+		prefill_length=PREFILL_LENGTH,
+	)
+	first = scheduler.submit([5, 6, 7], max_new_tokens=12)
+	scheduler.step()
+	assert scheduler.num_active == 1
+	second = scheduler.submit([9, 10], max_new_tokens=4)
+	scheduler.step()
+	assert scheduler.num_active <= 2
+	for _ in scheduler.run():
+		...
+	assert first.generated_ids == greedy_reference(inference.model, [5, 6, 7], 12)
+	assert second.generated_ids == greedy_reference(inference.model, [9, 10], 4)
+
+
+def test_scheduler_serves_per_request_sampling_params(inference):
+	def run(batch):
+		scheduler = vInferenceScheduler(
+			inference,
+			max_batch_size=len(batch),
+			prefill_length=PREFILL_LENGTH,
+		)
+		requests = [scheduler.submit(prompt, 12, **kwargs) for prompt, kwargs in batch]
+		list(scheduler.run())
+		return [request.generated_ids for request in requests]
+
+	sampled = ([5, 6, 7], dict(temperature=1.5, top_k=20, presence_penalty=0.5, seed=3))
+	greedy = ([9, 10], dict(temperature=0.0))
+	mixed = run([sampled, greedy])
+	assert mixed[1] == greedy_reference(inference.model, [9, 10], 12)
+	# a seeded request samples the same tokens whatever it is batched with.
+	assert run([greedy, sampled])[1] == mixed[0]
+	assert run([sampled])[0] == mixed[0]
+
+
+def test_scheduler_derives_default_seeds_from_its_seed(inference):
+	def seeds(seed):
+		scheduler = vInferenceScheduler(
+			inference,
+			max_batch_size=1,
+			prefill_length=PREFILL_LENGTH,
+			seed=seed,
+		)
+		requests = [scheduler.submit([5, 6], temperature=1.0) for _ in range(3)]
+		return [int(request.sampling_params.seed[0]) for request in requests]
+
+	np.random.seed(0)
+	expected = seeds(0)
+	np.random.seed(1)
+	assert seeds(0) == expected
+	assert len(set(expected)) == 3
+	assert seeds(1) != expected
+
+
+def test_scheduler_rejects_invalid_requests(inference):
+	scheduler = vInferenceScheduler(inference, max_batch_size=1, prefill_length=4)
+	with pytest.raises(ValueError):
+		scheduler.submit(list(range(3, 9)))
+	with pytest.raises(ValueError):
+		scheduler.submit([3, 4], max_new_tokens=100)
@@ -47,6 +47,7 @@ from easydel.utils.helpers import get_logger
 
 from ..utils import (
 	SampleState,
+	SamplingParams,
 	vInferenceConfig,
 )
 from ._fn import (
@@ -54,7 +55,10 @@ from ._fn import (
 	basic_generation_iter_fn,
 	get_compiled_funcs,
 	measure_flops,
+	prompt_lookup_generation_iter_fn,
 	put_compiled_funcs,
+	speculative_generation_first_iter_fn,
+	speculative_generation_iter_fn,
 )
 
 if tp.TYPE_CHECKING:
@@ -91,6 +95,8 @@ class vInferenceMetaData(BaseModel):
 	in_compiling_process: set
 	input_partition_spec: jax.sharding.PartitionSpec
 	uuid4: str
+	num_speculative_tokens: tp.Optional[int] = None
+	prompt_lookup_max_ngram_size: tp.Optional[int] = None
 	model_config = dict(arbitrary_types_allowed=True)
 
 
@@ -99,7 +105,11 @@ class vInference:
 	Class for performing text generation using a pre-trained language graphdef in EasyDeL.
 
 	This class handles the generation process, including initialization, precompilation,
-	and generating text in streaming chunks.
+	and generating text in streaming chunks. Decoding is speculative when a
+	`draft_model` or `prompt_lookup_max_ngram_size` is given: `num_speculative_tokens`
+	tokens are proposed by the draft model (see `speculative_generation_iter_fn`) or
+	copied from earlier occurrences of the trailing n-gram (see
+	`prompt_lookup_generation_iter_fn`), and the model verifies them in one forward pass.
 	"""
 
 	def __init__(
@@ -111,6 +121,9 @@ class vInference:
 		input_partition_spec: tp.Optional[PartitionSpec] = None,
 		max_new_tokens: int = 512,
 		inference_name: tp.Optional[str] = None,
+		draft_model: tp.Optional[EasyDeLBaseModule] = None,
+		num_speculative_tokens: int = 4,
+		prompt_lookup_max_ngram_size: tp.Optional[int] = None,
 	):
 		"""
 		Arguments:
@@ -120,12 +133,35 @@ class vInference:
 		  seed: The random seed for generation.
 		  input_partition_spec: The partitioning specification for input data.
 		  max_new_tokens: The maximum number of new tokens to generate.
+		  draft_model: tp.Optional smaller model sharing the vocabulary of `model`, used
+		    to propose tokens for speculative decoding.
+		  num_speculative_tokens: Number of tokens proposed per speculative step.
+		  prompt_lookup_max_ngram_size: tp.Optional longest n-gram matched to propose
+		    tokens by prompt lookup, for speculative decoding without a draft model.
 		"""
 
 		graphdef, graphstate = nn.split(model)
 		self.graphdef = graphdef
 		self.graphstate = graphstate
 		self.model = model
+		self.draft_model = draft_model
+		self.num_speculative_tokens = num_speculative_tokens
+		self.prompt_lookup_max_ngram_size = prompt_lookup_max_ngram_size
+		if draft_model is not None and prompt_lookup_max_ngram_size is not None:
+			raise ValueError(
+				"Pass either `draft_model` or `prompt_lookup_max_ngram_size`, not both."
+			)
+		if self.is_speculative and num_speculative_tokens < 1:
+			raise ValueError("`num_speculative_tokens` must be at least 1.")
+		if prompt_lookup_max_ngram_size is not None and prompt_lookup_max_ngram_size < 1:
+			raise ValueError("`prompt_lookup_max_ngram_size` must be at least 1.")
+		if draft_model is not None:
+			if draft_model.config.vocab_size != model.config.vocab_size:
+				raise ValueError(
+					"`draft_model` must share the vocabulary of `model` "
+					f"(got {draft_model.config.vocab_size} and {model.config.vocab_size})."
+				)
+			self.draft_graphdef, self.draft_graphstate = nn.split(draft_model)
 		self.processor_class = processor_class
 		self.generation_config = self._init_generation_config(
 			generation_config, max_new_tokens
@@ -192,6 +228,18 @@ class vInference:
 				model_name=self.metrics.model_name,
 				status="success",
 			).inc()
+			if self.is_speculative:
+				self.metrics.speculative_draft_tokens.labels(
+					model_name=self.metrics.model_name,
+					status="proposed",
+				).inc(int(state.num_draft_tokens))
+				self.metrics.speculative_draft_tokens.labels(
+					model_name=self.metrics.model_name,
+					status="accepted",
+				).inc(int(state.num_accepted_draft_tokens))
+				self.metrics.speculative_acceptance_rate.labels(
+					model_name=self.metrics.model_name,
+				).set(state.draft_acceptance_rate)
 
 	def _submit_during_generation_metrics_update(self):
 		if self._report_metrics:
@@ -287,7 +335,22 @@ class vInference:
 				f"Looked for attributes: {', '.join(possible_length_attributes)}"
 			)
 
-		return max_length - self.generation_config.max_new_tokens
+		return max_length - self.generation_config.max_new_tokens - self._cache_headroom
+
+	@property
+	def is_speculative(self) -> bool:
+		"""Whether decoding verifies proposed tokens (draft model or prompt lookup)."""
+		return self.draft_model is not None or self.prompt_lookup_max_ngram_size is not None
+
+	@property
+	def _cache_headroom(self) -> int:
+		"""
+		Extra cache positions needed past `max_new_tokens`; speculative steps write the
+		running token and every proposal before the rejected ones are rolled back.
+		"""
+		if not self.is_speculative:
+			return 0
+		return self.num_speculative_tokens + 1
 
 	def _get_model_max_length(self, attributes: list[str]) -> tp.Optional[int]:
 		"""
@@ -356,15 +419,30 @@ class vInference:
 		self,
 		input_ids: jax.Array = None,
 		rng: tp.Optional[PRNGKey] = None,
+		sampling_params: tp.Optional[SamplingParams] = None,
 		**model_kwargs,
 	):
 		pad_token_id = jnp.array(self.generation_config.pad_token_id, dtype=jnp.int32)
 		batch_size, current_length = input_ids.shape
+		if sampling_params is None and not self.is_speculative:
+			sampling_params = SamplingParams.from_generation_config(
+				self.generation_config,
+				batch_size,
+				rng=rng,
+			)
 		max_length = current_length + self.generation_config.max_new_tokens
 		current_length = jnp.array(current_length)
 		sequences = jnp.full((batch_size, max_length), pad_token_id, dtype=jnp.int32)
 		sequences = lax.dynamic_update_slice(sequences, input_ids, (0, 0))
 		is_sequence_finished = jnp.zeros((batch_size,), dtype=jnp.bool_)
+		cache_length = max_length + self._cache_headroom
+		draft_model_kwargs = None
+		if self.draft_model is not None:
+			draft_model_kwargs = self.draft_model.prepare_inputs_for_generation(
+				input_ids=input_ids,
+				max_length=cache_length,
+				attention_mask=model_kwargs.get("attention_mask"),
+			)
 
 		return SampleState(
 			current_length=current_length,
@@ -374,10 +452,14 @@ class vInference:
 			prng_key=rng,
 			model_kwargs=self.model.prepare_inputs_for_generation(
 				input_ids=input_ids,
-				max_length=max_length,
+				max_length=cache_length,
 				**model_kwargs,
 			),
 			generated_tokens=0,
+			draft_model_kwargs=draft_model_kwargs,
+			num_draft_tokens=0,
+			num_accepted_draft_tokens=0,
+			sampling_params=sampling_params,
 		)
 
 	def _validate_token_ids(self):
@@ -397,14 +479,15 @@ class vInference:
 			"(Set `tokenizer.pad_token_id = tokenizer.eos_token_id` if undefined"
 			" or (`processing_class.tokenizer.pad_token_id = processing_class.tokenizer.eos_token_id`))"
 		)
-		assert (
-			self.generation_config.eos_token_id is not None
-		), "`eos_token_id` cannot be None."
+		assert self.generation_config.eos_token_id is not None, (
+			"`eos_token_id` cannot be None."
+		)
 
 	def generate(
 		self,
 		input_ids: jax.Array,
 		attention_mask: tp.Optional[jax.Array] = None,
+		sampling_params: tp.Optional[SamplingParams] = None,
 		**model_kwargs,
 	) -> tp.Union[tp.Generator[SampleState, tp.Any, tp.Any], SampleState]:
 		"""
@@ -413,6 +496,9 @@ class vInference:
 		Args:
 		    input_ids: Input token IDs as a JAX array
 		    attention_mask: Optional attention mask for the input
+		    sampling_params: Optional per-row sampling settings overriding the sampling
+		      fields of `generation_config`; they are inputs of the compiled functions,
+		      so any combination reuses the same executable
 		    **model_kwargs: Additional model-specific keyword arguments
 
 		Returns:
@@ -433,6 +519,17 @@ class vInference:
 			self.precompile(batch_size=batch_size, input_tokens_length=sequence_length)
 			if batch_size <= 0 or sequence_length <= 0:
 				raise ValueError(f"Invalid input dimensions: {input_ids.shape}")
+			if sampling_params is not None:
+				if self.is_speculative:
+					raise ValueError(
+						"per-row `sampling_params` are not supported with speculative decoding."
+					)
+				if sampling_params.seed.shape != (batch_size,):
+					raise ValueError(
+						f"`sampling_params` hold {sampling_params.seed.shape[0]} rows "
+						f"but the batch has {batch_size}."
+					)
+				model_kwargs["sampling_params"] = sampling_params
 
 			# Prepare generation context
 			with self._inference_latency_context_manager("preprocessing"):
@@ -522,6 +619,17 @@ class vInference:
 		state,
 		func,
 	) -> tp.Tuple[tp.Union[tp.Any, jax.Array]]:
+		if self.draft_model is not None:
+			if isinstance(func, Compiled):
+				return (self.graphstate, self.draft_graphstate, state)
+			return (
+				self.graphdef,
+				self.graphstate,
+				self.draft_graphdef,
+				self.draft_graphstate,
+				state,
+				self.generation_config,
+			)
 		if isinstance(func, Compiled):
 			return (
 				self.graphstate,
@@ -540,12 +648,40 @@ class vInference:
 		state,
 		interval_func,
 	) -> tp.Tuple[tp.Union[tp.Any, jax.Array]]:
+		if self.draft_model is not None:
+			if isinstance(interval_func, Compiled):
+				return (
+					self.graphstate,
+					self.draft_graphstate,
+					state,
+					self.generation_config.streaming_chunks,
+				)
+			return (
+				self.graphdef,
+				self.graphstate,
+				self.draft_graphdef,
+				self.draft_graphstate,
+				state,
+				self.generation_config,
+				self.num_speculative_tokens,
+				self.generation_config.streaming_chunks,
+			)
 		if isinstance(interval_func, Compiled):
 			return (
 				self.graphstate,
 				state,
 				self.generation_config.streaming_chunks,
 			)
+		if self.prompt_lookup_max_ngram_size is not None:
+			return (
+				self.graphdef,
+				self.graphstate,
+				state,
+				self.generation_config,
+				self.num_speculative_tokens,
+				self.prompt_lookup_max_ngram_size,
+				self.generation_config.streaming_chunks,
+			)
 
 		return (
 			self.graphdef,
@@ -618,50 +754,79 @@ class vInference:
 			)
 
 			state = self._init_state(**wargs)
+			chunks = self.generation_config.streaming_chunks
+			if self.draft_model is not None:
+				graphstates = (self.graphstate, self.draft_graphstate)
+				first_iter_fn, first_iter_static_argnums = (
+					speculative_generation_first_iter_fn,
+					(0, 2, 5),
+				)
+				iter_fn, iter_static_argnums = speculative_generation_iter_fn, (0, 2, 5, 6)
+
+				def first_iter_args(state):
+					return (
+						self.graphdef,
+						self.graphstate,
+						self.draft_graphdef,
+						self.draft_graphstate,
+						state,
+						self.generation_config,
+					)
+
+				def iter_args(state):
+					return first_iter_args(state) + (self.num_speculative_tokens, chunks)
+			else:
+				graphstates = (self.graphstate,)
+				first_iter_fn, first_iter_static_argnums = (
+					basic_generation_first_iter_fn,
+					(0, 3),
+				)
+
+				def first_iter_args(state):
+					return (self.graphdef, self.graphstate, state, self.generation_config)
+
+				if self.prompt_lookup_max_ngram_size is not None:
+					iter_fn, iter_static_argnums = prompt_lookup_generation_iter_fn, (0, 3, 4, 5)
+
+					def iter_args(state):
+						return first_iter_args(state) + (
+							self.num_speculative_tokens,
+							self.prompt_lookup_max_ngram_size,
+							chunks,
+						)
+				else:
+					iter_fn, iter_static_argnums = basic_generation_iter_fn, (0, 3)
+
+					def iter_args(state):
+						return first_iter_args(state) + (chunks,)
+
+			graphstate_shardings = tuple(extract_shardings(gs) for gs in graphstates)
 			logger.debug("smart compiling `first_iter_fn`")
 			logger.debug("lowering `first_iter_fn`")
 			first_iter_fn_lowered = jax.jit(
-				basic_generation_first_iter_fn,
-				static_argnums=(0, 3),
-				in_shardings=(
-					extract_shardings(self.graphstate),
-					extract_shardings(state),
-				),
-			).lower(
-				self.graphdef,
-				self.graphstate,
-				state,
-				self.generation_config,
-			)
+				first_iter_fn,
+				static_argnums=first_iter_static_argnums,
+				in_shardings=graphstate_shardings + (extract_shardings(state),),
+			).lower(*first_iter_args(state))
 			logger.debug("`first_iter_fn` lowered successfully.")
 			compiled_generate_func = smart_compile(
 				first_iter_fn_lowered,
-				tag="vinference.basic_generation_first_iter_fn",
+				tag=f"vinference.{first_iter_fn.__name__}",
 			)
 			logger.debug("smart compiling `iter_fn`")
 			logger.debug("lowering `iter_fn`")
-			sample_state = compiled_generate_func(self.graphstate, state)
+			sample_state = compiled_generate_func(*graphstates, state)
 			sample_state_shardings = extract_shardings(sample_state)
 			iter_fn_lowered = jax.jit(
-				basic_generation_iter_fn,
-				static_argnums=(0, 3),
-				in_shardings=(
-					extract_shardings(self.graphstate),
-					sample_state_shardings,
-					None,
-				),
+				iter_fn,
+				static_argnums=iter_static_argnums,
+				in_shardings=graphstate_shardings + (sample_state_shardings, None),
 				out_shardings=sample_state_shardings,
-			).lower(
-				self.graphdef,
-				self.graphstate,
-				sample_state,
-				self.generation_config,
-				self.generation_config.streaming_chunks,
-			)
+			).lower(*iter_args(sample_state))
 			logger.debug("`iter_fn` lowered successfully.")
 			compiled_interval_func = smart_compile(
 				iter_fn_lowered,
-				tag="vinference.basic_generation_iter_fn",
+				tag=f"vinference.{iter_fn.__name__}",
 			)
 
 			del state
@@ -751,6 +916,10 @@ class vInference:
 			in_compiling_process=self._in_compiling_process,
 			input_partition_spec=self.input_partition_spec,
 			uuid4=self._uuid4,
+			num_speculative_tokens=(
+				self.num_speculative_tokens if self.is_speculative else None
+			),
+			prompt_lookup_max_ngram_size=self.prompt_lookup_max_ngram_size,
 		)
 		for config_key in self._precompiled_configs:
 			batch_size, input_tokens_length = config_key
@@ -771,10 +940,19 @@ class vInference:
 		path: tp.Union[os.PathLike, str],
 		model: EasyDeLBaseModule,
 		processor_class: ProcessingClassType,
+		draft_model: tp.Optional[EasyDeLBaseModule] = None,
 	):
 		path = pathlib.Path(path)
 		assert path.exists(), "provided path to vInference doesn't exists."
 		metadata = pickle.load(open(path / "config", "rb"))
+		num_speculative_tokens = getattr(metadata, "num_speculative_tokens", None)
+		max_ngram_size = getattr(metadata, "prompt_lookup_max_ngram_size", None)
+		uses_draft_model = num_speculative_tokens is not None and max_ngram_size is None
+		if (draft_model is not None) != uses_draft_model:
+			raise ValueError(
+				"`draft_model` must be given exactly when the saved vInference "
+				"decodes speculatively with a draft model."
+			)
 		for config_key in metadata.precompiled_configs:
 			batch_size, input_tokens_length = config_key
 			metafile = f"{metadata.uuid4}-{batch_size}-{input_tokens_length}"
@@ -793,6 +971,9 @@ class vInference:
 			generation_config=metadata.generation_config,
 			input_partition_spec=metadata.input_partition_spec,
 			inference_name=metadata.inference_name,
+			draft_model=draft_model,
+			num_speculative_tokens=num_speculative_tokens or 4,
+			prompt_lookup_max_ngram_size=max_ngram_size,
 		)
 		self._uuid4 = metadata.uuid4
 		return self
@@ -0,0 +1,203 @@
+# Copyright 2023 The EASYDEL Author @erfanzar (Erfan Zare Chavoshi).
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import itertools
+
+import numpy as np
+import pytest
+from flax import nnx as nn
+from jax import numpy as jnp
+
+import easydel as ed
+
+from ._fn import COMPILED_FUNCS
+
+EOS_TOKEN_ID = 1
+PAD_TOKEN_ID = 2
+MAX_NEW_TOKENS = 12
+# every inference registers its own prometheus metrics, so names must be unique.
+INFERENCE_IDS = itertools.count()
+
+
+def llama(seed, num_hidden_layers=2, hidden_size=64):
+	config = ed.LlamaConfig(
+		vocab_size=128,
+		hidden_size=hidden_size,
+		intermediate_size=2 * hidden_size,
+		num_hidden_layers=num_hidden_layers,
+		num_attention_heads=4,
+		num_key_value_heads=2,
+		max_position_embeddings=128,
+		attn_mechanism=ed.AttentionMechanisms.VANILLA,
+	)
+	return ed.LlamaForCausalLM(
+		config=config,
+		dtype=jnp.float32,
+		param_dtype=jnp.float32,
+		rngs=nn.Rngs(seed),
+	)
+
+
+@pytest.fixture(scope="module")
+def target():
+	return llama(0)
+
+
+def inference(model, do_sample=False, **kwargs):
+	return ed.vInference(
+		model=model,
+		processor_class=None,
+		inference_name=f"vinference-test-{next(INFERENCE_IDS)}",
+		seed=0,
+		generation_config=ed.vInferenceConfig(
+			max_new_tokens=MAX_NEW_TOKENS,
+			streaming_chunks=4,
+			do_sample=do_sample,
+			temperature=1.0,
+			top_k=0,
+			top_p=1.0,
+			bos_token_id=0,
+			eos_token_id=EOS_TOKEN_ID,
+			pad_token_id=PAD_TOKEN_ID,
+		),
+		**kwargs,
+	)
+
+
+def prompts():
+	rng = np.random.RandomState(0)
+	input_ids = rng.randint(3, 128, size=(2, 8)).astype(np.int32)
+	attention_mask = np.ones_like(input_ids)
+	# left-pad the second prompt.
+	input_ids[1, :3] = PAD_TOKEN_ID
+	attention_mask[1, :3] = 0
+	return input_ids, attention_mask
+
+
+def generate(inference, sampling_params=None):
+	input_ids, attention_mask = prompts()
+	state = None
+	for state in inference.generate(
+		input_ids,
+		attention_mask=attention_mask,
+		sampling_params=sampling_params,
+	):
+		pass
+	return state
+
+
+def greedy_reference(model, prompt):
+	sequence = list(prompt)
+	for _ in range(MAX_NEW_TOKENS):
+		logits = model(input_ids=jnp.array([sequence])).logits
+		next_token = int(jnp.argmax(logits[0, -1]))
+		sequence.append(next_token)
+		if next_token == EOS_TOKEN_ID:
+			break
+	generated = sequence[len(prompt) :]
+	return generated + [PAD_TOKEN_ID] * (MAX_NEW_TOKENS - len(generated))
+
+
+@pytest.mark.parametrize("draft_seed", [None, 1])
+def test_greedy_speculative_decoding_matches_greedy_decoding(target, draft_seed):
+	draft = target if draft_seed is None else llama(draft_seed, num_hidden_layers=1)
+	state = generate(inference(target, draft_model=draft, num_speculative_tokens=3))
+
+	input_ids, attention_mask = prompts()
+	for row, (prompt, mask) in enumerate(zip(input_ids, attention_mask)):
+		assert np.asarray(state.sequences[row, 8:]).tolist() == greedy_reference(
+			target,
+			prompt[mask.astype(bool)],
+		)
+	assert int(state.generated_tokens) == MAX_NEW_TOKENS
+	assert int(state.num_draft_tokens) > 0
+	if draft_seed is None:
+		assert state.draft_acceptance_rate == 1.0
+	else:
+		# an unrelated draft gets rejected, so the caches were rolled back.
+		assert state.draft_acceptance_rate < 1.0
+
+
+def test_greedy_prompt_lookup_decoding_matches_greedy_decoding(target):
+	state = generate(
+		inference(target, prompt_lookup_max_ngram_size=2, num_speculative_tokens=3)
+	)
+
+	input_ids, attention_mask = prompts()
+	for row, (prompt, mask) in enumerate(zip(input_ids, attention_mask)):
+		assert np.asarray(state.sequences[row, 8:]).tolist() == greedy_reference(
+			target,
+			prompt[mask.astype(bool)],
+		)
+	# the greedy outputs of the test model repeat themselves.
+	assert state.draft_acceptance_rate > 0.0
+
+
+def test_sampling_accepts_every_proposal_of_the_target_itself(target):
+	state = generate(
+		inference(target, do_sample=True, draft_model=target, num_speculative_tokens=3)
+	)
+	assert state.draft_acceptance_rate == 1.0
+	generated = np.asarray(state.sequences[:, 8:])
+	assert generated.shape == (2, MAX_NEW_TOKENS)
+	assert ((generated >= 0) & (generated < 128)).all()
+
+
+def test_draft_model_must_share_the_vocabulary(target):
+	config = ed.LlamaConfig(
+		vocab_size=64,
+		hidden_size=32,
+		intermediate_size=64,
+		num_hidden_layers=1,
+		num_attention_heads=4,
+		num_key_value_heads=2,
+	)
+	draft = ed.LlamaForCausalLM(config=config, rngs=nn.Rngs(0))
+	with pytest.raises(ValueError):
+		inference(target, draft_model=draft)
+	with pytest.raises(ValueError):
+		inference(target, draft_model=target, prompt_lookup_max_ngram_size=2)
+
+
+def test_per_row_sampling_params_share_one_executable(target):
+	engine = inference(target)
+	greedy = generate(engine)
+	num_compiled = len(COMPILED_FUNCS)
+
+	input_ids, attention_mask = prompts()
+	for row, (prompt, mask) in enumerate(zip(input_ids, attention_mask)):
+		# the basic loop overwrites the last column with one extra step.
+		assert (
+			np.asarray(greedy.sequences[row, 8:-1]).tolist()
+			== greedy_reference(target, prompt[mask.astype(bool)])[:-1]
+		)
+
+	# the first row keeps decoding greedily while the second one samples.
+	mixed = ed.SamplingParams.create(
+		batch_size=2,
+		temperature=[0.0, 1.5],
+		top_p=[1.0, 0.9],
+		top_k=[0, 20],
+		presence_penalty=[0.0, 0.5],
+		seed=[0, 1],
+	)
+	state = generate(engine, mixed)
+	assert len(COMPILED_FUNCS) == num_compiled
+	np.testing.assert_array_equal(state.sequences[0], greedy.sequences[0])
+	np.testing.assert_array_equal(generate(engine, mixed).sequences, state.sequences)
+
+	with pytest.raises(ValueError):
+		generate(engine, ed.SamplingParams.create(batch_size=3))
+	with pytest.raises(ValueError):
+		generate(inference(target, draft_model=target), mixed)
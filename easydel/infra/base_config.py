@@ -20,7 +20,6 @@ import chex
 import jax
 import jax.extend
 import jax.tree_util
-from flax import nnx as nn
 from jax import numpy as jnp
 from transformers.configuration_utils import PretrainedConfig
 
@@ -30,6 +29,7 @@ from easydel.utils.helpers import get_logger
 
 from .etils import (
 	AVAILABLE_ATTENTION_MECHANISMS,
+	AVAILABLE_MOE_METHODS,
 	DEFAULT_ATTENTION_MECHANISM,
 	EasyDeLBackends,
 	EasyDeLGradientCheckPointers,
@@ -38,10 +38,12 @@ from .etils import (
 )
 
 if tp.TYPE_CHECKING:
+	from easydel.layers.masking import AttentionMask
 	from easydel.layers.rotary_embedding import RopeConfig
 
 	from .utils import ModuleCaches
 else:
+	AttentionMask = tp.Any
 	RopeConfig = tp.Any
 	ModuleCaches = tp.Any
 logger = get_logger(__name__)
@@ -140,6 +142,9 @@ class EasyDeLBaseConfigDict(tp.TypedDict, total=False):
 	pallas_m_block_size: int
 	pallas_k_block_size: int
 	pallas_n_block_size: int
+	moe_method: AVAILABLE_MOE_METHODS
+	moe_capacity_factor: tp.Optional[float]
+	decode_attention_blocksize: tp.Optional[int]
 	mask_max_position_embeddings: int
 	freq_max_position_embeddings: int
 
@@ -168,7 +173,7 @@ class EasyDeLBaseConfig(PretrainedConfig):
 		scan_mlp_chunk_size (int): Chunk size for scan MLP. Default is 1024.
 		attention_axis_name (str): Name of the attention axis. Default is "sp".
 		gradient_checkpointing (EasyDeLGradientCheckPointers): Gradient checkpointing method. Default is EasyDeLGradientCheckPointers.NONE.
-		kv_cache_quantization_method (EasyDeLQuantizationMethods): Key-value cache quantization method. Default is EasyDeLQuantizationMethods.NONE.
+		kv_cache_quantization_method (EasyDeLQuantizationMethods): Key-value cache quantization method; 8-bit methods store an int8 cache with per-token, per-head scales that is written in place. Default is EasyDeLQuantizationMethods.NONE.
 		kv_cache_quantization_blocksize (int): Block size for key-value cache quantization. Default is 64.
 		quantization_method (EasyDeLQuantizationMethods): Quantization method. Default is EasyDeLQuantizationMethods.NONE.
 		quantization_pattern (str): Pattern for quantization. Default is ".*".
@@ -182,6 +187,9 @@ class EasyDeLBaseConfig(PretrainedConfig):
 		pallas_m_block_size (int): Block size for Pallas M. Default is DEFAULT_PALLAS_M_BLOCK_SIZE.
 		pallas_k_block_size (int): Block size for Pallas K. Default is DEFAULT_PALLAS_K_BLOCK_SIZE.
 		pallas_n_block_size (int): Block size for Pallas N. Default is DEFAULT_PALLAS_N_BLOCK_SIZE.
+		moe_method (AVAILABLE_MOE_METHODS): How MoE layers dispatch tokens to experts, "dense" or "sorted". Default is "dense".
+		moe_capacity_factor (tp.Optional[float]): Expert capacity factor for sorted MoE dispatch; tokens past capacity are dropped. Default is None (no dropping).
+		decode_attention_blocksize (tp.Optional[int]): Cache block size of the length-aware decode attention, which skips the blocks past the longest live sequence; None or 0 keeps the configured mechanism for decode steps. Default is 256.
 		**kwargs: Additional keyword arguments.
 	Raises:
 		Warning: If `kv_cache_quantization_method` is not NONE and `use_sharded_kv_caching` is True.
@@ -225,6 +233,9 @@ class EasyDeLBaseConfig(PretrainedConfig):
 		pallas_m_block_size: int = DEFAULT_PALLAS_M_BLOCK_SIZE,
 		pallas_k_block_size: int = DEFAULT_PALLAS_K_BLOCK_SIZE,
 		pallas_n_block_size: int = DEFAULT_PALLAS_N_BLOCK_SIZE,
+		moe_method: AVAILABLE_MOE_METHODS = "dense",
+		moe_capacity_factor: tp.Optional[float] = None,
+		decode_attention_blocksize: tp.Optional[int] = 256,
 		**kwargs,
 	):
 		self.axis_dims = getattr(self, "axis_dims", axis_dims)
@@ -273,6 +284,9 @@ class EasyDeLBaseConfig(PretrainedConfig):
 		self.pallas_m_block_size = getattr(self, "pallas_m_block_size", pallas_m_block_size)
 		self.pallas_k_block_size = getattr(self, "pallas_k_block_size", pallas_k_block_size)
 		self.pallas_n_block_size = getattr(self, "pallas_n_block_size", pallas_n_block_size)
+		self.moe_method = getattr(self, "moe_method", moe_method)
+		self.moe_capacity_factor = getattr(self, "moe_capacity_factor", moe_capacity_factor)
+		self.decode_attention_blocksize = getattr(self, "decode_attention_blocksize", decode_attention_blocksize)
 		# fmt:on
 
 		self.pretraining_tp = 1  # it's for pytorch models.
@@ -428,6 +442,9 @@ class EasyDeLBaseConfig(PretrainedConfig):
 		pallas_m_block_size: int = ...,
 		pallas_k_block_size: int = ...,
 		pallas_n_block_size: int = ...,
+		moe_method: AVAILABLE_MOE_METHODS = ...,
+		moe_capacity_factor: tp.Optional[float] = ...,
+		decode_attention_blocksize: tp.Optional[int] = ...,
 	):
 		"""
 		It initializes all the attributes of an object, and it's called when you create a new instance of that class.
@@ -467,6 +484,9 @@ class EasyDeLBaseConfig(PretrainedConfig):
 		    pallas_m_block_size (int, optional): block size m dim in matmul for pallas kernel `A(mk)@B(kn)=B(mn)`. Defaults to DEFAULT_PALLAS_M_BLOCK_SIZE.
 		    pallas_k_block_size (int, optional): block size k dim in matmul for pallas kernel `A(mk)@B(kn)=B(mn)`. Defaults to DEFAULT_PALLAS_K_BLOCK_SIZE.
 		    pallas_n_block_size (int, optional): block size n dim in matmul for pallas kernel `A(mk)@B(kn)=B(mn)`. Defaults to DEFAULT_PALLAS_N_BLOCK_SIZE.
+		    moe_method (AVAILABLE_MOE_METHODS, optional): "sorted" runs experts only on their routed tokens with grouped matmuls instead of running every expert densely. Defaults to "dense".
+		    moe_capacity_factor (tp.Optional[float], optional): expert capacity factor for sorted MoE dispatch, tokens past an expert's capacity are dropped. Defaults to None.
+		    decode_attention_blocksize (tp.Optional[int], optional): cache block size of the length-aware decode attention, None or 0 disables it. Defaults to 256.
 
 		"""
 		# fmt: off
@@ -502,6 +522,9 @@ class EasyDeLBaseConfig(PretrainedConfig):
 		set_attrs_smartly(self, "pallas_m_block_size", DEFAULT_PALLAS_M_BLOCK_SIZE, pallas_m_block_size)
 		set_attrs_smartly(self, "pallas_k_block_size", DEFAULT_PALLAS_K_BLOCK_SIZE, pallas_k_block_size)
 		set_attrs_smartly(self, "pallas_n_block_size", DEFAULT_PALLAS_N_BLOCK_SIZE, pallas_n_block_size)
+		set_attrs_smartly(self, "moe_method", "dense", moe_method)
+		set_attrs_smartly(self, "moe_capacity_factor", None, moe_capacity_factor)
+		set_attrs_smartly(self, "decode_attention_blocksize", 256, decode_attention_blocksize)
 		# fmt: on
 
 	def __repr__(self):
@@ -767,17 +790,17 @@ class EasyDeLBaseConfig(PretrainedConfig):
 
 		return ModuleCaches(frequencies)
 
-	def get_basic_causal_mask(self, dtype="bool"):
-		from .utils import ModuleCaches
+	def get_basic_causal_mask(self) -> AttentionMask:
+		"""
+		Returns the causal mask of the model as an `AttentionMask` description, which
+		attention evaluates from token positions instead of slicing a
+		`(max_position, max_position)` tensor.
+		"""
+		from easydel.layers.masking import AttentionMask
 
-		return ModuleCaches(
-			nn.make_causal_mask(
-				jnp.ones(
-					shape=(1, self.granted_mask_max_position_embedding),
-					dtype=dtype,
-				),
-				dtype=dtype,
-			)
+		return AttentionMask(
+			causal=True,
+			max_length=self.granted_mask_max_position_embedding,
 		)
 
 	def get_fcm_mask(self, batch_size, seq_length, deterministic: bool):
@@ -37,6 +37,7 @@ from .base_config import EasyDeLBaseConfig
 from .etils import EasyDeLQuantizationMethods
 from .loss_utils import (
 	LOSS_MAPPING,
+	ForCausalLMChunkedLoss,
 	ForCausalLMLoss,
 	LossConfig,
 	LossMetrics,
@@ -50,8 +51,10 @@ from .utils import quantize_linear_layers
 
 if tp.TYPE_CHECKING:
 	from easydel.infra.base_state import EasyDeLState
+	from easydel.layers.masking import AttentionMask
 else:
 	EasyDeLState = tp.Any
+	AttentionMask = tp.Any
 
 PartitionLike = tp.Optional[
 	tp.Union[
@@ -82,6 +85,10 @@ class EasyDeLBaseModule(
 	base_model_prefix: str
 	_model_task: tp.Optional[str] = None
 	_model_type: tp.Optional[str] = None
+	# causal LMs that accept `apply_lm_head=False` and implement `get_lm_head_kernel`
+	# can compute their loss with `ForCausalLMChunkedLoss` (see `LossConfig.lm_head_chunk_size`)
+	# and only project the positions they sample from (see `forward_selected_logits`).
+	supports_chunked_lm_head_loss: bool = False
 
 	def __init__(
 		self,
@@ -162,8 +169,8 @@ class EasyDeLBaseModule(
 		return nn.split(self)[-1]
 
 	@cached_property
-	def causal_mask(self) -> jnp.ndarray:
-		"""Returns a causal mask from the config."""
+	def causal_mask(self) -> AttentionMask:
+		"""Returns the causal `AttentionMask` description from the config."""
 		return self.config.get_basic_causal_mask()
 
 	@cached_property
@@ -695,6 +702,128 @@ class EasyDeLBaseModule(
 			dtype=self.param_dtype,
 		)
 
+	@property
+	def safetensors_transform_fn(self):
+		"""
+		Like `pure_transform_fn`, but converting a HuggingFace safetensors checkpoint
+		(files, index or directory) without torch, see `safetensors_to_easydel_params`.
+		"""
+		from easydel.utils import graph_utils
+		from easydel.utils.parameters_transformation import safetensors_to_easydel_params
+
+		embedding_path = [
+			pa[-1]
+			for pa, _ in graph_utils.iter_module_search(self, nn.Embed)
+			if not isinstance(pa[-1], int)
+		]
+		layernorm_path = [
+			pa[-1]
+			for pa, _ in graph_utils.iter_module_search(self, nn.LayerNorm)
+			if not isinstance(pa[-1], int)
+		]
+
+		return partial(
+			safetensors_to_easydel_params,
+			embedding_layer_names=embedding_path,
+			layernorm_names=layernorm_path,
+			dtype=self.param_dtype,
+		)
+
+	def get_lm_head_kernel(self) -> chex.Array:
+		"""
+		Returns the `(hidden_size, vocab_size)` kernel of the language-modeling head.
+
+		Only meaningful for tied embeddings or a plain `nn.Linear` head; quantized and
+		LoRA-wrapped heads are only applied through their module call.
+		"""
+		if getattr(self.config, "tie_word_embeddings", False):
+			return self.model.embed_tokens.embedding.value.T
+		return self.lm_head.kernel.value
+
+	def compute_lm_logits(self, hidden_states: chex.Array) -> chex.Array:
+		"""Projects `hidden_states` to the vocabulary with the language-modeling head."""
+		if getattr(self.config, "tie_word_embeddings", False):
+			return jax.lax.dot_general(
+				hidden_states,
+				self.model.embed_tokens.embedding.value.T,
+				(((hidden_states.ndim - 1), (0,)), ((), ())),
+			)
+		return self.lm_head(hidden_states)
+
+	def forward_selected_logits(
+		self,
+		logits_positions: tp.Optional[chex.Array] = None,
+		**kwargs,
+	):
+		"""
+		Runs the model like `__call__`, but only returns the logits of `logits_positions`,
+		which is what decoding samples from.
+
+		Models supporting `apply_lm_head=False` project just the selected hidden states,
+		skipping the `[batch, sequence_length, vocab_size]` projection of every prompt
+		position during prefill; other models compute the full logits and gather them.
+
+		Args:
+		    logits_positions: Per-row positions along the sequence axis, `[batch]` or
+		        `[batch, num_positions]`. Defaults to the last position of every row, which
+		        is the last valid token of left-padded inputs (for right-padded ones, pass
+		        `attention_mask.sum(-1) - 1`).
+		    **kwargs: Inputs of `__call__`.
+
+		Returns:
+		    The outputs of `__call__`, with logits of shape `[batch, num_positions, vocab_size]`.
+		"""
+		kwargs.pop("return_dict", None)
+		if self.supports_chunked_lm_head_loss:
+			outputs = self(**kwargs, return_dict=True, apply_lm_head=False)
+			states = outputs.last_hidden_state
+		else:
+			outputs = self(**kwargs, return_dict=True)
+			states = outputs.logits
+		if logits_positions is None:
+			states = states[:, -1:]
+		else:
+			logits_positions = jnp.asarray(logits_positions, dtype=jnp.int32)
+			if logits_positions.ndim == 1:
+				logits_positions = logits_positions[:, None]
+			states = jnp.take_along_axis(states, logits_positions[..., None], axis=1)
+		if self.supports_chunked_lm_head_loss:
+			return outputs.replace(
+				logits=self.compute_lm_logits(states), last_hidden_state=None
+			)
+		return outputs.replace(logits=states)
+
+	def _use_chunked_lm_head_loss(self, loss_config: tp.Optional[LossConfig]) -> bool:
+		if loss_config is None or not loss_config.lm_head_chunk_size:
+			return False
+		if self.loss_function.__name__ != ForCausalLMLoss.__name__:
+			return False
+		if not self.supports_chunked_lm_head_loss:
+			warnings.warn(
+				f"{self.__class__.__name__} does not support the chunked LM-head loss, "
+				"falling back to `ForCausalLMLoss`.",
+				stacklevel=1,
+			)
+			return False
+		if not getattr(self.config, "tie_word_embeddings", False) and (
+			type(self.lm_head) is not nn.Linear
+		):
+			# quantized or LoRA-wrapped heads don't expose their effective kernel.
+			warnings.warn(
+				f"The chunked LM-head loss needs a plain `nn.Linear` head, got "
+				f"{type(self.lm_head).__name__}; falling back to `ForCausalLMLoss`.",
+				stacklevel=1,
+			)
+			return False
+		if loss_config.reduction is not None:
+			warnings.warn(
+				"The chunked LM-head loss does not support a custom `reduction` "
+				f"({loss_config.reduction!r}), falling back to `ForCausalLMLoss`.",
+				stacklevel=1,
+			)
+			return False
+		return True
+
 	def compute_loss(
 		self,
 		*,
@@ -709,14 +838,25 @@ class EasyDeLBaseModule(
 		assert labels is not None, "`labels` can not be `None` for computing loss."
 		loss_kwargs = loss_kwargs or {}
 		batch.pop("return_dict", None)
-		outputs = self(**batch, return_dict=True)
-		loss_output: LossMetrics = self.loss_function(
-			labels=labels,
-			config=loss_config,
-			paxis=self.config.partition_axis,
-			**loss_kwargs,
-			**outputs,
-		)
+		if self._use_chunked_lm_head_loss(loss_config):
+			outputs = self(**batch, return_dict=True, apply_lm_head=False)
+			loss_output: LossMetrics = ForCausalLMChunkedLoss(
+				hidden_states=outputs.last_hidden_state,
+				lm_head_kernel=self.get_lm_head_kernel(),
+				labels=labels,
+				config=loss_config,
+				paxis=self.config.partition_axis,
+				**loss_kwargs,
+			)
+		else:
+			outputs = self(**batch, return_dict=True)
+			loss_output: LossMetrics = self.loss_function(
+				labels=labels,
+				config=loss_config,
+				paxis=self.config.partition_axis,
+				**loss_kwargs,
+				**outputs,
+			)
 		if hasattr(outputs, "aux_loss"):
 			if outputs.aux_loss is not None:
 				loss_output.loss = loss_output.loss + outputs.aux_loss
@@ -0,0 +1,73 @@
+# Copyright 2023 The EASYDEL Author @erfanzar (Erfan Zare Chavoshi).
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import numpy as np
+import pytest
+from flax import nnx as nn
+from jax import numpy as jnp
+
+import easydel as ed
+
+
+def llama(tie_word_embeddings):
+	config = ed.LlamaConfig(
+		vocab_size=128,
+		hidden_size=32,
+		intermediate_size=64,
+		num_hidden_layers=2,
+		num_attention_heads=4,
+		num_key_value_heads=2,
+		max_position_embeddings=64,
+		tie_word_embeddings=tie_word_embeddings,
+		attn_mechanism=ed.AttentionMechanisms.VANILLA,
+	)
+	return ed.LlamaForCausalLM(
+		config=config,
+		dtype=jnp.float32,
+		param_dtype=jnp.float32,
+		rngs=nn.Rngs(0),
+	)
+
+
+@pytest.mark.parametrize("tie_word_embeddings", [False, True])
+@pytest.mark.parametrize("supports_selection", [True, False])
+def test_forward_selected_logits(tie_word_embeddings, supports_selection):
+	model = llama(tie_word_embeddings)
+	# models without `apply_lm_head` gather the selected positions from full logits.
+	model.supports_chunked_lm_head_loss = supports_selection
+	input_ids = jnp.asarray(np.random.RandomState(0).randint(0, 128, (2, 8)))
+	logits = model(input_ids=input_ids).logits
+
+	outputs = model.forward_selected_logits(input_ids=input_ids)
+	assert outputs.logits.shape == (2, 1, 128)
+	np.testing.assert_allclose(outputs.logits, logits[:, -1:], atol=1e-5)
+	assert outputs.last_hidden_state is None
+
+	positions = jnp.array([[5, 2], [7, 0]])
+	outputs = model.forward_selected_logits(positions[:, 0], input_ids=input_ids)
+	np.testing.assert_allclose(outputs.logits[:, 0], logits[[0, 1], [5, 7]], atol=1e-5)
+	outputs = model.forward_selected_logits(positions, input_ids=input_ids)
+	np.testing.assert_allclose(
+		outputs.logits,
+		np.take_along_axis(np.asarray(logits), np.asarray(positions)[..., None], axis=1),
+		atol=1e-5,
+	)
+
+
+def test_forward_selected_logits_keeps_the_cache():
+	model = llama(False)
+	input_ids = jnp.ones((1, 4), dtype=jnp.int32)
+	inputs = model.prepare_inputs_for_generation(input_ids, max_length=8)
+	outputs = model.forward_selected_logits(input_ids=input_ids, **inputs)
+	np.testing.assert_array_equal(outputs.past_key_values.views[0].index, [4])
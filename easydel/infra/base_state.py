@@ -13,6 +13,7 @@
 # limitations under the License.
 from __future__ import annotations
 
+import json
 import os
 import pathlib
 import pickle
@@ -24,10 +25,16 @@ import optax
 from flax import nnx as nn
 from flax import struct
 from jax.sharding import NamedSharding, PartitionSpec
-from safetensors.flax import save_file as safe_save_file, load_file as safe_load_file
+from safetensors.flax import load_file as safe_load_file
 
+from easydel.utils.checkpoint_managers import CheckpointManager, CheckpointWriteFuture
+from easydel.utils.checkpoint_managers.streamer import SHARDED_INDEX_SUFFIX
 from easydel.utils.helpers import get_logger
-from easydel.utils.traversals import specs_to_name_sharding
+from easydel.utils.traversals import (
+	flatten_dict,
+	specs_to_name_sharding,
+	unflatten_dict,
+)
 
 if tp.TYPE_CHECKING:
 	from jax.sharding import Mesh
@@ -41,9 +48,26 @@ else:
 WEIGHTS_NAME = "easydel-model.parameters"
 OPTIMIZER_NAME = "easydel-optstate.parameters"
 OPTIMIZER_STRUCT_NAME = "easydel-optstate.structure"
+SHARDED_WEIGHTS_PREFIX = "easydel-model"
+SHARDED_OPTIMIZER_PREFIX = "easydel-optstate"
 logger = get_logger(__name__)
 
 
+def _keystrs(treedef: jax.tree_util.PyTreeDef) -> tp.List[str]:
+	leaves = jax.tree_util.tree_unflatten(treedef, [0] * treedef.num_leaves)
+	return [
+		jax.tree_util.keystr(path)
+		for path, _ in jax.tree_util.tree_flatten_with_path(leaves)[0]
+	]
+
+
+def _flatten_with_keystr(tree: tp.Any) -> tp.Dict[str, tp.Any]:
+	return {
+		jax.tree_util.keystr(path): leaf
+		for path, leaf in jax.tree_util.tree_flatten_with_path(tree)[0]
+	}
+
+
 class EasyDeLState(struct.PyTreeNode):
 	"""
 	**EasyDeLState A Snapshot of Your EasyDeL Model**
@@ -318,60 +342,190 @@ class EasyDeLState(struct.PyTreeNode):
 		mismatch_allowed: bool = True,
 		save_optimizer: bool = True,
 		enable: tp.Optional[bool] = None,
-	):
-		save_directory = pathlib.Path(save_directory)
-		save_directory = pathlib.Path(save_directory)
-		if save_optimizer:
-			if enable is None:
-				enable = jax.process_index() == 0
-			if enable:
-				save_directory.mkdir(parents=True, exist_ok=True)
-				optim_path = save_directory / OPTIMIZER_NAME
-				struct_path = save_directory / OPTIMIZER_STRUCT_NAME
-			else:
-				optim_path = pathlib.Path("/dev/null")
-				struct_path = pathlib.Path("/dev/null")
-
-			logger.info(f"Coordinated optimizer save through {optim_path}")
-
-			try:
-				tdef = jax.tree_util.tree_structure(self.opt_state)
-				with open(struct_path, "wb") as f:
-					pickle.dump(tdef, f)
-
-				@partial(
-					jax.jit,
-					out_shardings=NamedSharding(self.model.mesh, PartitionSpec()),
-				)
-				def gather_fn(x):
-					return x
+		async_save: bool = False,
+	) -> CheckpointWriteFuture:
+		"""
+		Saves the parameters, optimizer state and step without gathering them.
 
-				tree = jax.tree_util.tree_leaves(self.opt_state)
-				gathered = {
-					f"param_{i}": jax.device_get(gather_fn(param)) for i, param in enumerate(tree)
-				}
-				safe_save_file(tensors=gathered, filename=str(optim_path))
+		Every process writes only its own shards (see
+		`CheckpointManager.save_sharded_checkpoint`) once they are copied to the host, so
+		the state can be donated or updated right after this returns. The model config is
+		saved as well, so the directory also loads with `from_pretrained`.
 
-			except Exception as e:
-				logger.error(f"Optimizer save failed: {str(e)}")
-				raise
-		else:
-			logger.info("Skipping optimizer saving as requested")
+		Args:
+		    save_directory: Directory to save the state to.
+		    float_dtype: Optional dtype the parameters are saved in (the optimizer state
+		        keeps its dtype).
+		    verbose: Whether to log progress.
+		    mismatch_allowed: Kept for backward compatibility; sharded saves have no gather
+		        functions to mismatch.
+		    save_optimizer: Whether to save the optimizer state.
+		    enable: Whether this process writes the shared files (config, optimizer
+		        structure, indexes). Defaults to process 0.
+		    async_save: Whether to write the files in a background thread.
 
-		self.model.save_pretrained(
-			save_directory=str(save_directory),
-			gather_fns=self.model._gather_fns,
+		Returns:
+		    CheckpointWriteFuture: Handle to wait for the files to be written.
+		"""
+		save_directory = pathlib.Path(save_directory)
+		if enable is None:
+			enable = jax.process_index() == 0
+		save_directory.mkdir(parents=True, exist_ok=True)
+		step = int(jax.device_get(self.step))
+		if enable:
+			self.model._save_model_config(save_directory)
+
+		if verbose:
+			logger.info(f"saving sharded state to {save_directory}.")
+		future = CheckpointManager.save_sharded_checkpoint(
+			state=flatten_dict(self.graphstate.to_pure_dict(), sep="."),
+			directory=str(save_directory),
+			prefix=SHARDED_WEIGHTS_PREFIX,
 			float_dtype=float_dtype,
-			mismatch_allowed=mismatch_allowed,
-			verbose=verbose,
-			enable=enable,
+			metadata={"step": step},
+			async_save=async_save,
 		)
+		if save_optimizer and self.opt_state is not None:
+			if enable:
+				with open(save_directory / OPTIMIZER_STRUCT_NAME, "wb") as f:
+					pickle.dump(jax.tree_util.tree_structure(self.opt_state), f)
+			future += CheckpointManager.save_sharded_checkpoint(
+				state=_flatten_with_keystr(self.opt_state),
+				directory=str(save_directory),
+				prefix=SHARDED_OPTIMIZER_PREFIX,
+				metadata={"step": step},
+				async_save=async_save,
+			)
+		else:
+			logger.info("Skipping optimizer saving as requested")
+		return future
 
 	def load_state(
 		self,
 		load_directory: tp.Union[str, os.PathLike],
 		verbose: bool = True,
-	): ...
+		load_optimizer: bool = True,
+		partition_rules: PartitionLike = None,
+	) -> EasyDeLState:
+		"""
+		Restores the parameters, optimizer state and step saved by `save_state` into this
+		state's structure.
+
+		Each array is built directly in its target sharding: the sharding of the
+		corresponding array of this state, or the one given by `partition_rules` (the
+		model's rules by default) when this state only holds shapes (e.g. a
+		`lazy_init` model). The optimizer state is restored when it was saved, using this
+		state's optimizer structure or, if it has none, the saved one.
+
+		Args:
+		    load_directory: Directory the state was saved to.
+		    verbose: Whether to log progress.
+		    load_optimizer: Whether to restore the optimizer state.
+		    partition_rules: Partition rules of arrays that are not materialized yet.
+
+		Returns:
+		    EasyDeLState: The restored state.
+		"""
+		from easydel.escale import match_partition_rules
+
+		load_directory = pathlib.Path(load_directory)
+		if not CheckpointManager.is_sharded_checkpoint(
+			load_directory, SHARDED_WEIGHTS_PREFIX
+		):
+			raise FileNotFoundError(f"No sharded state found in {load_directory}.")
+		if partition_rules is None:
+			partition_rules = self.model.config.get_partition_rules()
+		mesh = self.model.mesh
+
+		def target_shardings(tree):
+			specs = jax.tree_util.tree_leaves(
+				match_partition_rules(
+					partition_rules,
+					jax.tree_util.tree_map(
+						lambda x: jax.ShapeDtypeStruct(x.shape, x.dtype), tree
+					),
+				),
+				is_leaf=lambda x: isinstance(x, PartitionSpec),
+			)
+			return [
+				leaf.sharding if isinstance(leaf, jax.Array) else NamedSharding(mesh, spec)
+				for leaf, spec in zip(jax.tree_util.tree_leaves(tree), specs)
+			]
+
+		# disabled parameters (e.g. biases) are `None` and are not saved.
+		flat_params = {
+			key: value
+			for key, value in flatten_dict(self.graphstate.to_pure_dict()).items()
+			if value is not None
+		}
+		keys = [".".join(map(str, key)) for key in flat_params]
+		loaded, metadata = CheckpointManager.load_sharded_checkpoint(
+			directory=str(load_directory),
+			prefix=SHARDED_WEIGHTS_PREFIX,
+			shardings=dict(zip(keys, target_shardings(flat_params))),
+			verbose=verbose,
+		)
+		missing = [key for key in keys if key not in loaded]
+		if missing:
+			raise KeyError(f"Parameters missing from {load_directory}: {missing[:5]}...")
+		graphstate = jax.tree_util.tree_map(lambda x: x, self.graphstate)
+		graphstate.replace_by_pure_dict(
+			unflatten_dict(
+				{
+					tuple_key: loaded[key].astype(value.dtype)
+					for (tuple_key, value), key in zip(flat_params.items(), keys)
+				}
+			)
+		)
+		self = self.replace(graphstate=graphstate)
+
+		step = metadata.get("step", 0)
+		if isinstance(self.step, jax.Array):
+			step = jax.device_put(
+				jax.numpy.asarray(step, dtype=self.step.dtype), self.step.sharding
+			)
+		self = self.replace(step=step)
+
+		if load_optimizer and CheckpointManager.is_sharded_checkpoint(
+			load_directory, SHARDED_OPTIMIZER_PREFIX
+		):
+			opt_state = self.opt_state
+			if opt_state is None:
+				with open(load_directory / OPTIMIZER_STRUCT_NAME, "rb") as f:
+					treedef = pickle.load(f)
+				with open(
+					load_directory / (SHARDED_OPTIMIZER_PREFIX + SHARDED_INDEX_SUFFIX)
+				) as f:
+					loaded_shapes = json.load(f)["tensors"]
+				paths = _keystrs(treedef)
+				opt_state = jax.tree_util.tree_unflatten(
+					treedef,
+					[
+						jax.ShapeDtypeStruct(
+							tuple(loaded_shapes[path]["shape"]),
+							jax.numpy.dtype(loaded_shapes[path]["dtype"]),
+						)
+						for path in paths
+					],
+				)
+			flat_opt_state = _flatten_with_keystr(opt_state)
+			loaded, _ = CheckpointManager.load_sharded_checkpoint(
+				directory=str(load_directory),
+				prefix=SHARDED_OPTIMIZER_PREFIX,
+				shardings=dict(zip(flat_opt_state, target_shardings(opt_state))),
+				verbose=verbose,
+			)
+			self = self.replace(
+				opt_state=jax.tree_util.tree_unflatten(
+					jax.tree_util.tree_structure(opt_state),
+					[loaded[key] for key in flat_opt_state],
+				)
+			)
+		if verbose:
+			logger.info(
+				f"state restored from {load_directory} at step {metadata.get('step')}."
+			)
+		return self
 
 	def shard_with_shape(self, shape) -> EasyDeLState:
 		"""shard current state with a given shape"""
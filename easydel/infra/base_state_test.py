@@ -0,0 +1,101 @@
+# Copyright 2023 The EASYDEL Author @erfanzar (Erfan Zare Chavoshi).
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+
+import jax
+import numpy as np
+import optax
+import pytest
+from flax import nnx as nn
+from jax import numpy as jnp
+
+import easydel as ed
+from easydel.utils.checkpoint_managers import CheckpointManager
+from easydel.utils.traversals import flatten_dict
+
+from .base_state import SHARDED_OPTIMIZER_PREFIX, SHARDED_WEIGHTS_PREFIX
+
+
+def llama(seed):
+	config = ed.LlamaConfig(
+		vocab_size=128,
+		hidden_size=32,
+		intermediate_size=64,
+		num_hidden_layers=2,
+		num_attention_heads=4,
+		num_key_value_heads=2,
+		max_position_embeddings=64,
+		attn_mechanism=ed.AttentionMechanisms.VANILLA,
+	)
+	return ed.LlamaForCausalLM(
+		config=config,
+		dtype=jnp.float32,
+		param_dtype=jnp.float32,
+		rngs=nn.Rngs(seed),
+	)
+
+
+def trained_state():
+	state = llama(0).to_state()
+	state = state.init_tx(optax.adamw(1e-3))
+	grads = jax.tree_util.tree_map(jnp.ones_like, state.graphstate)
+	return state.apply_gradients(grads=grads)
+
+
+def assert_trees_equal(tree, expected):
+	leaves, expected_leaves = (
+		jax.tree_util.tree_leaves(tree),
+		jax.tree_util.tree_leaves(expected),
+	)
+	assert len(leaves) == len(expected_leaves)
+	for leaf, expected_leaf in zip(leaves, expected_leaves):
+		np.testing.assert_array_equal(leaf, expected_leaf)
+
+
+@pytest.mark.parametrize("async_save", [False, True])
+def test_save_and_load_state(tmp_path, async_save):
+	state = trained_state()
+	future = state.save_state(tmp_path, verbose=False, async_save=async_save)
+	future.wait()
+	assert future.done()
+	for prefix in (SHARDED_WEIGHTS_PREFIX, SHARDED_OPTIMIZER_PREFIX):
+		assert CheckpointManager.is_sharded_checkpoint(tmp_path, prefix)
+	assert not any(name.endswith(".tmp") for name in os.listdir(tmp_path))
+
+	restored = llama(1).to_state().init_tx(optax.adamw(1e-3))
+	restored = restored.load_state(tmp_path, verbose=False)
+	assert int(restored.step) == int(state.step) == 1
+	assert_trees_equal(restored.graphstate, state.graphstate)
+	assert_trees_equal(restored.opt_state, state.opt_state)
+
+	# without an optimizer, the saved optimizer structure is rebuilt.
+	restored = llama(1).to_state().load_state(tmp_path, verbose=False)
+	assert_trees_equal(restored.opt_state, state.opt_state)
+
+
+def test_from_pretrained_reads_sharded_checkpoint(tmp_path):
+	state = trained_state()
+	state.save_state(tmp_path, verbose=False, save_optimizer=False).wait()
+	model = ed.LlamaForCausalLM.from_pretrained(
+		str(tmp_path),
+		dtype=jnp.float32,
+		param_dtype=jnp.float32,
+		auto_shard_model=False,
+	)
+	params = flatten_dict(nn.state(model, nn.Param).to_pure_dict())
+	expected = flatten_dict(state.graphstate.to_pure_dict())
+	assert set(params) == set(expected)
+	for key, value in expected.items():
+		np.testing.assert_array_equal(params[key], value)
@@ -117,6 +117,8 @@ AVAILABLE_SCHEDULERS = tp.Literal[
 	"warm_up_linear",
 ]
 
+AVAILABLE_MOE_METHODS = tp.Literal["dense", "sorted"]
+
 AVAILABLE_OPTIMIZERS = tp.Literal[
 	"adafactor",
 	"lion",
@@ -15,7 +15,7 @@
 import enum
 import pprint
 import typing as tp
-from functools import reduce
+from functools import partial, reduce
 from operator import mul
 
 import chex
@@ -23,6 +23,7 @@ import flax
 import flax.struct
 import jax
 import jax.numpy as jnp
+import numpy as np
 from jax import lax
 from jax.sharding import PartitionSpec
 
@@ -63,6 +64,7 @@ class LossConfig:
 	shift_tokens: bool = True
 	break_on_nan: bool = True
 	reduction: tp.Optional[tp.Literal["none", "mean", "sum"]] = None
+	lm_head_chunk_size: tp.Optional[int] = None
 	num_classification_labels: tp.Optional[int] = None
 	classification_problem_type: tp.Optional[
 		tp.Literal[
@@ -85,6 +87,7 @@ class LossConfig:
 				"shift_tokens": self.shift_tokens,
 				"break_on_nan": self.break_on_nan,
 				"reduction": self.reduction,
+				"lm_head_chunk_size": self.lm_head_chunk_size,
 				"num_classification_labels": self.num_classification_labels,
 				"classification_problem_type": self.classification_problem_type,
 			}
@@ -455,6 +458,266 @@ def compute_weighted_cross_entropy_and_accuracy(
 	return total_loss, total_z_loss, weight_sum, accuracy
 
 
+def _to_chunks(x: chex.Array, chunk_size: int) -> chex.Array:
+	"""Splits the sequence axis of a `[batch, seq, ...]` array into leading chunks."""
+	x = x.reshape(x.shape[0], x.shape[1] // chunk_size, chunk_size, *x.shape[2:])
+	return jnp.moveaxis(x, 1, 0)
+
+
+def _from_chunks(x: chex.Array) -> chex.Array:
+	"""Inverse of `_to_chunks`."""
+	x = jnp.moveaxis(x, 0, 1)
+	return x.reshape(x.shape[0], -1, *x.shape[3:])
+
+
+def _lm_head_chunk_logits(hidden_states: chex.Array, kernel: chex.Array) -> chex.Array:
+	return jnp.einsum(
+		"bch,hv->bcv",
+		hidden_states,
+		kernel.astype(hidden_states.dtype),
+		preferred_element_type=jnp.float32,
+	)
+
+
+def _label_smoothing_constants(
+	vocab_size: int,
+	label_smoothing: float,
+) -> tp.Tuple[float, float, float]:
+	confidence = 1.0 - label_smoothing
+	low_confidence = (1.0 - confidence) / (vocab_size - 1)
+	normalizing_constant = -(
+		confidence * jnp.log(confidence)
+		+ (vocab_size - 1) * low_confidence * jnp.log(low_confidence + 1e-20)
+	)
+	return confidence, low_confidence, normalizing_constant
+
+
+def _chunked_lm_head_cross_entropy_fwd(
+	hidden_states: chex.Array,
+	kernel: chex.Array,
+	targets: chex.Array,
+	weights: chex.Array,
+	chunk_size: int,
+	z_loss: float,
+	label_smoothing: float,
+):
+	"""Forward pass of `_chunked_lm_head_cross_entropy`."""
+	confidence, low_confidence, normalizing_constant = _label_smoothing_constants(
+		kernel.shape[-1],
+		label_smoothing,
+	)
+
+	def step(carry, chunk):
+		hidden, target, weight = chunk
+		logits = _lm_head_chunk_logits(hidden, kernel)
+		log_z = jax.scipy.special.logsumexp(logits, axis=-1)
+		target_logit = jnp.take_along_axis(
+			logits,
+			jnp.maximum(target, 0)[..., None],
+			axis=-1,
+		)[..., 0]
+		if label_smoothing > 0.0:
+			target_logit = confidence * target_logit + low_confidence * (
+				jnp.sum(logits, axis=-1) - target_logit
+			)
+		token_z_loss = z_loss * jax.lax.square(log_z)
+		token_loss = log_z - target_logit + token_z_loss - normalizing_constant
+		correct = (jnp.argmax(logits, axis=-1) == target).astype(jnp.float32)
+		loss_sum, z_loss_sum, correct_sum = carry
+		carry = (
+			loss_sum + jnp.sum(token_loss * weight),
+			z_loss_sum + jnp.sum(token_z_loss * weight),
+			correct_sum + jnp.sum(correct * weight),
+		)
+		return carry, (log_z, token_loss, token_z_loss)
+
+	zero = jnp.zeros((), jnp.float32)
+	outputs, (log_z, token_loss, token_z_loss) = lax.scan(
+		step,
+		(zero, zero, zero),
+		(
+			_to_chunks(hidden_states, chunk_size),
+			_to_chunks(targets, chunk_size),
+			_to_chunks(weights, chunk_size),
+		),
+	)
+	residuals = (
+		hidden_states,
+		kernel,
+		targets,
+		weights,
+		_from_chunks(log_z),
+		_from_chunks(token_loss),
+		_from_chunks(token_z_loss),
+	)
+	return outputs, residuals
+
+
+def _chunked_lm_head_cross_entropy_bwd(
+	chunk_size: int,
+	z_loss: float,
+	label_smoothing: float,
+	residuals,
+	g,
+):
+	"""Backward pass of `_chunked_lm_head_cross_entropy`, recomputing each chunk's logits."""
+	hidden_states, kernel, targets, weights, log_z, token_loss, token_z_loss = residuals
+	g_loss, g_z_loss, _ = g
+	vocab_size = kernel.shape[-1]
+	confidence, low_confidence, _ = _label_smoothing_constants(
+		vocab_size, label_smoothing
+	)
+
+	def step(g_kernel, chunk):
+		hidden, target, weight, chunk_log_z = chunk
+		logits = _lm_head_chunk_logits(hidden, kernel)
+		probs = jnp.exp(logits - chunk_log_z[..., None])
+		weight = weight.astype(jnp.float32)
+		probs_coef = weight * (
+			g_loss * (1.0 + 2.0 * z_loss * chunk_log_z)
+			+ g_z_loss * 2.0 * z_loss * chunk_log_z
+		)
+		soft_targets = onehot(
+			target,
+			vocab_size,
+			on_value=confidence,
+			off_value=low_confidence,
+		)
+		g_logits = (
+			probs_coef[..., None] * probs - (g_loss * weight)[..., None] * soft_targets
+		)
+		g_hidden = jnp.einsum(
+			"bcv,hv->bch",
+			g_logits,
+			kernel.astype(jnp.float32),
+			preferred_element_type=jnp.float32,
+		)
+		g_kernel = g_kernel + jnp.einsum(
+			"bch,bcv->hv",
+			hidden.astype(jnp.float32),
+			g_logits,
+			preferred_element_type=jnp.float32,
+		)
+		return g_kernel, g_hidden.astype(hidden_states.dtype)
+
+	g_kernel, g_hidden = lax.scan(
+		step,
+		jnp.zeros(kernel.shape, jnp.float32),
+		(
+			_to_chunks(hidden_states, chunk_size),
+			_to_chunks(targets, chunk_size),
+			_to_chunks(weights, chunk_size),
+			_to_chunks(log_z, chunk_size),
+		),
+	)
+	g_weights = g_loss * token_loss + g_z_loss * token_z_loss
+	return (
+		_from_chunks(g_hidden),
+		g_kernel.astype(kernel.dtype),
+		np.zeros(targets.shape, dtype=jax.dtypes.float0),
+		g_weights.astype(weights.dtype),
+	)
+
+
+@partial(jax.custom_vjp, nondiff_argnums=(4, 5, 6))
+def _chunked_lm_head_cross_entropy(
+	hidden_states: chex.Array,
+	kernel: chex.Array,
+	targets: chex.Array,
+	weights: chex.Array,
+	chunk_size: int,
+	z_loss: float,
+	label_smoothing: float,
+) -> tp.Tuple[chex.Array, chex.Array, chex.Array]:
+	return _chunked_lm_head_cross_entropy_fwd(
+		hidden_states,
+		kernel,
+		targets,
+		weights,
+		chunk_size,
+		z_loss,
+		label_smoothing,
+	)[0]
+
+
+_chunked_lm_head_cross_entropy.defvjp(
+	_chunked_lm_head_cross_entropy_fwd,
+	_chunked_lm_head_cross_entropy_bwd,
+)
+
+
+def chunked_lm_head_cross_entropy_and_accuracy(
+	hidden_states: chex.Array,
+	kernel: chex.Array,
+	targets: chex.Array,
+	weights: tp.Optional[chex.Array] = None,
+	chunk_size: int = 1024,
+	label_smoothing: float = 0.0,
+	z_loss: float = 0.0,
+	loss_normalizing_factor: tp.Optional[float] = None,
+) -> tp.Tuple[chex.Array, chex.Array, chex.Array, chex.Array]:
+	"""
+	Computes the same values as `compute_weighted_cross_entropy_and_accuracy` for
+	`hidden_states @ kernel` without materializing the full logits.
+
+	The sequence is processed in chunks of `chunk_size` tokens under `lax.scan`; the
+	backward pass recomputes each chunk's logits, so peak memory holds one
+	`[batch, chunk_size, vocab_size]` block instead of `[batch, seq_len, vocab_size]`.
+
+	Args:
+	    hidden_states: Final hidden states, shape (batch_size, seq_len, hidden_size).
+	    kernel: LM-head kernel, shape (hidden_size, vocab_size).
+	    targets: The target class labels (integers), shape (batch_size, seq_len).
+	    weights: tp.Optional weights for each example.
+	    chunk_size: Number of sequence positions projected at once.
+	    label_smoothing: Label smoothing factor.
+	    z_loss: Coefficient for the auxiliary z-loss term.
+	    loss_normalizing_factor: A factor to normalize the loss.
+
+	Returns:
+	    A tuple containing the total loss, z-loss, sum of weights, and accuracy.
+	"""
+	if not 0.0 <= label_smoothing < 1.0:
+		raise ValueError(f"label_smoothing must be in range 0~1, got {label_smoothing}")
+	if z_loss < 0.0:
+		raise ValueError(f"z_loss must be non-negative, got {z_loss}")
+	if chunk_size <= 0:
+		raise ValueError(f"chunk_size must be positive, got {chunk_size}")
+	if hidden_states.ndim != 3 or hidden_states.shape[:2] != targets.shape:
+		raise ValueError(
+			f"Incorrect shapes. Got shape {hidden_states.shape} hidden_states "
+			f"and {targets.shape} targets"
+		)
+	if weights is None:
+		weight_sum = reduce(mul, targets.shape, 1)
+		weights = jnp.ones(targets.shape, jnp.float32)
+	else:
+		weight_sum = jnp.sum(weights)
+	weights = weights.astype(jnp.float32)
+
+	seq_len = targets.shape[1]
+	chunk_size = min(chunk_size, seq_len)
+	padding = -seq_len % chunk_size
+	if padding:
+		hidden_states = jnp.pad(hidden_states, ((0, 0), (0, padding), (0, 0)))
+		targets = jnp.pad(targets, ((0, 0), (0, padding)))
+		weights = jnp.pad(weights, ((0, 0), (0, padding)))
+
+	total_loss, total_z_loss, num_correct = _chunked_lm_head_cross_entropy(
+		hidden_states,
+		kernel,
+		targets,
+		weights,
+		chunk_size,
+		float(z_loss),
+		float(label_smoothing),
+	)
+	if loss_normalizing_factor is not None:
+		total_loss /= loss_normalizing_factor
+		total_z_loss /= loss_normalizing_factor
+	return total_loss, total_z_loss, weight_sum, num_correct / weight_sum
+
+
 def cross_entropy_loss_and_accuracy(source, target, valid=None):
 	if valid is None:
 		valid = jnp.ones(target.shape[:2])
@@ -823,6 +1086,123 @@ def ForCausalLMLoss(
 	return loss
 
 
+def ForCausalLMChunkedLoss(
+	hidden_states: jax.Array,
+	lm_head_kernel: jax.Array,
+	labels: jax.Array,
+	attention_mask: tp.Optional[jax.Array] = None,
+	config: tp.Optional[LossConfig] = None,
+	paxis: tp.Optional[PartitionAxis] = None,
+	num_items_in_batch: tp.Optional[int] = None,
+	batch: tp.Optional[tp.Mapping[str, chex.Array]] = None,
+	**kwargs: tp.Any,
+) -> LossMetrics:
+	"""
+	Memory-efficient variant of `ForCausalLMLoss` that takes the final hidden states
+	and the LM-head kernel instead of logits; see `chunked_lm_head_cross_entropy_and_accuracy`.
+
+	Args:
+	    hidden_states: Final (normalized) hidden states, shape (batch_size, seq_len, hidden_size).
+	    lm_head_kernel: LM-head kernel, shape (hidden_size, vocab_size).
+	    labels: True labels, shape (batch_size, seq_len). Must be integers.
+	    num_items_in_batch: tp.Optional, used when reduction should be sum.
+	    batch: tp.Optional batch for dynamic loss normalization
+	    **kwargs: Additional keyword arguments (ignored).
+
+	Returns:
+	    The computed causal language modeling loss.
+	"""
+	if hidden_states is None or lm_head_kernel is None or labels is None:
+		raise ValueError("Hidden states, LM-head kernel and labels cannot be None")
+	if config is None:
+		config = LossConfig()
+	if config.reduction is not None:
+		raise NotImplementedError(
+			f"chunked LM-head loss does not support `reduction={config.reduction}`."
+		)
+	if paxis is not None:
+		hidden_states = with_sharding_constraint(
+			hidden_states,
+			PartitionSpec(
+				paxis.batch_axis,
+				paxis.sequence_axis,
+				paxis.hidden_state_axis,
+			),
+		)
+		labels = with_sharding_constraint(
+			labels,
+			PartitionSpec(
+				paxis.batch_axis,
+				paxis.sequence_axis,
+			),
+		)
+	# shifting the labels instead of the hidden states avoids copying them; the last
+	# position gets a zero weight.
+	target = labels[:, 1:] if config.shift_tokens else labels
+	mask = (
+		attention_mask if attention_mask is not None else (target != config.ignore_index)
+	)
+	nwn_cond = str(SpecialLossNormalizingFactor.NO_WEIGHT_NUM_REAL_TARGET_TOKENS)
+	if config.loss_normalizing_factor in nwn_cond:
+		# per-sequence token average, as in `cross_entropy_loss_and_accuracy`.
+		mask = mask.astype(jnp.float32)
+		valid_length = jnp.maximum(jnp.sum(mask, axis=-1, keepdims=True), 1e-10)
+		loss_weights = mask / (valid_length * mask.shape[0])
+		loss_normalizing_factor = None
+		label_smoothing, z_loss = 0.0, 0.0
+	else:
+		if batch is None:
+			if config.loss_normalizing_factor in str(
+				SpecialLossNormalizingFactor.NUM_REAL_TARGET_TOKENS
+			):
+				batch = {
+					"decoder_target_tokens": target,
+					"decoder_loss_weights": mask,
+				}
+			else:
+				batch = {}
+		(
+			loss_normalizing_factor,
+			loss_weights,
+		) = get_loss_normalizing_factor_and_weights(config.loss_normalizing_factor, batch)
+		if loss_weights is None:
+			loss_weights = jnp.ones(target.shape, jnp.float32)
+		label_smoothing, z_loss = config.label_smoothing, config.z_loss
+	if config.shift_tokens:
+		target = jnp.pad(target, ((0, 0), (0, 1)))
+		loss_weights = jnp.pad(loss_weights, ((0, 0), (0, 1)))
+
+	(
+		total_loss,
+		total_z_loss,
+		weight_sum,
+		accuracy,
+	) = chunked_lm_head_cross_entropy_and_accuracy(
+		hidden_states=hidden_states,
+		kernel=lm_head_kernel,
+		targets=target,
+		weights=loss_weights,
+		chunk_size=config.lm_head_chunk_size or 1024,
+		label_smoothing=label_smoothing,
+		z_loss=z_loss,
+		loss_normalizing_factor=loss_normalizing_factor,
+	)
+	loss = total_loss
+	if config.loss_normalizing_factor in nwn_cond:
+		accuracy = accuracy * weight_sum
+		total_z_loss, weight_sum = 0.0, 1.0
+	elif num_items_in_batch is not None:
+		loss = total_loss / num_items_in_batch
+	elif config.divide_weight_sum:
+		loss = total_loss / weight_sum
+	return LossMetrics(
+		loss=loss,
+		z_loss=total_z_loss,
+		weight_sum=weight_sum,
+		accuracy=accuracy,
+	)
+
+
 def ForSequenceClassificationLoss(
 	labels: jax.Array,
 	logits: jax.Array,
@@ -18,7 +18,11 @@ import numpy as np
 import pytest
 
 from .loss_utils import (
+	ForCausalLMChunkedLoss,
+	ForCausalLMLoss,
+	LossConfig,
 	SpecialLossNormalizingFactor,
+	chunked_lm_head_cross_entropy_and_accuracy,
 	auxiliary_load_balancing_loss_func,
 	compute_weighted_cross_entropy,
 	compute_weighted_cross_entropy_and_accuracy,
@@ -523,5 +527,150 @@ def test_fixed_cross_entropy_input_validation():
 		fixed_cross_entropy(jnp.array([[1, 2, 3], [1, 2, 3]]), None)
 
 
+@pytest.mark.parametrize("chunk_size", [3, 8, 64])
+def test_chunked_lm_head_cross_entropy_matches_dense(chunk_size):
+	"""Test chunked LM-head loss against the dense loss, including gradients."""
+	rng = np.random.RandomState(0)
+	hidden_states = jnp.array(rng.randn(2, 10, 16), jnp.float32)
+	kernel = jnp.array(rng.randn(16, 32) * 0.1, jnp.float32)
+	targets = jnp.array(rng.randint(0, 32, (2, 10)))
+	weights = jnp.array(rng.rand(2, 10), jnp.float32)
+
+	def dense(hidden_states, kernel, weights):
+		total_loss, _, _, accuracy = compute_weighted_cross_entropy_and_accuracy(
+			hidden_states @ kernel,
+			targets,
+			weights,
+			label_smoothing=0.1,
+			z_loss=1e-3,
+			loss_normalizing_factor=7.0,
+		)
+		return total_loss, accuracy
+
+	def chunked(hidden_states, kernel, weights):
+		total_loss, _, _, accuracy = chunked_lm_head_cross_entropy_and_accuracy(
+			hidden_states,
+			kernel,
+			targets,
+			weights,
+			chunk_size=chunk_size,
+			label_smoothing=0.1,
+			z_loss=1e-3,
+			loss_normalizing_factor=7.0,
+		)
+		return total_loss, accuracy
+
+	grad_fn = jax.value_and_grad(dense, argnums=(0, 1, 2), has_aux=True)
+	(expected_loss, expected_accuracy), expected_grads = grad_fn(
+		hidden_states, kernel, weights
+	)
+	grad_fn = jax.jit(jax.value_and_grad(chunked, argnums=(0, 1, 2), has_aux=True))
+	(loss, accuracy), grads = grad_fn(hidden_states, kernel, weights)
+
+	np.testing.assert_allclose(loss, expected_loss, rtol=1e-5)
+	np.testing.assert_allclose(accuracy, expected_accuracy, rtol=1e-5)
+	for grad, expected_grad in zip(grads, expected_grads):
+		np.testing.assert_allclose(grad, expected_grad, rtol=1e-4, atol=1e-6)
+
+
+@pytest.mark.parametrize(
+	"loss_normalizing_factor", ["NUM_REAL_TARGET_TOKENS", "AVERAGE_PER_SEQUENCE"]
+)
+def test_causal_lm_chunked_loss_matches_dense(loss_normalizing_factor):
+	"""Test `ForCausalLMChunkedLoss` against `ForCausalLMLoss` on shifted, masked labels."""
+	rng = np.random.RandomState(1)
+	hidden_states = jnp.array(rng.randn(2, 9, 16), jnp.float32)
+	kernel = jnp.array(rng.randn(16, 32) * 0.1, jnp.float32)
+	labels = jnp.array(rng.randint(0, 32, (2, 9))).at[0, :3].set(-100)
+	batch = None
+	if loss_normalizing_factor == "AVERAGE_PER_SEQUENCE":
+		batch = {
+			"decoder_target_tokens": labels[:, 1:],
+			"decoder_loss_weights": (labels[:, 1:] != -100).astype(jnp.float32),
+		}
+	config = LossConfig(
+		loss_normalizing_factor=loss_normalizing_factor,
+		lm_head_chunk_size=4,
+		z_loss=1e-3,
+	)
+
+	def dense(hidden_states, kernel):
+		metrics = ForCausalLMLoss(
+			hidden_states @ kernel, labels, config=config, batch=batch
+		)
+		return metrics.loss, metrics
+
+	def chunked(hidden_states, kernel):
+		metrics = ForCausalLMChunkedLoss(
+			hidden_states, kernel, labels, config=config, batch=batch
+		)
+		return metrics.loss, metrics
+
+	(expected_loss, expected), expected_grads = jax.value_and_grad(
+		dense, argnums=(0, 1), has_aux=True
+	)(hidden_states, kernel)
+	(loss, metrics), grads = jax.value_and_grad(chunked, argnums=(0, 1), has_aux=True)(
+		hidden_states, kernel
+	)
+
+	np.testing.assert_allclose(loss, expected_loss, rtol=1e-5)
+	np.testing.assert_allclose(metrics.accuracy, expected.accuracy, rtol=1e-5)
+	np.testing.assert_allclose(metrics.weight_sum, expected.weight_sum, rtol=1e-5)
+	for grad, expected_grad in zip(grads, expected_grads):
+		np.testing.assert_allclose(grad, expected_grad, rtol=1e-4, atol=1e-6)
+
+
+def _tiny_llama():
+	import flax
+
+	import easydel as ed
+
+	config = ed.LlamaConfig(
+		vocab_size=32,
+		hidden_size=16,
+		intermediate_size=32,
+		num_hidden_layers=1,
+		num_attention_heads=2,
+		num_key_value_heads=2,
+		max_position_embeddings=16,
+	)
+	return ed.LlamaForCausalLM(
+		config=config,
+		dtype=jnp.float32,
+		param_dtype=jnp.float32,
+		rngs=flax.nnx.Rngs(0),
+	)
+
+
+def test_chunked_loss_falls_back_on_custom_reduction():
+	model = _tiny_llama()
+	input_ids = jnp.array(np.random.RandomState(0).randint(0, 32, (2, 8)))
+	with pytest.warns(UserWarning, match="reduction"):
+		_, metrics = model.compute_loss(
+			input_ids=input_ids,
+			labels=input_ids,
+			loss_config=LossConfig(lm_head_chunk_size=4, reduction="mean"),
+		)
+	_, expected = model.compute_loss(
+		input_ids=input_ids,
+		labels=input_ids,
+		loss_config=LossConfig(reduction="mean"),
+	)
+	np.testing.assert_allclose(metrics.loss, expected.loss, rtol=1e-6)
+
+
+def test_chunked_loss_falls_back_on_wrapped_lm_head():
+	model = _tiny_llama().apply_lora_to_layers(lora_rank=2, lora_pattern=".*lm_head.*")
+	input_ids = jnp.array(np.random.RandomState(0).randint(0, 32, (2, 8)))
+	with pytest.warns(UserWarning, match="nn.Linear"):
+		_, metrics = model.compute_loss(
+			input_ids=input_ids,
+			labels=input_ids,
+			loss_config=LossConfig(lm_head_chunk_size=4),
+		)
+	_, expected = model.compute_loss(input_ids=input_ids, labels=input_ids)
+	np.testing.assert_allclose(metrics.loss, expected.loss, rtol=1e-6)
+
+
 if __name__ == "__main__":
 	pytest.main([__file__])
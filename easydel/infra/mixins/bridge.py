@@ -14,10 +14,12 @@
 from __future__ import annotations
 
 import gc
+import json
 import os
 import typing as tp
 import warnings
 from copy import deepcopy
+from functools import partial
 from pathlib import Path
 
 import jax
@@ -25,12 +27,13 @@ import jax.extend
 import jax.tree_util
 from flax import nnx as nn
 from jax import numpy as jnp
-from jax.sharding import PartitionSpec
+from jax.sharding import NamedSharding, PartitionSpec
 from transformers.utils.generic import working_or_temp_dir
 from transformers.utils.hub import PushToHubMixin
 
 from easydel.escale import PartitionAxis
 from easydel.utils.checkpoint_managers import CheckpointManager
+from easydel.utils.checkpoint_managers.streamer import SHARDED_INDEX_SUFFIX
 from easydel.utils.helpers import get_logger
 from easydel.utils.readme_generator import (
 	ModelInfo,
@@ -48,6 +51,7 @@ from ..base_config import (
 	EasyDeLBaseConfig,
 	EasyDeLBaseConfigDict,
 )
+from ..base_state import SHARDED_WEIGHTS_PREFIX
 from ..etils import (
 	EasyDeLBackends,
 	EasyDeLPlatforms,
@@ -58,6 +62,8 @@ from ..utils import quantize_linear_layers
 logger = get_logger(__name__)
 
 FLAX_WEIGHTS_NAME = "easydel-model.parameters"
+# multi-file checkpoints: `{"metadata": ..., "weight_map": {key: file}}`.
+FLAX_WEIGHTS_INDEX_NAME = FLAX_WEIGHTS_NAME + SHARDED_INDEX_SUFFIX
 
 
 class EasyBridgeMixin(PushToHubMixin):
@@ -94,6 +100,22 @@ class EasyBridgeMixin(PushToHubMixin):
 		)
 		return ReadmeGenerator().generate_readme(model_info)
 
+	def _save_model_config(self, save_directory: Path):
+		"""Saves the model's configuration and generation config to `save_directory`.
+
+		Args:
+		  save_directory (Path): The directory where the configuration files will be saved.
+		"""
+		save_directory.mkdir(parents=True, exist_ok=True)
+
+		config_to_save = deepcopy(self.config)
+		config_to_save.__dict__.pop("attn_dtype", None)  # Make sure dtypes are not included
+		config_to_save.architectures = [self.__class__.__name__]
+		config_to_save.save_pretrained(str(save_directory))
+
+		if self.can_generate() and hasattr(self, "generation_config"):
+			self.generation_config.save_pretrained(str(save_directory))
+
 	def _save_model_files(
 		self,
 		save_directory: Path,
@@ -114,15 +136,7 @@ class EasyBridgeMixin(PushToHubMixin):
 			enable (bool): if True, allows file to be saved (used for multi-host saving models).
 		"""
 
-		save_directory.mkdir(parents=True, exist_ok=True)
-
-		config_to_save = deepcopy(self.config)
-		config_to_save.__dict__.pop("attn_dtype", None)  # Make sure dtypes are not included
-		config_to_save.architectures = [self.__class__.__name__]
-		config_to_save.save_pretrained(str(save_directory))
-
-		if self.can_generate() and hasattr(self, "generation_config"):
-			self.generation_config.save_pretrained(str(save_directory))
+		self._save_model_config(save_directory)
 
 		output_model_file = save_directory / FLAX_WEIGHTS_NAME
 		state = nn.split(self, nn.Param, ...)[1]
@@ -293,6 +307,26 @@ class EasyBridgeMixin(PushToHubMixin):
 		# 	return False
 		return True
 
+	@staticmethod
+	def _param_shardings(
+		model: nn.Module,
+		partition_rules: tp.Optional[tp.Tuple[tp.Tuple[str, PartitionSpec]]] = None,
+	) -> tp.Dict[str, NamedSharding]:
+		"""
+		Target sharding of every parameter of `model` from the partition rules, keyed
+		like the tensors of a checkpoint (`.`-joined, with or without a `params.` prefix).
+		"""
+		from easydel.escale import match_partition_rules
+
+		specs = match_partition_rules(
+			rules=model._get_partition_rules(partition_rules),
+			tree=model.graphtree_params_shape,
+		)
+		shardings = {}
+		for key, spec in flatten_dict(specs, sep=".").items():
+			shardings[key] = shardings["params." + key] = NamedSharding(model.mesh, spec)
+		return shardings
+
 	@classmethod
 	def _load_model_weights(
 		cls,
@@ -305,20 +339,38 @@ class EasyBridgeMixin(PushToHubMixin):
 		quantization_method: tp.Optional[EasyDeLQuantizationMethods],
 		quantization_block_size: int,
 		vebose: bool,
+		shardings: tp.Optional[tp.Dict[str, NamedSharding]] = None,
 	) -> nn.Module:
 		"""Loads model weights from a checkpoint file.
 
 		Args:
-		    resolved_archive_file: The path to the checkpoint file.
+		    resolved_archive_file: The path to the checkpoint file or index.
 		    model: A Flax model.
 		    mismatch_allowed: If True, allows mismatch in parameters while loading.
 		    verbose: Whether to print verbose messages.
 		    shard_fns: Custom shard functions for loading checkpoint.
+		    shardings: Target shardings tensors are loaded into directly (see
+		        `_param_shardings`).
 
 		Returns:
 		    A flax Module, with loaded parameter.
 		"""
-		if resolved_archive_file:
+		if (
+			resolved_archive_file
+			and os.path.basename(resolved_archive_file)
+			== SHARDED_WEIGHTS_PREFIX + SHARDED_INDEX_SUFFIX
+		):
+			state, _ = CheckpointManager.load_sharded_checkpoint(
+				directory=os.path.dirname(resolved_archive_file),
+				prefix=SHARDED_WEIGHTS_PREFIX,
+				shardings=shardings,
+				shard_fns=shard_fns,
+				mismatch_allowed=mismatch_allowed,
+				dtype=param_dtype,
+				verbose=verbose,
+			)
+			state = unflatten_dict(state, sep=".")
+		elif resolved_archive_file:
 			state, _ = CheckpointManager.load_checkpoint(
 				path=resolved_archive_file,
 				mismatch_allowed=mismatch_allowed,
@@ -326,15 +378,19 @@ class EasyBridgeMixin(PushToHubMixin):
 				shard_fns=shard_fns,
 				callback=None,
 				dtype=param_dtype,
+				shardings=shardings,
 			)
-
+		if resolved_archive_file:
 			params = state.get("params", None)
 			if params is not None:
 				state = params
+			from easydel.layers.scan import match_layer_params_layout
+
 			state = flatten_dict(state)
 			state = string_key_to_int(state)
 
 			required_params = set(flatten_dict(model.graphtree_params_shape))
+			state = match_layer_params_layout(state, required_params)
 			unexpected_keys = set(state.keys()) - required_params
 			if any([k[-1].startswith("quant_") for k in state.keys()]):
 				model = quantize_linear_layers(
@@ -414,6 +470,7 @@ class EasyBridgeMixin(PushToHubMixin):
 		"""
 
 		from huggingface_hub import HfApi
+		from huggingface_hub.utils import EntryNotFoundError
 		from transformers import GenerationConfig
 		from transformers.utils import download_url as _download_url
 		from transformers.utils import is_offline_mode as _is_offline_mode
@@ -421,7 +478,6 @@ class EasyBridgeMixin(PushToHubMixin):
 
 		from easydel.modules.auto.auto_configuration import (
 			AutoEasyDeLConfig,
-			AutoShardAndGatherFunctions,
 			get_modules_by_type,
 		)
 
@@ -468,18 +524,7 @@ class EasyBridgeMixin(PushToHubMixin):
 
 		if commit_hash is None:
 			commit_hash = getattr(config, "_commit_hash", None)
-		if auto_shard_model and shard_fns is None:
-			shard_fns, _ = AutoShardAndGatherFunctions.from_config(
-				config=config,
-				flatten=False,
-				partition_rules=partition_rules,
-				model_task=cls._model_task,
-			)
-			fns = {"params": shard_fns}
-			fns.update(shard_fns)
-			shard_fns = fns
-
-		elif auto_shard_model and shard_fns is not None:
+		if auto_shard_model and shard_fns is not None:
 			logger.warning(
 				"`auto_shard_model` will be ignored since `shard_fns` is provided."
 			)
@@ -494,6 +539,15 @@ class EasyBridgeMixin(PushToHubMixin):
 				archive_file = (
 					Path(pretrained_model_name_or_path) / subfolder / FLAX_WEIGHTS_NAME
 				)
+				for index_name in (
+					FLAX_WEIGHTS_INDEX_NAME,
+					# checkpoints written by `EasyDeLState.save_state`.
+					SHARDED_WEIGHTS_PREFIX + SHARDED_INDEX_SUFFIX,
+				):
+					if (
+						not archive_file.is_file() and archive_file.with_name(index_name).is_file()
+					):
+						archive_file = archive_file.with_name(index_name)
 				if not archive_file.is_file():
 					raise FileNotFoundError(
 						f"No file named '{FLAX_WEIGHTS_NAME}' found in directory '{pretrained_model_name_or_path}'."
@@ -510,18 +564,27 @@ class EasyBridgeMixin(PushToHubMixin):
 				resolved_archive_file = _download_url(pretrained_model_name_or_path)
 			else:
 				filename = FLAX_WEIGHTS_NAME
+				download = partial(
+					api.hf_hub_download,
+					repo_id=pretrained_model_name_or_path,
+					subfolder=subfolder,
+					revision=revision,
+					cache_dir=cache_dir,
+					force_download=force_download,
+					proxies=proxies,
+					token=token,
+					local_files_only=local_files_only,
+				)
 				try:
-					resolved_archive_file = api.hf_hub_download(
-						repo_id=pretrained_model_name_or_path,
-						filename=filename,
-						subfolder=subfolder,
-						revision=revision,
-						cache_dir=cache_dir,
-						force_download=force_download,
-						proxies=proxies,
-						token=token,
-						local_files_only=local_files_only,
-					)
+					try:
+						resolved_archive_file = download(filename=filename)
+					except EntryNotFoundError:
+						filename = FLAX_WEIGHTS_INDEX_NAME
+						resolved_archive_file = download(filename=filename)
+						with open(resolved_archive_file, "r", encoding="utf-8") as stream:
+							weight_files = set(json.load(stream)["weight_map"].values())
+						for weight_file in weight_files:
+							download(filename=weight_file)
 
 					if resolved_archive_file is None:
 						raise FileNotFoundError("No model parameters found!")
@@ -552,6 +615,10 @@ class EasyBridgeMixin(PushToHubMixin):
 			rngs=nn.Rngs(0),
 		)
 
+		shardings = None
+		if auto_shard_model and shard_fns is None:
+			# every process reads only its slices, straight into their final sharding.
+			shardings = cls._param_shardings(model, partition_rules)
 		model = cls._load_model_weights(
 			resolved_archive_file,
 			model,
@@ -562,6 +629,7 @@ class EasyBridgeMixin(PushToHubMixin):
 			quantization_method,
 			quantization_block_size,
 			vebose,
+			shardings=shardings,
 		)
 		model = quantize_linear_layers(
 			model,
@@ -624,6 +692,35 @@ class EasyBridgeMixin(PushToHubMixin):
 			get_modules_by_type,
 		)
 
+		safetensors_files = cls._resolve_hf_safetensors_files(
+			pretrained_model_name_or_path,
+			**kwargs,
+		)
+		if safetensors_files is not None:
+			return cls._from_hf_safetensors(
+				pretrained_model_name_or_path=pretrained_model_name_or_path,
+				safetensors_files=safetensors_files,
+				device=device,
+				dtype=dtype,
+				param_dtype=param_dtype,
+				precision=precision,
+				sharding_axis_dims=sharding_axis_dims,
+				sharding_axis_names=sharding_axis_names,
+				partition_axis=partition_axis,
+				shard_attention_computation=shard_attention_computation,
+				shard_fns=shard_fns,
+				backend=backend,
+				platform=platform,
+				config_kwargs=config_kwargs,
+				auto_shard_model=auto_shard_model,
+				partition_rules=partition_rules,
+				quantization_method=quantization_method,
+				quantization_block_size=quantization_block_size,
+				verbose=verbose,
+				trust_remote_code=kwargs.get("trust_remote_code", False),
+				hub_kwargs=cls._hf_hub_kwargs(kwargs),
+			)
+
 		try:
 			import torch
 
@@ -734,9 +831,16 @@ class EasyBridgeMixin(PushToHubMixin):
 		)
 		del state_dict
 		_clear()
-		if is_flatten(params):
-			logger.info("converted parameters are flatten making them unflatten.")
-			params = unflatten_dict(params)
+		from easydel.layers.scan import match_layer_params_layout
+
+		if not is_flatten(params):
+			params = flatten_dict(params)
+		params = unflatten_dict(
+			match_layer_params_layout(
+				params,
+				flatten_dict(model.graphtree_params_shape).keys(),
+			)
+		)
 
 		logger.debug("merging model and parameters pytree.")
 		model = merge_model_and_tree(model=model, tree=params)
@@ -757,6 +861,188 @@ class EasyBridgeMixin(PushToHubMixin):
 		logger.debug("returning model.")
 		return model
 
+	@staticmethod
+	def _hf_hub_kwargs(kwargs: tp.Mapping[str, tp.Any]) -> tp.Dict[str, tp.Any]:
+		"""
+		The `from_pretrained` keyword arguments that select and authenticate the hub
+		files (cache, revision, token, subfolder, ...), shared by every file fetched
+		for a checkpoint so weights, config and generation config stay consistent.
+		"""
+		return {
+			name: kwargs[name]
+			for name in (
+				"cache_dir",
+				"force_download",
+				"proxies",
+				"token",
+				"revision",
+				"local_files_only",
+				"subfolder",
+			)
+			if name in kwargs
+		}
+
+	@classmethod
+	def _resolve_hf_safetensors_files(
+		cls,
+		pretrained_model_name_or_path: str,
+		**kwargs,
+	) -> tp.Optional[tp.List[str]]:
+		"""
+		Local paths of the safetensors files of a HuggingFace checkpoint (a directory or a
+		hub repository, downloaded if needed), or `None` if it has no safetensors weights.
+		"""
+		from transformers.utils import SAFE_WEIGHTS_INDEX_NAME, SAFE_WEIGHTS_NAME
+		from transformers.utils.hub import cached_file, get_checkpoint_shard_files
+
+		hub_kwargs = cls._hf_hub_kwargs(kwargs)
+		for filename in (SAFE_WEIGHTS_INDEX_NAME, SAFE_WEIGHTS_NAME):
+			try:
+				resolved = cached_file(
+					pretrained_model_name_or_path,
+					filename,
+					_raise_exceptions_for_missing_entries=False,
+					_raise_exceptions_for_connection_errors=False,
+					**hub_kwargs,
+				)
+			except EnvironmentError:
+				resolved = None
+			if resolved is None:
+				continue
+			if filename == SAFE_WEIGHTS_NAME:
+				return [resolved]
+			files, _ = get_checkpoint_shard_files(
+				pretrained_model_name_or_path,
+				resolved,
+				**hub_kwargs,
+			)
+			return files
+		return None
+
+	@classmethod
+	def _from_hf_safetensors(
+		cls,
+		pretrained_model_name_or_path: str,
+		safetensors_files: tp.List[str],
+		device: tp.Optional[jax.Device] = None,
+		dtype: jax.numpy.dtype = jax.numpy.float32,
+		param_dtype: jax.numpy.dtype = jax.numpy.float32,
+		precision: tp.Optional[jax.lax.Precision] = None,
+		sharding_axis_dims: tp.Sequence[int] = (1, -1, 1, 1),
+		sharding_axis_names: tp.Sequence[str] = ("dp", "fsdp", "tp", "sp"),
+		partition_axis: tp.Optional[PartitionAxis] = None,
+		shard_attention_computation: bool = True,
+		shard_fns: tp.Optional[tp.Mapping[tuple, tp.Callable] | dict] = None,
+		backend: tp.Optional[EasyDeLBackends] = None,
+		platform: tp.Optional[EasyDeLPlatforms] = None,
+		config_kwargs: tp.Optional[EasyDeLBaseConfigDict] = None,
+		auto_shard_model: bool = False,
+		partition_rules: tp.Optional[tp.Tuple[tp.Tuple[str, PartitionSpec], ...]] = None,
+		quantization_method: tp.Optional[EasyDeLQuantizationMethods] = None,
+		quantization_block_size: int = 128,
+		verbose: bool = True,
+		trust_remote_code: bool = False,
+		hub_kwargs: tp.Optional[tp.Dict[str, tp.Any]] = None,
+	):
+		"""
+		Converts a HuggingFace safetensors checkpoint without torch: tensors are streamed
+		from the memory-mapped files, converted on a thread pool and put in their final
+		sharding one by one, so the host never holds more than a few of them.
+
+		`hub_kwargs` (see `_hf_hub_kwargs`) are used to fetch the configs, so they come
+		from the same revision/subfolder/cache as `safetensors_files`.
+		"""
+		from transformers import AutoConfig, GenerationConfig
+
+		from easydel.layers.scan import match_layer_params_layout
+		from easydel.modules.auto.auto_configuration import get_modules_by_type
+
+		hub_kwargs = hub_kwargs or {}
+		config = AutoConfig.from_pretrained(
+			pretrained_model_name_or_path,
+			trust_remote_code=trust_remote_code,
+			**hub_kwargs,
+		)
+		config_class, module, _ = get_modules_by_type(
+			config.model_type,
+			task_type=cls._model_task,
+		)
+		config_class = config_class.from_pretrained(
+			pretrained_model_name_or_path,
+			**hub_kwargs,
+		)
+		if hasattr(config_class, "add_jax_args"):
+			config_class.add_jax_args()
+		config_class.add_basic_configurations(
+			axis_dims=sharding_axis_dims,
+			axis_names=sharding_axis_names,
+			partition_axis=partition_axis,
+			backend=backend,
+			platform=platform,
+			shard_attention_computation=shard_attention_computation,
+		)
+		if config_kwargs is not None:
+			for k, v in config_kwargs.items():
+				setattr(config_class, k, v)
+
+		model = module.lazy_init(
+			config=config_class,
+			dtype=dtype,
+			param_dtype=param_dtype,
+			precision=precision,
+			rngs=nn.Rngs(0),
+		)
+		try:
+			model.generation_config = GenerationConfig.from_pretrained(
+				pretrained_model_name_or_path,
+				**hub_kwargs,
+			)
+		except OSError:
+			model.generation_config = None
+
+		shardings = None
+		if shard_fns is not None:
+			if auto_shard_model:
+				warnings.warn(
+					"`auto_shard_model` will be ignored since you are passing custom sharding functions",
+					stacklevel=1,
+				)
+			if not is_flatten(shard_fns):
+				shard_fns = flatten_dict(shard_fns)
+		elif auto_shard_model:
+			shardings = cls._param_shardings(model, partition_rules)
+
+		required_keys = set(flatten_dict(model.graphtree_params_shape))
+		params = model.safetensors_transform_fn(
+			safetensors_files,
+			device=device,
+			shardings=shardings,
+			shard_fns=shard_fns,
+			# scanned models stack the per-layer tensors after conversion.
+			required_keys=None
+			if getattr(config_class, "scan_layers", False)
+			else required_keys,
+			uses_tie_word_embedding=getattr(config, "tie_word_embeddings", False),
+			verbose=verbose,
+		)
+		params = unflatten_dict(
+			match_layer_params_layout(flatten_dict(params), required_keys)
+		)
+		model = merge_model_and_tree(model=model, tree=params)
+		if auto_shard_model:
+			model = model.fully_shard()
+		if (
+			quantization_method is not None
+			and quantization_method != EasyDeLQuantizationMethods.NONE
+		):
+			model = quantize_linear_layers(
+				model,
+				method=quantization_method,
+				block_size=quantization_block_size,
+				verbose=verbose,
+			)
+		return model
+
 	@classmethod
 	def get_torch_loader(cls):
 		from ..factory import TaskType
@@ -38,6 +38,10 @@ from easydel.inference.logits_process import (
 	FlaxTopKLogitsWarper,
 	FlaxTopPLogitsWarper,
 )
+from easydel.layers.caching.paged_transformer_cache import (
+	PagedTransformerCache,
+	PagedTransformerCacheMetaData,
+)
 from easydel.layers.caching.transformer_cache import (
 	TransformerCache,
 	TransformerCacheMetaData,
@@ -127,13 +131,24 @@ class EasyGenerationMixin:
 	_model_task: tp.Optional[str] = None
 	_model_type: tp.Optional[str] = None
 
-	def init_cache(self, batch_size: int, max_length: int):
+	def _get_cache_head_dims(self) -> tp.Tuple[int, int]:
 		head_dim = getattr(self.config, "head_dim", None)
 		if head_dim is None:
 			head_dim = self.config.hidden_size // self.config.num_attention_heads
 		num_key_value_heads = getattr(self.config, "num_key_value_heads", None)
 		if num_key_value_heads is None:
 			num_key_value_heads = self.config.num_attention_heads
+		return head_dim, num_key_value_heads
+
+	def _get_cache_sliding_windows(self) -> tp.Optional[tp.List[tp.Optional[int]]]:
+		"""
+		Per-layer attention windows; layers with a window shorter than the generation
+		get a ring-buffer cache of that size. Models with sliding-window layers override it.
+		"""
+		return None
+
+	def init_cache(self, batch_size: int, max_length: int):
+		head_dim, num_key_value_heads = self._get_cache_head_dims()
 		return TransformerCache.init_layers_cache(
 			num_hidden_layers=self.config.num_hidden_layers,
 			dtype=self.dtype,
@@ -155,6 +170,49 @@ class EasyGenerationMixin:
 				quantization_platform=self.config.platform,
 			),
 			mesh=self.config.mesh,
+			sliding_windows=self._get_cache_sliding_windows(),
+		)
+
+	def init_paged_cache(
+		self,
+		batch_size: int,
+		num_blocks: int,
+		block_size: int,
+		max_length: int,
+	) -> PagedTransformerCache:
+		"""
+		Initializes a paged KV cache: a shared pool of `num_blocks` blocks of
+		`block_size` tokens per layer, addressed by a per-sequence block table.
+
+		Args:
+		    batch_size: Number of rows (sequences) of the block table.
+		    num_blocks: Number of blocks in the pool (shared by every sequence).
+		    block_size: Number of tokens per block.
+		    max_length: Longest sequence a single row may hold.
+
+		Returns:
+		    PagedTransformerCache: A cache with empty block tables; fill them with
+		    `PagedTransformerCache.update_block_tables` and a `BlockAllocator`.
+		"""
+		head_dim, num_key_value_heads = self._get_cache_head_dims()
+		return PagedTransformerCache.init_layers_cache(
+			num_hidden_layers=self.config.num_hidden_layers,
+			dtype=self.dtype,
+			key_values_partition_specs=PartitionSpec(
+				None,
+				None,
+				self.config.partition_axis.head_axis,
+				self.config.partition_axis.attention_dim_axis,
+			),
+			metadata=PagedTransformerCacheMetaData.create(
+				batch_size=batch_size,
+				num_blocks=num_blocks,
+				block_size=block_size,
+				max_blocks_per_sequence=-(-max_length // block_size),
+				num_heads=num_key_value_heads,
+				head_dim=head_dim,
+			),
+			mesh=self.config.mesh,
 		)
 
 	@cached_property
@@ -738,6 +738,12 @@ class BaseModuleProtocol(metaclass=ABCMeta):
 		"""generates a pure transform function for converting torch to easydel module."""
 		...
 
+	@property
+	@abstractmethod
+	def safetensors_transform_fn(self) -> tp.Callable:
+		"""generates a torch-free transform function for converting safetensors checkpoints to easydel module."""
+		...
+
 	@property
 	@abstractmethod
 	def params_sharding(self) -> tp.Dict:
@@ -531,6 +531,8 @@ class FlaxMaskedLMOutput(ModelOutput):
 
 	        Attentions weights after the attention softmax, used to compute the weighted average in the self-attention
 	        heads.
+	    last_hidden_state (`chex.Array` of shape `(batch_size, sequence_length, hidden_size)`, *optional*, returned when `apply_lm_head=False` is passed):
+	        Final hidden states that would be fed to the language modeling head (used by chunked LM-head losses).
 	"""
 
 	logits: chex.Array = None
@@ -538,6 +540,7 @@ class FlaxMaskedLMOutput(ModelOutput):
 	attentions: tp.Optional[tp.Tuple[chex.Array]] = None
 	past_key_values: tp.Optional[TransformerCache] = None
 	loss: tp.Optional[chex.Array] = None
+	last_hidden_state: tp.Optional[chex.Array] = None
 
 
 FlaxCausalLMOutput = FlaxMaskedLMOutput
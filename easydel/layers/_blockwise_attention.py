@@ -26,12 +26,15 @@ import jax.lax as lax
 import jax.numpy as jnp
 from einops import rearrange
 
+from easydel.layers.masking import AttentionMask
+
 
 def blockwise_attn(
 	query,
 	key,
 	value,
 	bias=None,
+	segment_ids=None,
 	deterministic=True,
 	dropout_rng=None,
 	attn_pdrop=0.0,
@@ -46,6 +49,7 @@ def blockwise_attn(
 ):
 	# query, key, value: (batch, seq_len, num_heads, dim_per_head)
 	# bias: (batch, seq_len) can be used to mask out attention (e.g. padding)
+	# segment_ids: (batch, seq_len) packed documents, only attending within themselves
 	# causal: whether to use causal mask
 	# policy: one of jax.checkpoint_policies
 	query = query / jnp.sqrt(query.shape[-1]).astype(dtype)
@@ -83,6 +87,7 @@ def blockwise_attn(
 		query_chunk_size,
 		key_chunk_size,
 		bias,
+		segment_ids,
 		deterministic,
 		attn_dropout,
 		attn_pdrop,
@@ -157,6 +162,7 @@ def _chunk_attention_bias(
 	query_chunk_size,
 	key_chunk_size,
 	bias,
+	segment_ids,
 	deterministic,
 	attn_dropout,
 	attn_pdrop,
@@ -179,17 +185,25 @@ def _chunk_attention_bias(
 			),
 		)
 
-	if causal:
-		query_idx = lax.broadcasted_iota(
-			dtype=jnp.int32, shape=(query_chunk_size, 1), dimension=0
-		)
-		key_idx = lax.broadcasted_iota(
-			dtype=jnp.int32, shape=(1, key_chunk_size), dimension=1
+	if causal or segment_ids is not None:
+		# the mask of the chunk is evaluated from its positions, never sliced from a
+		# full-size mask.
+		query_segment_ids = key_segment_ids = None
+		if segment_ids is not None:
+			query_segment_ids = lax.dynamic_slice_in_dim(
+				segment_ids, query_offset, query_chunk_size, axis=1
+			)
+			key_segment_ids = lax.dynamic_slice_in_dim(
+				segment_ids, key_offset, key_chunk_size, axis=1
+			)
+		chunk_mask = AttentionMask(causal=causal)(
+			query_offset + jnp.arange(query_chunk_size),
+			key_offset + jnp.arange(key_chunk_size),
+			query_segment_ids=query_segment_ids,
+			key_segment_ids=key_segment_ids,
 		)
-		offset = query_offset - key_offset
-		query_idx += offset
-		causal_mask_value = (query_idx < key_idx) * jnp.finfo(dtype).min
-		chunk_bias += causal_mask_value.reshape(1, 1, *causal_mask_value.shape)
+		chunk_mask = chunk_mask.reshape(-1, 1, query_chunk_size, key_chunk_size)
+		chunk_bias = jnp.where(chunk_mask, chunk_bias, jnp.finfo(dtype).min)
 
 	if not deterministic and attn_pdrop > 0.0:
 		attn_dropout_slice = lax.dynamic_slice(
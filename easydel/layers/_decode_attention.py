@@ -0,0 +1,149 @@
+# Copyright 2023 The EASYDEL Author @erfanzar (Erfan Zare Chavoshi).
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Length-aware single-token attention over a preallocated KV cache."""
+
+import typing as tp
+
+import jax
+import jax.lax as lax
+import jax.numpy as jnp
+
+
+def _block_scale(scale: jax.Array, offset: jax.Array, block_size: int) -> jax.Array:
+	"""Per-token, per-head scales of one block, laid out as `(batch, kv_heads, 1, block)`."""
+	scale = lax.dynamic_slice_in_dim(scale, offset, block_size, axis=1)
+	return jnp.transpose(scale[..., 0].astype(jnp.float32), (0, 2, 1))[:, :, None, :]
+
+
+def decode_attention(
+	query: jax.Array,
+	key: jax.Array,
+	value: jax.Array,
+	attention_mask: jax.Array,
+	bias: tp.Optional[jax.Array] = None,
+	key_scale: tp.Optional[jax.Array] = None,
+	value_scale: tp.Optional[jax.Array] = None,
+	sm_scale: float = 1.0,
+	block_size: int = 256,
+	precision: tp.Optional[lax.PrecisionLike] = None,
+	dtype: jnp.dtype = jnp.float32,
+) -> jax.Array:
+	"""
+	Attention of one new token per row over the cache, block by block.
+
+	The cache is walked in blocks of `block_size` positions with an online softmax,
+	and the loop stops after the last block holding a position any row may attend
+	to. Decode cost therefore follows the longest live sequence of the batch rather
+	than the provisioned `max_length`; positions of shorter rows inside the visited
+	blocks are masked.
+
+	Args:
+	    query: Queries of shape `(batch, 1, num_q_heads, head_dim)`.
+	    key: Key cache of shape `(batch, max_length, num_kv_heads, head_dim)`.
+	    value: Value cache of shape `(batch, max_length, num_kv_heads, head_dim)`.
+	    attention_mask: Boolean `(batch, max_length)` mask of the attended positions.
+	    bias: Optional additive bias of shape `(batch, 1 | num_q_heads, 1, max_length)`,
+	      added to the scores of every visited block.
+	    key_scale: Scales of shape `(batch, max_length, num_kv_heads, 1)` of an int8
+	      `key`, applied to the scores of each block.
+	    value_scale: Scales of shape `(batch, max_length, num_kv_heads, 1)` of an int8
+	      `value`, applied to the weights of each block.
+	    sm_scale: Softmax scale applied to the queries.
+	    block_size: Number of cache positions per block.
+	    precision: Precision of the block matmuls.
+	    dtype: Dtype of the returned attention outputs.
+
+	Returns:
+	    jax.Array: Attention outputs of shape `(batch, 1, num_q_heads, head_dim)`.
+	"""
+	batch_size, _, num_q_heads, head_dim = query.shape
+	max_length, num_kv_heads = key.shape[1], key.shape[2]
+	num_reps = num_q_heads // num_kv_heads
+	block_size = min(block_size, max_length)
+
+	query = query.reshape(batch_size, num_kv_heads, num_reps, head_dim)
+	query = query.astype(jnp.float32) * sm_scale
+	attention_mask = attention_mask.astype(jnp.bool_)
+	if bias is not None:
+		bias = bias.reshape(bias.shape[0], -1, max_length)
+		if bias.shape[1] == num_q_heads:
+			bias = bias.reshape(bias.shape[0], num_kv_heads, num_reps, max_length)
+		else:
+			bias = bias[:, :, None, :]
+
+	positions = jnp.arange(max_length, dtype=jnp.int32)
+	kv_length = jnp.max(jnp.where(attention_mask, positions + 1, 0))
+	num_blocks = (kv_length + block_size - 1) // block_size
+
+	def body(carry):
+		block_idx, running_max, denominator, accumulator = carry
+		start = block_idx * block_size
+		# the last block is shifted back to fit, its positions seen before are masked.
+		offset = jnp.minimum(start, max_length - block_size)
+		key_block = lax.dynamic_slice_in_dim(key, offset, block_size, axis=1)
+		value_block = lax.dynamic_slice_in_dim(value, offset, block_size, axis=1)
+		mask_block = lax.dynamic_slice_in_dim(attention_mask, offset, block_size, axis=1)
+		mask_block = jnp.logical_and(
+			mask_block,
+			(offset + jnp.arange(block_size)) >= start,
+		)[:, None, None, :]
+
+		scores = jnp.einsum(
+			"bkhd,bmkd->bkhm",
+			query,
+			key_block.astype(jnp.float32),
+			precision=precision,
+		)
+		if key_scale is not None:
+			scores = scores * _block_scale(key_scale, offset, block_size)
+		if bias is not None:
+			scores = scores + lax.dynamic_slice_in_dim(
+				bias, offset, block_size, axis=3
+			).astype(jnp.float32)
+		scores = jnp.where(mask_block, scores, -jnp.inf)
+
+		next_max = jnp.maximum(running_max, jnp.max(scores, axis=-1))
+		# rows without any attended position so far keep a finite reference.
+		safe_max = jnp.where(jnp.isfinite(next_max), next_max, 0.0)
+		weights = jnp.exp(scores - safe_max[..., None])
+		correction = jnp.exp(running_max - safe_max)
+		denominator = denominator * correction + jnp.sum(weights, axis=-1)
+		if value_scale is not None:
+			weights_block = weights * _block_scale(value_scale, offset, block_size)
+		else:
+			weights_block = weights
+		accumulator = accumulator * correction[..., None] + jnp.einsum(
+			"bkhm,bmkd->bkhd",
+			weights_block,
+			value_block.astype(jnp.float32),
+			precision=precision,
+		)
+		return block_idx + 1, next_max, denominator, accumulator
+
+	_, _, denominator, accumulator = lax.while_loop(
+		lambda carry: carry[0] < num_blocks,
+		body,
+		(
+			jnp.zeros((), jnp.int32),
+			jnp.full((batch_size, num_kv_heads, num_reps), -jnp.inf, jnp.float32),
+			jnp.zeros((batch_size, num_kv_heads, num_reps), jnp.float32),
+			jnp.zeros(
+				(batch_size, num_kv_heads, num_reps, value.shape[-1]),
+				jnp.float32,
+			),
+		),
+	)
+	outputs = accumulator / jnp.where(denominator > 0, denominator, 1.0)[..., None]
+	return outputs.reshape(batch_size, 1, num_q_heads, value.shape[-1]).astype(dtype)
@@ -56,7 +56,15 @@ from easydel.infra.etils import (
 from easydel.kernels.flash_attention_2 import create_flash_attention
 from easydel.kernels.ring_attention import ring_attention
 from easydel.layers._blockwise_attention import blockwise_attn
-from easydel.layers.caching import TransformerCacheView
+from easydel.layers._decode_attention import decode_attention
+from easydel.layers.caching import (
+	PagedTransformerCacheView,
+	QuantizedKV,
+	SlidingWindowCacheView,
+	TransformerCacheView,
+)
+from easydel.layers.caching.transformer_cache import quantize_kv
+from easydel.layers.masking import AttentionMask
 from easydel.utils.helpers import get_logger
 from easydel.utils.quantizers import EasyQuantizer
 
@@ -327,10 +335,12 @@ class FlexibleAttentionModule(nn.Module):
 		platform: EasyDeLPlatforms = ...,
 		backend: tp.Optional[EasyDeLBackends] = ...,
 		backward_pass_impl: tp.Literal["triton", "xla"] = "triton",
+		decode_attention_blocksize: tp.Optional[int] = ...,
 		base_config: tp.Optional[EasyDeLBaseConfig] = None,
 		_do_check: bool = True,
 	):
 		self.blocksize_k: int = ...
+		self.decode_attention_blocksize: tp.Optional[int] = ...
 		self.blocksize_q: int = ...
 		self.blocksize_b: int = ...
 		self.partition_axis: PartitionAxis = ...
@@ -348,6 +358,7 @@ class FlexibleAttentionModule(nn.Module):
 		set_attrs_smartly_with_prp(self, "blocksize_q", DEFAULT_Q_BLOCK, blocksize_q, base_config)
 		set_attrs_smartly_with_prp(self, "blocksize_k", DEFAULT_K_BLOCK, blocksize_k, base_config)
 		set_attrs_smartly_with_prp(self, "blocksize_b", 1, blocksize_b, base_config)
+		set_attrs_smartly_with_prp(self, "decode_attention_blocksize", 256, decode_attention_blocksize, base_config)
 		set_attrs_smartly_with_prp(self, "dtype", jnp.float32, dtype, base_config, "attn_dtype")
 		set_attrs_smartly_with_prp(self, "shard_attention_computation", True, shard_attention_computation, base_config)
 		set_attrs_smartly_with_prp(self, "scan_ring_attention", True, scan_ring_attention, base_config)
@@ -605,6 +616,38 @@ class FlexibleAttentionModule(nn.Module):
 			query_sequence_length = query_states.shape[1]
 		if key_value_sequence_length is None:
 			key_value_sequence_length = key_states.shape[1]
+		if self._can_use_decode_attention(
+			query_sequence_length=query_sequence_length,
+			key_states=key_states,
+			bias=bias,
+			attention_mask=attention_mask,
+			deterministic=deterministic,
+			uses_cache=uses_cache,
+		):
+			return self.length_aware_decode_attention(
+				query_states=query_states,
+				key_states=key_states,
+				value_states=value_states,
+				bias=bias,
+				attention_mask=attention_mask,
+			)
+		if isinstance(key_states, QuantizedKV):
+			key_states = key_states.materialize(query_states.dtype)
+		if isinstance(value_states, QuantizedKV):
+			value_states = value_states.materialize(query_states.dtype)
+		if segment_ids is not None and not (
+			segment_ids.ndim == 2
+			and segment_ids.shape[-1] == query_sequence_length == key_value_sequence_length
+		):
+			# packed documents only exist in full-sequence (uncached) calls.
+			segment_ids = None
+		if segment_ids is not None and self.attn_mechanism not in (
+			AttentionMechanisms.RING,
+			AttentionMechanisms.SPLASH,
+			AttentionMechanisms.BLOCKWISE,
+		):
+			# the blockwise kernels mask documents chunk by chunk themselves.
+			bias = self._apply_segment_ids(bias, segment_ids)
 		with self.mesh:
 			# if self._do_check:
 			# 	self._check_states(
@@ -656,12 +699,6 @@ class FlexibleAttentionModule(nn.Module):
 					)
 				case AttentionMechanisms.SPLASH:
 					if PRINT_COMMON:
-						if segment_ids is not None:
-							warnings.warn(
-								"Splash attention don't support `segment_ids` this argument will be ignored",
-								UserWarning,
-								stacklevel=1,
-							)
 						if self.attention_dropout != 0.0:
 							warnings.warn(
 								"Splash attention don't support `attention_dropout` this argument will be ignored",
@@ -682,26 +719,28 @@ class FlexibleAttentionModule(nn.Module):
 						query_sequence_length=query_sequence_length,
 						key_value_sequence_length=key_value_sequence_length,
 						attention_mask=attention_mask,
+						segment_ids=segment_ids,
 					)
 				case AttentionMechanisms.BLOCKWISE:
-					if segment_ids is not None and PRINT_COMMON:
-						warnings.warn(
-							"BlockWise Attention don't support `segment_ids` this argument will be ignored",
-							UserWarning,
-							stacklevel=1,
-						)
-						PRINT_COMMON = False
 					return self.blockwise_attention(
 						query_states=query_states,
 						key_states=key_states,
 						value_states=value_states,
 						bias=bias,
+						segment_ids=segment_ids,
 						deterministic=deterministic,
 						dropout_rng=dropout_rng,
 						query_sequence_length=query_sequence_length,
 						key_value_sequence_length=key_value_sequence_length,
 					)
 				case AttentionMechanisms.CUDNN:
+					if segment_ids is not None and PRINT_COMMON:
+						warnings.warn(
+							"`CUDNN` doesn't support bias, packed `segment_ids` will be ignored",
+							UserWarning,
+							stacklevel=1,
+						)
+						PRINT_COMMON = False
 					return self.cuddn_flash_attention(
 						query_states=query_states,
 						key_states=key_states,
@@ -713,9 +752,9 @@ class FlexibleAttentionModule(nn.Module):
 						key_value_sequence_length=key_value_sequence_length,
 					)
 				case AttentionMechanisms.CUDA_FLASH_ATTN2:
-					if bias is not None and PRINT_COMMON:
+					if (bias is not None or segment_ids is not None) and PRINT_COMMON:
 						warnings.warn(
-							"`CUDA_FLASH_ATTN2` doesn't support bias and attention mask and "
+							"`CUDA_FLASH_ATTN2` doesn't support bias, attention mask and segment ids and "
 							f"causal will only be used which is passed as {causal}, please check outputs to make sure this is what you want.",
 							stacklevel=1,
 						)
@@ -730,6 +769,122 @@ class FlexibleAttentionModule(nn.Module):
 
 		raise ValueError(f"Unknown Attention mechanism of {self.attn_mechanism}")
 
+	def _apply_segment_ids(
+		self,
+		bias: tp.Optional[Array],
+		segment_ids: Array,
+	) -> Array:
+		"""
+		Masks attention between different packed documents into `bias`.
+
+		`segment_ids` of shape `(batch, seq_len)` number the documents of each row;
+		tokens only attend to tokens of the same segment.
+		"""
+		same_segment = jnp.equal(
+			segment_ids[:, :, None],
+			segment_ids[:, None, :],
+		)[:, None, :, :]
+		dtype = self.dtype if bias is None else bias.dtype
+		if bias is None:
+			bias = jnp.zeros(same_segment.shape, dtype=dtype)
+		return jnp.where(same_segment, bias, jnp.finfo(dtype).min).astype(dtype)
+
+	def _can_use_decode_attention(
+		self,
+		*,
+		query_sequence_length: int,
+		key_states: tp.Union[Array, QuantizedKV],
+		bias: tp.Optional[Array],
+		attention_mask: tp.Optional[Array],
+		deterministic: bool,
+		uses_cache: bool,
+	) -> bool:
+		"""Whether a decode step can run through `length_aware_decode_attention`."""
+		if not uses_cache or query_sequence_length != 1:
+			return False
+		if not self.decode_attention_blocksize:
+			return False
+		if not deterministic and self.attention_dropout > 0.0:
+			return False
+		max_length = key_states.shape[1]
+		if attention_mask is None or attention_mask.ndim != 4:
+			return False
+		if attention_mask.shape[1:] != (1, 1, max_length):
+			return False
+		if bias is not None and (
+			bias.ndim != 4 or bias.shape[2] != 1 or bias.shape[3] != max_length
+		):
+			return False
+		# blocks are sliced out of the sequence axis, which has to stay on one device.
+		axis_name = self.partition_axis.generation_key_sequence_axis
+		if axis_name is not None:
+			axis_names = axis_name if isinstance(axis_name, tuple) else (axis_name,)
+			if numpy.prod([self.mesh.shape.get(name, 1) for name in axis_names]) > 1:
+				return False
+		return True
+
+	def length_aware_decode_attention(
+		self,
+		*,
+		query_states: Array,
+		key_states: tp.Union[Array, QuantizedKV],
+		value_states: tp.Union[Array, QuantizedKV],
+		attention_mask: Array,
+		bias: tp.Optional[Array] = None,
+	) -> AttentionOutput:
+		"""
+		Single-token attention that only visits the cache blocks holding live positions.
+
+		Used for every decode step (one query token, KV cache of `max_length`) when
+		`decode_attention_blocksize` is set, whatever the configured mechanism, so the
+		step costs scale with the longest sequence of the batch rather than with the
+		provisioned cache. An int8 cache is dequantized block by block inside the
+		score and value products. Attention weights are not materialized.
+		"""
+		(
+			query_partitionspec,
+			key_partitionspec,
+			value_partitionspec,
+			_,
+			attention_partitionspec,
+			_,
+		) = self.get_bshd_partition_specs(1)
+		key_scale = value_scale = None
+		if isinstance(key_states, QuantizedKV):
+			key_states, key_scale = key_states.quantized, key_states.scale
+		if isinstance(value_states, QuantizedKV):
+			value_states, value_scale = value_states.quantized, value_states.scale
+		with self.mesh:
+			attention_outputs = decode_attention(
+				query=with_sharding_constraint(
+					arr=query_states,
+					sharding=query_partitionspec,
+				),
+				key=with_sharding_constraint(
+					arr=key_states,
+					sharding=key_partitionspec,
+				),
+				value=with_sharding_constraint(
+					arr=value_states,
+					sharding=value_partitionspec,
+				),
+				attention_mask=attention_mask[:, 0, 0, :],
+				bias=bias,
+				key_scale=key_scale,
+				value_scale=value_scale,
+				sm_scale=self.sm_scale,
+				block_size=self.decode_attention_blocksize,
+				precision=self.precision,
+				dtype=self.dtype,
+			)
+			return AttentionOutput(
+				attention_weights=None,
+				attention_outputs=with_sharding_constraint(
+					arr=attention_outputs,
+					sharding=attention_partitionspec,
+				),
+			)
+
 	def sdpa(
 		self,
 		*,
@@ -983,6 +1138,10 @@ class FlexibleAttentionModule(nn.Module):
 				key_partitionspec,
 				value_partitionspec,
 				bias_partitionspec,
+				# chunks index the segment ids at their global offsets.
+				PartitionSpec(query_partitionspec[0], None)
+				if segment_ids is not None
+				else None,
 			),
 			out_specs=attention_partitionspec,
 			mesh=self.mesh,
@@ -992,6 +1151,7 @@ class FlexibleAttentionModule(nn.Module):
 			key_states.astype(self.dtype),
 			value_states.astype(self.dtype),
 			bias.astype(self.dtype),
+			segment_ids,
 		)
 
 		return AttentionOutput(attention_weights=None, attention_outputs=attn_output)
@@ -1094,6 +1254,7 @@ class FlexibleAttentionModule(nn.Module):
 		key_states: Array,
 		value_states: Array,
 		bias: tp.Optional[Array] = None,
+		segment_ids: tp.Optional[Array] = None,
 		deterministic: bool = False,
 		dropout_rng: tp.Optional[random.PRNGKey] = None,
 		query_sequence_length: int,
@@ -1135,6 +1296,7 @@ class FlexibleAttentionModule(nn.Module):
 				key=key_states,
 				value=value_states,
 				bias=bias,
+				segment_ids=segment_ids,
 				deterministic=deterministic,
 				dtype=self.dtype,
 				dropout_rng=dropout_rng,
@@ -1158,6 +1320,7 @@ class FlexibleAttentionModule(nn.Module):
 		query_sequence_length: int,
 		key_value_sequence_length: int,
 		attention_mask: Array,
+		segment_ids: tp.Optional[Array] = None,
 	) -> AttentionOutput:
 		key_states, value_states = self.repeat_kv_heads(
 			key_states,
@@ -1180,7 +1343,12 @@ class FlexibleAttentionModule(nn.Module):
 		if attention_mask is not None:
 			if attention_mask.ndim == 4:
 				attention_mask = attention_mask[:, 0, -1]
+			if segment_ids is not None:
+				# padding tokens form their own segment, as without segment ids.
+				attention_mask = jnp.where(attention_mask, segment_ids, -1)
 			attention_mask = SegmentIds(attention_mask, attention_mask)
+		elif segment_ids is not None:
+			attention_mask = SegmentIds(segment_ids, segment_ids)
 		else:
 			warnings.warn(
 				"`attention_mask` is not passed to SplashAttention. (except miss computation problem)",
@@ -1746,10 +1914,12 @@ class FlaxAttentionModule(nn.Module):
 		value: Array,
 		cache_view: TransformerCacheView,
 		attention_mask: Array,
-		causal_mask: tp.Optional[Array] = None,
+		causal_mask: tp.Optional[AttentionMask] = None,
 	) -> tp.Tuple[Array, Array, Array]:
 		num_updated_cache_vectors = query.shape[1]
-		end_index = cache_view.index[0]
+		# every row keeps its own write position so rows of one batch can sit at
+		# different lengths (e.g. requests admitted by a continuous-batching scheduler).
+		end_index = cache_view.index
 
 		*batch_dims, max_length, num_heads, depth_per_head = cache_view.value.shape
 
@@ -1757,21 +1927,52 @@ class FlaxAttentionModule(nn.Module):
 			attention_mask = jnp.expand_dims(attention_mask, axis=(-3, -2))
 
 		if causal_mask is not None:
-			if hasattr(causal_mask, "value"):
-				causal_mask = causal_mask.value
-			causal_mask = lax.dynamic_slice(
-				causal_mask,
-				(0, 0, end_index, 0),
-				(1, 1, num_updated_cache_vectors, max_length),
-			)
-			causal_mask = jnp.broadcast_to(
-				causal_mask,
-				(query.shape[0],) + causal_mask.shape[1:],
-			)
+			causal_mask = causal_mask(
+				end_index[:, None] + jnp.arange(num_updated_cache_vectors),
+				jnp.arange(max_length),
+			)[:, None, :, :]
 			attention_mask = jnp.broadcast_to(attention_mask, causal_mask.shape)
 			attention_mask = jnp.logical_and(attention_mask, causal_mask)
 
-		slice_indices = (0, end_index % cache_view.value.shape[1], 0, 0)
+		def _update_rows(cache, update):
+			return jax.vmap(
+				lambda row_cache, row_update, idx: lax.dynamic_update_slice(
+					row_cache,
+					row_update,
+					(idx % max_length, 0, 0),
+				)
+			)(cache, update, end_index)
+
+		pad_mask = jnp.broadcast_to(
+			(
+				jnp.arange(max_length)[None, :]
+				< (end_index + num_updated_cache_vectors)[:, None]
+			)[:, None, None, :],
+			tuple(batch_dims) + (1, num_updated_cache_vectors, max_length),
+		)
+		attention_mask = jnp.logical_and(pad_mask, attention_mask)
+
+		if cache_view.is_int8:
+			# only the new tokens are quantized and written, stored ones stay untouched.
+			key_quant, key_scale = quantize_kv(key, cache_view.key_scale.dtype)
+			value_quant, value_scale = quantize_kv(value, cache_view.value_scale.dtype)
+			cache_view.key = with_sharding_constraint(
+				arr=_update_rows(cache_view.key, key_quant),
+				sharding=self.get_sharding_safely(cache_view.key),
+			)
+			cache_view.value = with_sharding_constraint(
+				arr=_update_rows(cache_view.value, value_quant),
+				sharding=self.get_sharding_safely(cache_view.value),
+			)
+			cache_view.key_scale = _update_rows(cache_view.key_scale, key_scale)
+			cache_view.value_scale = _update_rows(cache_view.value_scale, value_scale)
+			cache_view.index = cache_view.index + num_updated_cache_vectors
+			return (
+				QuantizedKV(quantized=cache_view.key, scale=cache_view.key_scale),
+				QuantizedKV(quantized=cache_view.value, scale=cache_view.value_scale),
+				attention_mask,
+			)
+
 		value_cache = cache_view.value
 		key_cache = cache_view.key
 		try:
@@ -1780,21 +1981,8 @@ class FlaxAttentionModule(nn.Module):
 		except Exception:
 			...
 		org_cache_dtype = key_cache.dtype
-		value_cache = lax.dynamic_update_slice(
-			value_cache.astype(value),
-			value,
-			slice_indices,
-		)
-		key_cache = lax.dynamic_update_slice(
-			key_cache.astype(key),
-			key,
-			slice_indices,
-		)
-		pad_mask = jnp.broadcast_to(
-			jnp.arange(max_length) < end_index + num_updated_cache_vectors,
-			tuple(batch_dims) + (1, num_updated_cache_vectors, max_length),
-		)
-		attention_mask = jnp.logical_and(pad_mask, attention_mask)
+		value_cache = _update_rows(value_cache.astype(value), value)
+		key_cache = _update_rows(key_cache.astype(key), key)
 		cache_view.key = self.quantizer(
 			with_sharding_constraint(
 				arr=key_cache.astype(org_cache_dtype),
@@ -1811,6 +1999,143 @@ class FlaxAttentionModule(nn.Module):
 
 		return key_cache, value_cache, attention_mask
 
+	def _concatenate_to_sliding_window_cache(
+		self,
+		query: Array,
+		key: Array,
+		value: Array,
+		cache_view: SlidingWindowCacheView,
+		attention_mask: Array,
+	) -> tp.Tuple[Array, Array, Array]:
+		"""
+		Attends over the ring buffer followed by the new tokens, then writes the last
+		`window_size` new tokens into their slots (`position % window_size`).
+
+		Masks come from absolute positions: a query at `p` sees the keys at `k` with
+		`p - window_size < k <= p` that are not padding.
+		"""
+		num_updated_cache_vectors = query.shape[1]
+		window_size = cache_view.window_size
+		start_index = cache_view.index
+		new_positions = start_index[:, None] + jnp.arange(num_updated_cache_vectors)
+		if attention_mask.ndim == 4:
+			attention_mask = attention_mask[:, 0, -1, :]
+		is_token = jnp.take_along_axis(
+			attention_mask.astype(jnp.bool_),
+			new_positions,
+			axis=1,
+			mode="fill",
+			fill_value=True,
+		)
+		new_positions = jnp.where(is_token, new_positions, -1)
+		key_positions = jnp.concatenate([cache_view.positions, new_positions], axis=1)
+		query_positions = start_index[:, None] + jnp.arange(num_updated_cache_vectors)
+		distance = query_positions[:, :, None] - key_positions[:, None, :]
+		attention_mask = (
+			(key_positions[:, None, :] >= 0) & (distance >= 0) & (distance < window_size)
+		)[:, None, :, :]
+
+		num_written = min(num_updated_cache_vectors, window_size)
+		slots = (
+			start_index[:, None]
+			+ (num_updated_cache_vectors - num_written)
+			+ jnp.arange(num_written)
+		) % window_size
+
+		def _write(cache, update):
+			return jax.vmap(
+				lambda row, row_slots, row_update: row.at[row_slots].set(row_update)
+			)(cache, slots, update[:, -num_written:])
+
+		if cache_view.is_int8:
+			key, key_scale = quantize_kv(key, cache_view.key_scale.dtype)
+			value, value_scale = quantize_kv(value, cache_view.value_scale.dtype)
+			key_states = QuantizedKV(
+				quantized=jnp.concatenate([cache_view.key, key], axis=1),
+				scale=jnp.concatenate([cache_view.key_scale, key_scale], axis=1),
+			)
+			value_states = QuantizedKV(
+				quantized=jnp.concatenate([cache_view.value, value], axis=1),
+				scale=jnp.concatenate([cache_view.value_scale, value_scale], axis=1),
+			)
+			cache_view.key_scale = _write(cache_view.key_scale, key_scale)
+			cache_view.value_scale = _write(cache_view.value_scale, value_scale)
+		else:
+			key_states = jnp.concatenate([cache_view.key.astype(key.dtype), key], axis=1)
+			value_states = jnp.concatenate(
+				[cache_view.value.astype(value.dtype), value], axis=1
+			)
+		cache_view.key = with_sharding_constraint(
+			arr=_write(cache_view.key, key.astype(cache_view.key.dtype)),
+			sharding=self.get_sharding_safely(cache_view.key),
+		)
+		cache_view.value = with_sharding_constraint(
+			arr=_write(cache_view.value, value.astype(cache_view.value.dtype)),
+			sharding=self.get_sharding_safely(cache_view.value),
+		)
+		cache_view.positions = _write(cache_view.positions, new_positions)
+		cache_view.index = cache_view.index + num_updated_cache_vectors
+		return key_states, value_states, attention_mask
+
+	def _concatenate_to_paged_cache(
+		self,
+		query: Array,
+		key: Array,
+		value: Array,
+		cache_view: PagedTransformerCacheView,
+		attention_mask: Array,
+	) -> tp.Tuple[Array, Array, Array]:
+		"""
+		Writes the new tokens into the page pool and gathers each row's keys/values
+		back through its block table, returning them in logical (contiguous) order.
+		"""
+		batch_size, num_updated_cache_vectors = key.shape[:2]
+		num_blocks, block_size = cache_view.key_pages.shape[:2]
+		max_blocks = cache_view.block_tables.shape[1]
+		max_length = max_blocks * block_size
+
+		positions = cache_view.index[:, None] + jnp.arange(num_updated_cache_vectors)[None, :]
+		block_ids = jnp.take_along_axis(
+			cache_view.block_tables,
+			jnp.clip(positions // block_size, 0, max_blocks - 1),
+			axis=1,
+		)
+		block_ids = jnp.where(positions < max_length, block_ids, num_blocks)
+		offsets = positions % block_size
+
+		key_pages = cache_view.key_pages.at[block_ids, offsets].set(
+			key.astype(cache_view.key_pages.dtype),
+			mode="drop",
+		)
+		value_pages = cache_view.value_pages.at[block_ids, offsets].set(
+			value.astype(cache_view.value_pages.dtype),
+			mode="drop",
+		)
+
+		def _gather(pages):
+			gathered = pages.at[cache_view.block_tables].get(mode="fill", fill_value=0)
+			return gathered.reshape((batch_size, max_length) + pages.shape[2:])
+
+		key_states = _gather(key_pages).astype(key.dtype)
+		value_states = _gather(value_pages).astype(value.dtype)
+
+		kv_positions = jnp.arange(max_length)
+		mask = kv_positions[None, None, :] <= positions[:, :, None]
+		if attention_mask.ndim == 2:
+			attention_mask = attention_mask[:, :max_length].astype(jnp.bool_)
+			attention_mask = jnp.pad(
+				attention_mask,
+				((0, 0), (0, max_length - attention_mask.shape[-1])),
+				constant_values=True,
+			)
+			mask = jnp.logical_and(mask, attention_mask[:, None, :])
+		attention_mask = mask[:, None, :, :]
+
+		cache_view.key_pages = key_pages
+		cache_view.value_pages = value_pages
+		cache_view.index = cache_view.index + num_updated_cache_vectors
+		return key_states, value_states, attention_mask
+
 	def concatenate(
 		self,
 		*,
@@ -1818,18 +2143,41 @@ class FlaxAttentionModule(nn.Module):
 		key: Array,
 		value: Array,
 		attention_mask: Array,
-		cache_view: tp.Optional[TransformerCacheView] = None,
-		causal_mask: tp.Optional[Array] = None,
+		cache_view: tp.Optional[
+			tp.Union[TransformerCacheView, PagedTransformerCacheView]
+		] = None,
+		causal_mask: tp.Optional[AttentionMask] = None,
 		fcm_mask: tp.Optional[Array] = None,
 		sliding_windows: tp.Optional[int] = None,
 	) -> tp.Tuple[Array, Array, Array, Array]:
-		if cache_view is None:
+		query_positions = None
+		if cache_view is not None:
+			query_positions = cache_view.index[:, None] + jnp.arange(query.shape[1])
+		if isinstance(cache_view, SlidingWindowCacheView):
+			# the ring buffer masks its window itself.
+			sliding_windows = None
+			key, value, attention_mask = self._concatenate_to_sliding_window_cache(
+				query=query,
+				key=key,
+				value=value,
+				cache_view=cache_view,
+				attention_mask=attention_mask,
+			)
+		elif isinstance(cache_view, PagedTransformerCacheView):
+			key, value, attention_mask = self._concatenate_to_paged_cache(
+				query=query,
+				key=key,
+				value=value,
+				cache_view=cache_view,
+				attention_mask=attention_mask,
+			)
+		elif cache_view is None:
 			query_length = query.shape[1]
 			key_length = key.shape[1]
 			if causal_mask is not None:
-				causal_mask = causal_mask[:, :, :query_length, :key_length]
 				causal_mask = jnp.broadcast_to(
-					causal_mask, (query.shape[0],) + causal_mask.shape[1:]
+					causal_mask(jnp.arange(query_length), jnp.arange(key_length)),
+					(query.shape[0], 1, query_length, key_length),
 				)
 				if attention_mask.ndim == 2:
 					attention_mask = jnp.expand_dims(attention_mask, axis=(-3, -2))
@@ -1850,13 +2198,18 @@ class FlaxAttentionModule(nn.Module):
 				causal_mask=causal_mask,
 			)
 		if sliding_windows is not None:
-			sliding_window_mask = jnp.tril(
-				jnp.ones_like(attention_mask, dtype=jnp.bool),
-				k=-sliding_windows,
+			window_mask = AttentionMask(causal=False, sliding_window=sliding_windows)
+			if query_positions is None:
+				query_positions = jnp.arange(attention_mask.shape[-2])
+			# cached keys sit at their absolute positions, queries start at the write index.
+			attention_mask = jnp.logical_and(
+				attention_mask,
+				window_mask(
+					query_positions,
+					jnp.arange(attention_mask.shape[-1]),
+				)[..., None, :, :],
 			)
-			window_mask = jnp.where(sliding_window_mask, 0, 1)
-			attention_mask = jnp.logical_and(window_mask, attention_mask)
-			if attention_mask.shape[-1] <= 1:
+			if cache_view is None and attention_mask.shape[-1] <= 1:
 				attention_mask = attention_mask[:, :, :, -sliding_windows:]
 
 		attention_bias = lax.select(
@@ -0,0 +1,330 @@
+# Copyright 2023 The EASYDEL Author @erfanzar (Erfan Zare Chavoshi).
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import jax
+import numpy as np
+import pytest
+from flax import nnx as nn
+from jax import numpy as jnp
+from jax.sharding import Mesh
+
+import easydel as ed
+
+from ._decode_attention import decode_attention
+from .attention import FlexibleAttentionModule
+from .caching.sliding_window_cache import SlidingWindowCacheView
+from .caching.transformer_cache import dequantize_kv, quantize_kv
+
+BATCH, MAX_LENGTH, NUM_Q_HEADS, NUM_KV_HEADS, HEAD_DIM = 3, 40, 4, 2, 8
+
+
+def reference_attention(query, key, value, attention_mask, bias=None):
+	key = jnp.repeat(key, NUM_Q_HEADS // NUM_KV_HEADS, axis=2)
+	value = jnp.repeat(value, NUM_Q_HEADS // NUM_KV_HEADS, axis=2)
+	scores = jnp.einsum("bqhd,bkhd->bhqk", query, key) / np.sqrt(HEAD_DIM)
+	if bias is not None:
+		scores = scores + bias
+	scores = jnp.where(attention_mask[:, None, None, :], scores, -jnp.inf)
+	return jnp.einsum("bhqk,bkhd->bqhd", jax.nn.softmax(scores, axis=-1), value)
+
+
+def cache_inputs(lengths):
+	rng = np.random.RandomState(0)
+	query = jnp.array(rng.randn(BATCH, 1, NUM_Q_HEADS, HEAD_DIM), jnp.float32)
+	key = rng.randn(BATCH, MAX_LENGTH, NUM_KV_HEADS, HEAD_DIM).astype(np.float32)
+	value = rng.randn(BATCH, MAX_LENGTH, NUM_KV_HEADS, HEAD_DIM).astype(np.float32)
+	attention_mask = np.arange(MAX_LENGTH)[None, :] < np.asarray(lengths)[:, None]
+	# a left-padded prompt.
+	attention_mask[1, :2] = False
+	return query, key, value, attention_mask
+
+
+@pytest.mark.parametrize("block_size", [1, 7, 8, 64])
+@pytest.mark.parametrize("bias_heads", [None, 1, NUM_Q_HEADS])
+def test_decode_attention_matches_full_attention(block_size, bias_heads):
+	query, key, value, attention_mask = cache_inputs([5, 17, 30])
+	bias = None
+	if bias_heads is not None:
+		bias = jnp.array(
+			np.random.RandomState(1).randn(BATCH, bias_heads, 1, MAX_LENGTH),
+			jnp.float32,
+		)
+	outputs = decode_attention(
+		query,
+		jnp.array(key),
+		jnp.array(value),
+		jnp.array(attention_mask),
+		bias=bias,
+		sm_scale=1 / np.sqrt(HEAD_DIM),
+		block_size=block_size,
+	)
+	np.testing.assert_allclose(
+		outputs,
+		reference_attention(query, key, value, jnp.array(attention_mask), bias),
+		atol=1e-5,
+	)
+
+
+def test_decode_attention_skips_blocks_past_the_longest_row():
+	query, key, value, attention_mask = cache_inputs([5, 17, 30])
+	expected = reference_attention(query, key, value, jnp.array(attention_mask))
+	# blocks holding no live position are never read, whatever they contain.
+	key[:, 32:], value[:, 32:] = np.nan, np.nan
+	outputs = jax.jit(decode_attention, static_argnames=("block_size",))(
+		query,
+		jnp.array(key),
+		jnp.array(value),
+		jnp.array(attention_mask),
+		sm_scale=1 / np.sqrt(HEAD_DIM),
+		block_size=8,
+	)
+	np.testing.assert_allclose(outputs, expected, atol=1e-5)
+
+
+def llama(
+	decode_attention_blocksize,
+	kv_cache_quantization_method=ed.EasyDeLQuantizationMethods.NONE,
+):
+	config = ed.LlamaConfig(
+		vocab_size=128,
+		hidden_size=32,
+		intermediate_size=64,
+		num_hidden_layers=2,
+		num_attention_heads=4,
+		num_key_value_heads=2,
+		max_position_embeddings=64,
+		attn_mechanism=ed.AttentionMechanisms.VANILLA,
+		decode_attention_blocksize=decode_attention_blocksize,
+		kv_cache_quantization_method=kv_cache_quantization_method,
+	)
+	return ed.LlamaForCausalLM(
+		config=config,
+		dtype=jnp.float32,
+		param_dtype=jnp.float32,
+		rngs=nn.Rngs(0),
+	)
+
+
+def decode_logits(model, num_steps=4, return_cache=False):
+	input_ids = jnp.asarray(np.random.RandomState(0).randint(3, 128, (2, 6)))
+	attention_mask = jnp.ones_like(input_ids).at[1, :2].set(0)
+	model_kwargs = model.prepare_inputs_for_generation(
+		input_ids,
+		max_length=32,
+		attention_mask=attention_mask,
+	)
+	outputs = model(input_ids=input_ids, **model_kwargs)
+	logits = []
+	for _ in range(num_steps):
+		model_kwargs = model.update_inputs_for_generation(outputs, model_kwargs)
+		next_tokens = jnp.argmax(outputs.logits[:, -1:], axis=-1)
+		outputs = model(input_ids=next_tokens, **model_kwargs)
+		logits.append(outputs.logits)
+	logits = jnp.concatenate(logits, axis=1)
+	if return_cache:
+		return logits, outputs.past_key_values
+	return logits
+
+
+def test_llama_decode_steps_match_the_configured_mechanism():
+	np.testing.assert_allclose(
+		decode_logits(llama(4)),
+		decode_logits(llama(None)),
+		atol=1e-5,
+	)
+
+
+def test_decode_attention_dequantizes_int8_blocks():
+	query, key, value, attention_mask = cache_inputs([5, 17, 30])
+	key_quant, key_scale = quantize_kv(jnp.array(key))
+	value_quant, value_scale = quantize_kv(jnp.array(value))
+	outputs = decode_attention(
+		query,
+		key_quant,
+		value_quant,
+		jnp.array(attention_mask),
+		key_scale=key_scale,
+		value_scale=value_scale,
+		sm_scale=1 / np.sqrt(HEAD_DIM),
+		block_size=8,
+	)
+	np.testing.assert_allclose(
+		outputs,
+		reference_attention(
+			query,
+			dequantize_kv(key_quant, key_scale, jnp.float32),
+			dequantize_kv(value_quant, value_scale, jnp.float32),
+			jnp.array(attention_mask),
+		),
+		atol=1e-5,
+	)
+
+
+@pytest.mark.parametrize("decode_attention_blocksize", [4, None])
+def test_llama_int8_kv_cache_is_written_in_place(decode_attention_blocksize):
+	model = llama(decode_attention_blocksize, ed.EasyDeLQuantizationMethods.A8Q)
+	logits, cache = decode_logits(model, return_cache=True)
+	for view in cache.views:
+		assert view.is_int8
+		assert view.key.dtype == jnp.int8 and view.value.dtype == jnp.int8
+		np.testing.assert_array_equal(view.index, [10, 10])
+	np.testing.assert_allclose(logits, decode_logits(llama(None)), atol=5e-3)
+
+
+def gemma2(kv_cache_quantization_method=ed.EasyDeLQuantizationMethods.NONE):
+	config = ed.Gemma2Config(
+		vocab_size=128,
+		hidden_size=32,
+		intermediate_size=64,
+		num_hidden_layers=2,
+		num_attention_heads=4,
+		num_key_value_heads=2,
+		head_dim=8,
+		max_position_embeddings=64,
+		sliding_window=4,
+		attn_mechanism=ed.AttentionMechanisms.VANILLA,
+		kv_cache_quantization_method=kv_cache_quantization_method,
+	)
+	return ed.Gemma2ForCausalLM(
+		config=config,
+		dtype=jnp.float32,
+		param_dtype=jnp.float32,
+		rngs=nn.Rngs(0),
+	)
+
+
+@pytest.mark.parametrize("decode_attention_blocksize", [4, None])
+def test_gemma2_ring_cache_matches_windowed_full_cache(decode_attention_blocksize):
+	model = gemma2()
+	model.config.decode_attention_blocksize = decode_attention_blocksize
+	logits, cache = decode_logits(model, num_steps=6, return_cache=True)
+	ring, full = cache.views
+	assert isinstance(ring, SlidingWindowCacheView) and ring.key.shape[1] == 4
+	assert full.key.shape[1] == 32
+	np.testing.assert_array_equal(ring.index, [12, 12])
+	# the last 4 positions, each in slot `position % 4`.
+	np.testing.assert_array_equal(ring.positions, [[8, 9, 10, 11]] * 2)
+
+	reference = gemma2()
+	reference._get_cache_sliding_windows = lambda: None
+	np.testing.assert_allclose(logits, decode_logits(reference, num_steps=6), atol=1e-5)
+
+
+def test_gemma2_int8_ring_cache():
+	model = gemma2(ed.EasyDeLQuantizationMethods.A8Q)
+	logits, cache = decode_logits(model, num_steps=6, return_cache=True)
+	assert all(view.is_int8 for view in cache.views)
+	assert isinstance(cache.views[0], SlidingWindowCacheView)
+	reference = gemma2(ed.EasyDeLQuantizationMethods.A8Q)
+	reference._get_cache_sliding_windows = lambda: None
+	np.testing.assert_allclose(logits, decode_logits(reference, num_steps=6), atol=1e-5)
+
+
+@pytest.mark.parametrize(
+	"attn_mechanism",
+	[
+		ed.AttentionMechanisms.VANILLA,
+		ed.AttentionMechanisms.SDPA,
+		ed.AttentionMechanisms.BLOCKWISE,
+		ed.AttentionMechanisms.FLASH_ATTN2,
+	],
+)
+def test_packed_documents_do_not_attend_to_each_other(attn_mechanism):
+	config = ed.LlamaConfig(
+		vocab_size=128,
+		hidden_size=32,
+		intermediate_size=64,
+		num_hidden_layers=2,
+		num_attention_heads=4,
+		num_key_value_heads=2,
+		max_position_embeddings=64,
+		attn_mechanism=attn_mechanism,
+		blocksize_q=8,
+		blocksize_k=8,
+	)
+	model = ed.LlamaForCausalLM(
+		config=config,
+		dtype=jnp.float32,
+		param_dtype=jnp.float32,
+		rngs=nn.Rngs(0),
+	)
+	documents = np.split(np.random.RandomState(0).randint(3, 128, 13), [5])
+	input_ids = np.concatenate(documents + [np.zeros(3, np.int32)])[None]
+	segment_ids = np.array([[1] * 5 + [2] * 8 + [0] * 3])
+	position_ids = np.array([list(range(5)) + list(range(8)) + [0] * 3])
+	packed = model(
+		input_ids=jnp.asarray(input_ids),
+		attention_mask=jnp.asarray(segment_ids > 0),
+		position_ids=jnp.asarray(position_ids),
+		segment_ids=jnp.asarray(segment_ids),
+	).logits
+	start = 0
+	for document in documents:
+		np.testing.assert_allclose(
+			packed[0, start : start + len(document)],
+			model(input_ids=jnp.asarray(document)[None]).logits[0],
+			atol=1e-4,
+		)
+		start += len(document)
+
+
+@pytest.mark.parametrize(
+	"attn_mechanism",
+	[
+		ed.AttentionMechanisms.VANILLA,
+		ed.AttentionMechanisms.SDPA,
+		ed.AttentionMechanisms.BLOCKWISE,
+		ed.AttentionMechanisms.FLASH_ATTN2,
+		ed.AttentionMechanisms.RING,
+	],
+)
+def test_segment_ids_mask_every_mechanism(attn_mechanism):
+	rng = np.random.RandomState(0)
+	query, key, value = (
+		jnp.asarray(rng.randn(1, 16, NUM_Q_HEADS, HEAD_DIM), jnp.float32) for _ in range(3)
+	)
+	segment_ids = jnp.asarray([[1] * 5 + [2] * 8 + [0] * 3])
+	causal = jnp.tril(jnp.ones((16, 16), jnp.bool_))[None, None]
+	attention = FlexibleAttentionModule(
+		mesh=Mesh(
+			np.array(jax.devices()[:1]).reshape(1, 1, 1, 1), ("dp", "fsdp", "tp", "sp")
+		),
+		sm_scale=1 / np.sqrt(HEAD_DIM),
+		num_kv_heads=NUM_Q_HEADS,
+		num_q_heads=NUM_Q_HEADS,
+		head_dims=HEAD_DIM,
+		attn_mechanism=attn_mechanism,
+		blocksize_q=8,
+		blocksize_k=8,
+		dtype=jnp.float32,
+		platform=ed.EasyDeLPlatforms.JAX,
+	)
+	outputs = attention(
+		query_states=query,
+		key_states=key,
+		value_states=value,
+		bias=jnp.where(causal, 0.0, jnp.finfo(jnp.float32).min),
+		segment_ids=segment_ids,
+	).attention_outputs
+	for start, end in ((0, 5), (5, 13)):
+		document = slice(start, end)
+		scores = jnp.einsum(
+			"bqhd,bkhd->bhqk", query[:, document], key[:, document]
+		) / np.sqrt(HEAD_DIM)
+		scores = jnp.where(causal[..., : end - start, : end - start], scores, -jnp.inf)
+		np.testing.assert_allclose(
+			outputs[:, document],
+			jnp.einsum("bhqk,bkhd->bqhd", jax.nn.softmax(scores), value[:, document]),
+			atol=1e-5,
+		)
@@ -27,7 +27,15 @@ from .mamba_cache import (
 	MambaCacheMetaData,
 	MambaCacheView,
 )
+from .paged_transformer_cache import (
+	BlockAllocator,
+	PagedTransformerCache,
+	PagedTransformerCacheMetaData,
+	PagedTransformerCacheView,
+)
+from .sliding_window_cache import SlidingWindowCacheView, alternating_sliding_windows
 from .transformer_cache import (
+	QuantizedKV,
 	TransformerCache,
 	TransformerCacheMetaData,
 	TransformerCacheView,
@@ -40,6 +48,13 @@ __all__ = (
 	"TransformerCache",
 	"TransformerCacheMetaData",
 	"TransformerCacheView",
+	"QuantizedKV",
+	"SlidingWindowCacheView",
+	"alternating_sliding_windows",
+	"PagedTransformerCache",
+	"PagedTransformerCacheMetaData",
+	"PagedTransformerCacheView",
+	"BlockAllocator",
 	"MambaCache",
 	"MambaCacheMetaData",
 	"MambaCacheView",
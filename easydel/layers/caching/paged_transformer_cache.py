@@ -0,0 +1,345 @@
+# Copyright 2023 The EASYDEL Author @erfanzar (Erfan Zare Chavoshi).
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import collections
+import typing as tp
+
+import chex as cx
+import numpy as np
+from jax import numpy as jnp
+from jax.sharding import Mesh, NamedSharding, PartitionSpec
+
+from easydel.escale import PartitionAxis
+
+
+@cx.dataclass
+class PagedTransformerCacheMetaData:
+	"""Metadata for paged (block-table) transformer cache configuration."""
+
+	# Required fields
+	batch_size: int
+	num_blocks: int
+	block_size: int
+	max_blocks_per_sequence: int
+
+	# Attention-related fields
+	key_heads: int
+	value_heads: int
+	key_dim: int
+	value_dim: int
+
+	@classmethod
+	def create(
+		cls,
+		batch_size: int,
+		num_blocks: int,
+		block_size: int,
+		max_blocks_per_sequence: int,
+		num_heads: tp.Optional[int] = None,
+		head_dim: tp.Optional[int] = None,
+		key_heads: tp.Optional[int] = None,
+		value_heads: tp.Optional[int] = None,
+		key_dim: tp.Optional[int] = None,
+		value_dim: tp.Optional[int] = None,
+	) -> "PagedTransformerCacheMetaData":
+		"""
+		Create a PagedTransformerCacheMetaData instance with validation.
+
+		Arguments:
+		    batch_size: Number of sequences addressed by the block table.
+		    num_blocks: Number of blocks in the shared pool.
+		    block_size: Number of tokens stored per block.
+		    max_blocks_per_sequence: Width of the block table (max blocks per sequence).
+		    num_heads: Number of key/value heads.
+		    head_dim: Dimension of each head.
+		    key_heads: Number of key heads.
+		    value_heads: Number of value heads.
+		    key_dim: Dimension of keys.
+		    value_dim: Dimension of values.
+
+		Returns:
+		    PagedTransformerCacheMetaData instance
+
+		Raises:
+		    ValueError: If required parameters are missing or invalid.
+		"""
+		if batch_size <= 0:
+			raise ValueError("batch_size must be positive")
+		if num_blocks <= 0:
+			raise ValueError("num_blocks must be positive")
+		if block_size <= 0:
+			raise ValueError("block_size must be positive")
+		if max_blocks_per_sequence <= 0:
+			raise ValueError("max_blocks_per_sequence must be positive")
+
+		if head_dim is not None:
+			key_dim = key_dim or head_dim
+			value_dim = value_dim or head_dim
+		elif key_dim is None or value_dim is None:
+			raise ValueError(
+				"Either head_dim or both key_dim and value_dim must be specified"
+			)
+
+		if num_heads is not None:
+			key_heads = key_heads or num_heads
+			value_heads = value_heads or num_heads
+		elif key_heads is None or value_heads is None:
+			raise ValueError(
+				"Either num_heads or both key_heads and value_heads must be specified"
+			)
+
+		return cls(
+			batch_size=batch_size,
+			num_blocks=num_blocks,
+			block_size=block_size,
+			max_blocks_per_sequence=max_blocks_per_sequence,
+			key_heads=key_heads,
+			value_heads=value_heads,
+			key_dim=key_dim,
+			value_dim=value_dim,
+		)
+
+
+@cx.dataclass
+class PagedTransformerCacheView:
+	"""
+	One layer of a paged cache.
+
+	`key_pages`/`value_pages` hold `[num_blocks, block_size, heads, dim]` and are
+	shared by every sequence; `block_tables[b, i]` is the pool block that stores
+	tokens `[i * block_size, (i + 1) * block_size)` of sequence `b`, and `index[b]`
+	is the number of tokens already written for sequence `b`. Unused table
+	entries hold `num_blocks` (out of range), so writes to them are dropped and
+	reads return zeros.
+	"""
+
+	key_pages: cx.Array
+	value_pages: cx.Array
+	block_tables: cx.Array
+	index: cx.Array
+	metadata: PagedTransformerCacheMetaData
+	layer_index: tp.Optional[int] = None
+
+	@classmethod
+	def init(
+		cls,
+		metadata: PagedTransformerCacheMetaData,
+		key_values_partition_specs: PartitionSpec,
+		dtype: jnp.dtype,
+		mesh: Mesh,
+		layer_index: tp.Optional[int] = None,
+	):
+		device = NamedSharding(mesh=mesh, spec=key_values_partition_specs)
+		return cls(
+			key_pages=jnp.zeros(
+				shape=(
+					metadata.num_blocks,
+					metadata.block_size,
+					metadata.key_heads,
+					metadata.key_dim,
+				),
+				dtype=dtype,
+				device=device,
+			),
+			value_pages=jnp.zeros(
+				shape=(
+					metadata.num_blocks,
+					metadata.block_size,
+					metadata.value_heads,
+					metadata.value_dim,
+				),
+				dtype=dtype,
+				device=device,
+			),
+			block_tables=jnp.full(
+				(metadata.batch_size, metadata.max_blocks_per_sequence),
+				metadata.num_blocks,
+				dtype=jnp.int32,
+			),
+			index=jnp.zeros((metadata.batch_size,), dtype=jnp.int32),
+			metadata=metadata,
+			layer_index=layer_index,
+		)
+
+	@property
+	def max_sequence_length(self) -> int:
+		return self.block_tables.shape[1] * self.key_pages.shape[1]
+
+	def __repr__(self):
+		try:
+			return (
+				self.__class__.__name__
+				+ f"(key_pages={self.key_pages.shape}, value_pages={self.value_pages.shape}, "
+				f"block_tables={self.block_tables.shape}, layer_index={self.layer_index})"
+			)
+		except AttributeError:
+			return self.__class__.__name__ + f"(layer_index={self.layer_index})"
+
+	__str__ = __repr__
+
+
+@cx.dataclass
+class PagedTransformerCache:
+	views: tp.List[tp.Optional[PagedTransformerCacheView]]
+
+	@classmethod
+	def init_layers_cache(
+		cls,
+		num_hidden_layers: int,
+		metadata: PagedTransformerCacheMetaData,
+		mesh: Mesh,
+		dtype: tp.Optional[jnp.dtype] = None,
+		key_values_partition_specs: tp.Optional[PartitionSpec] = None,
+	):
+		paxis = PartitionAxis()
+		key_values_partition_specs = key_values_partition_specs or PartitionSpec(
+			None,
+			None,
+			paxis.head_axis,
+			paxis.attention_dim_axis,
+		)
+		if dtype is None:
+			dtype = jnp.bfloat16
+		return cls(
+			views=[
+				PagedTransformerCacheView.init(
+					metadata=metadata,
+					key_values_partition_specs=key_values_partition_specs,
+					dtype=dtype,
+					mesh=mesh,
+					layer_index=layer_index,
+				)
+				for layer_index in range(num_hidden_layers)
+			]
+		)
+
+	@classmethod
+	def init_empty(cls, num_hidden_layers):
+		return cls(views=[None for _ in range(num_hidden_layers)])
+
+	def update_block_tables(
+		self,
+		block_tables: cx.Array,
+		index: tp.Optional[cx.Array] = None,
+	) -> "PagedTransformerCache":
+		"""
+		Returns a cache whose views address the pool through `block_tables`.
+
+		Arguments:
+		    block_tables: `[batch, max_blocks_per_sequence]` table (see `BlockAllocator`).
+		    index: Optional `[batch]` number of tokens already stored per sequence.
+		"""
+		block_tables = jnp.asarray(block_tables, dtype=jnp.int32)
+		views = []
+		for view in self.views:
+			if view is not None:
+				view = view.replace(
+					block_tables=block_tables,
+					index=view.index if index is None else jnp.asarray(index, dtype=jnp.int32),
+				)
+			views.append(view)
+		return self.replace(views=views)
+
+	def __repr__(self):
+		return (
+			f"{self.__class__.__name__}(\n  "
+			+ "\n  ".join(str(view) for view in self.views)
+			+ "\n)"
+		)
+
+	__str__ = __repr__
+
+
+class BlockAllocator:
+	"""
+	Host-side free-list allocator for the blocks of a `PagedTransformerCache`.
+
+	Sequences are identified by arbitrary hashable ids; each one owns an ordered
+	list of pool blocks that grows as tokens are appended and is returned to the
+	free list when the sequence is freed.
+
+	Example:
+	    >>> allocator = BlockAllocator(
+	    ...   num_blocks=64, block_size=16, max_blocks_per_sequence=8
+	    ... )
+	    >>> allocator.allocate("req-0", num_tokens=40)  # 3 blocks
+	    >>> cache = cache.update_block_tables(allocator.block_tables(["req-0"]))
+	"""
+
+	def __init__(self, num_blocks: int, block_size: int, max_blocks_per_sequence: int):
+		self.num_blocks = num_blocks
+		self.block_size = block_size
+		self.max_blocks_per_sequence = max_blocks_per_sequence
+		self._free_blocks: tp.Deque[int] = collections.deque(range(num_blocks))
+		self._sequence_blocks: tp.Dict[tp.Hashable, tp.List[int]] = {}
+
+	@property
+	def num_free_blocks(self) -> int:
+		return len(self._free_blocks)
+
+	def blocks_for(self, num_tokens: int) -> int:
+		return -(-num_tokens // self.block_size)
+
+	def can_allocate(self, seq_id: tp.Hashable, num_tokens: int) -> bool:
+		needed = self.blocks_for(num_tokens) - len(self._sequence_blocks.get(seq_id, []))
+		return needed <= self.num_free_blocks and (
+			self.blocks_for(num_tokens) <= self.max_blocks_per_sequence
+		)
+
+	def allocate(self, seq_id: tp.Hashable, num_tokens: int) -> tp.List[int]:
+		"""
+		Grows the blocks owned by `seq_id` so it can hold `num_tokens` tokens.
+
+		Returns:
+		    tp.List[int]: The blocks owned by `seq_id`.
+
+		Raises:
+		    ValueError: If the sequence would exceed `max_blocks_per_sequence`.
+		    MemoryError: If the pool has not enough free blocks.
+		"""
+		blocks = self._sequence_blocks.setdefault(seq_id, [])
+		needed = self.blocks_for(num_tokens)
+		if needed > self.max_blocks_per_sequence:
+			raise ValueError(
+				f"{num_tokens} tokens need {needed} blocks but a sequence can hold at most "
+				f"{self.max_blocks_per_sequence}."
+			)
+		missing = needed - len(blocks)
+		if missing > self.num_free_blocks:
+			raise MemoryError(
+				f"out of cache blocks (requested {missing}, free {self.num_free_blocks})."
+			)
+		for _ in range(max(missing, 0)):
+			blocks.append(self._free_blocks.popleft())
+		return blocks
+
+	def free(self, seq_id: tp.Hashable):
+		"""Returns every block owned by `seq_id` to the free list."""
+		self._free_blocks.extend(self._sequence_blocks.pop(seq_id, []))
+
+	def block_tables(self, seq_ids: tp.Sequence[tp.Optional[tp.Hashable]]) -> np.ndarray:
+		"""
+		Builds the `[len(seq_ids), max_blocks_per_sequence]` block table.
+
+		`None` entries (idle rows) and unused columns are filled with `num_blocks`.
+		"""
+		tables = np.full(
+			(len(seq_ids), self.max_blocks_per_sequence),
+			self.num_blocks,
+			dtype=np.int32,
+		)
+		for row, seq_id in enumerate(seq_ids):
+			blocks = self._sequence_blocks.get(seq_id, []) if seq_id is not None else []
+			tables[row, : len(blocks)] = blocks
+		return tables
@@ -0,0 +1,142 @@
+# Copyright 2023 The EASYDEL Author @erfanzar (Erfan Zare Chavoshi).
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import numpy as np
+import pytest
+from flax import nnx as nn
+from jax import numpy as jnp
+
+import easydel as ed
+
+from .paged_transformer_cache import (
+	BlockAllocator,
+	PagedTransformerCacheMetaData,
+)
+
+
+class TestPagedTransformerCacheMetaData:
+	def test_create_valid(self):
+		metadata = PagedTransformerCacheMetaData.create(
+			batch_size=2,
+			num_blocks=16,
+			block_size=4,
+			max_blocks_per_sequence=8,
+			num_heads=2,
+			head_dim=16,
+		)
+		assert metadata.key_heads == 2
+		assert metadata.value_heads == 2
+		assert metadata.key_dim == 16
+		assert metadata.value_dim == 16
+
+	def test_create_invalid_block_size(self):
+		with pytest.raises(ValueError, match="block_size must be positive"):
+			PagedTransformerCacheMetaData.create(
+				batch_size=2,
+				num_blocks=16,
+				block_size=0,
+				max_blocks_per_sequence=8,
+				num_heads=2,
+				head_dim=16,
+			)
+
+
+class TestBlockAllocator:
+	def test_allocate_and_free(self):
+		allocator = BlockAllocator(num_blocks=8, block_size=4, max_blocks_per_sequence=4)
+		assert len(allocator.allocate("a", 5)) == 2
+		assert len(allocator.allocate("a", 8)) == 2
+		assert len(allocator.allocate("a", 9)) == 3
+		assert allocator.num_free_blocks == 5
+		allocator.free("a")
+		assert allocator.num_free_blocks == 8
+
+	def test_out_of_blocks(self):
+		allocator = BlockAllocator(num_blocks=2, block_size=4, max_blocks_per_sequence=4)
+		allocator.allocate("a", 8)
+		assert not allocator.can_allocate("b", 1)
+		with pytest.raises(MemoryError):
+			allocator.allocate("b", 1)
+		with pytest.raises(ValueError):
+			allocator.allocate("c", 17)
+
+	def test_block_tables(self):
+		allocator = BlockAllocator(num_blocks=8, block_size=4, max_blocks_per_sequence=3)
+		allocator.allocate("a", 4)
+		allocator.allocate("b", 6)
+		tables = allocator.block_tables(["b", None, "a"])
+		np.testing.assert_array_equal(tables, [[1, 2, 8], [8, 8, 8], [0, 8, 8]])
+
+
+def test_paged_cache_matches_contiguous_cache():
+	config = ed.LlamaConfig(
+		vocab_size=128,
+		hidden_size=64,
+		intermediate_size=128,
+		num_hidden_layers=2,
+		num_attention_heads=4,
+		num_key_value_heads=2,
+		max_position_embeddings=64,
+		attn_mechanism=ed.AttentionMechanisms.VANILLA,
+	)
+	model = ed.LlamaForCausalLM(
+		config=config,
+		dtype=jnp.float32,
+		param_dtype=jnp.float32,
+		rngs=nn.Rngs(0),
+	)
+	batch_size, prompt_length, max_length, block_size = 2, 6, 16, 4
+	input_ids = jnp.array(np.random.RandomState(0).randint(3, 128, (2, prompt_length)))
+	attention_mask = jnp.array([[1] * prompt_length, [0, 0] + [1] * (prompt_length - 2)])
+
+	allocator = BlockAllocator(
+		num_blocks=12,
+		block_size=block_size,
+		max_blocks_per_sequence=max_length // block_size,
+	)
+	# interleave allocations so no row owns a contiguous run of blocks.
+	for tokens in range(block_size, max_length + 1, block_size):
+		allocator.allocate("row-1", tokens)
+		allocator.allocate("row-0", tokens)
+
+	contiguous_kwargs = model.prepare_inputs_for_generation(
+		input_ids=input_ids,
+		max_length=max_length,
+		attention_mask=attention_mask,
+	)
+	paged_kwargs = dict(contiguous_kwargs)
+	paged_kwargs["past_key_values"] = model.init_paged_cache(
+		batch_size=batch_size,
+		num_blocks=allocator.num_blocks,
+		block_size=block_size,
+		max_length=max_length,
+	).update_block_tables(allocator.block_tables(["row-0", "row-1"]))
+
+	running_token = input_ids
+	paged_token = input_ids
+	for _ in range(4):
+		contiguous_outputs = model(input_ids=running_token, **contiguous_kwargs)
+		paged_outputs = model(input_ids=paged_token, **paged_kwargs)
+		np.testing.assert_allclose(
+			paged_outputs.logits[:, -1],
+			contiguous_outputs.logits[:, -1],
+			atol=1e-4,
+			rtol=1e-4,
+		)
+		running_token = jnp.argmax(contiguous_outputs.logits[:, -1:], axis=-1)
+		paged_token = jnp.argmax(paged_outputs.logits[:, -1:], axis=-1)
+		contiguous_kwargs = model.update_inputs_for_generation(
+			contiguous_outputs, contiguous_kwargs
+		)
+		paged_kwargs = model.update_inputs_for_generation(paged_outputs, paged_kwargs)
@@ -0,0 +1,109 @@
+# Copyright 2023 The EASYDEL Author @erfanzar (Erfan Zare Chavoshi).
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import typing as tp
+
+import chex as cx
+from jax import numpy as jnp
+from jax.sharding import Mesh, NamedSharding, PartitionSpec
+
+from .transformer_cache import (
+	NATIVE_INT8_KV_METHODS,
+	TransformerCacheMetaData,
+	TransformerCacheView,
+	kv_scale_sharding,
+)
+
+if tp.TYPE_CHECKING:
+	from easydel.utils.quantizers import EasyQuantizer
+else:
+	EasyQuantizer = object
+
+
+def alternating_sliding_windows(
+	num_hidden_layers: int,
+	sliding_window: int,
+) -> tp.List[tp.Optional[int]]:
+	"""
+	Attention window of every layer of a model whose even layers attend locally over
+	`sliding_window` tokens and odd layers globally (e.g. Gemma2), in the format of
+	`TransformerCache.init_layers_cache(sliding_windows=...)`.
+	"""
+	return [
+		sliding_window if layer_idx % 2 == 0 else None
+		for layer_idx in range(num_hidden_layers)
+	]
+
+
+@cx.dataclass
+class SlidingWindowCacheView(TransformerCacheView):
+	"""
+	Ring-buffer cache of a sliding-window attention layer.
+
+	Only `window_size` slots are allocated: the token at absolute position `p`
+	lives in slot `p % window_size`, and `positions` records the absolute position
+	held by every slot (-1 for empty or padding slots), from which the attention
+	masks are rebuilt. `index` keeps counting absolute positions, so memory stays
+	fixed however long the generation runs.
+	"""
+
+	positions: tp.Optional[cx.Array] = None
+
+	@classmethod
+	def init(
+		cls,
+		metadata: TransformerCacheMetaData,
+		window_size: int,
+		quantizer: EasyQuantizer,
+		key_values_partition_specs: PartitionSpec,
+		dtype: jnp.dtype,
+		mesh: Mesh,
+		layer_index: tp.Optional[int] = None,
+	):
+		device = NamedSharding(mesh=mesh, spec=key_values_partition_specs)
+		key_shape = (
+			metadata.batch_size,
+			window_size,
+			metadata.key_heads,
+			metadata.key_dim,
+		)
+		value_shape = (
+			metadata.batch_size,
+			window_size,
+			metadata.value_heads,
+			metadata.value_dim,
+		)
+		key_scale = value_scale = None
+		if getattr(quantizer, "quantization_method", None) in NATIVE_INT8_KV_METHODS:
+			scale_device = kv_scale_sharding(device, len(key_shape))
+			key_scale = jnp.zeros(key_shape[:-1] + (1,), dtype=dtype, device=scale_device)
+			value_scale = jnp.zeros(
+				value_shape[:-1] + (1,),
+				dtype=dtype,
+				device=scale_device,
+			)
+			dtype = jnp.int8
+		return cls(
+			key=jnp.zeros(key_shape, dtype=dtype, device=device),
+			value=jnp.zeros(value_shape, dtype=dtype, device=device),
+			index=jnp.zeros((metadata.batch_size,), dtype=jnp.int32),
+			metadata=metadata,
+			layer_index=layer_index,
+			key_scale=key_scale,
+			value_scale=value_scale,
+			positions=jnp.full((metadata.batch_size, window_size), -1, dtype=jnp.int32),
+		)
+
+	@property
+	def window_size(self) -> int:
+		return self.key.shape[1]
@@ -0,0 +1,114 @@
+# Copyright 2023 The EASYDEL Author @erfanzar (Erfan Zare Chavoshi).
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import jax
+import numpy as np
+import pytest
+from jax import numpy as jnp
+from jax.sharding import Mesh
+
+from easydel.infra.etils import EasyDeLQuantizationMethods
+from easydel.utils.quantizers import EasyQuantizer
+
+from .sliding_window_cache import SlidingWindowCacheView, alternating_sliding_windows
+from .transformer_cache import (
+	TransformerCache,
+	TransformerCacheMetaData,
+	TransformerCacheView,
+)
+
+
+@pytest.fixture
+def metadata():
+	return TransformerCacheMetaData.create(
+		batch_size=2,
+		sequence_length=16,
+		num_heads=4,
+		head_dim=8,
+	)
+
+
+@pytest.fixture
+def mesh():
+	return Mesh(
+		np.array(jax.devices()[:1]).reshape(1, 1, 1, 1),
+		("dp", "fsdp", "tp", "sp"),
+	)
+
+
+def test_init_allocates_window_slots(metadata, mesh):
+	cache = TransformerCache.init_layers_cache(
+		num_hidden_layers=1,
+		metadata=metadata,
+		mesh=mesh,
+		dtype=jnp.float32,
+		sliding_windows=[4],
+	)
+	view = cache.views[0]
+	assert isinstance(view, SlidingWindowCacheView)
+	assert view.window_size == 4
+	assert view.key.shape == (2, 4, 4, 8)
+	assert view.value.shape == (2, 4, 4, 8)
+	np.testing.assert_array_equal(view.positions, -1)
+	np.testing.assert_array_equal(view.index, 0)
+
+
+def test_init_int8(metadata, mesh):
+	cache = TransformerCache.init_layers_cache(
+		num_hidden_layers=1,
+		metadata=metadata,
+		mesh=mesh,
+		quantizer=EasyQuantizer(EasyDeLQuantizationMethods.A8Q),
+		dtype=jnp.bfloat16,
+		sliding_windows=[4],
+	)
+	view = cache.views[0]
+	assert view.is_int8
+	assert view.key.dtype == jnp.int8
+	assert view.key_scale.shape == (2, 4, 4, 1)
+	assert view.key_scale.sharding.spec == view.key.sharding.spec[:3] + (None,)
+
+
+def test_layers_mix_window_and_full_caches(metadata, mesh):
+	cache = TransformerCache.init_layers_cache(
+		num_hidden_layers=4,
+		metadata=metadata,
+		mesh=mesh,
+		dtype=jnp.float32,
+		# windows covering the whole sequence need no ring buffer.
+		sliding_windows=[4, None, 16, 8],
+	)
+	assert [type(view) for view in cache.views] == [
+		SlidingWindowCacheView,
+		TransformerCacheView,
+		TransformerCacheView,
+		SlidingWindowCacheView,
+	]
+	assert [view.key.shape[1] for view in cache.views] == [4, 16, 16, 8]
+	assert [view.layer_index for view in cache.views] == [0, 1, 2, 3]
+
+
+def test_sliding_windows_must_cover_every_layer(metadata, mesh):
+	with pytest.raises(ValueError, match="sliding windows"):
+		TransformerCache.init_layers_cache(
+			num_hidden_layers=2,
+			metadata=metadata,
+			mesh=mesh,
+			sliding_windows=[4],
+		)
+
+
+def test_alternating_sliding_windows():
+	assert alternating_sliding_windows(5, 16) == [16, None, 16, None, 16]
+	assert alternating_sliding_windows(0, 16) == []
@@ -26,6 +26,69 @@ if tp.TYPE_CHECKING:
 else:
 	EasyQuantizer = object
 
+# kv cache quantization methods stored natively as int8 with per-token, per-head scales.
+NATIVE_INT8_KV_METHODS = (
+	EasyDeLQuantizationMethods.A8BIT,
+	EasyDeLQuantizationMethods.A8Q,
+)
+
+
+def quantize_kv(array: cx.Array, scale_dtype: jnp.dtype = jnp.float32):
+	"""
+	Symmetric int8 quantization with one scale per token and head.
+
+	Args:
+	    array: Keys or values of shape `(..., num_heads, head_dim)`.
+	    scale_dtype: Dtype of the returned scales.
+
+	Returns:
+	    tp.Tuple[cx.Array, cx.Array]: The int8 array and its scales of shape
+	    `(..., num_heads, 1)`.
+	"""
+	array = array.astype(jnp.float32)
+	scale = jnp.max(jnp.abs(array), axis=-1, keepdims=True) / 127.0
+	quantized = jnp.round(array / jnp.where(scale > 0, scale, 1.0))
+	return jnp.clip(quantized, -127, 127).astype(jnp.int8), scale.astype(scale_dtype)
+
+
+def dequantize_kv(quantized: cx.Array, scale: cx.Array, dtype: jnp.dtype) -> cx.Array:
+	"""Inverse of `quantize_kv`."""
+	return (quantized.astype(jnp.float32) * scale.astype(jnp.float32)).astype(dtype)
+
+
+def kv_scale_sharding(sharding: NamedSharding, ndim: int = 4) -> NamedSharding:
+	"""
+	Sharding of the `(..., num_heads, 1)` scales of keys or values placed with
+	`sharding`: the same partitioning with the (size one) head_dim axis unsharded.
+	"""
+	spec = tuple(sharding.spec)[:ndim]
+	spec = spec + (None,) * (ndim - len(spec))
+	return NamedSharding(mesh=sharding.mesh, spec=PartitionSpec(*spec[:-1], None))
+
+
+@cx.dataclass
+class QuantizedKV:
+	"""
+	Keys or values read from an int8 cache, handed to the attention as they are stored.
+
+	The length-aware decode attention dequantizes them block by block inside the
+	score and value products; every other attention path calls `materialize`.
+	"""
+
+	quantized: cx.Array
+	scale: cx.Array
+
+	@property
+	def shape(self) -> tp.Tuple[int, ...]:
+		return self.quantized.shape
+
+	@property
+	def ndim(self) -> int:
+		return self.quantized.ndim
+
+	def materialize(self, dtype: jnp.dtype) -> cx.Array:
+		return dequantize_kv(self.quantized, self.scale, dtype)
+
 
 @cx.dataclass
 class TransformerCacheMetaData:
@@ -128,6 +191,8 @@ class TransformerCacheView:
 	index: tp.Union[cx.Array, ImplicitArray]
 	metadata: TransformerCacheMetaData
 	layer_index: tp.Optional[int] = None
+	key_scale: tp.Optional[cx.Array] = None
+	value_scale: tp.Optional[cx.Array] = None
 
 	@classmethod
 	def init(
@@ -140,6 +205,8 @@ class TransformerCacheView:
 		layer_index: tp.Optional[int] = None,
 	):
 		device = NamedSharding(mesh=mesh, spec=key_values_partition_specs)
+		if getattr(quantizer, "quantization_method", None) in NATIVE_INT8_KV_METHODS:
+			return cls._init_int8(metadata, dtype, device, layer_index)
 
 		return cls(
 			key=quantizer(
@@ -171,6 +238,46 @@ class TransformerCacheView:
 			layer_index=layer_index,
 		)
 
+	@classmethod
+	def _init_int8(
+		cls,
+		metadata: TransformerCacheMetaData,
+		dtype: jnp.dtype,
+		device: NamedSharding,
+		layer_index: tp.Optional[int] = None,
+	):
+		key_shape = (
+			metadata.batch_size,
+			metadata.sequence_length,
+			metadata.key_heads,
+			metadata.key_dim,
+		)
+		value_shape = (
+			metadata.batch_size,
+			metadata.sequence_length,
+			metadata.value_heads,
+			metadata.value_dim,
+		)
+		scale_device = kv_scale_sharding(device, len(key_shape))
+		return cls(
+			key=jnp.zeros(key_shape, dtype=jnp.int8, device=device),
+			value=jnp.zeros(value_shape, dtype=jnp.int8, device=device),
+			key_scale=jnp.zeros(key_shape[:-1] + (1,), dtype=dtype, device=scale_device),
+			value_scale=jnp.zeros(
+				value_shape[:-1] + (1,),
+				dtype=dtype,
+				device=scale_device,
+			),
+			index=jnp.zeros((metadata.batch_size,), dtype=jnp.int32),
+			metadata=metadata,
+			layer_index=layer_index,
+		)
+
+	@property
+	def is_int8(self) -> bool:
+		"""Whether keys and values are stored as int8 with `key_scale`/`value_scale`."""
+		return self.key_scale is not None
+
 	def __repr__(self):
 		try:
 			return (
@@ -199,9 +306,19 @@ class TransformerCache:
 		quantizer: tp.Optional[EasyQuantizer] = None,
 		dtype: tp.Optional[jnp.dtype] = None,
 		key_values_partition_specs: tp.Optional[PartitionSpec] = None,
+		sliding_windows: tp.Optional[tp.Sequence[tp.Optional[int]]] = None,
 	):
+		"""
+		Allocates the cache of every layer.
+
+		Layers whose entry of `sliding_windows` is shorter than `metadata.sequence_length`
+		get a `SlidingWindowCacheView` ring buffer of that many slots instead of a full
+		cache, so models mixing local and global layers size each layer separately.
+		"""
 		from easydel.utils.quantizers import EasyQuantizer
 
+		from .sliding_window_cache import SlidingWindowCacheView
+
 		paxis = PartitionAxis()
 		quantizer = quantizer or EasyQuantizer(EasyDeLQuantizationMethods.NONE)
 		key_values_partition_specs = key_values_partition_specs or PartitionSpec(
@@ -212,8 +329,28 @@ class TransformerCache:
 		)
 		if dtype is None:
 			dtype = jnp.bfloat16
-		return cls(
-			views=[
+		if sliding_windows is None:
+			sliding_windows = [None] * num_hidden_layers
+		if len(sliding_windows) != num_hidden_layers:
+			raise ValueError(
+				f"got {len(sliding_windows)} sliding windows for {num_hidden_layers} layers."
+			)
+		views = []
+		for layer_index, window_size in enumerate(sliding_windows):
+			if window_size is not None and window_size < metadata.sequence_length:
+				views.append(
+					SlidingWindowCacheView.init(
+						metadata=metadata,
+						window_size=window_size,
+						quantizer=quantizer,
+						key_values_partition_specs=key_values_partition_specs,
+						dtype=dtype,
+						mesh=mesh,
+						layer_index=layer_index,
+					)
+				)
+				continue
+			views.append(
 				TransformerCacheView.init(
 					metadata=metadata,
 					quantizer=quantizer,
@@ -222,9 +359,8 @@ class TransformerCache:
 					mesh=mesh,
 					layer_index=layer_index,
 				)
-				for layer_index in range(num_hidden_layers)
-			]
-		)
+			)
+		return cls(views=views)
 
 	@classmethod
 	def init_empty(cls, num_hidden_layers):
@@ -232,7 +368,7 @@ class TransformerCache:
 
 	def __repr__(self):
 		return (
-			f"{self.__class__.__name__ }(\n  "
+			f"{self.__class__.__name__}(\n  "
 			+ "\n  ".join(str(view) for view in self.views)
 			+ "\n)"
 		)
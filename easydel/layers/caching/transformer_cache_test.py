@@ -12,9 +12,11 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import jax
+import numpy as np
 import pytest
 from jax import numpy as jnp
-from jax.sharding import PartitionSpec
+from jax.sharding import Mesh, PartitionSpec
 
 from easydel.escale import PartitionAxis
 from easydel.infra.etils import EasyDeLQuantizationMethods
@@ -24,6 +26,8 @@ from .transformer_cache import (
 	TransformerCache,
 	TransformerCacheMetaData,
 	TransformerCacheView,
+	dequantize_kv,
+	quantize_kv,
 )
 
 
@@ -195,6 +199,55 @@ class TestTransformerCacheView:
 		assert repr(cache_view) == expected_repr
 		assert str(cache_view) == expected_repr
 
+	@pytest.mark.parametrize(
+		"method",
+		[EasyDeLQuantizationMethods.A8Q, EasyDeLQuantizationMethods.A8BIT],
+	)
+	def test_init_int8(self, method):
+		metadata = TransformerCacheMetaData.create(
+			batch_size=2,
+			sequence_length=5,
+			num_heads=4,
+			head_dim=32,
+		)
+		paxis = PartitionAxis()
+		partition_spec = PartitionSpec(
+			paxis.batch_axis,
+			paxis.key_sequence_axis,
+			paxis.head_axis,
+			paxis.attention_dim_axis,
+		)
+		cache_view = TransformerCacheView.init(
+			metadata=metadata,
+			quantizer=EasyQuantizer(method),
+			key_values_partition_specs=partition_spec,
+			dtype=jnp.bfloat16,
+			mesh=Mesh(
+				np.array(jax.devices()[:1]).reshape(1, 1, 1, 1),
+				("dp", "fsdp", "tp", "sp"),
+			),
+		)
+		assert cache_view.is_int8
+		assert cache_view.key.dtype == jnp.int8
+		assert cache_view.value.shape == (2, 5, 4, 32)
+		assert cache_view.key_scale.shape == (2, 5, 4, 1)
+		assert cache_view.value_scale.dtype == jnp.bfloat16
+		scale_spec = PartitionSpec(*partition_spec[:3], None)
+		assert cache_view.key_scale.sharding.spec == scale_spec
+		assert cache_view.value_scale.sharding.spec == scale_spec
+
+
+def test_quantize_kv_round_trip():
+	array = jnp.array(np.random.RandomState(0).randn(2, 7, 4, 32), jnp.float32)
+	array = array.at[0, 0].set(0.0)
+	quantized, scale = quantize_kv(array)
+	assert quantized.dtype == jnp.int8
+	assert scale.shape == (2, 7, 4, 1)
+	restored = dequantize_kv(quantized, scale, jnp.float32)
+	# the error is at most half a step of each (token, head) scale.
+	assert bool(jnp.all(jnp.abs(restored - array) <= scale / 2 + 1e-6))
+	np.testing.assert_array_equal(restored[0, 0], 0.0)
+
 
 class TestTransformerCache:
 	def test_init_layers_cache(self):
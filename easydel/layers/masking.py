@@ -0,0 +1,126 @@
+# Copyright 2023 The EASYDEL Author @erfanzar (Erfan Zare Chavoshi).
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Attention masks described by rules over token positions."""
+
+import dataclasses
+import typing as tp
+
+import jax
+import jax.numpy as jnp
+
+
+@dataclasses.dataclass(frozen=True)
+class AttentionMask:
+	"""
+	Structured description of the keys every query may attend to.
+
+	Instead of a `(max_length, max_length)` boolean tensor, the mask is a rule
+	evaluated on the positions of the queries and keys at hand. Attention kernels
+	therefore only build the block they are working on, and under `jit` XLA fuses
+	the comparisons into the attention scores, so no full mask is materialized.
+
+	The structural parts (causality, sliding window) live on the description;
+	segment ids, prefix-LM prefixes and padding are per-example data passed when
+	the mask is evaluated.
+
+	Attributes:
+	    causal: Queries only attend to keys at the same or earlier positions.
+	    sliding_window: Queries only attend to keys less than `sliding_window`
+	      positions behind them.
+	    max_length: Number of positions covered when the mask is indexed like a
+	      `(1, 1, max_length, max_length)` array.
+	"""
+
+	causal: bool = True
+	sliding_window: tp.Optional[int] = None
+	max_length: tp.Optional[int] = None
+
+	def __call__(
+		self,
+		query_positions: jax.Array,
+		key_positions: jax.Array,
+		*,
+		query_segment_ids: tp.Optional[jax.Array] = None,
+		key_segment_ids: tp.Optional[jax.Array] = None,
+		prefix_lengths: tp.Optional[jax.Array] = None,
+		key_padding_mask: tp.Optional[jax.Array] = None,
+	) -> jax.Array:
+		"""
+		Evaluates the mask for a block of queries and keys.
+
+		Args:
+		    query_positions: Absolute positions of the queries, shape `(..., q)`.
+		    key_positions: Absolute positions of the keys, shape `(..., k)`.
+		    query_segment_ids: Documents of the queries, shape `(..., q)`; tokens only
+		      attend within their own document.
+		    key_segment_ids: Documents of the keys, shape `(..., k)`.
+		    prefix_lengths: Length of the bidirectional prefix of every row, shape
+		      `(...)`; keys inside the prefix are visible to every query (prefix-LM).
+		    key_padding_mask: `False` for padding keys, shape `(..., k)`.
+
+		Returns:
+		    jax.Array: Boolean mask of shape `(..., q, k)`, `True` where attending is
+		      allowed.
+		"""
+		query_positions = jnp.asarray(query_positions)[..., :, None]
+		key_positions = jnp.asarray(key_positions)[..., None, :]
+		mask = jnp.ones(
+			jnp.broadcast_shapes(query_positions.shape, key_positions.shape),
+			dtype=jnp.bool_,
+		)
+		if self.causal:
+			visible = key_positions <= query_positions
+			if prefix_lengths is not None:
+				prefix_lengths = jnp.asarray(prefix_lengths)[..., None, None]
+				visible = jnp.logical_or(visible, key_positions < prefix_lengths)
+			mask = jnp.logical_and(mask, visible)
+		if self.sliding_window is not None:
+			mask = jnp.logical_and(
+				mask,
+				query_positions - key_positions < self.sliding_window,
+			)
+		if query_segment_ids is not None and key_segment_ids is not None:
+			mask = jnp.logical_and(
+				mask,
+				query_segment_ids[..., :, None] == key_segment_ids[..., None, :],
+			)
+		if key_padding_mask is not None:
+			mask = jnp.logical_and(mask, key_padding_mask.astype(jnp.bool_)[..., None, :])
+		return mask
+
+	@property
+	def shape(self) -> tp.Tuple[int, int, int, int]:
+		return (1, 1, self.max_length, self.max_length)
+
+	@property
+	def ndim(self) -> int:
+		return 4
+
+	def __getitem__(self, index) -> jax.Array:
+		"""
+		Materializes a slice of the mask as if it were a
+		`(1, 1, max_length, max_length)` array, e.g. `mask[:, :, :q, :k]`; only the
+		requested block is built.
+		"""
+		if self.max_length is None:
+			raise ValueError("indexing an `AttentionMask` requires `max_length`.")
+		if not isinstance(index, tuple):
+			index = (index,)
+		index = index + (slice(None),) * (4 - len(index))
+		if not all(isinstance(axis_index, slice) for axis_index in index[2:]):
+			raise TypeError("the query and key axes of an `AttentionMask` take slices.")
+		positions = jnp.arange(self.max_length, dtype=jnp.int32)
+		mask = self(positions[index[2]], positions[index[3]])
+		return mask[None, None][index[:2]]
@@ -0,0 +1,136 @@
+# Copyright 2023 The EASYDEL Author @erfanzar (Erfan Zare Chavoshi).
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import jax
+import jax.numpy as jnp
+import numpy as np
+import pytest
+from flax import nnx as nn
+
+import easydel as ed
+from easydel.layers._blockwise_attention import blockwise_attn
+from easydel.layers.masking import AttentionMask
+
+
+def test_causal_mask_matches_lower_triangle():
+	mask = AttentionMask(causal=True)(jnp.arange(6), jnp.arange(6))
+	np.testing.assert_array_equal(mask, np.tril(np.ones((6, 6), dtype=bool)))
+
+
+def test_queries_at_an_offset_see_the_whole_prefix():
+	mask = AttentionMask(causal=True)(jnp.array([[3, 4]]), jnp.arange(6)[None])
+	np.testing.assert_array_equal(
+		mask[0],
+		[
+			[True, True, True, True, False, False],
+			[True, True, True, True, True, False],
+		],
+	)
+
+
+def test_sliding_window():
+	mask = AttentionMask(causal=True, sliding_window=2)(jnp.arange(5), jnp.arange(5))
+	expected = np.tril(np.ones((5, 5), dtype=bool)) & ~np.tril(
+		np.ones((5, 5), dtype=bool), k=-2
+	)
+	np.testing.assert_array_equal(mask, expected)
+
+
+def test_segments_prefix_and_padding():
+	segment_ids = jnp.array([[1, 1, 1, 2, 2, 0]])
+	mask = AttentionMask(causal=True)(
+		jnp.arange(6)[None],
+		jnp.arange(6)[None],
+		query_segment_ids=segment_ids,
+		key_segment_ids=segment_ids,
+		prefix_lengths=jnp.array([2]),
+		key_padding_mask=segment_ids > 0,
+	)
+	expected = np.array(
+		[
+			[1, 1, 0, 0, 0, 0],
+			[1, 1, 0, 0, 0, 0],
+			[1, 1, 1, 0, 0, 0],
+			[0, 0, 0, 1, 0, 0],
+			[0, 0, 0, 1, 1, 0],
+			[0, 0, 0, 0, 0, 0],
+		],
+		dtype=bool,
+	)
+	np.testing.assert_array_equal(mask[0], expected)
+
+
+def test_indexing_builds_only_the_requested_block():
+	mask = AttentionMask(causal=True, max_length=1 << 20)
+	assert mask.shape == (1, 1, 1 << 20, 1 << 20)
+	block = mask[:, :, 2:5, :4]
+	assert block.shape == (1, 1, 3, 4)
+	np.testing.assert_array_equal(block[0, 0], np.tril(np.ones((5, 4), bool))[2:])
+	with pytest.raises(ValueError):
+		AttentionMask()[:, :, :2, :2]
+
+
+def test_blockwise_attention_masks_segments_per_chunk():
+	rng = np.random.RandomState(0)
+	query, key, value = (
+		jnp.asarray(rng.randn(2, 16, 2, 8), jnp.float32) for _ in range(3)
+	)
+	segment_ids = jnp.asarray([[1] * 5 + [2] * 11, [1] * 9 + [2] * 4 + [0] * 3])
+	mask = AttentionMask(causal=True)(
+		jnp.arange(16),
+		jnp.arange(16),
+		query_segment_ids=segment_ids,
+		key_segment_ids=segment_ids,
+	)[:, None]
+	outputs = blockwise_attn(
+		query,
+		key,
+		value,
+		segment_ids=segment_ids,
+		query_chunk_size=4,
+		key_chunk_size=4,
+	)
+	bias = jnp.where(mask, 0.0, jnp.finfo(jnp.float32).min)
+	scores = jnp.einsum("bqhd,bkhd->bhqk", query, key) / jnp.sqrt(8.0) + bias
+	expected = jnp.einsum("bhqk,bkhd->bqhd", jax.nn.softmax(scores, axis=-1), value)
+	np.testing.assert_allclose(outputs, expected, atol=1e-5)
+
+
+def test_model_holds_no_position_squared_mask():
+	config = ed.LlamaConfig(
+		vocab_size=64,
+		hidden_size=32,
+		intermediate_size=64,
+		num_hidden_layers=1,
+		num_attention_heads=4,
+		num_key_value_heads=2,
+		max_position_embeddings=1 << 14,
+	)
+	model = ed.LlamaForCausalLM(
+		config=config,
+		dtype=jnp.float32,
+		param_dtype=jnp.float32,
+		rngs=nn.Rngs(0),
+	)
+	assert isinstance(model.model.causal_mask, AttentionMask)
+	input_ids = jnp.arange(8)[None] % 64
+	logits = model(input_ids=input_ids).logits
+	assert logits.shape == (1, 8, 64)
+	largest = max(
+		leaf.size
+		for leaf in jax.tree_util.tree_leaves(nn.state(model))
+		if hasattr(leaf, "size")
+	)
+	# only the rotary frequencies scale with the context, linearly.
+	assert largest < config.max_position_embeddings**2 // 64
@@ -0,0 +1,179 @@
+# Copyright 2023 The EASYDEL Author @erfanzar (Erfan Zare Chavoshi).
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Sorted (grouped) token dispatch for Mixture-of-Experts layers."""
+
+import math
+import typing as tp
+
+import chex
+from jax import lax
+from jax import numpy as jnp
+
+
+def use_sorted_moe_dispatch(config) -> bool:
+	"""
+	Whether MoE blocks built from `config` should use `sorted_moe_dispatch` instead of
+	running every expert over every token.
+
+	Quantized expert kernels (`bits`) and `use_scan_mlp` keep the dense path.
+	"""
+	return (
+		getattr(config, "moe_method", "dense") == "sorted"
+		and getattr(config, "bits", None) is None
+		and not getattr(config, "use_scan_mlp", False)
+	)
+
+
+def stack_expert_kernels(
+	experts: tp.Sequence[tp.Any],
+	*names: str,
+) -> tp.Tuple[chex.Array, ...]:
+	"""
+	Stacks the `nn.Linear` kernels of a list of experts.
+
+	Args:
+	    experts: Expert modules, one per expert.
+	    *names: Attribute names of the linear layers to stack, e.g. `"w1", "w3", "w2"`.
+
+	Returns:
+	    tp.Tuple[chex.Array, ...]: One `(num_experts, in_features, out_features)` array per name.
+	"""
+	return tuple(
+		jnp.stack([getattr(expert, name).kernel.value for expert in experts])
+		for name in names
+	)
+
+
+def moe_expert_capacity(
+	num_tokens: int,
+	num_experts: int,
+	top_k: int,
+	capacity_factor: float,
+) -> int:
+	"""Number of token slots per expert for a given capacity factor."""
+	if capacity_factor <= 0:
+		raise ValueError(f"capacity_factor must be positive, got {capacity_factor}")
+	capacity = math.ceil(capacity_factor * num_tokens * top_k / num_experts)
+	return max(1, min(capacity, num_tokens * top_k))
+
+
+def sorted_moe_dispatch(
+	hidden_states: chex.Array,
+	selected_experts: chex.Array,
+	routing_weights: chex.Array,
+	gate_kernel: chex.Array,
+	up_kernel: chex.Array,
+	down_kernel: chex.Array,
+	act_fn: tp.Callable[[chex.Array], chex.Array],
+	capacity_factor: tp.Optional[float] = None,
+	dtype: tp.Optional[jnp.dtype] = None,
+	precision: lax.PrecisionLike = None,
+) -> chex.Array:
+	"""
+	Runs gated-MLP experts (`down(act(x @ gate) * (x @ up))`) only on the tokens routed
+	to them.
+
+	Token/expert assignments are sorted by expert so that each expert sees a contiguous
+	group of rows, the experts are applied as grouped matmuls, and the outputs are
+	scattered back and combined with `routing_weights`. This costs `top_k / num_experts`
+	of the FLOPs of running every expert on every token.
+
+	Without `capacity_factor`, groups are processed with `jax.lax.ragged_dot` and no
+	token is dropped, which matches the dense path up to float reassociation. With a
+	`capacity_factor`, every expert gets a fixed buffer of
+	`ceil(capacity_factor * tokens * top_k / num_experts)` slots, processed with a
+	batched matmul; assignments beyond an expert's capacity (later tokens first) are
+	dropped and contribute zero.
+
+	Args:
+	    hidden_states: Token activations, shape `(..., hidden_size)`.
+	    selected_experts: Expert index per assignment, shape `(..., top_k)`.
+	    routing_weights: Weight per assignment, shape `(..., top_k)`.
+	    gate_kernel: Stacked gate projections, shape `(num_experts, hidden_size, ffn_dim)`.
+	    up_kernel: Stacked up projections, shape `(num_experts, hidden_size, ffn_dim)`.
+	    down_kernel: Stacked down projections, shape `(num_experts, ffn_dim, hidden_size)`.
+	    act_fn: Activation applied to the gate projection.
+	    capacity_factor: Optional expert capacity factor enabling token dropping.
+	    dtype: Computation dtype (defaults to `hidden_states.dtype`).
+	    precision: Matmul precision.
+
+	Returns:
+	    chex.Array: Combined expert outputs, same shape and dtype as `hidden_states`.
+	"""
+	dtype = dtype or hidden_states.dtype
+	num_experts = gate_kernel.shape[0]
+	top_k = selected_experts.shape[-1]
+	hidden_size = hidden_states.shape[-1]
+
+	tokens = hidden_states.reshape(-1, hidden_size).astype(dtype)
+	num_tokens = tokens.shape[0]
+	gate_kernel = gate_kernel.astype(dtype)
+	up_kernel = up_kernel.astype(dtype)
+	down_kernel = down_kernel.astype(dtype)
+
+	flat_experts = selected_experts.reshape(-1).astype(jnp.int32)
+	order = jnp.argsort(flat_experts, stable=True)
+	sorted_experts = flat_experts[order]
+	sorted_tokens = order // top_k
+	sorted_weights = routing_weights.reshape(-1)[order]
+	group_sizes = jnp.bincount(flat_experts, length=num_experts).astype(jnp.int32)
+	expert_inputs = tokens[sorted_tokens]
+
+	if capacity_factor is None:
+
+		def grouped_matmul(lhs, rhs):
+			return lax.ragged_dot(lhs, rhs, group_sizes, precision=precision)
+
+		intermediate = act_fn(grouped_matmul(expert_inputs, gate_kernel)) * grouped_matmul(
+			expert_inputs, up_kernel
+		)
+		expert_outputs = grouped_matmul(intermediate, down_kernel)
+	else:
+		capacity = moe_expert_capacity(num_tokens, num_experts, top_k, capacity_factor)
+		group_starts = jnp.cumsum(group_sizes) - group_sizes
+		position_in_expert = (
+			jnp.arange(sorted_experts.shape[0]) - group_starts[sorted_experts]
+		)
+		keep = position_in_expert < capacity
+		# dropped assignments point past the buffer and are ignored by scatter/gather.
+		slots = jnp.where(
+			keep,
+			sorted_experts * capacity + position_in_expert,
+			num_experts * capacity,
+		)
+		buffer = (
+			jnp.zeros((num_experts * capacity, hidden_size), dtype)
+			.at[slots]
+			.set(expert_inputs, mode="drop")
+			.reshape(num_experts, capacity, hidden_size)
+		)
+		intermediate = act_fn(
+			jnp.einsum("ech,ehf->ecf", buffer, gate_kernel, precision=precision)
+		) * jnp.einsum("ech,ehf->ecf", buffer, up_kernel, precision=precision)
+		buffer = jnp.einsum("ecf,efh->ech", intermediate, down_kernel, precision=precision)
+		expert_outputs = (
+			buffer.reshape(num_experts * capacity, hidden_size)
+			.at[slots]
+			.get(
+				mode="fill",
+				fill_value=0,
+			)
+		)
+		sorted_weights = jnp.where(keep, sorted_weights, 0)
+
+	expert_outputs = expert_outputs * sorted_weights[:, None].astype(expert_outputs.dtype)
+	combined = jnp.zeros((num_tokens, hidden_size), expert_outputs.dtype)
+	combined = combined.at[sorted_tokens].add(expert_outputs)
+	return combined.reshape(hidden_states.shape).astype(hidden_states.dtype)
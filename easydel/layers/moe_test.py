@@ -0,0 +1,143 @@
+# Copyright 2023 The EASYDEL Author @erfanzar (Erfan Zare Chavoshi).
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import jax
+import numpy as np
+import pytest
+from flax import nnx as nn
+from jax import numpy as jnp
+
+import easydel as ed
+
+from .moe import moe_expert_capacity, sorted_moe_dispatch
+
+NUM_EXPERTS, TOP_K, HIDDEN, FFN = 4, 2, 8, 16
+
+
+@pytest.fixture
+def moe_inputs():
+	rng = np.random.RandomState(0)
+	hidden_states = jnp.array(rng.randn(2, 5, HIDDEN), jnp.float32)
+	routing_weights, selected_experts = jax.lax.top_k(
+		jnp.array(rng.randn(2, 5, NUM_EXPERTS), jnp.float32),
+		TOP_K,
+	)
+	routing_weights = jax.nn.softmax(routing_weights, axis=-1)
+	kernels = (
+		jnp.array(rng.randn(NUM_EXPERTS, HIDDEN, FFN) * 0.3, jnp.float32),
+		jnp.array(rng.randn(NUM_EXPERTS, HIDDEN, FFN) * 0.3, jnp.float32),
+		jnp.array(rng.randn(NUM_EXPERTS, FFN, HIDDEN) * 0.3, jnp.float32),
+	)
+	return hidden_states, selected_experts, routing_weights, kernels
+
+
+def dense_moe(hidden_states, selected_experts, routing_weights, kernels):
+	gate, up, down = kernels
+	output = jnp.zeros_like(hidden_states)
+	for index in range(NUM_EXPERTS):
+		expert_output = (
+			jax.nn.silu(hidden_states @ gate[index]) * (hidden_states @ up[index])
+		) @ down[index]
+		weight = jnp.sum((selected_experts == index) * routing_weights, axis=-1)
+		output += weight[..., None] * expert_output
+	return output
+
+
+@pytest.mark.parametrize("capacity_factor", [None, NUM_EXPERTS / TOP_K])
+def test_sorted_dispatch_matches_dense(moe_inputs, capacity_factor):
+	hidden_states, selected_experts, routing_weights, kernels = moe_inputs
+
+	def sorted_loss(hidden_states, kernels):
+		return sorted_moe_dispatch(
+			hidden_states,
+			selected_experts,
+			routing_weights,
+			*kernels,
+			act_fn=jax.nn.silu,
+			capacity_factor=capacity_factor,
+		)
+
+	def dense_loss(hidden_states, kernels):
+		return dense_moe(hidden_states, selected_experts, routing_weights, kernels)
+
+	output = jax.jit(sorted_loss)(hidden_states, kernels)
+	np.testing.assert_allclose(output, dense_loss(hidden_states, kernels), atol=1e-5)
+
+	grads = jax.grad(lambda *a: jnp.sum(sorted_loss(*a) ** 2), argnums=(0, 1))(
+		hidden_states, kernels
+	)
+	expected = jax.grad(lambda *a: jnp.sum(dense_loss(*a) ** 2), argnums=(0, 1))(
+		hidden_states, kernels
+	)
+	for grad, expected_grad in zip(
+		jax.tree_util.tree_leaves(grads),
+		jax.tree_util.tree_leaves(expected),
+	):
+		np.testing.assert_allclose(grad, expected_grad, atol=1e-4)
+
+
+def test_capacity_drops_overflowing_tokens(moe_inputs):
+	hidden_states, _, routing_weights, kernels = moe_inputs
+	# every token is routed to experts 0 and 1, so a capacity of 2 slots keeps only
+	# the first two tokens.
+	selected_experts = jnp.broadcast_to(jnp.array([0, 1]), routing_weights.shape)
+	num_tokens = hidden_states.shape[0] * hidden_states.shape[1]
+	capacity_factor = 2 * NUM_EXPERTS / (num_tokens * TOP_K)
+	assert moe_expert_capacity(num_tokens, NUM_EXPERTS, TOP_K, capacity_factor) == 2
+
+	output = sorted_moe_dispatch(
+		hidden_states,
+		selected_experts,
+		routing_weights,
+		*kernels,
+		act_fn=jax.nn.silu,
+		capacity_factor=capacity_factor,
+	).reshape(num_tokens, HIDDEN)
+	expected = dense_moe(hidden_states, selected_experts, routing_weights, kernels)
+	expected = expected.reshape(num_tokens, HIDDEN)
+
+	np.testing.assert_allclose(output[:2], expected[:2], atol=1e-5)
+	np.testing.assert_array_equal(output[2:], 0)
+
+
+def test_invalid_capacity_factor():
+	with pytest.raises(ValueError):
+		moe_expert_capacity(8, NUM_EXPERTS, TOP_K, 0.0)
+
+
+def test_mixtral_sorted_dispatch_matches_dense():
+	config = ed.MixtralConfig(
+		vocab_size=128,
+		hidden_size=32,
+		intermediate_size=64,
+		num_hidden_layers=2,
+		num_attention_heads=4,
+		num_key_value_heads=2,
+		head_dim=8,
+		max_position_embeddings=64,
+		num_local_experts=NUM_EXPERTS,
+		num_experts_per_tok=TOP_K,
+		attn_mechanism=ed.AttentionMechanisms.VANILLA,
+	)
+	model = ed.MixtralForCausalLM(
+		config=config,
+		dtype=jnp.float32,
+		param_dtype=jnp.float32,
+		rngs=nn.Rngs(0),
+	)
+	input_ids = jnp.array(np.random.RandomState(0).randint(0, 128, (2, 7)))
+	dense_logits = model(input_ids=input_ids).logits
+	config.add_basic_configurations(moe_method="sorted")
+	sorted_logits = model(input_ids=input_ids).logits
+	np.testing.assert_allclose(sorted_logits, dense_logits, atol=1e-5)
@@ -0,0 +1,307 @@
+# Copyright 2023 The EASYDEL Author @erfanzar (Erfan Zare Chavoshi).
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Decoder layer stacks executed with `jax.lax.scan` (`config.scan_layers`)."""
+
+import re
+import typing as tp
+
+import chex
+import jax
+import numpy as np
+from flax import nnx as nn
+from jax import lax
+from jax import numpy as jnp
+
+from easydel.escale.partition.constraints import STACKED_LAYERS_KEY
+
+_LayerKey = tp.Tuple[tp.Union[str, int], ...]
+
+
+class ScannedLayers(nn.Module):
+	"""
+	A stack of `num_layers` identical layers whose parameters are stored stacked
+	(leading axis of size `num_layers`) and applied with a single `jax.lax.scan`.
+
+	The layer body is traced and compiled once instead of `num_layers` times, so the
+	compile time and HLO size of deep models no longer grow with depth. Parameters live
+	under `<name>/stacked/...` (see `stack_layer_params`/`unstack_layer_params` to convert
+	checkpoints), and `match_partition_rules` leaves their layer axis unsharded. Per-layer
+	cache views are stacked for the scan and split back afterwards. Other per-layer
+	variables are scanned over with the parameters, while the RNG streams shared with
+	the rest of the model advance from layer to layer as in the unrolled loop.
+
+	Layers must not depend on their index (e.g. alternating sliding windows); those
+	models keep the unrolled Python loop.
+	"""
+
+	def __init__(
+		self,
+		layer_factory: tp.Callable[..., nn.Module],
+		num_layers: int,
+		*,
+		rngs: nn.Rngs,
+	):
+		"""
+		Args:
+		    layer_factory: Callable building one layer from `rngs=...`, e.g.
+		        `partial(LlamaDecoderLayer, config=config, dtype=dtype, ...)`.
+		    num_layers: Number of layers in the stack.
+		    rngs: Random number generators, split across the layers for initialization.
+		"""
+		self.num_layers = num_layers
+
+		@nn.split_rngs(splits=num_layers)
+		@nn.vmap(in_axes=(0,), out_axes=0, axis_size=num_layers)
+		def _create_layers(rngs: nn.Rngs) -> nn.Module:
+			return layer_factory(rngs=rngs)
+
+		setattr(self, STACKED_LAYERS_KEY, _create_layers(rngs))
+
+	def __len__(self) -> int:
+		return self.num_layers
+
+	def __call__(
+		self,
+		hidden_states: chex.Array,
+		cache_views: tp.List[tp.Optional[tp.Any]],
+		output_attentions: bool = False,
+		output_hidden_states: bool = False,
+		**layer_kwargs,
+	) -> tp.Tuple[chex.Array, tp.Optional[tp.Tuple], tp.Optional[tp.Tuple]]:
+		"""
+		Runs `hidden_states` through every layer.
+
+		Args:
+		    hidden_states: Input of the first layer.
+		    cache_views: One cache view (or `None`) per layer; the list is updated in place
+		        with the views returned by the layers, as the unrolled loop does.
+		    output_attentions: Whether to collect each layer's attention weights.
+		    output_hidden_states: Whether to collect each layer's input hidden states.
+		    **layer_kwargs: Arguments passed unchanged to every layer (masks, position ids,
+		        frequencies, ...).
+
+		Returns:
+		    tp.Tuple: The last layer's hidden states, the per-layer input hidden states (or
+		    `None`) and the per-layer attention weights (or `None`).
+		"""
+		if len(cache_views) != self.num_layers:
+			raise ValueError(
+				f"Expected {self.num_layers} cache views, got {len(cache_views)}."
+			)
+		layers = getattr(self, STACKED_LAYERS_KEY)
+		# the RNG streams are the `rngs` the stack was built with, shared with the rest of
+		# the model: they advance from one layer to the next in the carry. Every other
+		# variable was stacked by `nn.vmap` and is scanned over like the parameters.
+		graphdef, params, shared_rngs, layer_state = nn.split(
+			layers,
+			nn.Param,
+			nn.RngState,
+			...,
+		)
+
+		use_cache = cache_views[0] is not None
+		if use_cache:
+			view_leaves, view_treedef = jax.tree_util.tree_flatten(cache_views[0])
+			is_array = [isinstance(leaf, (jax.Array, np.ndarray)) for leaf in view_leaves]
+			stacked_views = [
+				jnp.stack(leaves) if array else None
+				for array, leaves in zip(
+					is_array,
+					zip(*(jax.tree_util.tree_leaves(view) for view in cache_views)),
+				)
+			]
+
+			def build_view(leaves, static_leaves=view_leaves):
+				return jax.tree_util.tree_unflatten(
+					view_treedef,
+					[
+						leaf if array else static
+						for leaf, array, static in zip(leaves, is_array, static_leaves)
+					],
+				)
+		else:
+			stacked_views = None
+
+		# array arguments travel in the carry rather than the closure: layers evaluating
+		# under `jax.ensure_compile_time_eval` (e.g. rotary embeddings) would otherwise
+		# leak the caller's tracers.
+		array_kwargs = {
+			name: value
+			for name, value in layer_kwargs.items()
+			if isinstance(value, jax.Array)
+		}
+		static_kwargs = {
+			name: value for name, value in layer_kwargs.items() if name not in array_kwargs
+		}
+
+		def body(carry, xs):
+			hidden_states, shared_rngs, array_kwargs = carry
+			params, layer_state, view_leaves = xs
+			layer = nn.merge(graphdef, params, shared_rngs, layer_state)
+			cache_view = build_view(view_leaves) if use_cache else None
+			outputs = layer(
+				hidden_states=hidden_states,
+				cache_view=cache_view,
+				output_attentions=output_attentions,
+				**array_kwargs,
+				**static_kwargs,
+			)
+			new_view_leaves = (
+				[
+					leaf if array else None
+					for leaf, array in zip(jax.tree_util.tree_leaves(cache_view), is_array)
+				]
+				if use_cache
+				else None
+			)
+			_, shared_rngs, layer_state = nn.state(layer, nn.Param, nn.RngState, ...)
+			ys = (
+				hidden_states if output_hidden_states else None,
+				outputs[1] if output_attentions else None,
+				new_view_leaves,
+				layer_state,
+			)
+			return (outputs[0], shared_rngs, array_kwargs), ys
+
+		(
+			(hidden_states, shared_rngs, _),
+			(all_hidden_states, all_attentions, stacked_views, layer_state),
+		) = lax.scan(
+			body,
+			(hidden_states, shared_rngs, array_kwargs),
+			(params, layer_state, stacked_views),
+		)
+		nn.update(layers, shared_rngs, layer_state)
+
+		if use_cache:
+			for idx in range(self.num_layers):
+				cache_views[idx] = build_view(
+					[
+						leaf[idx] if array else None for leaf, array in zip(stacked_views, is_array)
+					],
+					jax.tree_util.tree_leaves(cache_views[idx]),
+				)
+		if output_hidden_states:
+			all_hidden_states = tuple(
+				all_hidden_states[idx] for idx in range(self.num_layers)
+			)
+		if output_attentions:
+			all_attentions = tuple(all_attentions[idx] for idx in range(self.num_layers))
+		return hidden_states, all_hidden_states, all_attentions
+
+
+def _layer_index_position(key: _LayerKey, layers_name: str) -> tp.Optional[int]:
+	for position in range(len(key) - 1):
+		if key[position] == layers_name and isinstance(key[position + 1], int):
+			return position + 1
+	return None
+
+
+def stack_layer_params(
+	params: tp.Dict[_LayerKey, chex.Array],
+	layers_name: str = "layers",
+) -> tp.Dict[_LayerKey, chex.Array]:
+	"""
+	Converts flat, unstacked parameters (`(..., "layers", 0, ...)`) into the layout used by
+	`ScannedLayers` (`(..., "layers", "stacked", ...)` with a leading layer axis).
+
+	Args:
+	    params: Flat parameter dictionary with tuple keys.
+	    layers_name: Name of the attribute holding the layer list.
+
+	Returns:
+	    tp.Dict: Flat parameter dictionary in the stacked layout.
+	"""
+	stacked, groups = {}, {}
+	for key, value in params.items():
+		position = _layer_index_position(key, layers_name)
+		if position is None:
+			stacked[key] = value
+			continue
+		new_key = key[:position] + (STACKED_LAYERS_KEY,) + key[position + 1 :]
+		groups.setdefault(new_key, {})[key[position]] = value
+	for new_key, layers in groups.items():
+		if sorted(layers) != list(range(len(layers))):
+			raise ValueError(
+				f"Missing layers while stacking {new_key}: got {sorted(layers)}."
+			)
+		values = [layers[idx] for idx in range(len(layers))]
+		stacked[new_key] = None if values[0] is None else jnp.stack(values)
+	return stacked
+
+
+def unstack_layer_params(
+	params: tp.Dict[_LayerKey, chex.Array],
+	layers_name: str = "layers",
+) -> tp.Dict[_LayerKey, chex.Array]:
+	"""
+	Inverse of `stack_layer_params`: splits `(..., "layers", "stacked", ...)` parameters
+	back into one entry per layer (`(..., "layers", 0, ...)`), e.g. to export a scanned
+	model to a HuggingFace state dict.
+
+	Args:
+	    params: Flat parameter dictionary with tuple keys.
+	    layers_name: Name of the attribute holding the layer list.
+
+	Returns:
+	    tp.Dict: Flat parameter dictionary in the unstacked layout.
+	"""
+
+	def stacked_position(key):
+		for idx in range(1, len(key)):
+			if key[idx] == STACKED_LAYERS_KEY and key[idx - 1] == layers_name:
+				return idx
+		return None
+
+	num_layers = {}
+	for key, value in params.items():
+		position = stacked_position(key)
+		if position is not None and value is not None:
+			num_layers[key[:position]] = value.shape[0]
+
+	unstacked = {}
+	for key, value in params.items():
+		position = stacked_position(key)
+		if position is None:
+			unstacked[key] = value
+			continue
+		# `None` leaves (e.g. disabled biases) are repeated for every layer.
+		for layer_idx in range(num_layers.get(key[:position], 0)):
+			unstacked[key[:position] + (layer_idx,) + key[position + 1 :]] = (
+				None if value is None else value[layer_idx]
+			)
+	return unstacked
+
+
+def match_layer_params_layout(
+	params: tp.Dict[_LayerKey, chex.Array],
+	reference_keys: tp.Iterable[_LayerKey],
+	layers_name: str = "layers",
+) -> tp.Dict[_LayerKey, chex.Array]:
+	"""
+	Converts flat `params` to the stacked or unstacked layout used by `reference_keys`
+	(usually the keys of a model's parameter tree), so that checkpoints saved with or
+	without `scan_layers` load into either kind of model.
+	"""
+	pattern = re.compile(rf"(^|/){layers_name}/{STACKED_LAYERS_KEY}(/|$)")
+	reference_stacked = any(
+		pattern.search("/".join(map(str, key))) for key in reference_keys
+	)
+	params_stacked = any(pattern.search("/".join(map(str, key))) for key in params)
+	if reference_stacked and not params_stacked:
+		return stack_layer_params(params, layers_name=layers_name)
+	if params_stacked and not reference_stacked:
+		return unstack_layer_params(params, layers_name=layers_name)
+	return params
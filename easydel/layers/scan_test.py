@@ -0,0 +1,246 @@
+# Copyright 2023 The EASYDEL Author @erfanzar (Erfan Zare Chavoshi).
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import jax
+import numpy as np
+import pytest
+from flax import nnx as nn
+from jax import numpy as jnp
+from jax.sharding import PartitionSpec
+
+import easydel as ed
+from easydel.escale import match_partition_rules
+from easydel.utils.traversals import flatten_dict, merge_model_and_tree, unflatten_dict
+
+from .scan import (
+	ScannedLayers,
+	match_layer_params_layout,
+	stack_layer_params,
+	unstack_layer_params,
+)
+
+NUM_LAYERS = 3
+
+
+def llama(scan_layers, **kwargs):
+	config = ed.LlamaConfig(
+		vocab_size=128,
+		hidden_size=32,
+		intermediate_size=64,
+		num_hidden_layers=NUM_LAYERS,
+		num_attention_heads=4,
+		num_key_value_heads=2,
+		max_position_embeddings=64,
+		scan_layers=scan_layers,
+		attn_mechanism=ed.AttentionMechanisms.VANILLA,
+		**kwargs,
+	)
+	return ed.LlamaForCausalLM(
+		config=config,
+		dtype=jnp.float32,
+		param_dtype=jnp.float32,
+		rngs=nn.Rngs(0),
+	)
+
+
+def params_of(model):
+	return flatten_dict(nn.state(model, nn.Param).to_pure_dict())
+
+
+@pytest.fixture(scope="module")
+def models():
+	unrolled = llama(scan_layers=False)
+	scanned = merge_model_and_tree(
+		llama(scan_layers=True),
+		unflatten_dict(stack_layer_params(params_of(unrolled))),
+	)
+	return unrolled, scanned
+
+
+def test_stack_and_unstack_layer_params():
+	params = {
+		("model", "embed", "embedding"): np.ones((4, 2)),
+		**{("model", "layers", i, "mlp", "kernel"): np.full((2, 3), i) for i in range(3)},
+		**{("model", "layers", i, "mlp", "bias"): None for i in range(3)},
+	}
+	stacked = stack_layer_params(params)
+	assert set(stacked) == {
+		("model", "embed", "embedding"),
+		("model", "layers", "stacked", "mlp", "kernel"),
+		("model", "layers", "stacked", "mlp", "bias"),
+	}
+	np.testing.assert_array_equal(
+		stacked[("model", "layers", "stacked", "mlp", "kernel")][:, 0, 0], [0, 1, 2]
+	)
+	unstacked = unstack_layer_params(stacked)
+	assert set(unstacked) == set(params)
+	for key, value in params.items():
+		if value is not None:
+			np.testing.assert_array_equal(unstacked[key], value)
+
+	assert set(match_layer_params_layout(params, stacked)) == set(stacked)
+	assert set(match_layer_params_layout(stacked, params)) == set(params)
+	assert match_layer_params_layout(params, params) is params
+
+
+def test_scanned_params_layout(models):
+	unrolled, scanned = models
+	assert isinstance(scanned.model.layers, ScannedLayers)
+	assert len(scanned.model.layers) == NUM_LAYERS
+	assert set(params_of(scanned)) == set(stack_layer_params(params_of(unrolled)))
+	kernel = scanned.model.layers.stacked.self_attn.q_proj.kernel.value
+	assert kernel.shape == (NUM_LAYERS, 32, 32)
+
+
+def test_partition_rules_skip_layer_axis():
+	rules = (
+		("self_attn/q_proj/kernel", PartitionSpec("fsdp", "tp")),
+		(".*", PartitionSpec()),
+	)
+	stacked_tree = {
+		"layers": {
+			"stacked": {
+				"self_attn": {"q_proj": {"kernel": jax.ShapeDtypeStruct((4, 256, 256), "f4")}}
+			},
+		}
+	}
+	tree = {
+		"layers": {
+			0: {"self_attn": {"q_proj": {"kernel": jax.ShapeDtypeStruct((256, 256), "f4")}}},
+		}
+	}
+	specs = match_partition_rules(rules, stacked_tree)
+	assert specs["layers"]["stacked"]["self_attn"]["q_proj"]["kernel"] == PartitionSpec(
+		None, "fsdp", "tp"
+	)
+	specs = match_partition_rules(rules, tree)
+	assert specs["layers"][0]["self_attn"]["q_proj"]["kernel"] == PartitionSpec(
+		"fsdp", "tp"
+	)
+
+
+def test_scanned_forward_matches_unrolled(models):
+	unrolled, scanned = models
+	input_ids = jnp.array(np.random.RandomState(0).randint(0, 128, (2, 9)))
+	expected = unrolled(
+		input_ids=input_ids, output_hidden_states=True, output_attentions=True
+	)
+	outputs = nn.jit(
+		lambda model, input_ids: model(
+			input_ids=input_ids,
+			output_hidden_states=True,
+			output_attentions=True,
+		)
+	)(scanned, input_ids)
+	np.testing.assert_allclose(outputs.logits, expected.logits, atol=1e-5)
+	assert len(outputs.hidden_states) == len(expected.hidden_states) == NUM_LAYERS + 1
+	assert len(outputs.attentions) == NUM_LAYERS
+	for hidden_state, expected_hidden_state in zip(
+		outputs.hidden_states,
+		expected.hidden_states,
+	):
+		np.testing.assert_allclose(hidden_state, expected_hidden_state, atol=1e-5)
+
+
+def test_scanned_decode_with_cache(models):
+	unrolled, scanned = models
+	input_ids = jnp.array(np.random.RandomState(1).randint(0, 128, (2, 5)))
+	logits = []
+	for model in (unrolled, scanned):
+		inputs = model.prepare_inputs_for_generation(input_ids, 16)
+		outputs = model(input_ids=input_ids, **inputs)
+		next_token = jnp.argmax(outputs.logits[:, -1:], axis=-1)
+		inputs = model.update_inputs_for_generation(outputs, inputs)
+		logits.append(model(input_ids=next_token, **inputs).logits)
+		views = inputs["past_key_values"].views
+		assert [view.layer_index for view in views] == list(range(NUM_LAYERS))
+		np.testing.assert_array_equal(views[-1].index, [6, 6])
+	np.testing.assert_allclose(logits[1], logits[0], atol=1e-5)
+
+
+def test_scanned_gradients_with_remat(models):
+	unrolled, _ = models
+	scanned = merge_model_and_tree(
+		llama(
+			scan_layers=True,
+			gradient_checkpointing=ed.EasyDeLGradientCheckPointers.NOTHING_SAVEABLE,
+		),
+		unflatten_dict(stack_layer_params(params_of(unrolled))),
+	)
+	input_ids = jnp.array(np.random.RandomState(2).randint(0, 128, (2, 7)))
+
+	def loss_fn(model):
+		return jnp.mean(model(input_ids=input_ids).logits ** 2)
+
+	expected = stack_layer_params(flatten_dict(nn.grad(loss_fn)(unrolled).to_pure_dict()))
+	grads = flatten_dict(nn.grad(loss_fn)(scanned).to_pure_dict())
+	assert set(grads) == set(expected)
+	for key, grad in grads.items():
+		if grad is not None:
+			np.testing.assert_allclose(grad, expected[key], atol=1e-6)
+
+
+class CountingLayer(nn.Module):
+	def __init__(self, rngs: nn.Rngs):
+		self.linear = nn.Linear(4, 4, rngs=rngs)
+		self.dropout = nn.Dropout(0.5, rngs=rngs)
+		self.calls = nn.BatchStat(jnp.zeros((), jnp.int32))
+
+	def __call__(self, hidden_states, cache_view=None, output_attentions=False):
+		self.calls.value += 1
+		return (self.dropout(self.linear(hidden_states)), None)
+
+
+def test_scan_keeps_per_layer_state_and_shares_rngs():
+	layers = ScannedLayers(CountingLayer, NUM_LAYERS, rngs=nn.Rngs(0))
+	rngs = layers.stacked.dropout.rngs
+	count = rngs.default.count.value
+	hidden_states = jnp.ones((2, 4))
+	outputs, _, _ = layers(hidden_states, [None] * NUM_LAYERS)
+	np.testing.assert_array_equal(layers.stacked.calls.value, [1] * NUM_LAYERS)
+	assert rngs.default.count.value == count + NUM_LAYERS
+
+	# the same layers applied one after the other, drawing from the same stream.
+	rngs.default.count.value = count
+	graphdef, params, others = nn.split(layers.stacked, nn.Param, ...)
+	expected = hidden_states
+	for idx in range(NUM_LAYERS):
+		layer_params = jax.tree_util.tree_map(lambda leaf, idx=idx: leaf[idx], params)
+		layer = nn.merge(graphdef, layer_params, others)
+		expected = layer.dropout(layer.linear(expected))
+		others = nn.state(layer, nn.Not(nn.Param))
+	np.testing.assert_allclose(outputs, expected, atol=1e-6)
+
+
+def test_scanned_dropout_matches_unrolled(models):
+	unrolled, scanned = models
+	input_ids = jnp.array(np.random.RandomState(3).randint(0, 128, (2, 9)))
+	logits = []
+	for model in (unrolled, scanned):
+		model = merge_model_and_tree(
+			llama(
+				scan_layers=isinstance(model.model.layers, ScannedLayers),
+				resid_pdrop=0.25,
+				embd_pdrop=0.25,
+			),
+			nn.state(model, nn.Param).to_pure_dict(),
+		)
+		# both draw the dropout masks from a stream at the same position.
+		for _, node in nn.iter_graph(model):
+			if isinstance(node, nn.RngStream):
+				node.key.value = jax.random.key(0)
+				node.count.value = jnp.zeros((), jnp.uint32)
+		logits.append(model(input_ids=input_ids).logits)
+	np.testing.assert_allclose(logits[1], logits[0], atol=1e-5)
+	assert not np.allclose(logits[0], unrolled(input_ids=input_ids).logits)
@@ -34,6 +34,7 @@ from easydel.infra.utils import (
 )
 from easydel.layers.attention import FlaxAttentionModule, FlexibleAttentionModule
 from easydel.layers.caching import TransformerCache, TransformerCacheView
+from easydel.layers.moe import sorted_moe_dispatch, use_sorted_moe_dispatch
 from easydel.modules.dbrx.dbrx_configuration import (
 	DbrxAttentionConfig as DbrxAttentionConfig,
 )
@@ -403,6 +404,23 @@ class DbrxExperts(nn.Module):
 		top_weights: chex.Array,
 		top_experts: chex.Array,
 	):
+		if use_sorted_moe_dispatch(self.config):
+			expert_shape = (
+				self.config.ffn_config.moe_num_experts,
+				self.config.ffn_config.ffn_hidden_size,
+				self.config.d_model,
+			)
+			return sorted_moe_dispatch(
+				x,
+				top_experts,
+				top_weights,
+				self.mlp.w1.value.reshape(expert_shape).transpose(0, 2, 1),
+				self.mlp.v1.value.reshape(expert_shape).transpose(0, 2, 1),
+				self.mlp.w2.value.reshape(expert_shape),
+				act_fn=self.mlp.activation_fn,
+				capacity_factor=self.config.moe_capacity_factor,
+				precision=self.precision,
+			)
 		final_hidden_state = jnp.zeros_like(x)
 		for index in range(self.config.ffn_config.moe_num_experts):
 			output_moe_layer = self.mlp(x, index)
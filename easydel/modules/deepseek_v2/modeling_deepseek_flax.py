@@ -39,6 +39,11 @@ from easydel.infra.utils import (
 )
 from easydel.layers.attention import FlaxAttentionModule, FlexibleAttentionModule
 from easydel.layers.caching import TransformerCache, TransformerCacheView
+from easydel.layers.moe import (
+	sorted_moe_dispatch,
+	stack_expert_kernels,
+	use_sorted_moe_dispatch,
+)
 from easydel.layers.norms import RMSNorm
 from easydel.modules.deepseek_v2.deepseek_configuration import (
 	DeepseekV2Config as DeepseekV2Config,
@@ -370,7 +375,7 @@ class FlaxDeepseekV2MoE(nn.Module):
 		)
 		if config.n_shared_experts is not None:
 			intermediate_size = config.moe_intermediate_size * config.n_shared_experts
-			self.shared_experts = FlaxDeepseekV2MoE(
+			self.shared_experts = FlaxDeepseekV2MLP(
 				config=config,
 				dtype=dtype,
 				param_dtype=param_dtype,
@@ -385,14 +390,24 @@ class FlaxDeepseekV2MoE(nn.Module):
 		orig_shape = hidden_states.shape
 		topk_idx, topk_weight, aux_loss = self.gate(hidden_states)
 		hidden_states = hidden_states.reshape(-1, hidden_states.shape[-1])
-		flat_topk_idx = topk_idx.reshape(-1)
-		hidden_states = hidden_states.repeat(self.num_experts_per_tok, axis=0)
-		y = jnp.empty_like(hidden_states)
-		for i, expert in enumerate(self.experts):
-			y[flat_topk_idx == i] = expert(hidden_states[flat_topk_idx == i])
-		y = (y.reshape(*topk_weight.shape, -1) * jnp.expand_dims(topk_weight, -1)).sum(
-			axis=1
-		)
+		if use_sorted_moe_dispatch(self.config):
+			y = sorted_moe_dispatch(
+				hidden_states,
+				topk_idx,
+				topk_weight,
+				*stack_expert_kernels(self.experts, "gate_proj", "up_proj", "down_proj"),
+				act_fn=self.experts[0].act_fn,
+				capacity_factor=self.config.moe_capacity_factor,
+				dtype=self.dtype,
+				precision=self.precision,
+			)
+		else:
+			y = jnp.zeros_like(hidden_states)
+			for index, expert in enumerate(self.experts):
+				y += (
+					jnp.sum(jnp.multiply(topk_idx == index, topk_weight), axis=-1)[:, None]
+					* expert(hidden_states)
+				)
 		y = y.reshape(*orig_shape)
 		if self.config.n_shared_experts is not None:
 			y = y + self.shared_experts(identity)
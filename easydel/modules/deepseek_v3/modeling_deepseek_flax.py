@@ -38,6 +38,11 @@ from easydel.layers.caching.transformer_cache import (
 	TransformerCache,
 	TransformerCacheView,
 )
+from easydel.layers.moe import (
+	sorted_moe_dispatch,
+	stack_expert_kernels,
+	use_sorted_moe_dispatch,
+)
 from easydel.layers.norms import RMSNorm
 
 from .deepseek_configuration import DeepseekV3Config
@@ -368,8 +373,7 @@ class DeepseekV3MoE(nn.Module):
 		orig_shape = hidden_states.shape
 		topk_idx, topk_weight = self.gate(hidden_states)
 		hidden_states = hidden_states.reshape(-1, hidden_states.shape[-1])
-		if self.deterministic:
-			y = self.moe_infer(hidden_states, topk_idx, topk_weight).reshape(*orig_shape)
+		y = self.moe_infer(hidden_states, topk_idx, topk_weight).reshape(*orig_shape)
 		if self.config.n_shared_experts is not None:
 			y = y + self.shared_experts(identity)
 		return y
@@ -388,6 +392,17 @@ class DeepseekV3MoE(nn.Module):
 		Returns:
 		        Output tensor of shape [batch_size, hidden_dim]
 		"""
+		if use_sorted_moe_dispatch(self.config):
+			return sorted_moe_dispatch(
+				x,
+				topk_ids,
+				topk_weight,
+				*stack_expert_kernels(self.experts, "gate_proj", "up_proj", "down_proj"),
+				act_fn=self.experts[0].act_fn,
+				capacity_factor=self.config.moe_capacity_factor,
+				dtype=self.dtype,
+				precision=self.precision,
+			)
 		final_hidden_state = jnp.zeros_like(x)
 
 		for index in range(len(self.experts)):
@@ -37,6 +37,7 @@ from easydel.infra.utils import (
 )
 from easydel.layers.attention import FlaxAttentionModule, FlexibleAttentionModule
 from easydel.layers.caching import TransformerCache, TransformerCacheView
+from easydel.layers.scan import ScannedLayers
 from easydel.modules.gemma.gemma_configuration import GemmaConfig as GemmaConfig
 from easydel.utils.helpers import get_logger
 
@@ -454,16 +455,29 @@ class GemmaModel(EasyDeLBaseModule):
 			param_dtype=param_dtype,
 			rngs=rngs,
 		)
-		self.layers = [
-			GemmaDecoderLayer(
-				self.config,
-				dtype=dtype,
-				param_dtype=param_dtype,
-				precision=precision,
+		if getattr(self.config, "scan_layers", False):
+			self.layers = ScannedLayers(
+				functools.partial(
+					GemmaDecoderLayer,
+					config=self.config,
+					dtype=dtype,
+					param_dtype=param_dtype,
+					precision=precision,
+				),
+				num_layers=self.config.num_hidden_layers,
 				rngs=rngs,
 			)
-			for i in range(self.config.num_hidden_layers)
-		]
+		else:
+			self.layers = [
+				GemmaDecoderLayer(
+					self.config,
+					dtype=dtype,
+					param_dtype=param_dtype,
+					precision=precision,
+					rngs=rngs,
+				)
+				for i in range(self.config.num_hidden_layers)
+			]
 		self.norm = GemmaRMSNorm(self.config, dtype=self.dtype)
 
 	# Ignore copy
@@ -526,24 +540,41 @@ class GemmaModel(EasyDeLBaseModule):
 		hidden_states = inputs_embeds
 		if past_key_values is None:
 			past_key_values = TransformerCache.init_empty(len(self.layers))
-		for idx, block in enumerate(self.layers):
-			if output_hidden_states:
-				all_hidden_states += (hidden_states,)
-
-			layer_outputs = block(
-				hidden_states=hidden_states,
+		if isinstance(self.layers, ScannedLayers):
+			hidden_states, layers_hidden_states, layers_attentions = self.layers(
+				hidden_states,
+				past_key_values.views,
+				output_attentions=output_attentions,
+				output_hidden_states=output_hidden_states,
 				attention_mask=attention_mask,
 				position_ids=position_ids,
-				cache_view=past_key_values.views[idx],
 				causal_mask=self.causal_mask,
-				output_attentions=output_attentions,
 				segment_ids=segment_ids,
 				frequencies=self.frequencies,
 			)
-			hidden_states = layer_outputs[0]
-
+			if output_hidden_states:
+				all_hidden_states += layers_hidden_states
 			if output_attentions:
-				all_attentions += (layer_outputs[1],)
+				all_attentions += layers_attentions
+		else:
+			for idx, block in enumerate(self.layers):
+				if output_hidden_states:
+					all_hidden_states += (hidden_states,)
+
+				layer_outputs = block(
+					hidden_states=hidden_states,
+					attention_mask=attention_mask,
+					position_ids=position_ids,
+					cache_view=past_key_values.views[idx],
+					causal_mask=self.causal_mask,
+					output_attentions=output_attentions,
+					segment_ids=segment_ids,
+					frequencies=self.frequencies,
+				)
+				hidden_states = layer_outputs[0]
+
+				if output_attentions:
+					all_attentions += (layer_outputs[1],)
 
 		hidden_states = self.norm(hidden_states)
 		if output_hidden_states:
@@ -569,6 +600,8 @@ class GemmaModel(EasyDeLBaseModule):
 	embedding_layer_names=["embed_tokens"],
 )
 class GemmaForCausalLM(EasyDeLBaseModule):
+	supports_chunked_lm_head_loss = True
+
 	def __init__(
 		self,
 		config: GemmaConfig,
@@ -615,6 +648,7 @@ class GemmaForCausalLM(EasyDeLBaseModule):
 		output_hidden_states: tp.Optional[bool] = None,
 		past_key_values: tp.Optional[TransformerCache] = None,
 		return_dict: bool = True,
+		apply_lm_head: bool = True,
 	) -> tp.Union[FlaxCausalLMOutput, tp.Tuple]:
 		"""
 		Forward pass through the Gemma module.
@@ -648,7 +682,9 @@ class GemmaForCausalLM(EasyDeLBaseModule):
 		)
 
 		hidden_states = outputs[0]
-		if self.config.tie_word_embeddings:
+		if not apply_lm_head:
+			lm_logits = None
+		elif self.config.tie_word_embeddings:
 			# self.lm_head.kernel.value = self.model.embed_tokens.embedding.value.T
 			# lm_logits = self.lm_head(hidden_states)
 			lm_logits = jax.lax.dot_general(
@@ -667,4 +703,5 @@ class GemmaForCausalLM(EasyDeLBaseModule):
 			hidden_states=outputs.hidden_states,
 			attentions=outputs.attentions,
 			past_key_values=outputs.past_key_values,
+			last_hidden_state=None if apply_lm_head else hidden_states,
 		)
@@ -37,7 +37,11 @@ from easydel.infra.utils import (
 	get_dot_general_by_bits,
 )
 from easydel.layers.attention import FlaxAttentionModule, FlexibleAttentionModule
-from easydel.layers.caching import TransformerCache, TransformerCacheView
+from easydel.layers.caching import (
+	TransformerCache,
+	TransformerCacheView,
+	alternating_sliding_windows,
+)
 from easydel.modules.gemma2.gemma2_configuration import Gemma2Config as Gemma2Config
 from easydel.utils.helpers import get_logger
 
@@ -475,6 +479,13 @@ class Gemma2Model(EasyDeLBaseModule):
 		]
 		self.norm = Gemma2RMSNorm(self.config, dtype=self.dtype)
 
+	def _get_cache_sliding_windows(self) -> tp.List[tp.Optional[int]]:
+		# even layers attend locally, see `Gemma2Attention`.
+		return alternating_sliding_windows(
+			self.config.num_hidden_layers,
+			self.config.sliding_window,
+		)
+
 	def __call__(
 		self,
 		input_ids: tp.Optional[chex.Array] = None,
@@ -609,6 +620,9 @@ class Gemma2ForCausalLM(EasyDeLBaseModule):
 			**get_dot_general_by_bits(config.bits, config.easy_method),
 		)
 
+	def _get_cache_sliding_windows(self) -> tp.List[tp.Optional[int]]:
+		return self.model._get_cache_sliding_windows()
+
 	def __call__(
 		self,
 		input_ids: tp.Optional[chex.Array] = None,
@@ -37,6 +37,11 @@ from easydel.infra.utils import (
 )
 from easydel.layers.attention import FlaxAttentionModule, FlexibleAttentionModule
 from easydel.layers.caching import TransformerCache, TransformerCacheView
+from easydel.layers.moe import (
+	sorted_moe_dispatch,
+	stack_expert_kernels,
+	use_sorted_moe_dispatch,
+)
 from easydel.layers.norms import RMSNorm as FlaxGrok1RMSNorm
 from easydel.modules.grok_1.grok_1_configuration import Grok1Config as Grok1Config
 
@@ -356,25 +361,37 @@ class FlaxGrok1SparseMoeBlock(nn.Module):
 		routing_weights = jax.nn.softmax(
 			routing_weights.astype(jnp.promote_types(self.dtype, jnp.float32)), axis=-1
 		)
-		final_hidden_state = jnp.zeros_like(hidden_states)
-
-		for index in range(self.config.num_experts):
-			expert_layer_output = (
-				block_wise_ffn(
-					self.layers[index],
-					hidden_states,
-					self.config.scan_mlp_chunk_size,
-				)
-				if self.config.use_scan_mlp
-				else self.layers[index](hidden_states)
+		if use_sorted_moe_dispatch(self.config):
+			final_hidden_state = sorted_moe_dispatch(
+				hidden_states,
+				selected_experts,
+				routing_weights,
+				*stack_expert_kernels(self.experts, "linear", "linear_v", "linear_1"),
+				act_fn=nn.gelu,
+				capacity_factor=self.config.moe_capacity_factor,
+				dtype=self.dtype,
+				precision=self.precision,
 			)
-			expert_layer_output_exp = (
-				jnp.sum(jnp.multiply(selected_experts == index, routing_weights), axis=-1)[
-					:, :, None
-				]
-				* expert_layer_output
-			)
-			final_hidden_state += expert_layer_output_exp
+		else:
+			final_hidden_state = jnp.zeros_like(hidden_states)
+
+			for index in range(self.config.num_experts):
+				expert_layer_output = (
+					block_wise_ffn(
+						self.experts[index],
+						hidden_states,
+						self.config.scan_mlp_chunk_size,
+					)
+					if self.config.use_scan_mlp
+					else self.experts[index](hidden_states)
+				)
+				expert_layer_output_exp = (
+					jnp.sum(jnp.multiply(selected_experts == index, routing_weights), axis=-1)[
+						:, :, None
+					]
+					* expert_layer_output
+				)
+				final_hidden_state += expert_layer_output_exp
 		return (final_hidden_state, router_logits)
 
 
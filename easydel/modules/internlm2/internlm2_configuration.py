@@ -185,7 +185,7 @@ class InternLM2Config(EasyDeLBaseConfig):
 		bits: tp.Optional[int] = None,
 		rope_theta: float = 10000.0,
 		hidden_act: str = "silu",
-		scan_layers: bool = True,
+		scan_layers: bool = False,
 		**kwargs,
 	):
 		"""The add_jax_args function adds the following arguments to the Transformer class:
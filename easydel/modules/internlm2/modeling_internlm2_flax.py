@@ -40,6 +40,7 @@ from easydel.infra.utils import (
 from easydel.layers.attention import FlaxAttentionModule, FlexibleAttentionModule
 from easydel.layers.caching import TransformerCache, TransformerCacheView
 from easydel.layers.norms import RMSNorm
+from easydel.layers.scan import ScannedLayers
 from easydel.modules.internlm2.internlm2_configuration import (
 	InternLM2Config as InternLM2Config,
 )
@@ -360,16 +361,29 @@ class InternLM2Model(EasyDeLBaseModule):
 			param_dtype=param_dtype,
 			rngs=rngs,
 		)
-		self.layers = [
-			FlaxInternLM2Block(
-				config=config,
+		if getattr(config, "scan_layers", False):
+			self.layers = ScannedLayers(
+				functools.partial(
+					FlaxInternLM2Block,
+					config=config,
+					dtype=dtype,
+					param_dtype=param_dtype,
+					precision=precision,
+				),
+				num_layers=config.num_hidden_layers,
 				rngs=rngs,
-				dtype=dtype,
-				param_dtype=param_dtype,
-				precision=precision,
 			)
-			for i in range(config.num_hidden_layers)
-		]
+		else:
+			self.layers = [
+				FlaxInternLM2Block(
+					config=config,
+					rngs=rngs,
+					dtype=dtype,
+					param_dtype=param_dtype,
+					precision=precision,
+				)
+				for i in range(config.num_hidden_layers)
+			]
 		self.norm = RMSNorm(
 			dim=config.hidden_size,
 			eps=config.rms_norm_eps,
@@ -435,24 +449,41 @@ class InternLM2Model(EasyDeLBaseModule):
 		all_attentions = () if output_attentions else None
 		all_hidden_states = () if output_hidden_states else None
 
-		for idx, block in enumerate(self.layers):
-			if output_hidden_states:
-				all_hidden_states += (hidden_states,)
-
-			layer_outputs = block(
-				hidden_states=hidden_states,
+		if isinstance(self.layers, ScannedLayers):
+			hidden_states, layers_hidden_states, layers_attentions = self.layers(
+				hidden_states,
+				past_key_values.views,
+				output_attentions=output_attentions,
+				output_hidden_states=output_hidden_states,
 				attention_mask=attention_mask,
 				position_ids=position_ids,
 				causal_mask=self.causal_mask,
-				cache_view=past_key_values.views[idx],
-				output_attentions=output_attentions,
 				segment_ids=segment_ids,
 				frequencies=self.frequencies,
 			)
-			hidden_states = layer_outputs[0]
-
+			if output_hidden_states:
+				all_hidden_states += layers_hidden_states
 			if output_attentions:
-				all_attentions += (layer_outputs[1],)
+				all_attentions += layers_attentions
+		else:
+			for idx, block in enumerate(self.layers):
+				if output_hidden_states:
+					all_hidden_states += (hidden_states,)
+
+				layer_outputs = block(
+					hidden_states=hidden_states,
+					attention_mask=attention_mask,
+					position_ids=position_ids,
+					causal_mask=self.causal_mask,
+					cache_view=past_key_values.views[idx],
+					output_attentions=output_attentions,
+					segment_ids=segment_ids,
+					frequencies=self.frequencies,
+				)
+				hidden_states = layer_outputs[0]
+
+				if output_attentions:
+					all_attentions += (layer_outputs[1],)
 
 		hidden_states = self.norm(hidden_states)
 
@@ -207,7 +207,7 @@ class LlamaConfig(EasyDeLBaseConfig):
 		rope_theta: float = 10000.0,
 		attention_bias: bool = False,
 		hidden_act: str = "silu",
-		scan_layers: bool = True,
+		scan_layers: bool = False,
 		**kwargs,
 	):
 		"""The add_jax_args function adds the following arguments to the Transformer class:
@@ -39,6 +39,7 @@ from easydel.infra.utils import (
 from easydel.layers.attention import FlaxAttentionModule, FlexibleAttentionModule
 from easydel.layers.caching import TransformerCache, TransformerCacheView
 from easydel.layers.norms import RMSNorm
+from easydel.layers.scan import ScannedLayers
 from easydel.modules.llama.llama_configuration import (
 	LlamaConfig as LlamaConfig,
 )
@@ -380,16 +381,29 @@ class LlamaModel(EasyDeLBaseModule):
 			rngs=rngs,
 		)
 		self.dropout = nn.Dropout(rate=self.config.embd_pdrop, rngs=rngs)
-		self.layers = [
-			LlamaDecoderLayer(
-				config=config,
-				dtype=dtype,
-				param_dtype=param_dtype,
-				precision=precision,
+		if getattr(self.config, "scan_layers", False):
+			self.layers = ScannedLayers(
+				partial(
+					LlamaDecoderLayer,
+					config=config,
+					dtype=dtype,
+					param_dtype=param_dtype,
+					precision=precision,
+				),
+				num_layers=self.config.num_hidden_layers,
 				rngs=rngs,
 			)
-			for _ in range(self.config.num_hidden_layers)
-		]
+		else:
+			self.layers = [
+				LlamaDecoderLayer(
+					config=config,
+					dtype=dtype,
+					param_dtype=param_dtype,
+					precision=precision,
+					rngs=rngs,
+				)
+				for _ in range(self.config.num_hidden_layers)
+			]
 		self.norm = RMSNorm(
 			self.config.hidden_size,
 			eps=self.config.rms_norm_eps,
@@ -434,24 +448,41 @@ class LlamaModel(EasyDeLBaseModule):
 		hidden_states = self.dropout(inputs_embeds)
 		if past_key_values is None:
 			past_key_values = TransformerCache.init_empty(len(self.layers))
-		for idx, block in enumerate(self.layers):
-			if output_hidden_states:
-				all_hidden_states += (hidden_states,)
-
-			layer_outputs = block(
-				hidden_states=hidden_states,
+		if isinstance(self.layers, ScannedLayers):
+			hidden_states, layers_hidden_states, layers_attentions = self.layers(
+				hidden_states,
+				past_key_values.views,
+				output_attentions=output_attentions,
+				output_hidden_states=output_hidden_states,
 				attention_mask=attention_mask,
 				position_ids=position_ids,
-				cache_view=past_key_values.views[idx],
 				causal_mask=self.causal_mask,
-				output_attentions=output_attentions,
 				segment_ids=segment_ids,
 				frequencies=self.frequencies,
 			)
-			hidden_states = layer_outputs[0]
-
+			if output_hidden_states:
+				all_hidden_states += layers_hidden_states
 			if output_attentions:
-				all_attentions += (layer_outputs[1],)
+				all_attentions += layers_attentions
+		else:
+			for idx, block in enumerate(self.layers):
+				if output_hidden_states:
+					all_hidden_states += (hidden_states,)
+
+				layer_outputs = block(
+					hidden_states=hidden_states,
+					attention_mask=attention_mask,
+					position_ids=position_ids,
+					cache_view=past_key_values.views[idx],
+					causal_mask=self.causal_mask,
+					output_attentions=output_attentions,
+					segment_ids=segment_ids,
+					frequencies=self.frequencies,
+				)
+				hidden_states = layer_outputs[0]
+
+				if output_attentions:
+					all_attentions += (layer_outputs[1],)
 
 		hidden_states = self.norm(hidden_states)
 
@@ -487,6 +518,8 @@ class LlamaForCausalLM(EasyDeLBaseModule):
 		precision (tp.Optional[tp.Union[str, jax.lax.Precision]]): Precision setting for JAX operations (default is "fastest").
 	"""
 
+	supports_chunked_lm_head_loss = True
+
 	def __init__(
 		self,
 		config: LlamaConfig,
@@ -534,6 +567,7 @@ class LlamaForCausalLM(EasyDeLBaseModule):
 		output_attentions: tp.Optional[bool] = None,
 		output_hidden_states: tp.Optional[bool] = None,
 		return_dict: bool = True,
+		apply_lm_head: bool = True,
 	) -> tp.Union[FlaxCausalLMOutput, tp.Tuple]:
 		outputs = self.model(
 			input_ids=input_ids,
@@ -548,7 +582,9 @@ class LlamaForCausalLM(EasyDeLBaseModule):
 		)
 
 		hidden_states = outputs[0]
-		if self.config.tie_word_embeddings:
+		if not apply_lm_head:
+			lm_logits = None
+		elif self.config.tie_word_embeddings:
 			lm_logits = jax.lax.dot_general(
 				hidden_states,
 				self.model.embed_tokens.embedding.value.T,
@@ -565,6 +601,7 @@ class LlamaForCausalLM(EasyDeLBaseModule):
 			hidden_states=outputs.hidden_states,
 			attentions=outputs.attentions,
 			past_key_values=outputs.past_key_values,
+			last_hidden_state=None if apply_lm_head else hidden_states,
 		)
 
 
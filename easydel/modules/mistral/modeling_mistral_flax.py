@@ -482,6 +482,8 @@ class MistralModel(EasyDeLBaseModule):
 	embedding_layer_names=["embed_tokens"],
 )
 class MistralForCausalLM(EasyDeLBaseModule):
+	supports_chunked_lm_head_loss = True
+
 	def __init__(
 		self,
 		config: MistralConfig,
@@ -529,6 +531,7 @@ class MistralForCausalLM(EasyDeLBaseModule):
 		output_attentions: tp.Optional[bool] = None,
 		output_hidden_states: tp.Optional[bool] = None,
 		return_dict: bool = True,
+		apply_lm_head: bool = True,
 	) -> tp.Union[FlaxCausalLMOutput, tp.Tuple]:
 		outputs = self.model(
 			input_ids=input_ids,
@@ -544,7 +547,9 @@ class MistralForCausalLM(EasyDeLBaseModule):
 
 		hidden_states = outputs[0]
 
-		if self.config.tie_word_embeddings:
+		if not apply_lm_head:
+			lm_logits = None
+		elif self.config.tie_word_embeddings:
 			# self.lm_head.kernel.value = self.model.embed_tokens.embedding.value.T
 			# lm_logits = self.lm_head(hidden_states)
 			lm_logits = jax.lax.dot_general(
@@ -563,4 +568,5 @@ class MistralForCausalLM(EasyDeLBaseModule):
 			hidden_states=outputs.hidden_states,
 			attentions=outputs.attentions,
 			past_key_values=outputs.past_key_values,
+			last_hidden_state=None if apply_lm_head else hidden_states,
 		)
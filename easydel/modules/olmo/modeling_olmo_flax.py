@@ -486,6 +486,8 @@ class OlmoModel(EasyDeLBaseModule):
 	embedding_layer_names=["embed_tokens"],
 )
 class OlmoForCausalLM(EasyDeLBaseModule):
+	supports_chunked_lm_head_loss = True
+
 	def __init__(
 		self,
 		config: OlmoConfig,
@@ -534,6 +536,7 @@ class OlmoForCausalLM(EasyDeLBaseModule):
 		output_attentions: tp.Optional[bool] = None,
 		output_hidden_states: tp.Optional[bool] = None,
 		return_dict: bool = True,
+		apply_lm_head: bool = True,
 	) -> tp.Union[FlaxCausalLMOutput, tp.Tuple]:
 		outputs = self.model(
 			input_ids=input_ids,
@@ -548,7 +551,9 @@ class OlmoForCausalLM(EasyDeLBaseModule):
 		)
 
 		hidden_states = outputs[0]
-		if self.config.tie_word_embeddings:
+		if not apply_lm_head:
+			lm_logits = None
+		elif self.config.tie_word_embeddings:
 			# self.lm_head.kernel.value = self.model.embed_tokens.embedding.value.T
 			# lm_logits = self.lm_head(hidden_states)
 			lm_logits = jax.lax.dot_general(
@@ -566,4 +571,5 @@ class OlmoForCausalLM(EasyDeLBaseModule):
 			hidden_states=outputs.hidden_states,
 			attentions=outputs.attentions,
 			past_key_values=outputs.past_key_values,
+			last_hidden_state=None if apply_lm_head else hidden_states,
 		)
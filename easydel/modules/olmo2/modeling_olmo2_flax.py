@@ -498,6 +498,8 @@ class Olmo2Model(EasyDeLBaseModule):
 	embedding_layer_names=["embed_tokens"],
 )
 class Olmo2ForCausalLM(EasyDeLBaseModule):
+	supports_chunked_lm_head_loss = True
+
 	def __init__(
 		self,
 		config: Olmo2Config,
@@ -545,6 +547,7 @@ class Olmo2ForCausalLM(EasyDeLBaseModule):
 		output_attentions: tp.Optional[bool] = None,
 		output_hidden_states: tp.Optional[bool] = None,
 		return_dict: bool = True,
+		apply_lm_head: bool = True,
 	) -> tp.Union[FlaxCausalLMOutput, tp.Tuple]:
 		outputs = self.model(
 			input_ids=input_ids,
@@ -559,7 +562,9 @@ class Olmo2ForCausalLM(EasyDeLBaseModule):
 		)
 
 		hidden_states = outputs[0]
-		if self.config.tie_word_embeddings:
+		if not apply_lm_head:
+			lm_logits = None
+		elif self.config.tie_word_embeddings:
 			# self.lm_head.kernel.value = self.model.embed_tokens.embedding.value.T
 			# lm_logits = self.lm_head(hidden_states)
 			lm_logits = jax.lax.dot_general(
@@ -577,4 +582,5 @@ class Olmo2ForCausalLM(EasyDeLBaseModule):
 			hidden_states=outputs.hidden_states,
 			attentions=outputs.attentions,
 			past_key_values=outputs.past_key_values,
+			last_hidden_state=None if apply_lm_head else hidden_states,
 		)
@@ -548,6 +548,8 @@ class Phi3Model(EasyDeLBaseModule):
 	embedding_layer_names=["embed_tokens"],
 )
 class Phi3ForCausalLM(EasyDeLBaseModule):
+	supports_chunked_lm_head_loss = True
+
 	def __init__(
 		self,
 		config: Phi3Config,
@@ -594,6 +596,7 @@ class Phi3ForCausalLM(EasyDeLBaseModule):
 		output_hidden_states: tp.Optional[bool] = None,
 		past_key_values: tp.Optional[TransformerCache] = None,
 		return_dict: bool = True,
+		apply_lm_head: bool = True,
 	) -> tp.Union[FlaxCausalLMOutput, tp.Tuple]:
 		"""
 		Forward pass through the Phi3 module.
@@ -627,7 +630,9 @@ class Phi3ForCausalLM(EasyDeLBaseModule):
 		)
 		hidden_states = outputs.last_hidden_state
 
-		if self.config.tie_word_embeddings:
+		if not apply_lm_head:
+			lm_logits = None
+		elif self.config.tie_word_embeddings:
 			# self.lm_head.kernel.value = self.model.embed_tokens.embedding.value.T
 			# lm_logits = self.lm_head(hidden_states)
 			lm_logits = jax.lax.dot_general(
@@ -645,4 +650,5 @@ class Phi3ForCausalLM(EasyDeLBaseModule):
 			hidden_states=outputs.hidden_states,
 			attentions=outputs.attentions,
 			past_key_values=outputs.past_key_values,
+			last_hidden_state=None if apply_lm_head else hidden_states,
 		)
@@ -40,6 +40,11 @@ from easydel.infra.utils import (
 )
 from easydel.layers.attention import FlaxAttentionModule, FlexibleAttentionModule
 from easydel.layers.caching import TransformerCache, TransformerCacheView
+from easydel.layers.moe import (
+	sorted_moe_dispatch,
+	stack_expert_kernels,
+	use_sorted_moe_dispatch,
+)
 from easydel.layers.norms import RMSNorm as RMSNorm
 from easydel.modules.phimoe.phimoe_configuration import PhiMoeConfig as PhiMoeConfig
 
@@ -334,23 +339,35 @@ class PhiMoeSparseMoeBlock(nn.Module):
 			)(self.make_rng(), hidden_states.shape, hidden_states.dtype)
 		else:
 			final_hidden_state = jnp.zeros_like(hidden_states)
-		for index in range(self.config.num_local_experts):
-			expert_layer_output = (
-				block_wise_ffn(
-					self.experts[index],
-					hidden_states,
-					self.config.scan_mlp_chunk_size,
-				)
-				if self.config.use_scan_mlp
-				else self.experts[index](hidden_states)
-			)
-			expert_layer_output_exp = (
-				jnp.sum(jnp.multiply(selected_experts == index, routing_weights), axis=-1)[
-					:, :, None
-				]
-				* expert_layer_output
+		if use_sorted_moe_dispatch(self.config):
+			final_hidden_state = final_hidden_state + sorted_moe_dispatch(
+				hidden_states,
+				selected_experts,
+				routing_weights,
+				*stack_expert_kernels(self.experts, "w1", "w3", "w2"),
+				act_fn=self.experts[0].act_fn,
+				capacity_factor=self.config.moe_capacity_factor,
+				dtype=self.dtype,
+				precision=self.precision,
 			)
-			final_hidden_state += expert_layer_output_exp
+		else:
+			for index in range(self.config.num_local_experts):
+				expert_layer_output = (
+					block_wise_ffn(
+						self.experts[index],
+						hidden_states,
+						self.config.scan_mlp_chunk_size,
+					)
+					if self.config.use_scan_mlp
+					else self.experts[index](hidden_states)
+				)
+				expert_layer_output_exp = (
+					jnp.sum(jnp.multiply(selected_experts == index, routing_weights), axis=-1)[
+						:, :, None
+					]
+					* expert_layer_output
+				)
+				final_hidden_state += expert_layer_output_exp
 		return (
 			final_hidden_state,
 			router_logits,
@@ -39,6 +39,7 @@ from easydel.infra.utils import (
 from easydel.layers.attention import FlaxAttentionModule, FlexibleAttentionModule
 from easydel.layers.caching import TransformerCache, TransformerCacheView
 from easydel.layers.norms import RMSNorm as RMSNorm
+from easydel.layers.scan import ScannedLayers
 from easydel.modules.qwen2.qwen_configuration import Qwen2Config as Qwen2Config
 
 
@@ -422,16 +423,29 @@ class Qwen2Model(EasyDeLBaseModule):
 			rngs=rngs,
 		)
 		self.dropout = nn.Dropout(rate=config.embd_pdrop)
-		self.layers = [
-			Qwen2DecoderLayer(
-				config=config,
-				dtype=dtype,
-				param_dtype=param_dtype,
-				precision=precision,
+		if getattr(config, "scan_layers", False):
+			self.layers = ScannedLayers(
+				partial(
+					Qwen2DecoderLayer,
+					config=config,
+					dtype=dtype,
+					param_dtype=param_dtype,
+					precision=precision,
+				),
+				num_layers=config.num_hidden_layers,
 				rngs=rngs,
 			)
-			for i in range(config.num_hidden_layers)
-		]
+		else:
+			self.layers = [
+				Qwen2DecoderLayer(
+					config=config,
+					dtype=dtype,
+					param_dtype=param_dtype,
+					precision=precision,
+					rngs=rngs,
+				)
+				for i in range(config.num_hidden_layers)
+			]
 		self.norm = RMSNorm(
 			config.hidden_size,
 			eps=config.rms_norm_eps,
@@ -476,24 +490,41 @@ class Qwen2Model(EasyDeLBaseModule):
 		hidden_states = self.dropout(inputs_embeds)
 		if past_key_values is None:
 			past_key_values = TransformerCache.init_empty(len(self.layers))
-		for idx, block in enumerate(self.layers):
-			if output_hidden_states:
-				all_hidden_states += (hidden_states,)
-
-			layer_outputs = block(
-				hidden_states=hidden_states,
+		if isinstance(self.layers, ScannedLayers):
+			hidden_states, layers_hidden_states, layers_attentions = self.layers(
+				hidden_states,
+				past_key_values.views,
+				output_attentions=output_attentions,
+				output_hidden_states=output_hidden_states,
 				attention_mask=attention_mask,
 				position_ids=position_ids,
-				cache_view=past_key_values.views[idx],
 				causal_mask=self.causal_mask,
-				output_attentions=output_attentions,
 				segment_ids=segment_ids,
 				frequencies=self.frequencies,
 			)
-			hidden_states = layer_outputs[0]
-
+			if output_hidden_states:
+				all_hidden_states += layers_hidden_states
 			if output_attentions:
-				all_attentions += (layer_outputs[1],)
+				all_attentions += layers_attentions
+		else:
+			for idx, block in enumerate(self.layers):
+				if output_hidden_states:
+					all_hidden_states += (hidden_states,)
+
+				layer_outputs = block(
+					hidden_states=hidden_states,
+					attention_mask=attention_mask,
+					position_ids=position_ids,
+					cache_view=past_key_values.views[idx],
+					causal_mask=self.causal_mask,
+					output_attentions=output_attentions,
+					segment_ids=segment_ids,
+					frequencies=self.frequencies,
+				)
+				hidden_states = layer_outputs[0]
+
+				if output_attentions:
+					all_attentions += (layer_outputs[1],)
 
 		hidden_states = self.norm(hidden_states)
 
@@ -521,6 +552,8 @@ class Qwen2Model(EasyDeLBaseModule):
 	embedding_layer_names=["embed_tokens"],
 )
 class Qwen2ForCausalLM(EasyDeLBaseModule):
+	supports_chunked_lm_head_loss = True
+
 	def __init__(
 		self,
 		config: Qwen2Config,
@@ -568,6 +601,7 @@ class Qwen2ForCausalLM(EasyDeLBaseModule):
 		output_hidden_states: tp.Optional[bool] = None,
 		past_key_values: tp.Optional[TransformerCache] = None,
 		return_dict: bool = True,
+		apply_lm_head: bool = True,
 	) -> tp.Union[FlaxCausalLMOutput, tp.Tuple]:
 		outputs = self.model(
 			input_ids=input_ids,
@@ -583,7 +617,9 @@ class Qwen2ForCausalLM(EasyDeLBaseModule):
 
 		hidden_states = outputs[0]
 
-		if self.config.tie_word_embeddings:
+		if not apply_lm_head:
+			lm_logits = None
+		elif self.config.tie_word_embeddings:
 			# self.lm_head.kernel.value = self.model.embed_tokens.embedding.value.T
 			# lm_logits = self.lm_head(hidden_states)
 			lm_logits = jax.lax.dot_general(
@@ -602,6 +638,7 @@ class Qwen2ForCausalLM(EasyDeLBaseModule):
 			hidden_states=outputs.hidden_states,
 			attentions=outputs.attentions,
 			past_key_values=outputs.past_key_values,
+			last_hidden_state=None if apply_lm_head else hidden_states,
 		)
 
 
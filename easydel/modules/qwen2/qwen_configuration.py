@@ -85,7 +85,7 @@ class Qwen2Config(EasyDeLBaseConfig):
 	        Number of repetitions for the key and value vectors.
 	    bits (`int`, *optional*):
 	        The number of bits to quantize the model to.
-	    scan_layers (`bool`, *optional*, defaults to `True`):
+	    scan_layers (`bool`, *optional*, defaults to `False`):
 	        Whether to use the scan implementation for the layers.
 	    rope_scaling (`tp.Dict[str, tp.Union[str, float]]`, *optional*):
 	        The configuration for rope scaling.
@@ -121,7 +121,7 @@ class Qwen2Config(EasyDeLBaseConfig):
 		scan_mlp_chunk_size: int = 1024,
 		number_rep_kv: int = 1,
 		bits: tp.Optional[int] = None,
-		scan_layers: bool = True,
+		scan_layers: bool = False,
 		rope_scaling: tp.Optional[tp.Mapping[str, str | float]] = None,
 		**kwargs,
 	):
@@ -213,7 +213,7 @@ class Qwen2Config(EasyDeLBaseConfig):
 		bits: tp.Optional[int] = None,
 		rope_theta: float = 10000.0,
 		hidden_act: str = "silu",
-		scan_layers: bool = True,
+		scan_layers: bool = False,
 		rope_scaling: tp.Optional[tp.Mapping[str, str | float]] = None,
 		**kwargs,
 	):
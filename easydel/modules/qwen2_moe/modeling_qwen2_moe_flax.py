@@ -38,6 +38,11 @@ from easydel.infra.utils import (
 )
 from easydel.layers.attention import FlaxAttentionModule, FlexibleAttentionModule
 from easydel.layers.caching import TransformerCache, TransformerCacheView
+from easydel.layers.moe import (
+	sorted_moe_dispatch,
+	stack_expert_kernels,
+	use_sorted_moe_dispatch,
+)
 from easydel.layers.norms import RMSNorm as RMSNorm
 from easydel.modules.qwen2_moe.configuration_qwen2_moe import (
 	Qwen2MoeConfig as Qwen2MoeConfig,
@@ -353,25 +358,37 @@ class Qwen2MoeSparseMoeBlock(nn.Module):
 
 		if self.config.norm_topk_prob:
 			routing_weights /= routing_weights.sum(axis=-1, keepdims=True)
-		final_hidden_state = jnp.zeros_like(hidden_states)
-
-		for index in range(self.config.num_experts):
-			expert_layer_output = (
-				block_wise_ffn(
-					self.experts[index],
-					hidden_states,
-					self.config.scan_mlp_chunk_size,
-				)
-				if self.config.use_scan_mlp
-				else self.experts[index](hidden_states)
-			)
-			expert_layer_output_exp = (
-				jnp.sum(jnp.multiply(selected_experts == index, routing_weights), axis=-1)[
-					:, :, None
-				]
-				* expert_layer_output
+		if use_sorted_moe_dispatch(self.config):
+			final_hidden_state = sorted_moe_dispatch(
+				hidden_states,
+				selected_experts,
+				routing_weights,
+				*stack_expert_kernels(self.experts, "gate_proj", "up_proj", "down_proj"),
+				act_fn=self.experts[0].act_fn,
+				capacity_factor=self.config.moe_capacity_factor,
+				dtype=self.dtype,
+				precision=self.precision,
 			)
-			final_hidden_state += expert_layer_output_exp
+		else:
+			final_hidden_state = jnp.zeros_like(hidden_states)
+
+			for index in range(self.config.num_experts):
+				expert_layer_output = (
+					block_wise_ffn(
+						self.experts[index],
+						hidden_states,
+						self.config.scan_mlp_chunk_size,
+					)
+					if self.config.use_scan_mlp
+					else self.experts[index](hidden_states)
+				)
+				expert_layer_output_exp = (
+					jnp.sum(jnp.multiply(selected_experts == index, routing_weights), axis=-1)[
+						:, :, None
+					]
+					* expert_layer_output
+				)
+				final_hidden_state += expert_layer_output_exp
 
 		shared_expert_output = self.shared_expert(hidden_states)
 		shared_expert_output = (
@@ -35,7 +35,11 @@ from easydel.infra.utils import (
 	get_dot_general_by_bits,
 )
 from easydel.layers.attention import FlaxAttentionModule, FlexibleAttentionModule
-from easydel.layers.caching import TransformerCache, TransformerCacheView
+from easydel.layers.caching import (
+	TransformerCache,
+	TransformerCacheView,
+	alternating_sliding_windows,
+)
 from easydel.modules.xerxes.xerxes_configuration import XerxesConfig as XerxesConfig
 from easydel.utils.helpers import get_logger
 
@@ -555,6 +559,13 @@ class XerxesModel(EasyDeLBaseModule):
 			param_dtype=param_dtype,
 		)
 
+	def _get_cache_sliding_windows(self) -> tp.List[tp.Optional[int]]:
+		# even layers attend locally, see `XerxesAttention`.
+		return alternating_sliding_windows(
+			self.config.num_hidden_layers,
+			4096,
+		)
+
 	def __call__(
 		self,
 		input_ids: tp.Optional[chex.Array] = None,
@@ -693,6 +704,9 @@ class XerxesForCausalLM(EasyDeLBaseModule):
 			**get_dot_general_by_bits(config.bits, config.easy_method),
 		)
 
+	def _get_cache_sliding_windows(self) -> tp.List[tp.Optional[int]]:
+		return self.model._get_cache_sliding_windows()
+
 	def __call__(
 		self,
 		input_ids: tp.Optional[chex.Array] = None,
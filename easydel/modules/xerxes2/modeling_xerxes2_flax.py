@@ -41,6 +41,7 @@ from easydel.layers.caching.transformer_cache import (
 	TransformerCacheView,
 )
 from easydel.layers.norms import RMSNorm
+from easydel.layers.scan import ScannedLayers
 from easydel.utils.helpers import get_logger
 
 from .xerxes2_configuration import Xerxes2Config as Xerxes2Config
@@ -422,16 +423,29 @@ class Xerxes2Model(EasyDeLBaseModule):
 			param_dtype=param_dtype,
 			rngs=rngs,
 		)
-		self.layers = [
-			Xerxes2DecoderLayer(
-				self.config,
-				dtype=dtype,
-				param_dtype=param_dtype,
-				precision=precision,
+		if getattr(self.config, "scan_layers", False):
+			self.layers = ScannedLayers(
+				functools.partial(
+					Xerxes2DecoderLayer,
+					config=self.config,
+					dtype=dtype,
+					param_dtype=param_dtype,
+					precision=precision,
+				),
+				num_layers=self.config.num_hidden_layers,
 				rngs=rngs,
 			)
-			for i in range(self.config.num_hidden_layers)
-		]
+		else:
+			self.layers = [
+				Xerxes2DecoderLayer(
+					self.config,
+					dtype=dtype,
+					param_dtype=param_dtype,
+					precision=precision,
+					rngs=rngs,
+				)
+				for i in range(self.config.num_hidden_layers)
+			]
 		self.norm = RMSNorm(
 			dim=self.config.hidden_size,
 			eps=self.config.rms_norm_eps,
@@ -480,24 +494,41 @@ class Xerxes2Model(EasyDeLBaseModule):
 		hidden_states = inputs_embeds
 		if past_key_values is None:
 			past_key_values = TransformerCache.init_empty(len(self.layers))
-		for idx, block in enumerate(self.layers):
-			if output_hidden_states:
-				all_hidden_states += (hidden_states,)
-
-			layer_outputs = block(
-				hidden_states=hidden_states,
+		if isinstance(self.layers, ScannedLayers):
+			hidden_states, layers_hidden_states, layers_attentions = self.layers(
+				hidden_states,
+				past_key_values.views,
+				output_attentions=output_attentions,
+				output_hidden_states=output_hidden_states,
 				attention_mask=attention_mask,
 				position_ids=position_ids,
-				cache_view=past_key_values.views[idx],
 				causal_mask=self.causal_mask,
-				output_attentions=output_attentions,
 				segment_ids=segment_ids,
 				frequencies=self.frequencies,
 			)
-			hidden_states = layer_outputs[0]
-
+			if output_hidden_states:
+				all_hidden_states += layers_hidden_states
 			if output_attentions:
-				all_attentions += (layer_outputs[1],)
+				all_attentions += layers_attentions
+		else:
+			for idx, block in enumerate(self.layers):
+				if output_hidden_states:
+					all_hidden_states += (hidden_states,)
+
+				layer_outputs = block(
+					hidden_states=hidden_states,
+					attention_mask=attention_mask,
+					position_ids=position_ids,
+					cache_view=past_key_values.views[idx],
+					causal_mask=self.causal_mask,
+					output_attentions=output_attentions,
+					segment_ids=segment_ids,
+					frequencies=self.frequencies,
+				)
+				hidden_states = layer_outputs[0]
+
+				if output_attentions:
+					all_attentions += (layer_outputs[1],)
 
 		hidden_states = self.norm(hidden_states)
 
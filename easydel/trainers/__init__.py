@@ -13,6 +13,7 @@
 # limitations under the License.
 
 from .base_trainer import BaseTrainer
+from .data_loader import DevicePrefetchLoader, NumpyDataLoader
 from .direct_preference_optimization_trainer import (
 	DPOConfig,
 	DPOTrainer,
@@ -21,7 +22,7 @@ from .odds_ratio_preference_optimization_trainer import (
 	ORPOConfig,
 	ORPOTrainer,
 )
-from .packer import pack_sequences
+from .packer import pack_examples, pack_sequences
 from .supervised_fine_tuning_trainer import (
 	SFTConfig,
 	SFTTrainer,
@@ -39,10 +40,13 @@ from .utils import (
 
 __all__ = (
 	"BaseTrainer",
+	"DevicePrefetchLoader",
+	"NumpyDataLoader",
 	"DPOConfig",
 	"DPOTrainer",
 	"ORPOConfig",
 	"ORPOTrainer",
+	"pack_examples",
 	"pack_sequences",
 	"SFTTrainer",
 	"SFTConfig",
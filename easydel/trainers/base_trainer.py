@@ -13,6 +13,7 @@
 # limitations under the License.
 from __future__ import annotations
 
+import json
 import os
 import pprint
 import shutil
@@ -28,7 +29,6 @@ import flax.core
 import flax.nnx
 import jax
 import jax.extend
-import numpy as np
 import termcolor
 import tqdm
 from flax import nnx as nn
@@ -55,6 +55,7 @@ from easydel.infra.base_module import (
 from easydel.utils import Timers
 from easydel.utils.helpers import get_logger
 
+from .data_loader import DevicePrefetchLoader, NumpyDataLoader, stack_examples
 from .trainer_protocol import (
 	BaseProgressBar,
 	BaseTrainerProtocol,
@@ -150,6 +151,7 @@ class BaseTrainer(BaseTrainerProtocol):
 		self.tx = getattr(self, "tx", None)
 
 		self.checkpoint_manager = getattr(self, "checkpoint_manager", None)  #
+		self._checkpoint_future = getattr(self, "_checkpoint_future", None)
 		self.pruning_module = getattr(self.arguments, "pruning_module", None)
 		self.memory_monitor = getattr(self.arguments, "memory_monitor", None)
 
@@ -226,6 +228,8 @@ class BaseTrainer(BaseTrainerProtocol):
 		self._configure_model()
 		self._configure_state()
 		self._configure_functions()
+		if self.checkpoint_path is not None:
+			self._resume_from_checkpoint()
 
 	def _initialize_wandb(self):
 		if self.arguments.use_wandb:
@@ -302,6 +306,31 @@ class BaseTrainer(BaseTrainerProtocol):
 
 		self.timer.log("configure sharded state")
 
+	def _resume_from_checkpoint(self):
+		"""
+		Restores the state (parameters, optimizer state and step) and the position of the
+		training dataloader saved in `checkpoint_path`, in the trainer's shardings.
+		"""
+		with self.timer("resume from checkpoint"):
+			with self.model.mesh:
+				self.model_state = self.model_state.load_state(
+					self.checkpoint_path,
+					verbose=self.arguments.verbose,
+				)
+			dataloader_state = os.path.join(self.checkpoint_path, "dataloader_state.json")
+			if os.path.exists(dataloader_state) and hasattr(
+				self.dataloader_train, "load_state_dict"
+			):
+				with open(dataloader_state, "r") as f:
+					self.dataloader_train.load_state_dict(json.load(f))
+		self.timer.log("resume from checkpoint")
+
+	def wait_for_checkpoint(self):
+		"""Blocks until the checkpoint being written in the background is on disk."""
+		if self._checkpoint_future is not None:
+			self._checkpoint_future.wait()
+			self._checkpoint_future = None
+
 	@abstractmethod
 	def create_collect_function(
 		self,
@@ -324,6 +353,77 @@ class BaseTrainer(BaseTrainerProtocol):
 		"""
 		raise NotImplementedError
 
+	def create_dataloader(
+		self,
+		dataset: tp.Union[Dataset, IterableDataset],
+		batch_size: int,
+		collate_fn: tp.Optional[tp.Callable] = None,
+		shuffle: bool = False,
+		drop_remainder: bool = True,
+		lengths: tp.Optional[tp.Sequence[int]] = None,
+	) -> DevicePrefetchLoader:
+		"""
+		Creates a dataloader that assembles batches on `dataloader_num_workers` host threads,
+		keeps this process's share of every global batch and places the upcoming batches on
+		the mesh with `step_partition_spec` while the current step runs.
+
+		Args:
+		    dataset (tp.Union[Dataset, IterableDataset]): The dataset to load.
+		    batch_size (int): The global batch size.
+		    collate_fn (tp.Optional[tp.Callable], optional): Turns a list of examples into a batch.
+		    shuffle (bool, optional): Whether to shuffle the dataset every epoch.
+		    drop_remainder (bool, optional): Whether to drop the last incomplete batch.
+		    lengths (tp.Optional[tp.Sequence[int]], optional): Example lengths, to group
+		        batches by length.
+
+		Returns:
+		    DevicePrefetchLoader: The dataloader.
+		"""
+		loader = NumpyDataLoader(
+			dataset=dataset,
+			batch_size=batch_size,
+			collate_fn=collate_fn,
+			shuffle=shuffle,
+			seed=self.arguments.dataloader_seed,
+			drop_remainder=drop_remainder,
+			num_workers=self.arguments.dataloader_num_workers,
+			prefetch_size=self.arguments.dataloader_prefetch_size,
+			lengths=lengths,
+		)
+		if lengths is not None:
+			logger.info(
+				"length-grouped batches have a token utilization of "
+				f"{loader.token_utilization():.2%}"
+			)
+		return DevicePrefetchLoader(
+			loader=loader,
+			mesh=self.model.mesh,
+			partition_spec=self.arguments.step_partition_spec,
+			buffer_size=self.arguments.dataloader_prefetch_size,
+		)
+
+	def _train_dataset_lengths(
+		self,
+		dataset: tp.Union[Dataset, IterableDataset],
+	) -> tp.Optional[tp.List[int]]:
+		"""
+		Lengths the training batches are grouped by when `group_by_length` is set: the
+		`length_column_name` column if the dataset has one, else the `input_ids` lengths.
+		Datasets without columns (e.g. a list of examples) are read row by row.
+		"""
+		if not self.arguments.group_by_length or not hasattr(dataset, "__len__"):
+			return None
+		length_column_name = self.arguments.length_column_name
+		column_names = getattr(dataset, "column_names", None)
+		if column_names is None:
+			return [
+				row[length_column_name] if length_column_name in row else len(row["input_ids"])
+				for row in dataset
+			]
+		if length_column_name in column_names:
+			return list(dataset[length_column_name])
+		return [len(input_ids) for input_ids in dataset["input_ids"]]
+
 	@abstractmethod
 	def configure_functions(self) -> TrainerConfigureFunctionOutput:
 		"""
@@ -352,93 +452,6 @@ class BaseTrainer(BaseTrainerProtocol):
 		                                    maximum number of training and evaluation steps.
 		"""
 
-		def create_tf_dataset(
-			dataset: Dataset,
-			is_train: bool,
-		) -> tp.Iterator[np.ndarray]:
-			"""
-			Creates a TensorFlow dataset from a Hugging Face Dataset.
-
-			Args:
-			    dataset (Dataset): The Hugging Face Dataset.
-			    is_train (bool): Whether the dataset is for training.
-
-			Returns:
-			    tp.Iterator[np.ndarray]: The TensorFlow dataset iterator.
-			"""
-			try:
-				import tensorflow as tf
-			except ImportError as exec:
-				raise ImportError(
-					"Please install TensorFlow to use the TensorFlow dataset conversion."
-				) from exec
-			batch_size = self.training_batch_size if is_train else self.evaluation_batch_size
-			return (
-				dataset.to_tf_dataset(
-					collate_fn=self.create_collect_function(
-						max_sequence_length=self.arguments.max_sequence_length,
-						truncation_mode=self.arguments.truncation_mode,
-					),
-					batch_size=batch_size,
-					drop_remainder=True,
-					shuffle=is_train and self.arguments.shuffle_train_dataset,
-					num_workers=self.arguments.dataloader_num_workers,
-				)
-				.repeat(self.arguments.num_train_epochs if is_train else 1)
-				.prefetch(tf.data.AUTOTUNE)
-				.as_numpy_iterator()
-			)
-
-		def create_tf_dataset_from_iterable(
-			dataset: IterableDataset,
-			is_train: bool,
-		) -> tp.Iterator[np.ndarray]:
-			"""
-			Creates a TensorFlow dataset from an iterable Hugging Face Dataset.
-
-			Args:
-			    dataset (IterableDataset): The iterable Hugging Face Dataset.
-			    is_train (bool): Whether the dataset is for training.
-
-			Returns:
-			    tp.Iterator[np.ndarray]: The TensorFlow dataset iterator.
-			"""
-			try:
-				import tensorflow as tf
-			except ImportError as exec:
-				raise ImportError(
-					"Please install TensorFlow to use the TensorFlow dataset conversion."
-				) from exec
-			batch_size = self.training_batch_size if is_train else self.evaluation_batch_size
-			tf_data_mapping = {
-				"float16": tf.float16,
-				"float32": tf.float32,
-				"float64": tf.float64,
-				"int16": tf.int16,
-				"int32": tf.int32,
-				"int64": tf.int64,
-				"bool": tf.bool,
-			}
-			return (
-				tf.data.Dataset.from_generator(
-					lambda: dataset,
-					output_signature={
-						col: tf.TensorSpec(
-							shape=vals.shape[1:]
-							if len(vals.shape) > 1 and vals.shape[0] == 1  # auto remove batch dim
-							else vals.shape,
-							dtype=tf_data_mapping[str(vals.dtype)],
-						)
-						for col, vals in next(iter(dataset)).items()
-						if hasattr(vals, "shape")
-					},
-				)
-				.repeat(self.arguments.num_train_epochs if is_train else 1)
-				.batch(batch_size, drop_remainder=False)
-				.prefetch(tf.data.AUTOTUNE)
-				.as_numpy_iterator()
-			)
-
 		def calculate_steps(
 			dataset: tp.Union[Dataset, IterableDataset],
 			is_train: bool,
@@ -486,32 +499,46 @@ class BaseTrainer(BaseTrainerProtocol):
 				steps = steps // self.arguments.gradient_accumulation_steps
 			return steps
 
-		def to_tf_dataloader(
+		def create_dataloader(
 			dataset: tp.Union[Dataset, IterableDataset],
 			is_train: bool,
-		) -> tp.Iterator[np.ndarray]:
+		) -> DevicePrefetchLoader:
 			"""
-			Converts a Hugging Face Dataset to a TensorFlow dataloader.
+			Creates the dataloader of a Hugging Face Dataset.
+
+			Map-style datasets are collated with `create_collect_function`; examples of
+			iterable datasets are stacked as they are.
+			With `group_by_length`, training batches are grouped by length.
 
 			Args:
 			    dataset (tp.Union[Dataset, IterableDataset]): The Hugging Face Dataset.
 			    is_train (bool): Whether the dataset is for training.
 
 			Returns:
-			    tp.Iterator[np.ndarray]: The TensorFlow dataloader iterator.
+			    DevicePrefetchLoader: The dataloader.
 			"""
 			if hasattr(dataset, "__len__"):
-				return create_tf_dataset(dataset, is_train)
+				collate_fn = self.create_collect_function(
+					max_sequence_length=self.arguments.max_sequence_length,
+					truncation_mode=self.arguments.truncation_mode,
+				)
 			else:
-				return create_tf_dataset_from_iterable(dataset, is_train)
+				collate_fn = stack_examples
+			return self.create_dataloader(
+				dataset=dataset,
+				batch_size=self.training_batch_size if is_train else self.evaluation_batch_size,
+				collate_fn=collate_fn,
+				shuffle=is_train and self.arguments.shuffle_train_dataset,
+				lengths=self._train_dataset_lengths(dataset) if is_train else None,
+			)
 
 		max_training_steps = calculate_steps(self.dataset_train, is_train=True)
 
-		dataloader_train = to_tf_dataloader(self.dataset_train, is_train=True)
+		dataloader_train = create_dataloader(self.dataset_train, is_train=True)
 
 		if self.dataset_eval is not None and self.arguments.do_eval:
 			max_evaluation_steps = calculate_steps(self.dataset_eval, is_train=False)
-			dataloader_eval = to_tf_dataloader(self.dataset_eval, is_train=False)
+			dataloader_eval = create_dataloader(self.dataset_eval, is_train=False)
 		else:
 			dataloader_eval, max_evaluation_steps = None, 0
 
@@ -546,6 +573,8 @@ class BaseTrainer(BaseTrainerProtocol):
 
 	def _save_state(self, state: EasyDeLState, *args, **kwargs) -> str:
 		step = self._get_current_step(state)
+		# only one snapshot is kept in host memory at a time.
+		self.wait_for_checkpoint()
 		self._manage_checkpoint_limit(self.arguments._get_save_directory())
 
 		directory_name = self.arguments._get_save_directory_milestone(
@@ -557,14 +586,19 @@ class BaseTrainer(BaseTrainerProtocol):
 		enable = True
 		if self.arguments.process_zero_is_admin and not self.arguments.is_process_zero:
 			enable = False
-		state.save_state(
+		self._checkpoint_future = state.save_state(
 			save_directory=directory_name,
 			float_dtype=self.model.param_dtype,
 			verbose=self.arguments.verbose,
 			save_optimizer=self.arguments.save_optimizer_state,
 			enable=enable,
+			async_save=self.arguments.async_checkpointing,
 		)
 
+		if enable and hasattr(self.dataloader_train, "state_dict"):
+			with open(os.path.join(directory_name, "dataloader_state.json"), "w") as f:
+				json.dump(self.dataloader_train.state_dict(), f)
+
 		self._save_readme(directory_name)
 		return str(directory_name)
 
@@ -819,7 +853,8 @@ model = AutoEasyDeLModelForCausalLM.from_pretrained(
 		def compile_function(function, dataloader, state, tag):
 			if not isinstance(function, Compiled):
 				logger.info("Compiling function: %s", tag)
-				return function.lower(state, next(iter(dataloader))).compile()
+				# lowered from abstract batches, so no batch is taken from the loader.
+				return function.lower(state, dataloader.batch_spec()).compile()
 			return function
 
 		if self.dataloader_train is not None:
@@ -900,6 +935,7 @@ model = AutoEasyDeLModelForCausalLM.from_pretrained(
 			)
 			if self.arguments.save_directory is not None:
 				checkpoint_path = os.path.join(self.arguments.save_directory, filename)
+			self.wait_for_checkpoint()
 
 		return TrainerOutput(
 			state=state,
@@ -0,0 +1,545 @@
+# Copyright 2023 The EASYDEL Author @erfanzar (Erfan Zare Chavoshi).
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""TensorFlow-free data loading for the trainers."""
+
+from __future__ import annotations
+
+import collections
+import itertools
+import math
+import typing as tp
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+import jax
+import numpy as np
+from jax.sharding import Mesh, NamedSharding, PartitionSpec
+
+if tp.TYPE_CHECKING:
+	from datasets import Dataset, IterableDataset
+else:
+	Dataset = tp.Any
+	IterableDataset = tp.Any
+
+Batch = tp.Dict[str, np.ndarray]
+
+
+def length_grouped_indices(
+	lengths: tp.Sequence[int],
+	batch_size: int,
+	rng: tp.Optional[np.random.Generator] = None,
+	megabatch_multiplier: int = 50,
+) -> np.ndarray:
+	"""
+	Orders examples so every batch holds examples of similar lengths.
+
+	The examples are (shuffled with `rng` and) split into megabatches of
+	`megabatch_multiplier * batch_size`, each megabatch is sorted by decreasing length,
+	and the resulting batches are shuffled with `rng` while staying whole. Batches thus
+	stay random across the epoch but pad far less when collated to their longest row.
+	"""
+	lengths = np.asarray(lengths)
+	indices = np.arange(len(lengths))
+	if rng is not None:
+		indices = rng.permutation(indices)
+	megabatch_size = max(batch_size * megabatch_multiplier, 1)
+	indices = np.concatenate(
+		[
+			megabatch[np.argsort(-lengths[megabatch], kind="stable")]
+			for megabatch in np.split(
+				indices, range(megabatch_size, len(indices), megabatch_size)
+			)
+		]
+	)
+	if rng is not None:
+		num_full = len(indices) // batch_size
+		batches = indices[: num_full * batch_size].reshape(num_full, batch_size)
+		# a last incomplete batch stays last, so `drop_remainder` still drops it.
+		indices = np.concatenate(
+			[batches[rng.permutation(num_full)].reshape(-1), indices[num_full * batch_size :]]
+		)
+	return indices
+
+
+def token_utilization(
+	lengths: tp.Sequence[int],
+	indices: tp.Sequence[int],
+	batch_size: int,
+) -> float:
+	"""
+	Share of non-padding tokens when the examples of `indices`, taken `batch_size` at a
+	time, are padded to the longest example of their batch.
+	"""
+	lengths = np.asarray(lengths)[np.asarray(indices, dtype=np.int64)]
+	num_tokens, num_slots = 0, 0
+	for start in range(0, len(lengths), batch_size):
+		batch = lengths[start : start + batch_size]
+		num_tokens += int(batch.sum())
+		num_slots += int(batch.max()) * len(batch)
+	return num_tokens / num_slots if num_slots else 1.0
+
+
+def default_collate(rows: tp.List[tp.Mapping[str, tp.Any]]) -> Batch:
+	"""Stacks every column of `rows` into a numpy array."""
+	return {key: np.stack([np.asarray(row[key]) for row in rows]) for key in rows[0]}
+
+
+def stack_examples(rows: tp.List[tp.Mapping[str, tp.Any]]) -> Batch:
+	"""
+	Stacks the array columns of already tokenized examples, dropping a leading batch
+	axis of size one (e.g. the output of a tokenizer called with `return_tensors`).
+	"""
+
+	def squeeze(value):
+		value = np.asarray(value)
+		return value[0] if value.ndim > 1 and value.shape[0] == 1 else value
+
+	return {
+		key: np.stack([squeeze(row[key]) for row in rows])
+		for key, value in rows[0].items()
+		if hasattr(value, "shape")
+	}
+
+
+def _pad_sequences(
+	sequences: tp.List[tp.Any],
+	max_sequence_length: tp.Optional[int],
+	truncation_mode: tp.Literal["keep_end", "keep_start"],
+	padding_value: int,
+) -> np.ndarray:
+	lengths = np.fromiter((len(seq) for seq in sequences), np.int64, len(sequences))
+	if isinstance(sequences[0], np.ndarray):
+		flat = np.concatenate(sequences)
+	else:
+		# python lists are read in one pass into a single contiguous buffer.
+		first = next((seq for seq in sequences if len(seq)), [0])
+		flat = np.fromiter(
+			itertools.chain.from_iterable(sequences),
+			dtype=np.asarray(first).dtype,
+			count=int(lengths.sum()),
+		)
+	# a static length keeps the step shape, and the global batch of every process,
+	# the same from batch to batch.
+	length = int(lengths.max()) if max_sequence_length is None else max_sequence_length
+	kept = np.minimum(lengths, length)
+	starts = np.cumsum(lengths) - lengths
+	if truncation_mode == "keep_end":
+		starts += lengths - kept
+	columns = np.arange(length)
+	valid = columns[None, :] < kept[:, None]
+	batch = np.full((len(sequences), length), padding_value, dtype=flat.dtype)
+	batch[valid] = flat[(starts[:, None] + columns[None, :])[valid]]
+	return batch
+
+
+def pad_collate(
+	rows: tp.List[tp.Mapping[str, tp.Any]],
+	max_sequence_length: tp.Optional[int] = None,
+	truncation_mode: tp.Literal["keep_end", "keep_start"] = "keep_end",
+	padding_values: tp.Optional[tp.Mapping[str, int]] = None,
+) -> Batch:
+	"""
+	Collates examples into contiguous numpy arrays, padding ragged sequences.
+
+	One-dimensional columns are flattened into a single buffer and scattered into a
+	`(batch, length)` array with vectorized indexing: rows are truncated to
+	`max_sequence_length` (keeping their end or start per `truncation_mode`) and
+	right-padded to exactly `max_sequence_length`, so every batch has the same shape
+	on every process and the training step compiles once. Other numeric columns are
+	stacked, and non-numeric ones (e.g. raw text) are dropped.
+
+	Args:
+	    rows: Examples mapping column names to scalars, lists or arrays.
+	    max_sequence_length: Length every sequence is truncated and padded to. With
+	      `None` rows are only padded to the longest row of the batch.
+	    truncation_mode: Which end of a too long sequence to keep.
+	    padding_values: Padding value of every column, 0 for the unlisted ones.
+	"""
+	if truncation_mode not in ("keep_end", "keep_start"):
+		raise ValueError(f"unknown truncation mode {truncation_mode!r}.")
+	padding_values = padding_values or {}
+	batch = {}
+	for key, value in rows[0].items():
+		if isinstance(value, (str, bytes)):
+			continue
+		values = [row[key] for row in rows]
+		if np.ndim(value) == 1 and np.asarray(value[:1]).dtype.kind in "biuf":
+			array = _pad_sequences(
+				values,
+				max_sequence_length=max_sequence_length,
+				truncation_mode=truncation_mode,
+				padding_value=padding_values.get(key, 0),
+			)
+		else:
+			array = np.stack([np.asarray(value) for value in values])
+		if array.dtype.kind in "biuf":
+			batch[key] = array
+	return batch
+
+
+class NumpyDataLoader:
+	"""
+	Pure-numpy batch iterator over a map-style (`__len__`/`__getitem__`) or iterable dataset.
+
+	- Each epoch is shuffled with a permutation seeded by `seed + epoch`, so every process
+	  draws the same global batches, and each process keeps only its contiguous
+	  `batch_size // process_count` slice of them.
+	- Batches are gathered and collated by `num_workers` threads, up to `prefetch_size`
+	  batches ahead of the consumer (synchronously when `num_workers == 0`).
+	- One call to `iter()` runs to the end of the current epoch. The loader remembers how
+	  many batches were consumed, so `state_dict()`/`load_state_dict()` checkpoint and
+	  restore the exact position, and a fresh `iter()` resumes where the previous one
+	  stopped.
+
+	Iterable datasets are read in order (no shuffling) and every process reads the whole
+	stream, keeping its slice of each global batch.
+
+	Given the `lengths` of the examples, map-style epochs are ordered with
+	`length_grouped_indices` so batches hold examples of similar lengths.
+	"""
+
+	def __init__(
+		self,
+		dataset: tp.Union[Dataset, IterableDataset, tp.Sequence, tp.Iterable],
+		batch_size: int,
+		collate_fn: tp.Optional[tp.Callable[[tp.List[tp.Any]], Batch]] = None,
+		shuffle: bool = False,
+		seed: int = 0,
+		drop_remainder: bool = True,
+		num_workers: int = 0,
+		prefetch_size: int = 2,
+		process_index: tp.Optional[int] = None,
+		process_count: tp.Optional[int] = None,
+		lengths: tp.Optional[tp.Sequence[int]] = None,
+	):
+		"""
+		Args:
+		    dataset: Dataset to read examples from.
+		    batch_size: Global batch size, summed over all processes.
+		    collate_fn: Function turning a list of examples into a batch. Defaults to
+		        `default_collate`.
+		    shuffle: Whether to shuffle map-style datasets every epoch.
+		    seed: Base seed of the per-epoch permutations.
+		    drop_remainder: Whether to drop the last incomplete batch.
+		    num_workers: Number of host threads assembling batches.
+		    prefetch_size: Number of batches assembled ahead of the consumer.
+		    process_index: Index of this process. Defaults to `jax.process_index()`.
+		    process_count: Number of processes. Defaults to `jax.process_count()`.
+		    lengths: Token count of every example of a map-style dataset, to group batches
+		        by length.
+		"""
+		self.process_index = jax.process_index() if process_index is None else process_index
+		self.process_count = jax.process_count() if process_count is None else process_count
+		if batch_size % self.process_count != 0:
+			raise ValueError(
+				f"batch_size ({batch_size}) must be divisible by the number of "
+				f"processes ({self.process_count})."
+			)
+		self.dataset = dataset
+		self.batch_size = batch_size
+		self.local_batch_size = batch_size // self.process_count
+		self.collate_fn = collate_fn or default_collate
+		self.shuffle = shuffle
+		self.seed = seed
+		self.drop_remainder = drop_remainder
+		self.num_workers = num_workers or 0
+		self.prefetch_size = max(prefetch_size, self.num_workers, 1)
+		self.is_map_style = hasattr(dataset, "__len__") and hasattr(dataset, "__getitem__")
+		if lengths is not None and (not self.is_map_style or len(lengths) != len(dataset)):
+			raise ValueError("`lengths` needs one entry per example of a map-style dataset.")
+		self.lengths = None if lengths is None else np.asarray(lengths)
+		self._epoch = 0
+		self._position = 0
+		self._generation = 0
+
+	def __len__(self) -> int:
+		"""Number of batches per epoch."""
+		if not self.is_map_style:
+			raise TypeError("Iterable datasets have no length.")
+		if self.drop_remainder:
+			return len(self.dataset) // self.batch_size
+		return math.ceil(len(self.dataset) / self.batch_size)
+
+	def state_dict(self) -> tp.Dict[str, int]:
+		"""Returns the position of the loader as a JSON-serializable dict."""
+		return {"epoch": self._epoch, "position": self._position, "seed": self.seed}
+
+	def load_state_dict(self, state: tp.Mapping[str, int]):
+		"""Restores a position saved with `state_dict`."""
+		self._epoch = int(state["epoch"])
+		self._position = int(state["position"])
+		self.seed = int(state.get("seed", self.seed))
+		self._generation += 1
+
+	def peek(self) -> Batch:
+		"""Returns the next batch without moving the loader."""
+		state = self.state_dict()
+		batches = iter(self)
+		try:
+			return next(batches)
+		finally:
+			batches.close()
+			self.load_state_dict(state)
+
+	def _local_slice(self, items: tp.Sequence) -> tp.Sequence:
+		start = self.process_index * len(items) // self.process_count
+		end = (self.process_index + 1) * len(items) // self.process_count
+		return items[start:end]
+
+	def _epoch_indices(self, epoch: int) -> np.ndarray:
+		rng = np.random.default_rng(self.seed + epoch) if self.shuffle else None
+		if self.lengths is not None:
+			return length_grouped_indices(self.lengths, self.batch_size, rng)
+		indices = np.arange(len(self.dataset))
+		if rng is not None:
+			indices = rng.permutation(indices)
+		return indices
+
+	def token_utilization(self, epoch: tp.Optional[int] = None) -> float:
+		"""
+		Share of non-padding tokens of an epoch (the current one by default) when every
+		batch is padded to its longest example. Requires `lengths`.
+		"""
+		if self.lengths is None:
+			raise ValueError("`token_utilization` needs the `lengths` of the examples.")
+		indices = self._epoch_indices(self._epoch if epoch is None else epoch)
+		if self.drop_remainder:
+			indices = indices[: len(self) * self.batch_size]
+		return token_utilization(self.lengths, indices, self.batch_size)
+
+	def _load(self, indices: np.ndarray) -> Batch:
+		indices = [int(idx) for idx in indices]
+		getitems = getattr(self.dataset, "__getitems__", None)
+		if getitems is not None:
+			rows = getitems(indices)
+		else:
+			rows = [self.dataset[idx] for idx in indices]
+		return self._collate(rows)
+
+	def _collate(self, rows: tp.List[tp.Any]) -> Batch:
+		return jax.tree_util.tree_map(np.asarray, self.collate_fn(rows))
+
+	def _map_style_tasks(self, epoch: int, position: int):
+		indices = self._epoch_indices(epoch)
+		for batch_idx in range(position, len(self)):
+			global_indices = indices[
+				batch_idx * self.batch_size : (batch_idx + 1) * self.batch_size
+			]
+			yield partial(self._load, self._local_slice(global_indices))
+
+	def _iterable_tasks(self, epoch: int, position: int):
+		if hasattr(self.dataset, "set_epoch"):
+			self.dataset.set_epoch(epoch)
+		examples = iter(self.dataset)
+		for _ in itertools.islice(examples, position * self.batch_size):
+			pass
+		while True:
+			rows = list(itertools.islice(examples, self.batch_size))
+			if not rows or (self.drop_remainder and len(rows) < self.batch_size):
+				return
+			yield partial(self._collate, self._local_slice(rows))
+
+	def __iter__(self) -> tp.Iterator[Batch]:
+		if self.is_map_style and self._position >= len(self):
+			self._epoch, self._position = self._epoch + 1, 0
+		self._generation += 1
+		return self._iterate(self._generation, self._epoch, self._position)
+
+	def _iterate(self, generation: int, epoch: int, position: int):
+		if self.is_map_style:
+			tasks = self._map_style_tasks(epoch, position)
+		else:
+			tasks = self._iterable_tasks(epoch, position)
+
+		def advance():
+			nonlocal position
+			position += 1
+			# an iterator replaced by a newer `iter()` or `load_state_dict` must not
+			# move the loader.
+			if generation == self._generation:
+				self._epoch, self._position = epoch, position
+
+		if self.num_workers == 0:
+			for task in tasks:
+				batch = task()
+				advance()
+				yield batch
+			if not self.is_map_style and generation == self._generation:
+				self._epoch, self._position = epoch + 1, 0
+			return
+
+		with ThreadPoolExecutor(
+			max_workers=self.num_workers,
+			thread_name_prefix="easydel-data-loader",
+		) as executor:
+			pending = collections.deque(
+				executor.submit(task) for task in itertools.islice(tasks, self.prefetch_size)
+			)
+			try:
+				while pending:
+					batch = pending.popleft().result()
+					for task in itertools.islice(tasks, 1):
+						pending.append(executor.submit(task))
+					advance()
+					yield batch
+			finally:
+				for future in pending:
+					future.cancel()
+		if not self.is_map_style and generation == self._generation:
+			self._epoch, self._position = epoch + 1, 0
+
+
+def batch_sharding(
+	array: np.ndarray,
+	mesh: Mesh,
+	partition_spec: PartitionSpec,
+	process_count: int = 1,
+) -> NamedSharding:
+	"""
+	Sharding of one batch leaf: `partition_spec` trimmed to the rank of the array, with
+	the axes whose mesh size does not divide the (global) dimension left unsharded.
+	"""
+	shape = list(array.shape)
+	if shape:
+		shape[0] *= process_count
+	spec = []
+	for dim, axes in zip(shape, tuple(partition_spec)[: len(shape)]):
+		names = (axes,) if isinstance(axes, str) else tuple(axes or ())
+		size = int(np.prod([mesh.shape[name] for name in names if name in mesh.shape]))
+		spec.append(axes if axes is not None and dim % size == 0 else None)
+	return NamedSharding(mesh, PartitionSpec(*spec))
+
+
+def shard_batch(
+	batch: Batch,
+	mesh: Mesh,
+	partition_spec: PartitionSpec,
+) -> tp.Dict[str, jax.Array]:
+	"""
+	Places a process-local batch on the devices of `mesh` as global arrays sharded with
+	`partition_spec` (see `batch_sharding`). On a single process the whole batch goes
+	through one `device_put`. The transfer is asynchronous.
+	"""
+	process_count = jax.process_count()
+	batch = jax.tree_util.tree_map(np.asarray, batch)
+	shardings = jax.tree_util.tree_map(
+		lambda array: batch_sharding(array, mesh, partition_spec, process_count),
+		batch,
+	)
+	if process_count == 1:
+		return jax.device_put(batch, shardings)
+	return jax.tree_util.tree_map(
+		jax.make_array_from_process_local_data,
+		shardings,
+		batch,
+	)
+
+
+class DevicePrefetchLoader:
+	"""
+	Wraps a `NumpyDataLoader` and keeps `buffer_size` batches in flight on the devices.
+
+	Each batch is put on the mesh with `shard_batch` as soon as the previous one is handed
+	out, so its host-to-device transfer overlaps with the training step consuming the
+	current batch. `state_dict()` reports the position of the last batch handed out, not
+	of the ones still sitting in the buffer.
+	"""
+
+	def __init__(
+		self,
+		loader: NumpyDataLoader,
+		mesh: Mesh,
+		partition_spec: PartitionSpec,
+		buffer_size: int = 2,
+	):
+		self.loader = loader
+		self.mesh = mesh
+		self.partition_spec = partition_spec
+		self.buffer_size = max(buffer_size, 1)
+		self._state = None
+		self._generation = 0
+
+	def __len__(self) -> int:
+		return len(self.loader)
+
+	def state_dict(self) -> tp.Dict[str, int]:
+		return dict(self._state if self._state is not None else self.loader.state_dict())
+
+	def load_state_dict(self, state: tp.Mapping[str, int]):
+		self.loader.load_state_dict(state)
+		self._state = None
+		self._generation += 1
+
+	def batch_spec(self) -> tp.Dict[str, jax.ShapeDtypeStruct]:
+		"""
+		Global shape, dtype and sharding of the batches, read from a `peek` at the next
+		host batch. Nothing is consumed or put on the devices, so the step functions can
+		be lowered ahead of time without skipping a batch.
+		"""
+		process_count = jax.process_count()
+
+		def spec(array: np.ndarray) -> jax.ShapeDtypeStruct:
+			shape = array.shape
+			if shape:
+				shape = (shape[0] * process_count,) + shape[1:]
+			return jax.ShapeDtypeStruct(
+				shape,
+				jax.dtypes.canonicalize_dtype(array.dtype),
+				sharding=batch_sharding(array, self.mesh, self.partition_spec, process_count),
+			)
+
+		return jax.tree_util.tree_map(spec, self.loader.peek())
+
+	def __iter__(self) -> tp.Iterator[tp.Dict[str, jax.Array]]:
+		if self._state is not None:
+			# drop the batches an abandoned iterator had already pulled.
+			self.loader.load_state_dict(self._state)
+		self._generation += 1
+		return self._iterate(self._generation)
+
+	def _iterate(self, generation: int):
+		batches = iter(self.loader)
+		buffer = collections.deque()
+
+		exhausted = False
+
+		def enqueue():
+			nonlocal exhausted
+			if exhausted:
+				return
+			for batch in itertools.islice(batches, 1):
+				buffer.append(
+					(
+						shard_batch(batch, self.mesh, self.partition_spec),
+						self.loader.state_dict(),
+					)
+				)
+				return
+			exhausted = True
+			# the loader may roll over to the next epoch only once the epoch is drained
+			# (iterable datasets), so the last batch carries that final state.
+			if buffer:
+				buffer[-1] = (buffer[-1][0], self.loader.state_dict())
+			elif generation == self._generation:
+				self._state = self.loader.state_dict()
+
+		for _ in range(self.buffer_size):
+			enqueue()
+		while buffer:
+			batch, state = buffer.popleft()
+			enqueue()
+			if generation == self._generation:
+				self._state = state
+			yield batch
@@ -0,0 +1,246 @@
+# Copyright 2023 The EASYDEL Author @erfanzar (Erfan Zare Chavoshi).
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import jax
+import numpy as np
+import pytest
+from jax.sharding import Mesh, PartitionSpec
+
+from .data_loader import (
+	DevicePrefetchLoader,
+	NumpyDataLoader,
+	length_grouped_indices,
+	pad_collate,
+	stack_examples,
+	token_utilization,
+)
+
+NUM_EXAMPLES, SEQ_LEN = 26, 4
+
+
+def examples():
+	return [
+		{"input_ids": np.full((SEQ_LEN,), idx), "label": np.int32(idx)}
+		for idx in range(NUM_EXAMPLES)
+	]
+
+
+def ids(batches):
+	return [batch["label"].tolist() for batch in batches]
+
+
+def loader(**kwargs):
+	kwargs = {"batch_size": 4, "shuffle": True, "seed": 3, **kwargs}
+	return NumpyDataLoader(examples(), process_index=0, process_count=1, **kwargs)
+
+
+def test_epochs_are_shuffled_deterministically():
+	data_loader = loader()
+	assert len(data_loader) == NUM_EXAMPLES // 4
+	first_epoch, second_epoch = ids(data_loader), ids(data_loader)
+	assert len(first_epoch) == len(second_epoch) == len(data_loader)
+	assert first_epoch != second_epoch
+	assert len(set(sum(first_epoch, []))) == len(data_loader) * 4
+	assert ids(loader()) == first_epoch
+	assert data_loader.state_dict()["epoch"] == 1
+
+	batch = next(iter(loader(shuffle=False)))
+	assert batch["input_ids"].shape == (4, SEQ_LEN)
+	assert batch["label"].tolist() == [0, 1, 2, 3]
+	assert len(loader(drop_remainder=False)) == 7
+
+
+def test_processes_read_disjoint_slices():
+	expected = ids(loader(batch_size=6))
+	shards = [
+		ids(
+			NumpyDataLoader(
+				examples(),
+				batch_size=6,
+				shuffle=True,
+				seed=3,
+				process_index=index,
+				process_count=2,
+			)
+		)
+		for index in range(2)
+	]
+	assert [first + second for first, second in zip(*shards)] == expected
+	with pytest.raises(ValueError):
+		NumpyDataLoader(examples(), batch_size=5, process_index=0, process_count=2)
+
+
+def test_workers_keep_order():
+	assert ids(loader(num_workers=3, prefetch_size=4)) == ids(loader())
+
+
+@pytest.mark.parametrize("num_workers", [0, 2])
+def test_resume_from_state_dict(num_workers):
+	reference = loader()
+	expected = ids(reference) + ids(reference)
+
+	data_loader = loader(num_workers=num_workers)
+	batches = iter(data_loader)
+	consumed = ids([next(batches) for _ in range(len(data_loader) - 1)])
+	state = data_loader.state_dict()
+	assert state == {"epoch": 0, "position": len(data_loader) - 1, "seed": 3}
+
+	resumed = loader(num_workers=num_workers)
+	resumed.load_state_dict(state)
+	assert consumed + ids(resumed) + ids(resumed) == expected
+	# a fresh iterator continues where the abandoned one stopped.
+	assert consumed + ids(data_loader) + ids(data_loader) == expected
+
+
+def test_iterable_dataset():
+	def stream():
+		for example in examples():
+			yield {**example, "input_ids": example["input_ids"][None], "text": "skip"}
+
+	class Stream:
+		def __iter__(self):
+			return stream()
+
+	data_loader = NumpyDataLoader(
+		Stream(),
+		batch_size=8,
+		collate_fn=stack_examples,
+		process_index=0,
+		process_count=1,
+	)
+	batches = list(data_loader)
+	assert ids(batches) == [list(range(start, start + 8)) for start in (0, 8, 16)]
+	assert set(batches[0]) == {"input_ids", "label"}
+	assert batches[0]["input_ids"].shape == (8, SEQ_LEN)
+	assert data_loader.state_dict()["epoch"] == 1
+	with pytest.raises(TypeError):
+		len(data_loader)
+
+	data_loader.load_state_dict({"epoch": 0, "position": 2})
+	assert ids(data_loader) == [list(range(16, 24))]
+
+
+def test_device_prefetch():
+	mesh = Mesh(np.array(jax.devices()[:1]).reshape(1, 1, 1), ("dp", "fsdp", "sp"))
+	spec = PartitionSpec(("dp", "fsdp"), "sp")
+	data_loader = DevicePrefetchLoader(loader(), mesh, spec, buffer_size=2)
+	expected = ids(loader())
+
+	batches = iter(data_loader)
+	batch = next(batches)
+	assert isinstance(batch["input_ids"], jax.Array)
+	assert batch["input_ids"].sharding.spec == spec
+	assert batch["label"].sharding.spec == PartitionSpec(("dp", "fsdp"))
+	# the next two batches are already on the devices but not handed out yet.
+	assert data_loader.state_dict()["position"] == 1
+	assert data_loader.loader.state_dict()["position"] == 3
+
+	# an abandoned iterator gives its buffered batches back.
+	consumed = ids([batch]) + ids(data_loader)
+	assert consumed == expected
+	assert data_loader.state_dict()["position"] == len(data_loader)
+
+
+def test_batch_spec_does_not_consume_a_batch():
+	mesh = Mesh(np.array(jax.devices()[:1]).reshape(1, 1, 1), ("dp", "fsdp", "sp"))
+	spec = PartitionSpec(("dp", "fsdp"), "sp")
+	data_loader = DevicePrefetchLoader(loader(num_workers=2), mesh, spec)
+	expected = ids(loader())
+
+	batch_spec = data_loader.batch_spec()
+	batch = next(iter(data_loader))
+	for key, value in batch.items():
+		assert batch_spec[key].shape == value.shape
+		assert batch_spec[key].dtype == value.dtype
+		assert batch_spec[key].sharding == value.sharding
+	assert ids([batch]) + ids(data_loader) == expected
+
+	data_loader = loader()
+	assert ids([data_loader.peek()]) == expected[:1]
+	assert ids(data_loader) == expected
+
+
+def test_length_grouped_batches_pad_less():
+	lengths = np.random.RandomState(0).randint(1, 512, 1000)
+	shuffled = np.random.default_rng(0).permutation(len(lengths))
+	grouped = length_grouped_indices(lengths, 8, np.random.default_rng(0))
+	assert sorted(grouped.tolist()) == list(range(len(lengths)))
+	assert token_utilization(lengths, grouped, 8) > 0.9
+	assert token_utilization(lengths, shuffled, 8) < 0.7
+	assert token_utilization([3, 3, 1, 1], [0, 1, 2, 3], 2) == 1.0
+	assert token_utilization([3, 1], [0, 1], 2) == 4 / 6
+
+
+def test_loader_groups_batches_by_length():
+	lengths = [idx % 5 + 1 for idx in range(NUM_EXAMPLES)]
+	data_loader = loader(lengths=lengths, batch_size=4)
+	batches = ids(data_loader)
+	assert len(batches) == NUM_EXAMPLES // 4
+	assert data_loader.token_utilization(epoch=0) > token_utilization(
+		lengths, np.arange(NUM_EXAMPLES)[: len(batches) * 4], 4
+	)
+	assert ids(loader(lengths=lengths, batch_size=4)) == batches
+	with pytest.raises(ValueError, match="lengths"):
+		loader(lengths=lengths[:-1])
+
+
+@pytest.mark.parametrize("truncation_mode", ["keep_end", "keep_start"])
+@pytest.mark.parametrize("max_sequence_length", [None, 5, 12])
+def test_pad_collate_pads_and_truncates_rows(truncation_mode, max_sequence_length):
+	rng = np.random.RandomState(0)
+	rows = [
+		{
+			"input_ids": rng.randint(1, 100, length).tolist(),
+			"labels": np.arange(length),
+			"length": length,
+			"text": "raw",
+		}
+		for length in (3, 0, 8, 5)
+	]
+	batch = pad_collate(
+		rows,
+		max_sequence_length=max_sequence_length,
+		truncation_mode=truncation_mode,
+		padding_values={"labels": -100},
+	)
+	assert set(batch) == {"input_ids", "labels", "length"}
+	width = max_sequence_length or 8
+	for key, padding_value in (("input_ids", 0), ("labels", -100)):
+		expected = np.full((len(rows), width), padding_value)
+		for idx, row in enumerate(rows):
+			values = np.asarray(row[key], dtype=np.int64)
+			if len(values) > width:
+				values = values[-width:] if truncation_mode == "keep_end" else values[:width]
+			expected[idx, : len(values)] = values
+		np.testing.assert_array_equal(batch[key], expected)
+	np.testing.assert_array_equal(batch["length"], [3, 0, 8, 5])
+
+
+def test_pad_collate_gives_ragged_batches_a_fixed_shape():
+	rng = np.random.RandomState(0)
+	for _ in range(5):
+		rows = [
+			{"input_ids": np.ones(length, np.int32), "attention_mask": [1] * length}
+			for length in rng.randint(1, 20, 4)
+		]
+		batch = pad_collate(rows, max_sequence_length=16)
+		assert batch["input_ids"].shape == batch["attention_mask"].shape == (4, 16)
+
+
+def test_pad_collate_stacks_equal_rows():
+	batch = pad_collate(examples()[:4])
+	assert batch["input_ids"].shape == (4, SEQ_LEN)
+	assert batch["label"].tolist() == [0, 1, 2, 3]
+	with pytest.raises(ValueError, match="truncation"):
+		pad_collate(examples()[:4], truncation_mode="middle")
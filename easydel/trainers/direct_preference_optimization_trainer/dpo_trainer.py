@@ -34,6 +34,7 @@ from ..base_trainer import (
 	BaseTrainer,
 	TrainerConfigureFunctionOutput,
 )
+from ..data_loader import NumpyDataLoader
 from ..prompt_utils import maybe_apply_chat_template, maybe_extract_prompt
 from ..utils import DPODataCollatorWithPadding
 from ._fn import concatenated_forward, evaluation_step, training_step
@@ -409,7 +410,7 @@ class DPOTrainer(Trainer):
 				ref_precalculated="ref_chosen_logps" in ds_columns
 				and "ref_rejected_logps" in ds_columns,
 			),
-			in_shardings=(self.state_shardings, empty_sharding),
+			in_shardings=(self.state_shardings, None),
 			out_shardings=(self.state_shardings, empty_sharding),
 			donate_argnums=(0,),
 			static_argnames=[
@@ -440,7 +441,7 @@ class DPOTrainer(Trainer):
 				ref_precalculated="ref_chosen_logps" in ds_columns
 				and "ref_rejected_logps" in ds_columns,
 			),
-			in_shardings=(self.state_shardings, empty_sharding),
+			in_shardings=(self.state_shardings, None),
 			out_shardings=empty_sharding,
 			static_argnames=[
 				"concatenated_forward",
@@ -492,28 +493,22 @@ class DPOTrainer(Trainer):
 		them as columns to the dataset.
 
 		Returns:
-		    tensorflow.data.Dataset: The training dataloader.
+		    TrainerConfigureDataloaderOutput: The configured dataloaders.
 		"""
 
-		try:
-			import tensorflow_datasets
-		except ImportError as e:
-			raise ImportError(
-				"tensorflow_datasets is not installed, please install it by running `pip install tensorflow_datasets`"
-			) from e
 		if self.train_dataset is not None:
 			if (
 				self.arguments.precompute_ref_log_probs
 				and not self._precomputed_train_ref_log_probs
 			):
-				data_loader = tensorflow_datasets.as_numpy(
-					self.train_dataset.to_tf_dataset(
-						batch_size=self.training_batch_size,
-						collate_fn=self.input_data_collator,
-						num_workers=self.arguments.dataloader_num_workers,
-						shuffle=False,
-						drop_remainder=True,
-					)
+				# every process needs the reference log probs of the whole dataset.
+				data_loader = NumpyDataLoader(
+					dataset=self.train_dataset,
+					batch_size=self.training_batch_size,
+					collate_fn=self.input_data_collator,
+					num_workers=self.arguments.dataloader_num_workers,
+					process_index=0,
+					process_count=1,
 				)
 				reference_chosen_log_probs = []
 				ref_rejected_logps = []
@@ -547,14 +542,14 @@ class DPOTrainer(Trainer):
 				self.arguments.precompute_ref_log_probs
 				and not self._precomputed_eval_ref_log_probs
 			):
-				data_loader = tensorflow_datasets.as_numpy(
-					self.eval_dataset.to_tf_dataset(
-						batch_size=self.evaluation_batch_size,
-						collate_fn=self.input_data_collator,
-						num_workers=self.arguments.dataloader_num_workers,
-						shuffle=False,
-						drop_remainder=True,
-					)
+				# every process needs the reference log probs of the whole dataset.
+				data_loader = NumpyDataLoader(
+					dataset=self.eval_dataset,
+					batch_size=self.evaluation_batch_size,
+					collate_fn=self.input_data_collator,
+					num_workers=self.arguments.dataloader_num_workers,
+					process_index=0,
+					process_count=1,
 				)
 				reference_chosen_log_probs = []
 				ref_rejected_logps = []
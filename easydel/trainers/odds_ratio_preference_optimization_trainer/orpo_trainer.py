@@ -35,21 +35,18 @@ from ..base_trainer import (
 	TrainerConfigureDataloaderOutput,
 	TrainerConfigureFunctionOutput,
 )
+from ..data_loader import DevicePrefetchLoader
 from ..utils import DPODataCollatorWithPadding
 from ._fn import concatenated_forward, orpo_step
 from .orpo_config import ORPOConfig
 
 if tp.TYPE_CHECKING:
 	from datasets import Dataset
-	from tensorflow import data
 	from transformers import PreTrainedTokenizerBase
 
-	TFDataset = data.Dataset
-
 else:
 	Dataset = tp.Any
 	PreTrainedTokenizerBase = tp.Any
-	TFDataset = tp.Any
 
 logger = get_logger(__name__)
 
@@ -423,7 +420,7 @@ class ORPOTrainer(Trainer):
 				gradient_accumulation_steps=self.arguments.gradient_accumulation_steps,
 				loss_config=self.arguments.loss_config,
 			),
-			in_shardings=(self.state_shardings, empty_sharding),
+			in_shardings=(self.state_shardings, None),
 			out_shardings=(self.state_shardings, empty_sharding),
 			static_argnames=[
 				"concatenated_forward",
@@ -447,7 +444,7 @@ class ORPOTrainer(Trainer):
 				gradient_accumulation_steps=self.arguments.gradient_accumulation_steps,
 				loss_config=self.arguments.loss_config,
 			),
-			in_shardings=(self.state_shardings, empty_sharding),
+			in_shardings=(self.state_shardings, None),
 			out_shardings=(empty_sharding),
 			static_argnames=[
 				"concatenated_forward",
@@ -508,96 +505,72 @@ class ORPOTrainer(Trainer):
 			max_evaluation_steps=max_evaluation_steps,
 		)
 
-	def _get_train_dataloader(self) -> TFDataset:
+	def _get_train_dataloader(self) -> DevicePrefetchLoader:
 		"""
-		Creates the training dataloader as a TensorFlow Dataset.
+		Creates the training dataloader.
 
-		This method retrieves the training dataset, applies the data collator, and converts
-		it into a TensorFlow Dataset for efficient batching and data loading during training.
+		This method retrieves the training dataset and batches it with the data collator
+		through `create_dataloader`.
 
 		Returns:
-		    tensorflow.data.Dataset: The training dataloader.
+		    DevicePrefetchLoader: The training dataloader.
 
 		Raises:
 		    ValueError: If the training dataset is not set.
 		"""
 
-		try:
-			import tensorflow_datasets
-		except ImportError as e:
-			raise ImportError(
-				"tensorflow_datasets is not installed, please install it by running `pip install tensorflow_datasets`"
-			) from e
-
 		if self.train_dataset is None:
 			raise ValueError("Trainer: training requires a train_dataset.")
 
-		train_dataset = self.train_dataset
-		data_collator = self.data_collator
-
-		return tensorflow_datasets.as_numpy(
-			train_dataset.to_tf_dataset(
-				batch_size=self.training_batch_size,
-				collate_fn=data_collator,
-				num_workers=self.arguments.dataloader_num_workers,
-				shuffle=True,
-				drop_remainder=True,
-			)
+		return self.create_dataloader(
+			dataset=self.train_dataset,
+			batch_size=self.training_batch_size,
+			collate_fn=self.data_collator,
+			shuffle=True,
 		)
 
 	def _get_eval_dataloader(
 		self,
 		eval_dataset: tp.Optional[Dataset] = None,
-	) -> TFDataset:
+	) -> DevicePrefetchLoader:
 		"""
-		Creates the evaluation dataloader as a TensorFlow Dataset.
+		Creates the evaluation dataloader.
 
 		This method retrieves the evaluation dataset (either provided as an argument or
-		from the `self.eval_dataset` attribute), applies the data collator, and converts
-		it into a TensorFlow Dataset for efficient batching and data loading during evaluation.
+		from the `self.eval_dataset` attribute) and batches it with the data collator
+		through `create_dataloader`.
 
 		Args:
 		    eval_dataset (tp.Optional[Dataset], optional):
 		        An optional evaluation dataset to use. If None, `self.eval_dataset` is used. Defaults to None.
 
 		Returns:
-		    tensorflow.data.Dataset: The evaluation dataloader.
+		    DevicePrefetchLoader: The evaluation dataloader.
 
 		Raises:
 		    ValueError: If no evaluation dataset is provided or set.
 		"""
 
-		try:
-			import tensorflow_datasets
-		except ImportError as e:
-			raise ImportError(
-				"tensorflow_datasets is not installed, please install it by running `pip install tensorflow_datasets`"
-			) from e
-
 		if eval_dataset is None and self.eval_dataset is None:
 			raise ValueError("Trainer: evaluation requires an eval_dataset.")
 		eval_dataset = eval_dataset if eval_dataset is not None else self.eval_dataset
 
-		return tensorflow_datasets.as_numpy(
-			eval_dataset.to_tf_dataset(
-				batch_size=self.evaluation_batch_size,
-				collate_fn=self.data_collator,
-				num_workers=self.arguments.dataloader_num_workers,
-				shuffle=False,
-				drop_remainder=True,
-			)
+		return self.create_dataloader(
+			dataset=eval_dataset,
+			batch_size=self.evaluation_batch_size,
+			collate_fn=self.data_collator,
 		)
 
-	def get_train_dataloader(self) -> TFDataset:
+	def get_train_dataloader(self) -> DevicePrefetchLoader:
 		"""
 		Returns the training dataloader
 
 		Returns:
-		    tensorflow.data.Dataset: The training dataloader.
+		    DevicePrefetchLoader: The training dataloader.
 		"""
 		return self._get_train_dataloader()
 
-	def get_eval_dataloader(self, eval_dataset: tp.Optional[Dataset] = None) -> TFDataset:
+	def get_eval_dataloader(self, eval_dataset: tp.Optional[Dataset] = None) -> DevicePrefetchLoader:
 		"""
 		Returns the evaluation dataloader
 		Args:
@@ -605,7 +578,7 @@ class ORPOTrainer(Trainer):
 		        An optional evaluation dataset to use. If None, `self.eval_dataset` is used. Defaults to None.
 
 		Returns:
-		    tensorflow.data.Dataset: The evaluation dataloader.
+		    DevicePrefetchLoader: The evaluation dataloader.
 		"""
 		if eval_dataset is None and self.eval_dataset is None:
 			raise ValueError("Trainer: evaluation requires an eval_dataset.")
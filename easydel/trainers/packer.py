@@ -1,149 +1,265 @@
 from __future__ import annotations
 
+import bisect
 import typing as tp
+from dataclasses import dataclass
+
+import numpy as np
+
+from easydel.utils.helpers import get_logger
 
 if tp.TYPE_CHECKING:
 	from datasets import Dataset
 else:
 	Dataset = tp.Any
 
+logger = get_logger(__name__)
+
+IGNORE_INDEX = -100
+
+
+@dataclass
+class PackingPlan:
+	"""
+	Assignment of sequences to packed rows.
+
+	Attributes:
+	    bins: Indices of the sequences placed in every row, in placement order.
+	    lengths: Token count of every sequence, clipped to `max_length`.
+	    max_length: Number of tokens per row.
+	"""
+
+	bins: tp.List[tp.List[int]]
+	lengths: tp.List[int]
+	max_length: int
+
+	@property
+	def num_tokens(self) -> int:
+		return sum(self.lengths[idx] for row in self.bins for idx in row)
+
+	@property
+	def utilization(self) -> float:
+		"""Share of the packed row slots holding tokens rather than padding."""
+		if not self.bins:
+			return 1.0
+		return self.num_tokens / (len(self.bins) * self.max_length)
+
+
+def _best_fit_decreasing(
+	indices: tp.Sequence[int],
+	lengths: tp.Sequence[int],
+	max_length: int,
+) -> tp.List[tp.List[int]]:
+	bins: tp.List[tp.List[int]] = []
+	# (remaining capacity, bin index) of the open bins, kept sorted.
+	open_bins: tp.List[tp.Tuple[int, int]] = []
+	for idx in sorted(indices, key=lambda idx: -lengths[idx]):
+		length = lengths[idx]
+		position = bisect.bisect_left(open_bins, (length, -1))
+		if position < len(open_bins):
+			remaining, bin_idx = open_bins.pop(position)
+		else:
+			remaining, bin_idx = max_length, len(bins)
+			bins.append([])
+		bins[bin_idx].append(idx)
+		if remaining - length > 0:
+			bisect.insort(open_bins, (remaining - length, bin_idx))
+	return bins
+
+
+def plan_packing(
+	lengths: tp.Sequence[int],
+	max_length: int,
+	lookahead: tp.Optional[int] = None,
+) -> PackingPlan:
+	"""
+	Packs sequences into rows of `max_length` tokens with best-fit decreasing.
+
+	Sequences are taken in windows of `lookahead` (all at once when `None`). Inside
+	a window they are placed longest first, each into the open row it fills the
+	most, so the short sequences end up filling the gaps left by the long ones.
+	Bounding the window keeps the planner streaming-friendly and the order of the
+	data roughly preserved.
+
+	Args:
+	    lengths: Token count of every sequence; longer ones are clipped to `max_length`.
+	    max_length: Number of tokens per row.
+	    lookahead: Number of sequences planned together.
+
+	Returns:
+	    PackingPlan: The rows and their achieved token utilization.
+	"""
+	if max_length <= 0:
+		raise ValueError("`max_length` must be positive.")
+	lengths = [min(int(length), max_length) for length in lengths]
+	window = lookahead or max(len(lengths), 1)
+	bins = []
+	for start in range(0, len(lengths), window):
+		indices = [
+			idx for idx in range(start, min(start + window, len(lengths))) if lengths[idx]
+		]
+		bins.extend(_best_fit_decreasing(indices, lengths, max_length))
+	return PackingPlan(bins=bins, lengths=lengths, max_length=max_length)
+
+
+def pack_examples(
+	examples: tp.Dict[str, tp.List[tp.List[int]]],
+	max_length: int,
+	pad_token_id: int,
+	reset_position_ids: bool,
+	packing_strategy: tp.Literal["greedy", "best_fit"] = "greedy",
+) -> tp.Dict[str, tp.List[tp.List[int]]]:
+	"""
+	Packs a batch of examples (columns of token lists, as given to a batched
+	`dataset.map`) into rows of `max_length` tokens, either greedily in order or
+	following the best-fit decreasing `plan_packing` of the batch.
+
+	Documents are placed back to back without separators. Every token records the
+	(1-based) document it belongs to in `segment_ids`, padding gets segment 0, and
+	`labels` ignore the first token of every document so the loss never predicts
+	across a document boundary.
+	"""
+	attention_masks = examples.get("attention_mask")
+	if attention_masks is None:
+		attention_masks = [[1] * len(input_ids) for input_ids in examples["input_ids"]]
+	labels = examples.get("labels")
+	if labels is None:
+		labels = examples["input_ids"]
+
+	packed = {
+		"input_ids": [],
+		"attention_mask": [],
+		"position_ids": [],
+		"segment_ids": [],
+		"labels": [],
+	}
+	row = {key: [] for key in packed}
+
+	def _flush():
+		padding_length = max_length - len(row["input_ids"])
+		row["input_ids"].extend([pad_token_id] * padding_length)
+		row["labels"].extend([IGNORE_INDEX] * padding_length)
+		for key in ("attention_mask", "position_ids", "segment_ids"):
+			row[key].extend([0] * padding_length)
+		for key in packed:
+			packed[key].append(row[key])
+			row[key] = []
+
+	if packing_strategy == "best_fit":
+		plan = plan_packing([len(ids) for ids in examples["input_ids"]], max_length)
+		order = [idx for row_indices in plan.bins for idx in row_indices]
+		row_starts = {row_indices[0] for row_indices in plan.bins}
+	elif packing_strategy == "greedy":
+		order, row_starts = range(len(examples["input_ids"])), None
+	else:
+		raise ValueError(f"unknown packing strategy {packing_strategy!r}.")
+
+	for idx in order:
+		# documents longer than a row are truncated rather than split across rows.
+		input_ids = list(examples["input_ids"][idx][:max_length])
+		if not input_ids:
+			continue
+		attention_mask = list(attention_masks[idx][: len(input_ids)])
+		label_ids = list(labels[idx][: len(input_ids)])
+		if row["input_ids"] and (
+			idx in row_starts
+			if row_starts is not None
+			else len(row["input_ids"]) + len(input_ids) > max_length
+		):
+			_flush()
+
+		start = 0 if reset_position_ids else len(row["input_ids"])
+		segment_id = (row["segment_ids"][-1] if row["segment_ids"] else 0) + 1
+		row["input_ids"].extend(input_ids)
+		row["attention_mask"].extend(attention_mask)
+		row["position_ids"].extend(range(start, start + len(input_ids)))
+		row["segment_ids"].extend([segment_id] * len(input_ids))
+		row["labels"].extend(
+			[IGNORE_INDEX]
+			+ [
+				label if mask else IGNORE_INDEX
+				for label, mask in zip(label_ids[1:], attention_mask[1:])
+			]
+		)
+
+	if row["input_ids"]:
+		_flush()
+	return packed
+
 
 def pack_sequences(
 	dataset: Dataset,
 	max_length: int = 512,
 	pad_token_id: int = 0,
-	reset_position_ids: bool = False,
+	reset_position_ids: bool = True,
 	num_proc: tp.Optional[int] = None,
+	packing_strategy: tp.Literal["greedy", "best_fit"] = "best_fit",
+	lookahead: int = 1000,
 ):
 	"""
-	Pack sequences together with their attention masks and position IDs
-
-	# With continuous position IDs
-	packed_dataset = pack_sequences(
-			dataset,
-			max_length=512,
-			pad_token_id=0,
-			reset_position_ids=False
-	)
+	Pack sequences together with their attention masks, position IDs and segment IDs
 
-	# With reset position IDs for each sequence
-	packed_dataset = pack_sequences(
-			dataset,
-			max_length=512,
-			pad_token_id=0,
-			reset_position_ids=True
-	)
+	packed_dataset = pack_sequences(dataset, max_length=512, pad_token_id=0)
 
-	# Example output format for a packed sequence with two sequences:
-	# reset_position_ids=False:
-	{
-			'input_ids': [seq1_tokens + [PAD] + seq2_tokens + [PAD] + padding],
-			'attention_mask': [1,1,1,0,1,1,1,0,0,0],
-			'position_ids': [0,1,2,3,4,5,6,7,0,0]
-	}
+	With `packing_strategy="best_fit"` every `lookahead` sequences are packed with the
+	best-fit decreasing `plan_packing`; `"greedy"` fills rows in dataset order. The
+	achieved token utilization (share of non-padding tokens) is logged.
 
-	# reset_position_ids=True:
+	# Example output format for a packed row holding two sequences:
 	{
-			'input_ids': [seq1_tokens + [PAD] + seq2_tokens + [PAD] + padding],
-			'attention_mask': [1,1,1,0,1,1,1,0,0,0],
-			'position_ids': [0,1,2,0,0,1,2,0,0,0]
+			'input_ids': [seq1_tokens + seq2_tokens + padding],
+			'attention_mask': [1,1,1,1,1,1,1,0,0,0],
+			'position_ids': [0,1,2,0,1,2,3,0,0,0],
+			'segment_ids': [1,1,1,2,2,2,2,0,0,0],
+			'labels': [-100,t1,t2,-100,t4,t5,t6,-100,-100,-100],
 	}
 
+	Every attention mechanism of `FlexibleAttentionModule` masks attention between
+	different `segment_ids`, so packed documents never attend to each other.
+
 	Args:
-	    dataset: Dataset containing 'input_ids' and 'attention_mask'
-	    max_length: Maximum length of packed sequence
+	    dataset: Dataset containing 'input_ids' (and optionally 'attention_mask', 'labels')
+	    max_length: Maximum length of packed sequence, longer sequences are truncated
 	    pad_token_id: Token ID used for padding
-	    reset_position_ids: If True, reset position IDs for each sequence in the pack
+	    reset_position_ids: If True, position IDs restart at 0 for each sequence in the
+	      pack, otherwise they keep counting along the packed row
+	    num_proc: Number of processes used by `dataset.map`
+	    packing_strategy: "best_fit" or "greedy"
+	    lookahead: Number of sequences planned together
 
 	Returns:
-	    packed_dataset: Dataset with packed sequences, attention masks, and position IDs
+	    packed_dataset: Dataset with packed sequences, attention masks, position IDs,
+	      segment IDs and labels
 	"""
 
-	def pack_examples(examples):
-		current_packed_input_ids = []
-		current_packed_attention_mask = []
-		current_packed_position_ids = []
-		current_length = 0
-
-		packed_input_ids = []
-		packed_attention_mask = []
-		packed_position_ids = []
-
-		def get_position_ids(length, start_position=0):
-			if reset_position_ids:
-				return list(range(length))
-			else:
-				return list(range(start_position, start_position + length))
-
-		# Iterate through all examples
-		for input_ids, attention_mask in zip(
-			examples["input_ids"], examples["attention_mask"]
-		):
-			seq_length = len(input_ids)
-
-			# If adding this sequence would exceed max_length, start a new packed sequence
-			if current_length + seq_length + 1 > max_length:
-				# Pad the current packed sequence if needed
-				if current_length < max_length:
-					padding_length = max_length - current_length
-					current_packed_input_ids.extend([pad_token_id] * padding_length)
-					current_packed_attention_mask.extend([0] * padding_length)
-					current_packed_position_ids.extend([0] * padding_length)
-
-				# Add the completed packed sequence to results
-				packed_input_ids.append(current_packed_input_ids)
-				packed_attention_mask.append(current_packed_attention_mask)
-				packed_position_ids.append(current_packed_position_ids)
-
-				# Start new packed sequence
-				current_packed_input_ids = []
-				current_packed_attention_mask = []
-				current_packed_position_ids = []
-				current_length = 0
-
-			# Generate position IDs for current sequence
-			position_ids = get_position_ids(seq_length, start_position=current_length)
-
-			# Add current sequence
-			current_packed_input_ids.extend(input_ids)
-			current_packed_attention_mask.extend(attention_mask)
-			current_packed_position_ids.extend(position_ids)
-
-			# Add separator token
-			current_packed_input_ids.append(pad_token_id)
-			current_packed_attention_mask.append(0)
-			current_packed_position_ids.append(
-				position_ids[-1] + 1 if not reset_position_ids else 0
-			)
-
-			current_length += seq_length + 1
-
-		# Handle the last packed sequence
-		if current_packed_input_ids:
-			# Pad if needed
-			if current_length < max_length:
-				padding_length = max_length - current_length
-				current_packed_input_ids.extend([pad_token_id] * padding_length)
-				current_packed_attention_mask.extend([0] * padding_length)
-				current_packed_position_ids.extend([0] * padding_length)
-
-			packed_input_ids.append(current_packed_input_ids)
-			packed_attention_mask.append(current_packed_attention_mask)
-			packed_position_ids.append(current_packed_position_ids)
-
-		return {
-			"input_ids": packed_input_ids,
-			"attention_mask": packed_attention_mask,
-			"position_ids": packed_position_ids,
-		}
+	def pack_batch(examples):
+		return pack_examples(
+			examples,
+			max_length=max_length,
+			pad_token_id=pad_token_id,
+			reset_position_ids=reset_position_ids,
+			packing_strategy=packing_strategy,
+		)
 
 	# Process the dataset in batches
 	packed_dataset = dataset.map(
-		pack_examples,
+		pack_batch,
 		batched=True,
+		batch_size=lookahead,
 		remove_columns=dataset.column_names,
 		desc="Packing sequences",
 		num_proc=num_proc,
 	)
 
+	num_tokens = 0
+	for batch in packed_dataset.select_columns(["segment_ids"]).iter(
+		batch_size=lookahead
+	):
+		num_tokens += int(np.count_nonzero(np.asarray(batch["segment_ids"])))
+	if len(packed_dataset):
+		logger.info(
+			f"packed {len(packed_dataset)} rows with a token utilization of "
+			f"{num_tokens / (len(packed_dataset) * max_length):.2%}"
+		)
+
 	return packed_dataset
@@ -0,0 +1,121 @@
+# Copyright 2023 The EASYDEL Author @erfanzar (Erfan Zare Chavoshi).
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import numpy as np
+import pytest
+
+from .packer import IGNORE_INDEX, pack_examples, plan_packing
+
+X = IGNORE_INDEX
+
+
+def pack(input_ids, reset_position_ids=True, packing_strategy="greedy", **columns):
+	return pack_examples(
+		{"input_ids": input_ids, **columns},
+		max_length=8,
+		pad_token_id=0,
+		reset_position_ids=reset_position_ids,
+		packing_strategy=packing_strategy,
+	)
+
+
+def test_documents_get_segments_and_positions():
+	packed = pack([[11, 12, 13], [21, 22, 23, 24], [31, 32, 33, 34, 35]])
+	assert packed["input_ids"] == [
+		[11, 12, 13, 21, 22, 23, 24, 0],
+		[31, 32, 33, 34, 35, 0, 0, 0],
+	]
+	assert packed["segment_ids"] == [
+		[1, 1, 1, 2, 2, 2, 2, 0],
+		[1, 1, 1, 1, 1, 0, 0, 0],
+	]
+	assert packed["position_ids"] == [
+		[0, 1, 2, 0, 1, 2, 3, 0],
+		[0, 1, 2, 3, 4, 0, 0, 0],
+	]
+	assert packed["attention_mask"] == [
+		[1, 1, 1, 1, 1, 1, 1, 0],
+		[1, 1, 1, 1, 1, 0, 0, 0],
+	]
+	assert packed["labels"] == [
+		[X, 12, 13, X, 22, 23, 24, X],
+		[X, 32, 33, 34, 35, X, X, X],
+	]
+
+
+def test_running_positions_and_given_columns():
+	packed = pack(
+		[[11, 12], [21, 22, 23]],
+		reset_position_ids=False,
+		attention_mask=[[1, 1], [0, 1, 1]],
+		labels=[[X, 12], [X, X, 23]],
+	)
+	assert packed["position_ids"] == [[0, 1, 2, 3, 4, 0, 0, 0]]
+	assert packed["attention_mask"] == [[1, 1, 0, 1, 1, 0, 0, 0]]
+	assert packed["labels"] == [[X, 12, X, X, 23, X, X, X]]
+
+
+def test_long_documents_are_truncated():
+	packed = pack([list(range(1, 12)), [5]])
+	assert packed["input_ids"] == [list(range(1, 9)), [5, 0, 0, 0, 0, 0, 0, 0]]
+	assert packed["segment_ids"][0] == [1] * 8
+
+
+def test_best_fit_fills_the_gaps_of_long_sequences():
+	lengths = [5, 4, 3, 6, 2, 4]
+	plan = plan_packing(lengths, max_length=8)
+	assert sorted(sorted(row) for row in plan.bins) == [[0, 2], [1, 5], [3, 4]]
+	assert plan.utilization == 1.0
+	# greedy in order: [5], [4, 3], [6], [2, 4].
+	assert len(pack([[1] * length for length in lengths])["input_ids"]) == 4
+
+
+def test_lookahead_bounds_the_planned_window():
+	plan = plan_packing([5, 4, 3, 6, 2, 4], max_length=8, lookahead=3)
+	assert all(max(row) < 3 or min(row) >= 3 for row in plan.bins)
+	assert len(plan.bins) == 4
+	assert plan.num_tokens == 24
+	assert plan.utilization == 24 / 32
+
+
+def test_best_fit_plan_never_overflows():
+	lengths = np.random.RandomState(0).randint(0, 40, 500).tolist()
+	plan = plan_packing(lengths, max_length=32, lookahead=64)
+	placed = sorted(idx for row in plan.bins for idx in row)
+	assert placed == [idx for idx, length in enumerate(lengths) if length]
+	assert all(sum(plan.lengths[idx] for idx in row) <= 32 for row in plan.bins)
+	greedy_rows = len(
+		pack_examples(
+			{"input_ids": [[1] * length for length in lengths]},
+			max_length=32,
+			pad_token_id=0,
+			reset_position_ids=True,
+		)["input_ids"]
+	)
+	assert len(plan.bins) < greedy_rows
+
+
+def test_best_fit_rows():
+	packed = pack(
+		[[11, 12, 13, 14, 15], [21, 22, 23, 24], [31, 32, 33]],
+		packing_strategy="best_fit",
+	)
+	assert packed["input_ids"] == [
+		[11, 12, 13, 14, 15, 31, 32, 33],
+		[21, 22, 23, 24, 0, 0, 0, 0],
+	]
+	assert packed["segment_ids"][0] == [1, 1, 1, 1, 1, 2, 2, 2]
+	assert packed["position_ids"][0] == [0, 1, 2, 3, 4, 0, 1, 2]
+	with pytest.raises(ValueError, match="packing strategy"):
+		pack([[1]], packing_strategy="first_fit")
@@ -49,6 +49,9 @@ class SFTConfig(TrainingArguments):
 			chars_per_token (`float`, *optional*, defaults to `3.6`):
 					Number of characters per token to use for the [`ConstantLengthDataset`]. See
 					[chars_token_ratio](https://github.com/huggingface/trl/blob/08f550674c553c36c51d1027613c29f14f3676a5/examples/stack_llama/scripts/supervised_finetuning.py#L53) for more details.
+			packing_strategy (`str`, *optional*, defaults to `"concatenate"`):
+					How packed samples are laid out into rows: `"concatenate"` cuts the concatenated samples into
+					chunks, `"best_fit"` packs whole samples with best-fit decreasing and emits segment ids.
 	"""
 
 	dataset_text_field: str = "text"
@@ -61,5 +64,6 @@ class SFTConfig(TrainingArguments):
 	eval_packing: tp.Optional[bool] = None
 	num_of_sequences: int = 1024
 	chars_per_token: float = 3.6
+	packing_strategy: tp.Literal["concatenate", "best_fit"] = "concatenate"
 
 	__hash__ = hash_fn
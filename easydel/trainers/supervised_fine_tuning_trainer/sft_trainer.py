@@ -79,6 +79,7 @@ class SFTTrainer(Trainer):
 				arguments.num_of_sequences,
 				arguments.chars_per_token,
 				remove_unused_columns=arguments.remove_unused_columns,
+				packing_strategy=arguments.packing_strategy,
 				**arguments.dataset_kwargs,
 			)
 		if eval_dataset is not None:
@@ -100,6 +101,7 @@ class SFTTrainer(Trainer):
 					arguments.num_of_sequences,
 					arguments.chars_per_token,
 					remove_unused_columns=arguments.remove_unused_columns,
+					packing_strategy=arguments.packing_strategy,
 					**arguments.dataset_kwargs,
 				)
 			if not _multiple:
@@ -134,23 +136,16 @@ class SFTTrainer(Trainer):
 		    TrainerConfigureDataloaderOutput: An object containing the configured dataloaders and the
 		                                    maximum number of training and evaluation steps.
 		"""
-		try:
-			import tensorflow_datasets as tfds
-		except ImportError as e:
-			raise ImportError(
-				"tensorflow_datasets is not installed, please install it by running `pip install tensorflow_datasets`"
-			) from e
-
-		dataloader_train = tfds.as_numpy(
-			self.dataset_train.to_tf_dataset(
-				batch_size=self.training_batch_size,
-				drop_remainder=True,
-				num_workers=self.arguments.dataloader_num_workers,
-				collate_fn=self.create_collect_function(
-					max_sequence_length=self.arguments.max_sequence_length,
-					truncation_mode=self.arguments.truncation_mode,
-				),
-			)
+		collate_fn = self.create_collect_function(
+			max_sequence_length=self.arguments.max_sequence_length,
+			truncation_mode=self.arguments.truncation_mode,
+		)
+		dataloader_train = self.create_dataloader(
+			dataset=self.dataset_train,
+			batch_size=self.training_batch_size,
+			collate_fn=collate_fn,
+			shuffle=self.arguments.shuffle_train_dataset,
+			lengths=self._train_dataset_lengths(self.dataset_train),
 		)
 		max_training_steps = (
 			self.arguments.num_train_epochs * len(dataloader_train)
@@ -158,17 +153,10 @@ class SFTTrainer(Trainer):
 			else self.arguments.max_training_steps
 		)
 		if self.dataset_eval is not None and self.arguments.do_eval:
-			dataloader_eval = tfds.as_numpy(
-				self.dataset_eval.to_tf_dataset(
-					batch_size=self.evaluation_batch_size,
-					drop_remainder=True,
-					shuffle=True,
-					num_workers=self.arguments.dataloader_num_workers,
-					collate_fn=self.create_collect_function(
-						max_sequence_length=self.arguments.max_sequence_length,
-						truncation_mode=self.arguments.truncation_mode,
-					),
-				)
+			dataloader_eval = self.create_dataloader(
+				dataset=self.dataset_eval,
+				batch_size=self.evaluation_batch_size,
+				collate_fn=collate_fn,
 			)
 			max_evaluation_steps = (
 				len(dataloader_eval)
@@ -198,6 +186,7 @@ class SFTTrainer(Trainer):
 		remove_unused_columns=True,
 		append_concat_token=True,
 		add_special_tokens=True,
+		packing_strategy="concatenate",
 	):
 		"""
 		Prepares the dataset for training by applying tokenization and packing (if enabled).
@@ -214,6 +203,8 @@ class SFTTrainer(Trainer):
 		    remove_unused_columns (bool, optional): Whether to remove unused columns. Defaults to True.
 		    append_concat_token (bool, optional): Whether to append a concat token for packing. Defaults to True.
 		    add_special_tokens (bool, optional): Whether to add special tokens during tokenization. Defaults to True.
+		    packing_strategy (str, optional): "concatenate" or "best_fit" layout of packed rows.
+		        Defaults to "concatenate".
 
 		Returns:
 		    Dataset: The processed dataset ready for training.
@@ -246,6 +237,7 @@ class SFTTrainer(Trainer):
 				formatting_func,
 				append_concat_token,
 				add_special_tokens,
+				packing_strategy,
 			)
 
 	def _prepare_non_packed_dataloader(
@@ -346,6 +338,7 @@ class SFTTrainer(Trainer):
 		formatting_func=None,
 		append_concat_token=True,
 		add_special_tokens=True,
+		packing_strategy="concatenate",
 	):
 		"""
 		Prepares a packed dataloader from the given dataset.
@@ -369,6 +362,8 @@ class SFTTrainer(Trainer):
 		        between packed sequences. Defaults to True.
 		    add_special_tokens (bool, optional): Whether to add special tokens (like BOS, EOS)
 		        during tokenization. Defaults to True.
+		    packing_strategy (str, optional): "concatenate" cuts the concatenated samples into
+		        chunks, "best_fit" packs whole samples with `plan_packing`. Defaults to "concatenate".
 
 		Returns:
 		    Dataset: The processed dataset with packed sequences.
@@ -395,6 +390,7 @@ class SFTTrainer(Trainer):
 				eos_token_id=processing_class.eos_token_id,
 				append_concat_token=append_concat_token,
 				add_special_tokens=add_special_tokens,
+				packing_strategy=packing_strategy,
 			)
 
 			def data_generator(inner_constant_length_iterator):
@@ -11,13 +11,14 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+import collections
+import time
 import typing as tp
 from functools import partial
 
 import jax
 import jax.experimental
 import jax.lib
-from jax import numpy as jnp
 from jax.sharding import PartitionSpec
 
 from easydel.infra.base_state import EasyDeLState
@@ -29,6 +30,8 @@ from ..base_trainer import (
 	BaseTrainer,
 	TrainerConfigureFunctionOutput,
 )
+from ..data_loader import pad_collate
+from ..packer import IGNORE_INDEX
 from ..trainer_protocol import BaseProgressBar, MetricsTracker, StepMetrics
 from ._fn import evaluation_step, training_step
 from .modeling_output import TrainerOutput
@@ -43,10 +46,12 @@ class Trainer(BaseTrainer):
 		truncation_mode: tp.Literal["keep_end", "keep_start"] = "keep_end",
 	) -> tp.Callable:
 		"""
-		Creates a function to collect and process batches of data for training or evaluation.
+		Creates the function collating examples into a batch of contiguous numpy arrays.
 
-		This function handles padding or truncating sequences to the specified `max_sequence_length`
-		based on the chosen `truncation_mode`.
+		One-dimensional columns are truncated to `max_sequence_length` based on the chosen
+		`truncation_mode` and right-padded to `max_sequence_length` with vectorized numpy
+		operations (see `pad_collate`); `labels` are padded with the ignored index.
+		The batch is placed on the devices afterwards, in a single sharded transfer.
 
 		Args:
 		    max_sequence_length (int): The maximum allowed sequence length.
@@ -56,26 +61,12 @@ class Trainer(BaseTrainer):
 		Returns:
 		    Callable: A function that takes a batch of data and returns a processed batch.
 		"""
-
-		def collate_fn(batch):
-			results = {}
-			for key in batch[0].keys():
-				if self.model.__class__.__name__ == "ForCausalLMLoss":
-					if truncation_mode == "keep_end":
-						corrected_sequence = [
-							jnp.array(f[key])[..., -max_sequence_length:] for f in batch
-						]
-					else:
-						corrected_sequence = [
-							jnp.array(f[key])[..., :max_sequence_length] for f in batch
-						]
-					results[key] = jnp.stack(corrected_sequence)
-				else:
-					corrected_sequence = [jnp.array(f[key]) for f in batch]
-					results[key] = jnp.stack(corrected_sequence)
-			return results
-
-		return collate_fn
+		return partial(
+			pad_collate,
+			max_sequence_length=max_sequence_length,
+			truncation_mode=truncation_mode,
+			padding_values={"labels": IGNORE_INDEX},
+		)
 
 	def configure_functions(self) -> TrainerConfigureFunctionOutput:
 		"""
@@ -109,7 +100,8 @@ class Trainer(BaseTrainer):
 				"learning_rate_fn",
 				"gradient_accumulation_steps",
 			],
-			in_shardings=(self.state_shardings, empty_sharding),
+			# batches come from the dataloader already sharded with `step_partition_spec`.
+			in_shardings=(self.state_shardings, None),
 			out_shardings=(self.state_shardings, empty_sharding),
 			donate_argnums=(0,),
 		)
@@ -121,7 +113,7 @@ class Trainer(BaseTrainer):
 				loss_config=self.arguments.loss_config,
 			),
 			static_argnames=["partition_spec", "loss_config"],
-			in_shardings=(self.state_shardings, empty_sharding),
+			in_shardings=(self.state_shardings, None),
 			out_shardings=(empty_sharding),
 		)
 
@@ -152,10 +144,18 @@ class Trainer(BaseTrainer):
 			disabled=disabled,
 			desc="training process",
 		)
+		# a state restored from `checkpoint_path` resumes in the epoch it was saved in.
+		start_step = int(jax.device_get(state.step))
+		steps_per_epoch = max(self.max_training_steps // self.arguments.num_train_epochs, 1)
+		if start_step:
+			pbar.update(start_step)
 		try:
 			run_exception = None
 			with self.mesh:
-				for epoch in range(self.arguments.num_train_epochs):
+				for epoch in range(
+					start_step // steps_per_epoch,
+					self.arguments.num_train_epochs,
+				):
 					state, run_exception = self._train_epoch(
 						state=state,
 						train_dataset=self.dataloader_train,
@@ -215,7 +215,15 @@ class Trainer(BaseTrainer):
 		pbar: BaseProgressBar,
 		epoch: int,
 	):
-		"""Handles training for a single epoch."""
+		"""
+		Handles training for a single epoch.
+
+		The step counter is kept on the host. With `metrics_lag_steps > 0` steps are
+		dispatched without waiting for the devices: the metrics of every step stay on
+		the devices and are pulled and logged `metrics_lag_steps` steps later, so the
+		host work of a step overlaps with the device compute of the following ones.
+		Hooks acting on the metrics (e.g. `break_on_nan`) fire that many steps late.
+		"""
 		train_iter = iter(train_dataset)
 		data_collator = self.data_collator
 		if data_collator is None:
@@ -223,8 +231,38 @@ class Trainer(BaseTrainer):
 			def data_collator(x):
 				return x
 
-		for _ in range(self.max_training_steps // self.arguments.num_train_epochs):
-			current_step = int(jax.device_get(state.step))
+		steps_per_epoch = self.max_training_steps // self.arguments.num_train_epochs
+		current_step = int(jax.device_get(state.step))
+		# (step, metrics still on the devices, time the step was dispatched at)
+		pending_steps = collections.deque()
+		last_resolved = None
+
+		def resolve_pending(num_kept: int = 0):
+			nonlocal last_resolved
+			while len(pending_steps) > num_kept:
+				step, metrics, dispatched_at = pending_steps.popleft()
+				metrics = jax.device_get(metrics)
+				step_time = None
+				if self.arguments.metrics_lag_steps > 0:
+					# consecutive resolutions are a device step apart once the pipeline is full.
+					now = time.time()
+					step_time = now - max(dispatched_at, last_resolved or dispatched_at)
+					last_resolved = now
+					metrics.execution_time = step_time
+				self._log_training_step(
+					metrics=metrics,
+					current_step=step,
+					epoch=epoch,
+					step_time=step_time,
+					metrics_tracker=metrics_tracker,
+					step_metrics=step_metrics,
+					pbar=pbar,
+				)
+
+		run_exception = None
+		for _ in range(steps_per_epoch - current_step % max(steps_per_epoch, 1)):
+			if current_step >= self.max_training_steps:
+				break
 			try:  # to make training loop safer if user wants to break that.
 				batch = self._get_next_batch(train_iter)
 				if self._should_skip_step(current_step):
@@ -237,7 +275,8 @@ class Trainer(BaseTrainer):
 				EasyDeLBreakRequest,
 				StopIteration,
 			) as exect:
-				return state, exect
+				run_exception = exect
+				break
 
 			# Execute training step
 			with self.train_tracker.trace_compilation():
@@ -247,36 +286,13 @@ class Trainer(BaseTrainer):
 						batch=data_collator(batch),
 					)
 					metrics.execution_time = execution_time()
-					current_step = int(jax.device_get(state.step))
+			if run_exception is not None:
+				break
+			current_step += 1
+			pending_steps.append((current_step, metrics, step_metrics.step_start_time))
 			# Update and log metrics
 			try:
-				mean_loss, mean_accuracy = metrics_tracker.update(
-					loss=metrics.loss,
-					accuracy=metrics.accuracy,
-					step=current_step,
-				)
-				metrics = self.apply_training_hooks(metrics=metrics)
-				train_metrics = step_metrics.calculate(
-					metrics=metrics,
-					current_step=current_step,
-					learning_rate=self.scheduler(current_step)
-					if self.scheduler is not None
-					else self.arguments.learning_rate,
-					epoch=epoch,
-					flops=self.get_runstage_flops(is_training=True),
-					batch_size=self.training_batch_size,
-					seq_length=self.arguments.max_sequence_length,
-					mean_loss=mean_loss,
-					mean_accuracy=mean_accuracy,
-					mode="train",
-				)
-
-				self.log_metrics(
-					metrics=train_metrics,
-					pbar=pbar,
-					step=current_step,
-					mode="train",
-				)
+				resolve_pending(num_kept=self.arguments.metrics_lag_steps)
 
 				# Save checkpoint if needed
 				if self._should_save_checkpoint(current_step):
@@ -286,15 +302,58 @@ class Trainer(BaseTrainer):
 						save_directory=self.arguments.save_directory,
 					)
 				if self._should_run_evaluation(current_step):
+					resolve_pending()
 					for _ in self.eval(model_state=state):
 						...
 
 			except (KeyboardInterrupt, EasyDeLTimerError, EasyDeLBreakRequest):
 				return state, run_exception
-			if run_exception is not None:
-				break
+		try:
+			resolve_pending()
+		except (KeyboardInterrupt, EasyDeLTimerError, EasyDeLBreakRequest) as exect:
+			run_exception = run_exception or exect
 		return state, run_exception
 
+	def _log_training_step(
+		self,
+		metrics: LossMetrics,
+		current_step: int,
+		epoch: int,
+		step_time: tp.Optional[float],
+		metrics_tracker: MetricsTracker,
+		step_metrics: StepMetrics,
+		pbar: BaseProgressBar,
+	):
+		"""Updates the running means, applies the training hooks and logs one step."""
+		mean_loss, mean_accuracy = metrics_tracker.update(
+			loss=metrics.loss,
+			accuracy=metrics.accuracy,
+			step=current_step,
+		)
+		metrics = self.apply_training_hooks(metrics=metrics)
+		train_metrics = step_metrics.calculate(
+			metrics=metrics,
+			current_step=current_step,
+			learning_rate=self.scheduler(current_step)
+			if self.scheduler is not None
+			else self.arguments.learning_rate,
+			epoch=epoch,
+			flops=self.get_runstage_flops(is_training=True),
+			batch_size=self.training_batch_size,
+			seq_length=self.arguments.max_sequence_length,
+			mean_loss=mean_loss,
+			mean_accuracy=mean_accuracy,
+			mode="train",
+			step_time=step_time,
+		)
+
+		self.log_metrics(
+			metrics=train_metrics,
+			pbar=pbar,
+			step=current_step,
+			mode="train",
+		)
+
 	def _eval_epoch(
 		self,
 		state: EasyDeLState,
@@ -369,11 +428,10 @@ class Trainer(BaseTrainer):
 				)
 			)
 		metrics = LossMetrics()
-		# print({k: v.shape for k, v in batch.items()})
 		try:
-			state, metrics = jax.block_until_ready(
-				self.sharded_training_step_function(state, batch)
-			)
+			state, metrics = self.sharded_training_step_function(state, batch)
+			if self.arguments.metrics_lag_steps == 0:
+				state, metrics = jax.block_until_ready((state, metrics))
 			# Apply post-gradient updates
 			if self.pruning_module is not None:
 				state = state.replace(
@@ -0,0 +1,108 @@
+# Copyright 2023 The EASYDEL Author @erfanzar (Erfan Zare Chavoshi).
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import flax
+import jax.numpy as jnp
+import numpy as np
+import pytest
+
+import easydel as ed
+
+LOG_METRICS = ed.Trainer.log_metrics
+
+
+def create_trainer(tmp_path, metrics_lag_steps=0, **kwargs):
+	config = ed.LlamaConfig(
+		vocab_size=128,
+		hidden_size=32,
+		intermediate_size=64,
+		num_hidden_layers=1,
+		num_attention_heads=4,
+		num_key_value_heads=2,
+		max_position_embeddings=32,
+	)
+	model = ed.LlamaForCausalLM(
+		config=config,
+		dtype=jnp.float32,
+		param_dtype=jnp.float32,
+		rngs=flax.nnx.Rngs(0),
+	).shard_model()
+	rng = np.random.RandomState(0)
+	dataset = [
+		{
+			"input_ids": rng.randint(0, 128, 16).tolist(),
+			"attention_mask": [1] * 16,
+			"labels": rng.randint(0, 128, 16).tolist(),
+		}
+		for _ in range(32)
+	]
+	arguments = ed.TrainingArguments(
+		save_directory=str(tmp_path),
+		num_train_epochs=1,
+		total_batch_size=4,
+		max_sequence_length=16,
+		log_steps=1,
+		use_wandb=False,
+		report_metrics=False,
+		do_last_save=False,
+		shuffle_train_dataset=False,
+		progress_bar_type="json",
+		metrics_lag_steps=metrics_lag_steps,
+		**kwargs,
+	)
+	return ed.Trainer(arguments=arguments, model=model, dataset_train=dataset)
+
+
+def train_and_log(tmp_path, monkeypatch, metrics_lag_steps):
+	logged = []
+
+	def record(self, metrics, pbar, step, mode="train"):
+		logged.append((step, metrics["train/loss"]))
+		return LOG_METRICS(self, metrics, pbar, step, mode)
+
+	monkeypatch.setattr(ed.Trainer, "log_metrics", record)
+	create_trainer(tmp_path, metrics_lag_steps).train()
+	return logged
+
+
+def test_lagged_metrics_match_blocking_loop(tmp_path, monkeypatch):
+	blocking = train_and_log(tmp_path / "blocking", monkeypatch, 0)
+	lagged = train_and_log(tmp_path / "lagged", monkeypatch, 3)
+	assert [step for step, _ in blocking] == list(range(1, 9))
+	assert [step for step, _ in lagged] == [step for step, _ in blocking]
+	np.testing.assert_allclose(
+		[loss for _, loss in lagged], [loss for _, loss in blocking], rtol=1e-6
+	)
+
+
+def test_compile_aot_does_not_consume_a_batch(tmp_path):
+	trainer = create_trainer(tmp_path)
+	assert trainer.compile_aot()
+	assert trainer.dataloader_train.state_dict()["position"] == 0
+	_, metrics = trainer.sharded_training_step_function(
+		trainer.model_state,
+		next(iter(trainer.dataloader_train)),
+	)
+	assert np.isfinite(float(metrics.loss))
+
+
+def test_group_by_length_on_a_list_dataset(tmp_path):
+	trainer = create_trainer(tmp_path, group_by_length=True)
+	assert trainer._train_dataset_lengths(trainer.dataset_train) == [16] * 32
+	assert trainer.dataloader_train.loader.lengths is not None
+
+
+def test_negative_lag_is_rejected():
+	with pytest.raises(ValueError, match="metrics_lag_steps"):
+		ed.TrainingArguments(metrics_lag_steps=-1, use_wandb=False)
@@ -595,10 +595,17 @@ class StepMetrics:
 		seq_length: int,
 		learning_rate: float,
 		mode: tp.Optional[tp.Literal["eval", "train"]] = None,
+		step_time: tp.Optional[float] = None,
 		**extras,
 	) -> tp.Dict[str, float]:
-		"""Calculate comprehensive metrics for the training step."""
-		step_time = time.time() - self.step_start_time
+		"""
+		Calculate comprehensive metrics for the training step.
+
+		`step_time` defaults to the time since `start_step`; steps whose metrics are
+		resolved later than they ran pass their measured duration instead.
+		"""
+		if step_time is None:
+			step_time = time.time() - self.step_start_time
 		total_time = time.time() - self.start_time
 
 		visited_tokens = seq_length * (current_step) * batch_size
@@ -66,12 +66,15 @@ AVAILABLE_BACKENDS: tp.List[str] = ["cpu", "gpu", "tpu", None]
 
 @dataclass
 class TrainingArguments:
+	async_checkpointing: bool = True
 	auto_shard_states: bool = True
 	aux_loss_enabled: bool = False
 	backend: tp.Optional[str] = None
 	clip_grad: tp.Optional[float] = None
 	dataloader_num_workers: tp.Optional[int] = 0
 	dataloader_pin_memory: tp.Optional[bool] = False
+	dataloader_prefetch_size: int = 2
+	dataloader_seed: int = 0
 	do_eval: bool = False
 	do_last_save: bool = True
 	do_train: bool = True
@@ -80,11 +83,13 @@ class TrainingArguments:
 	extra_optimizer_kwargs: dict = field(default_factory=dict)
 	frozen_parameters: tp.Optional[str] = None
 	gradient_accumulation_steps: int = 1
+	group_by_length: bool = False
 	ids_to_pop_from_dataset: tp.Optional[list] = field(default_factory=list)
 	is_fine_tuning: bool = True
 	jax_distributed_config: tp.Optional[dict] = None
 	learning_rate: float = 5e-5
 	learning_rate_end: tp.Optional[float] = None
+	length_column_name: str = "length"
 	log_all_workers: bool = False
 	log_grad_norms: bool = True
 	report_metrics: bool = True
@@ -96,6 +101,7 @@ class TrainingArguments:
 	max_training_steps: tp.Optional[int] = None
 	model_name: str = "EasyDeL-Model"
 	model_parameters: tp.Optional[dict] = None
+	metrics_lag_steps: int = 0
 	metrics_to_show_in_rich_pbar: tp.Optional[list] = None
 	num_train_epochs: int = 10
 	offload_device_type: str = "cpu"
@@ -170,6 +176,8 @@ class TrainingArguments:
 			raise ValueError(
 				f"Backend {self.backend} is not recognized. Available backends: {AVAILABLE_BACKENDS}"
 			)
+		if self.metrics_lag_steps < 0:
+			raise ValueError("`metrics_lag_steps` can't be negative.")
 
 	def _setup_distributed(self):
 		"""
@@ -27,6 +27,8 @@ from ml_collections.config_dict import placeholder
 
 from easydel.utils.helpers import get_logger
 
+from .packer import pack_examples
+
 logger = get_logger(__name__)
 
 
@@ -94,10 +96,18 @@ def create_constant_length_dataset(
 	shuffle: bool = True,
 	append_concat_token: bool = True,
 	add_special_tokens: bool = True,
+	packing_strategy: tp.Literal["concatenate", "best_fit"] = "concatenate",
 ) -> tp.Callable[[], tp.Iterator[tp.Dict[str, jnp.ndarray]]]:
 	"""
 	Creates a generator function that yields constant length chunks of tokens from a stream of text files.
 
+	With `packing_strategy="concatenate"` the buffered samples are concatenated and cut
+	into `seq_length` chunks, which splits documents across rows and lets them attend to
+	each other. With `"best_fit"` every buffer is packed whole with the best-fit decreasing
+	`plan_packing` instead: documents are never split (longer ones are truncated), and
+	rows carry `position_ids`, `segment_ids` and `labels` so packed documents stay apart.
+	The token utilization achieved is logged once the dataset is exhausted.
+
 	Args:
 	    processing_class: The processor used for processing the data.
 	    dataset: Dataset with text files.
@@ -111,6 +121,7 @@ def create_constant_length_dataset(
 	    shuffle: Shuffle the examples before they are returned.
 	    append_concat_token: If true, appends eos_token_id at the end of each sample being packed.
 	    add_special_tokens: If true, processing_class adds special tokens to each sample being packed.
+	    packing_strategy: How the tokens of a buffer are laid out into rows, "concatenate" or "best_fit".
 
 	Returns:
 	    A generator function that yields dictionaries containing input_ids and attention_mask as jnp.arrays
@@ -149,10 +160,30 @@ def create_constant_length_dataset(
 		raise ValueError(
 			"Either `dataset_text_field` or `formatting_func` should be provided."
 		)
+	if packing_strategy not in ("concatenate", "best_fit"):
+		raise ValueError(f"unknown packing strategy {packing_strategy!r}.")
+
+	def best_fit_examples(tokenized_inputs, attention_masks):
+		packed = pack_examples(
+			{"input_ids": tokenized_inputs, "attention_mask": attention_masks},
+			max_length=seq_length,
+			pad_token_id=(
+				processing_class.pad_token_id
+				if getattr(processing_class, "pad_token_id", None) is not None
+				else concat_token_id
+			),
+			reset_position_ids=True,
+			packing_strategy="best_fit",
+		)
+		rows = list(zip(*packed.values()))
+		if shuffle:
+			random.shuffle(rows)
+		return [dict(zip(packed.keys(), row)) for row in rows]
 
 	def constant_length_generator() -> tp.Iterator[tp.Dict[str, jnp.ndarray]]:
 		iterator = iter(dataset)
 		more_examples = True
+		num_rows, num_tokens = 0, 0
 
 		while more_examples:
 			buffer, buffer_len = [], 0
@@ -189,6 +220,15 @@ def create_constant_length_dataset(
 			)
 			tokenized_inputs = tokens["input_ids"]
 			attention_masks = tokens["attention_mask"]
+			if packing_strategy == "best_fit":
+				if append_concat_token:
+					tokenized_inputs = [ids + [concat_token_id] for ids in tokenized_inputs]
+					attention_masks = [mask + [1] for mask in attention_masks]
+				for row in best_fit_examples(tokenized_inputs, attention_masks):
+					num_rows += 1
+					num_tokens += sum(segment > 0 for segment in row["segment_ids"])
+					yield {key: jnp.asarray(value, dtype="i4") for key, value in row.items()}
+				continue
 			# Concatenate all tokens and attention masks
 			all_token_ids = []
 			all_attention_masks = []
@@ -222,6 +262,12 @@ def create_constant_length_dataset(
 					"attention_mask": jnp.asarray(example_attention_mask, dtype="i4"),
 				}
 
+		if num_rows:
+			logger.info(
+				f"packed {num_rows} rows with a token utilization of "
+				f"{num_tokens / (num_rows * seq_length):.2%}"
+			)
+
 	return constant_length_generator
 
 
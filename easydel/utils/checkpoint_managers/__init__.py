@@ -12,6 +12,9 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from easydel.utils.checkpoint_managers.streamer import CheckpointManager
+from easydel.utils.checkpoint_managers.streamer import (
+	CheckpointManager,
+	CheckpointWriteFuture,
+)
 
-__all__ = ("CheckpointManager",)
+__all__ = ("CheckpointManager", "CheckpointWriteFuture")
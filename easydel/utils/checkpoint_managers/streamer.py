@@ -12,18 +12,22 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import json
 import os
 import typing as tp
-from functools import partial
+from concurrent.futures import Future, ThreadPoolExecutor
 
 import jax
 import jax.experimental
 import jax.experimental.multihost_utils
 import jax.numpy as jnp
 import msgpack
+import numpy as np
 import safetensors
+import safetensors.numpy
 from flax.serialization import to_bytes, to_state_dict
 from flax.struct import PyTreeNode
+from jax.sharding import NamedSharding
 from tqdm import tqdm
 
 from easydel.utils.helpers import get_logger
@@ -32,6 +36,18 @@ from ..traversals import flatten_dict, is_flatten, unflatten_dict
 
 logger = get_logger(__name__)
 
+SHARDED_INDEX_SUFFIX = ".index.json"
+SHARDED_FORMAT_VERSION = 1
+
+# threads reading and placing tensors concurrently while loading a checkpoint.
+DEFAULT_LOADING_WORKERS = min(16, os.cpu_count() or 1)
+
+# a single writer keeps background checkpoint writes ordered.
+_CHECKPOINT_WRITER = ThreadPoolExecutor(
+	max_workers=1,
+	thread_name_prefix="easydel-checkpoint-writer",
+)
+
 ALLOWED_DATA_TYPES = [
 	jnp.int4,
 	jnp.int8,
@@ -132,6 +148,247 @@ def _read_process_array(
 	return key, tensor, mismatch
 
 
+class CheckpointWriteFuture:
+	"""Handle of checkpoint files being written in the background."""
+
+	def __init__(self, futures: tp.Sequence[Future] = ()):
+		self._futures = list(futures)
+
+	def __add__(self, other: "CheckpointWriteFuture") -> "CheckpointWriteFuture":
+		return CheckpointWriteFuture(self._futures + other._futures)
+
+	def done(self) -> bool:
+		"""Whether every file has been written."""
+		return all(future.done() for future in self._futures)
+
+	def wait(self):
+		"""Blocks until every file is written, re-raising write errors."""
+		for future in self._futures:
+			future.result()
+
+
+def _sharded_process_file(prefix: str, process_index: int) -> str:
+	return f"{prefix}.process-{process_index:05d}.safetensors"
+
+
+def _snapshot_shards(
+	value: tp.Any,
+	process_index: int,
+) -> tp.Tuple[tp.Tuple[int, ...], tp.Any, tp.List[tp.Tuple[tp.List, tp.Any]]]:
+	"""
+	Returns the global shape, dtype and the `(bounds, data)` shards of `value` this
+	process has to write: one copy of every addressable shard with `replica_id == 0`
+	(so replicated data is written once across processes), or the whole value on
+	process 0 for host values.
+	"""
+	if isinstance(value, jax.Array):
+		shards = []
+		for shard in value.addressable_shards:
+			if shard.replica_id == 0:
+				bounds = [
+					list(index.indices(dim)[:2]) for index, dim in zip(shard.index, value.shape)
+				]
+				shards.append((bounds, shard.data))
+		return value.shape, value.dtype, shards
+	value = np.asarray(value)
+	shards = [([[0, dim] for dim in value.shape], value)] if process_index == 0 else []
+	return value.shape, value.dtype, shards
+
+
+class _ShardedCheckpointReader:
+	"""Reads arbitrary regions of the tensors of a sharded checkpoint."""
+
+	def __init__(self, directory: tp.Union[str, os.PathLike], prefix: str):
+		index_path = os.path.join(directory, prefix + SHARDED_INDEX_SUFFIX)
+		with open(index_path, "r", encoding="utf-8") as stream:
+			index = json.load(stream)
+		self.tensors = index["tensors"]
+		self.metadata = index.get("metadata", {})
+		self.files = []
+		self.shards = {key: [] for key in self.tensors}
+		for process_index in range(index["process_count"]):
+			path = os.path.join(directory, _sharded_process_file(prefix, process_index))
+			if not os.path.exists(path):
+				raise FileNotFoundError(
+					f"Checkpoint {index_path} is incomplete, missing {path}."
+				)
+			file = safetensors.safe_open(path, framework="numpy")
+			self.files.append(file)
+			for name, (key, bounds) in json.loads(file.metadata()["shards"]).items():
+				self.shards[key].append((file, name, bounds))
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc):
+		for file in self.files:
+			file.__exit__(*exc)
+		self.files = []
+
+	def keys(self) -> tp.List[str]:
+		return list(self.tensors.keys())
+
+	def shape(self, key: str) -> tp.Tuple[int, ...]:
+		return tuple(self.tensors[key]["shape"])
+
+	def dtype(self, key: str) -> jnp.dtype:
+		return jnp.dtype(self.tensors[key]["dtype"])
+
+	def read(
+		self, key: str, index: tp.Optional[tp.Tuple[slice, ...]] = None
+	) -> np.ndarray:
+		"""Assembles `tensor[index]` from the stored shards overlapping it."""
+		shape = self.shape(key)
+		if index is None:
+			index = tuple(slice(None) for _ in shape)
+		region = [slice(*item.indices(dim)[:2]) for item, dim in zip(index, shape)]
+		output = np.empty([item.stop - item.start for item in region], self.dtype(key))
+		for file, name, bounds in self.shards[key]:
+			overlap = [
+				(max(start, item.start), min(stop, item.stop))
+				for (start, stop), item in zip(bounds, region)
+			]
+			if any(low >= high for low, high in overlap):
+				continue
+			if not shape:
+				return file.get_tensor(name).reshape(())
+			source = tuple(
+				slice(low - start, high - start)
+				for (low, high), (start, _) in zip(overlap, bounds)
+			)
+			target = tuple(
+				slice(low - item.start, high - item.start)
+				for (low, high), item in zip(overlap, region)
+			)
+			output[target] = file.get_slice(name)[source]
+		return output
+
+	def get_tensor(self, key: str) -> jax.Array:
+		return jnp.asarray(self.read(key))
+
+
+class _SafetensorsReader:
+	"""
+	Memory-mapped reader over a safetensors file, or over all the files listed in a
+	safetensors index (`{"metadata": ..., "weight_map": {key: file}}`).
+	"""
+
+	def __init__(self, path: tp.Union[str, os.PathLike]):
+		path = str(path)
+		if path.endswith(SHARDED_INDEX_SUFFIX):
+			with open(path, "r", encoding="utf-8") as stream:
+				index = json.load(stream)
+			directory = os.path.dirname(path)
+			paths = [
+				os.path.join(directory, name)
+				for name in dict.fromkeys(index["weight_map"].values())
+			]
+			self.metadata = index.get("metadata", {})
+		else:
+			paths, self.metadata = [path], None
+		self.files, self.file_of = [], {}
+		for shard_path in paths:
+			file = safetensors.safe_open(shard_path, framework="numpy")
+			self.files.append(file)
+			for key in file.keys():
+				self.file_of[key] = file
+		if self.metadata is None:
+			self.metadata = self.files[0].metadata()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc):
+		for file in self.files:
+			file.__exit__(*exc)
+		self.files, self.file_of = [], {}
+
+	def keys(self) -> tp.List[str]:
+		return list(self.file_of.keys())
+
+	def shape(self, key: str) -> tp.Tuple[int, ...]:
+		return tuple(self.file_of[key].get_slice(key).get_shape())
+
+	def read(
+		self, key: str, index: tp.Optional[tp.Tuple[slice, ...]] = None
+	) -> np.ndarray:
+		"""Reads `tensor[index]`, copying only that region out of the mapped file."""
+		if index is None or not self.shape(key):
+			return self.file_of[key].get_tensor(key)
+		return self.file_of[key].get_slice(key)[index]
+
+	def get_tensor(self, key: str) -> jax.Array:
+		return jnp.asarray(self.read(key))
+
+
+def _load_tensors(
+	reader: tp.Union[_SafetensorsReader, _ShardedCheckpointReader],
+	shardings: tp.Optional[tp.Dict[str, jax.sharding.Sharding]],
+	shard_fns: tp.Optional[dict[tp.Callable]],
+	mismatch_allowed: bool,
+	callback: tp.Optional[tp.Callable[[jax.Array, str], jax.Array]],
+	dtype: tp.Optional[tp.Union[str, jnp.dtype]],
+	verbose: bool,
+	num_workers: int,
+) -> tp.Tuple[tp.Dict[str, jax.Array], int]:
+	"""
+	Loads every tensor of `reader` on a pool of `num_workers` threads.
+
+	Keys with a target in `shardings` are built with `jax.make_array_from_callback`: each
+	process reads only the regions held by its devices, casts them on host and puts them
+	straight on their device, so the full tensor is never materialized. The other keys
+	are read whole and passed through `shard_fns` and `callback`.
+	"""
+	shardings = shardings or {}
+	if shard_fns and not is_flatten(shard_fns):
+		shard_fns = flatten_dict(shard_fns, sep=".")
+
+	def load(key):
+		sharding = shardings.get(key)
+		if sharding is None:
+			return _read_process_array(
+				key,
+				shard_fns=shard_fns,
+				mismatch_allowed=mismatch_allowed,
+				manager=reader,
+				callback=callback,
+				dtype=dtype,
+			)
+		# replicated shardings ask for the same region once per device.
+		regions = {}
+
+		def read_region(index):
+			region = tuple((item.start, item.stop, item.step) for item in index)
+			if region not in regions:
+				regions[region] = put_dtype(reader.read(key, index), dtype)
+			return regions[region]
+
+		return (
+			key,
+			jax.make_array_from_callback(reader.shape(key), sharding, read_region),
+			0,
+		)
+
+	keys = reader.keys()
+	with ThreadPoolExecutor(
+		max_workers=max(num_workers, 1),
+		thread_name_prefix="easydel-checkpoint-reader",
+	) as executor:
+		results = list(
+			tqdm(
+				executor.map(load, keys),
+				desc="Loading",
+				total=len(keys),
+				disable=not verbose,
+			)
+		)
+	state = {key: tensor for key, tensor, _ in results}
+	mismatch_count = sum(mismatch for _, _, mismatch in results)
+	if verbose and mismatch_count:
+		logger.info(f"Sharding mismatch: {mismatch_count}")
+	return state, mismatch_count
+
+
 class CheckpointManager:
 	"""
 	A class to manage saving and loading checkpoints.
@@ -166,50 +423,42 @@ class CheckpointManager:
 		mismatch_allowed: bool = True,
 		callback: tp.Optional[tp.Callable[[jax.Array, str], jax.Array]] = None,
 		dtype: tp.Optional[tp.Union[str, jnp.dtype]] = None,
+		shardings: tp.Optional[tp.Dict[str, jax.sharding.Sharding]] = None,
+		num_workers: int = DEFAULT_LOADING_WORKERS,
 	) -> tp.Tuple[tp.Union[PyTreeNode, dict], dict]:
 		"""
 		Load a checkpoint from the given path.
 
+		The files are memory-mapped and tensors are loaded concurrently. Tensors with a
+		target in `shardings` are read slice by slice straight into that sharding (each
+		process only reads what its devices hold); the others are read whole and passed
+		through `shard_fns`.
+
 		Args:
-			path: The path to the checkpoint file.
-			target: The target PyTree to load the checkpoint into.
+			path: The path to a safetensors file, or to a safetensors index
+			    (`*.index.json`) listing the files of a multi-file checkpoint.
 			shard_fns: A dictionary of functions to shard the state after loading.
 			verbose: Whether to print verbose output.
 			mismatch_allowed: Whether to allow mismatches between the state dictionary and shard functions.
-			callback: Optional callback applied to each loaded tensor
+			callback: Optional callback applied to each tensor read whole.
+			dtype: Optional dtype floating-point tensors are cast to.
+			shardings: Flat (`.`-joined keys) mapping from keys to their target shardings.
+			num_workers: Number of threads loading tensors.
 		Returns:
 			A tuple containing the loaded state dictionary and metadata.
 		"""
-		with safetensors.safe_open(path, framework="flax") as f:
-			metadata = f.metadata()
-			keys = list(f.keys())
-
-			if shard_fns and not is_flatten(shard_fns):
-				shard_fns = flatten_dict(shard_fns, sep=".")
-
-			process_func = partial(
-				_read_process_array,
+		with _SafetensorsReader(path) as reader:
+			state, _ = _load_tensors(
+				reader,
+				shardings=shardings,
 				shard_fns=shard_fns,
 				mismatch_allowed=mismatch_allowed,
-				manager=f,
 				callback=callback,
 				dtype=dtype,
+				verbose=verbose,
+				num_workers=num_workers,
 			)
-			results = [
-				process_func(key)
-				for key in tqdm(
-					keys,
-					desc="Loading",
-					total=len(keys),
-					disable=not verbose,
-				)
-			]
-
-		state = {key: tensor for key, tensor, _ in results}
-		mismatch_count = sum(mismatch for _, _, mismatch in results)
-
-		if verbose and mismatch_count:
-			logger.info(f"Sharding mismatch: {mismatch_count}")
+			metadata = reader.metadata
 
 		state = unflatten_dict(state, sep=".")
 		return state, metadata
@@ -288,6 +537,151 @@ class CheckpointManager:
 		safetensors.flax.save_file(tensors=state, filename=path, metadata=metadata)
 		return path
 
+	@staticmethod
+	def save_sharded_checkpoint(
+		state: tp.Dict[str, tp.Any],
+		directory: tp.Union[str, os.PathLike],
+		prefix: str,
+		float_dtype: tp.Optional[jnp.dtype] = None,
+		metadata: tp.Optional[dict[str, tp.Any]] = None,
+		async_save: bool = False,
+	) -> CheckpointWriteFuture:
+		"""
+		Saves a flat state in the sharded format, without gathering anything.
+
+		Every process writes only the shards it holds to
+		`<prefix>.process-<index>.safetensors`, and process 0 writes
+		`<prefix>.index.json` with the global shapes, dtypes and partition specs. The
+		device-to-host copy happens before returning (the arrays may be donated right
+		after); with `async_save` the files are written by a background thread.
+
+		Args:
+			state: Flat mapping from string keys to arrays (`None` values are skipped).
+			directory: The directory to save the checkpoint to.
+			prefix: Name prefix of the checkpoint files.
+			float_dtype: Optional dtype floating-point arrays are cast to on the host.
+			metadata: JSON-serializable metadata stored in the index.
+			async_save: Whether to write the files in the background.
+
+		Returns:
+			CheckpointWriteFuture: Handle to wait for the write.
+		"""
+		process_index = jax.process_index()
+		state = {key: value for key, value in state.items() if value is not None}
+		snapshots = {
+			key: _snapshot_shards(value, process_index) for key, value in state.items()
+		}
+		for _, _, shards in snapshots.values():
+			for _, data in shards:
+				if isinstance(data, jax.Array):
+					data.copy_to_host_async()
+		host_shards = {
+			key: [(bounds, np.asarray(data)) for bounds, data in shards]
+			for key, (_, _, shards) in snapshots.items()
+		}
+		index = {
+			"format_version": SHARDED_FORMAT_VERSION,
+			"process_count": jax.process_count(),
+			"metadata": metadata or {},
+			"tensors": {
+				key: {
+					"shape": list(shape),
+					"dtype": jnp.dtype(put_dtype(np.zeros((), dtype), float_dtype).dtype).name,
+					"partition_spec": (
+						[
+							list(axes) if isinstance(axes, tuple) else axes
+							for axes in state[key].sharding.spec
+						]
+						if isinstance(getattr(state[key], "sharding", None), NamedSharding)
+						else None
+					),
+				}
+				for key, (shape, dtype, _) in snapshots.items()
+			},
+		}
+
+		def write():
+			os.makedirs(directory, exist_ok=True)
+			tensors, shards_metadata = {}, {}
+			for key, shards in host_shards.items():
+				for bounds, data in shards:
+					name = str(len(tensors))
+					tensors[name] = np.ascontiguousarray(put_dtype(data, float_dtype))
+					shards_metadata[name] = (key, bounds)
+			path = os.path.join(directory, _sharded_process_file(prefix, process_index))
+			safetensors.numpy.save_file(
+				tensors,
+				path + ".tmp",
+				metadata={"shards": json.dumps(shards_metadata)},
+			)
+			os.replace(path + ".tmp", path)
+			if process_index == 0:
+				index_path = os.path.join(directory, prefix + SHARDED_INDEX_SUFFIX)
+				with open(index_path + ".tmp", "w", encoding="utf-8") as stream:
+					json.dump(index, stream)
+				os.replace(index_path + ".tmp", index_path)
+			return directory
+
+		if async_save:
+			return CheckpointWriteFuture([_CHECKPOINT_WRITER.submit(write)])
+		future = Future()
+		future.set_result(write())
+		return CheckpointWriteFuture([future])
+
+	@staticmethod
+	def is_sharded_checkpoint(directory: tp.Union[str, os.PathLike], prefix: str) -> bool:
+		"""Whether `directory` holds a sharded checkpoint named `prefix`."""
+		return os.path.exists(os.path.join(directory, prefix + SHARDED_INDEX_SUFFIX))
+
+	@staticmethod
+	def load_sharded_checkpoint(
+		directory: tp.Union[str, os.PathLike],
+		prefix: str,
+		shardings: tp.Optional[tp.Dict[str, jax.sharding.Sharding]] = None,
+		shard_fns: tp.Optional[dict[tp.Callable]] = None,
+		mismatch_allowed: bool = True,
+		callback: tp.Optional[tp.Callable[[jax.Array, str], jax.Array]] = None,
+		dtype: tp.Optional[tp.Union[str, jnp.dtype]] = None,
+		verbose: bool = False,
+		num_workers: int = DEFAULT_LOADING_WORKERS,
+	) -> tp.Tuple[tp.Dict[str, jax.Array], dict]:
+		"""
+		Loads a checkpoint saved with `save_sharded_checkpoint`, written by any number of
+		processes with any sharding.
+
+		Keys with a target in `shardings` are built with `jax.make_array_from_callback`,
+		so each process reads (memory-mapped) only the regions its devices hold. The
+		other keys are read whole and passed through `shard_fns`, as `load_checkpoint`
+		does.
+
+		Args:
+			directory: The directory holding the checkpoint.
+			prefix: Name prefix of the checkpoint files.
+			shardings: Flat mapping from keys to their target shardings.
+			shard_fns: Flat mapping from keys to sharding functions for the other keys.
+			mismatch_allowed: Whether to allow keys without a shard function.
+			callback: Optional callback applied to each tensor read whole.
+			dtype: Optional dtype floating-point arrays are cast to.
+			verbose: Whether to print verbose output.
+			num_workers: Number of threads loading tensors.
+
+		Returns:
+			A tuple of the flat state and the metadata stored in the index.
+		"""
+		with _ShardedCheckpointReader(directory, prefix) as reader:
+			state, _ = _load_tensors(
+				reader,
+				shardings=shardings,
+				shard_fns=shard_fns,
+				mismatch_allowed=mismatch_allowed,
+				callback=callback,
+				dtype=dtype,
+				verbose=verbose,
+				num_workers=num_workers,
+			)
+			metadata = reader.metadata
+		return state, metadata
+
 	@staticmethod
 	def save_state_to_file(
 		state: PyTreeNode,
@@ -0,0 +1,115 @@
+# Copyright 2023 The EASYDEL Author @erfanzar (Erfan Zare Chavoshi).
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import os
+
+import jax
+import numpy as np
+import safetensors.numpy
+from flax import nnx as nn
+from jax import numpy as jnp
+from jax.sharding import Mesh, NamedSharding, PartitionSpec
+
+import easydel as ed
+from easydel.infra.mixins.bridge import FLAX_WEIGHTS_INDEX_NAME, FLAX_WEIGHTS_NAME
+from easydel.utils.traversals import flatten_dict
+
+from .streamer import CheckpointManager
+
+
+def write_index(directory, tensors, num_files=2, metadata=None):
+	"""Splits `tensors` over `num_files` safetensors files and writes their index."""
+	keys = sorted(tensors)
+	weight_map = {}
+	for file_idx in range(num_files):
+		name = f"model-{file_idx + 1:05d}-of-{num_files:05d}.safetensors"
+		shard = {key: tensors[key] for key in keys[file_idx::num_files]}
+		safetensors.numpy.save_file(shard, os.path.join(directory, name))
+		weight_map.update({key: name for key in shard})
+	path = os.path.join(directory, FLAX_WEIGHTS_INDEX_NAME)
+	with open(path, "w") as stream:
+		json.dump({"metadata": metadata or {}, "weight_map": weight_map}, stream)
+	return path
+
+
+def test_load_multi_file_checkpoint(tmp_path):
+	rng = np.random.RandomState(0)
+	tensors = {
+		"model.embed.embedding": rng.randn(16, 8).astype(np.float32),
+		"model.norm.scale": rng.randn(8).astype(np.float32),
+		"model.step": np.array(3, np.int32),
+	}
+	path = write_index(tmp_path, tensors, metadata={"format": "test"})
+	mesh = Mesh(np.array(jax.devices()[:1]).reshape(1, 1), ("fsdp", "tp"))
+	sharding = NamedSharding(mesh, PartitionSpec("fsdp", "tp"))
+
+	state, metadata = CheckpointManager.load_checkpoint(
+		path,
+		shardings={"model.embed.embedding": sharding},
+		dtype=jnp.bfloat16,
+		num_workers=4,
+	)
+	assert metadata == {"format": "test"}
+	state = flatten_dict(state, sep=".")
+	assert set(state) == set(tensors)
+	embedding = state["model.embed.embedding"]
+	assert embedding.sharding == sharding
+	assert embedding.dtype == jnp.bfloat16
+	np.testing.assert_allclose(
+		np.asarray(embedding, np.float32),
+		tensors["model.embed.embedding"],
+		rtol=1e-2,
+	)
+	assert state["model.norm.scale"].dtype == jnp.bfloat16
+	# non-float tensors keep their dtype.
+	assert state["model.step"].dtype == jnp.int32
+	assert int(state["model.step"]) == 3
+
+
+def test_from_pretrained_multi_file_checkpoint(tmp_path):
+	config = ed.LlamaConfig(
+		vocab_size=128,
+		hidden_size=32,
+		intermediate_size=64,
+		num_hidden_layers=2,
+		num_attention_heads=4,
+		num_key_value_heads=2,
+		max_position_embeddings=64,
+		attn_mechanism=ed.AttentionMechanisms.VANILLA,
+	)
+	model = ed.LlamaForCausalLM(
+		config=config,
+		dtype=jnp.float32,
+		param_dtype=jnp.float32,
+		rngs=nn.Rngs(0),
+	)
+	model.save_pretrained(str(tmp_path))
+	single_file = os.path.join(tmp_path, FLAX_WEIGHTS_NAME)
+	write_index(tmp_path, safetensors.numpy.load_file(single_file), num_files=3)
+	os.remove(single_file)
+
+	loaded = ed.LlamaForCausalLM.from_pretrained(
+		str(tmp_path),
+		dtype=jnp.float32,
+		param_dtype=jnp.float32,
+		auto_shard_model=True,
+	)
+	params = flatten_dict(nn.state(loaded, nn.Param).to_pure_dict())
+	expected = flatten_dict(nn.state(model, nn.Param).to_pure_dict())
+	assert set(params) == set(expected)
+	for key, value in expected.items():
+		if value is not None:
+			assert isinstance(params[key].sharding, NamedSharding)
+			np.testing.assert_array_equal(params[key], value)
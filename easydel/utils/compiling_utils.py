@@ -116,7 +116,10 @@ def get_signature(args, kwargs) -> tp.Tuple:
 
 
 def get_hash_of_lowering(lowered_func: Lowered):
-	text_representation = lowered_func.as_text()
+	# pytree structures without leaves (e.g. `None` fields) do not show in the HLO.
+	text_representation = (
+		lowered_func.as_text() + str(lowered_func.in_tree) + str(lowered_func.out_tree)
+	)
 	hash_object = hashlib.sha256(text_representation.encode("utf-8"))
 	hash_digest = hash_object.hexdigest()
 	return hash_digest
@@ -12,16 +12,20 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import collections
 import contextlib
 import gc
+import json
 import os
 import typing as tp
 import warnings
+from concurrent.futures import ThreadPoolExecutor
 
 import jax
 import jax.extend
 import numpy as np
-import torch
+import safetensors
+import safetensors.numpy
 from jax import dlpack
 from jax import numpy as jnp
 from tqdm.autonotebook import tqdm
@@ -134,11 +138,12 @@ def match_keywords(string, ts, ns):
 	return True
 
 
-def process_tensor(
+def convert_key_and_layout(
 	key: str, tensor: tp.Any, config: tp.Dict[str, tp.Any]
-) -> tp.Optional[tp.Tuple[tuple, jnp.ndarray]]:
+) -> tp.Optional[tp.Tuple[tuple, tp.Any]]:
 	"""
-	Process a single tensor and return its processed key and value.
+	Renames a HuggingFace parameter to its EasyDeL key and transposes its kernel into the
+	EasyDeL layout. `tensor` may be a torch tensor or a numpy array.
 
 	Args:
 	    key: The parameter key
@@ -146,12 +151,12 @@ def process_tensor(
 	    config: Dictionary containing processing configuration
 
 	Returns:
-	    tp.Tuple of processed key tuple and JAX array, or None if tensor should be skipped
+	    tp.Tuple of processed key tuple and tensor, or None if tensor should be skipped
 	"""
 	new_key = key
 	# Handle embedding layers
 	if any(layer_name in key for layer_name in config["embedding_layer_names"]):
-		new_key = f"{key[:-len('.weight')]}.embedding"
+		new_key = f"{key[: -len('.weight')]}.embedding"
 
 	# Handle layer normalization
 
@@ -164,21 +169,26 @@ def process_tensor(
 		match ndim:
 			case 2:
 				# linear layers
-				tensor = tensor.permute(1, 0)
+				axes = (1, 0)
 			case 3:
 				# 1d conv layers
-				tensor = tensor.permute(2, 1, 0)
+				axes = (2, 1, 0)
 			case 4:
 				# 2d conv layers
-				tensor = tensor.permute(2, 3, 1, 0)
+				axes = (2, 3, 1, 0)
 			case 5:
 				# 3d conv layers
-				tensor = tensor.permute(2, 3, 4, 1, 0)
+				axes = (2, 3, 4, 1, 0)
 			case 6:
 				# 4d conv layers
-				tensor = tensor.permute(4, 5, 3, 2, 1, 0)
+				axes = (4, 5, 3, 2, 1, 0)
 			case _:
-				...
+				axes = None
+		if axes is not None:
+			if isinstance(tensor, np.ndarray):
+				tensor = np.transpose(tensor, axes)
+			else:
+				tensor = tensor.permute(*axes)
 		new_key = key.replace(".weight", ".kernel")
 
 	# Convert key string to tuple
@@ -189,6 +199,28 @@ def process_tensor(
 		if key_tuple[0] == config["lm_head_name"]:
 			return None
 
+	return key_tuple, tensor
+
+
+def process_tensor(
+	key: str, tensor: tp.Any, config: tp.Dict[str, tp.Any]
+) -> tp.Optional[tp.Tuple[tuple, jnp.ndarray]]:
+	"""
+	Process a single tensor and return its processed key and value.
+
+	Args:
+	    key: The parameter key
+	    tensor: The tensor to process
+	    config: Dictionary containing processing configuration
+
+	Returns:
+	    tp.Tuple of processed key tuple and JAX array, or None if tensor should be skipped
+	"""
+	result = convert_key_and_layout(key, tensor, config)
+	if result is None:
+		return None
+	key_tuple, tensor = result
+
 	# Convert tensor to JAX array
 	array = convert_pytorch_tensor_to_jax(tensor, config["dtype"])
 
@@ -277,11 +309,217 @@ def torch_dict_to_easydel_params(
 		return unflatten_dict(flax_dict)
 
 
+def safetensors_checkpoint_files(path: tp.Union[str, os.PathLike]) -> tp.List[str]:
+	"""
+	Safetensors files of a checkpoint given as a file, an index (`*.index.json` with a
+	`weight_map`) or a directory holding `model.safetensors[.index.json]`.
+	"""
+	path = str(path)
+	if os.path.isdir(path):
+		for name in ("model.safetensors.index.json", "model.safetensors"):
+			if os.path.isfile(os.path.join(path, name)):
+				return safetensors_checkpoint_files(os.path.join(path, name))
+		raise FileNotFoundError(f"No safetensors checkpoint found in {path}.")
+	if path.endswith(".index.json"):
+		with open(path, "r", encoding="utf-8") as stream:
+			weight_map = json.load(stream)["weight_map"]
+		directory = os.path.dirname(path)
+		return [
+			os.path.join(directory, name) for name in dict.fromkeys(weight_map.values())
+		]
+	return [path]
+
+
+def iter_safetensors_easydel_params(
+	files: tp.Union[str, os.PathLike, tp.Sequence[tp.Union[str, os.PathLike]]],
+	*,
+	embedding_layer_names: tp.Optional[tp.List[str]] = None,
+	layernorm_names: tp.Optional[tp.List[str]] = None,
+	dtype: tp.Optional[jnp.dtype] = jnp.float16,
+	lm_head_name: tp.Optional[str] = None,
+	uses_tie_word_embedding: bool = False,
+	num_workers: int = 8,
+	max_in_flight: int = 16,
+	verbose: bool = True,
+) -> tp.Iterator[tp.Tuple[tuple, np.ndarray]]:
+	"""
+	Streams the parameters of a HuggingFace safetensors checkpoint converted to the
+	EasyDeL layout, without importing torch.
+
+	Tensors are read from the memory-mapped files with numpy, renamed, transposed and cast
+	to `dtype` on a pool of `num_workers` threads. At most `max_in_flight` converted
+	tensors are held at once: a tensor is only read once the consumer is that close to it,
+	so the host memory used is bounded by the largest tensors, not by the model size.
+
+	Args:
+	    files: Safetensors files, or anything accepted by `safetensors_checkpoint_files`.
+	    embedding_layer_names: Names of embedding layers
+	    layernorm_names: Names of layer normalization layers
+	    dtype: Target dtype of floating-point parameters (`None` keeps the stored one).
+	    lm_head_name: Name of language model head
+	    uses_tie_word_embedding: Whether model uses tied embeddings
+	    num_workers: Number of conversion threads.
+	    max_in_flight: Maximum number of tensors being converted or waiting to be consumed.
+	    verbose: Whether to show progress bar
+
+	Yields:
+	    tp.Tuple of the EasyDeL key tuple and the converted numpy array.
+	"""
+	if isinstance(files, (str, os.PathLike)):
+		files = safetensors_checkpoint_files(files)
+	config = {
+		"embedding_layer_names": set(embedding_layer_names or []),
+		"layernorm_names": set(layernorm_names or []),
+		"lm_head_name": lm_head_name,
+		"uses_tie_word_embedding": uses_tie_word_embedding,
+	}
+	with contextlib.ExitStack() as stack:
+		handles = [
+			stack.enter_context(safetensors.safe_open(str(file), framework="numpy"))
+			for file in files
+		]
+		entries = [(handle, key) for handle in handles for key in handle.keys()]
+
+		def convert(entry):
+			handle, key = entry
+			result = convert_key_and_layout(key, handle.get_tensor(key), config)
+			if result is None:
+				return None
+			key_tuple, tensor = result
+			# a contiguous copy releases the mapped pages of the source tensor.
+			return key_tuple, np.ascontiguousarray(float_tensor_to_dtype(tensor, dtype))
+
+		executor = stack.enter_context(
+			ThreadPoolExecutor(
+				max_workers=max(num_workers, 1),
+				thread_name_prefix="easydel-hf-converter",
+			)
+		)
+		pending = collections.deque()
+		entries_iter = iter(entries)
+		for entry in entries_iter:
+			pending.append(executor.submit(convert, entry))
+			if len(pending) >= max(max_in_flight, 1):
+				break
+		with tqdm(total=len(entries), disable=not verbose, desc="Converting Model") as pbar:
+			while pending:
+				result = pending.popleft().result()
+				for entry in entries_iter:
+					pending.append(executor.submit(convert, entry))
+					break
+				pbar.update(1)
+				if result is not None:
+					yield result
+
+
+def safetensors_to_easydel_params(
+	files: tp.Union[str, os.PathLike, tp.Sequence[tp.Union[str, os.PathLike]]],
+	*,
+	device: tp.Optional[jax.Device] = None,
+	shardings: tp.Optional[tp.Mapping[str, jax.sharding.Sharding]] = None,
+	shard_fns: tp.Optional[tp.Mapping[tuple, tp.Callable]] = None,
+	required_keys: tp.Optional[tp.Collection[tuple]] = None,
+	**kwargs,
+) -> tp.Dict[str, tp.Any]:
+	"""
+	Converts a HuggingFace safetensors checkpoint to EasyDeL parameters on device, without
+	importing torch or materializing the whole checkpoint on host.
+
+	Each converted tensor (see `iter_safetensors_easydel_params`) is put in its sharding
+	from `shardings` (`.`-joined keys), passed through its function in `shard_fns`, or
+	put on `device`, as soon as it is ready.
+
+	Args:
+	    files: Safetensors files, an index or a checkpoint directory.
+	    device: JAX device to use for parameters without sharding.
+	    shardings: Flat mapping from `.`-joined keys to target shardings.
+	    shard_fns: tp.Mapping of parameter key tuples to sharding functions
+	    required_keys: Key tuples of the target model; other tensors are dropped.
+	    **kwargs: Arguments of `iter_safetensors_easydel_params`.
+
+	Returns:
+	    Dictionary of converted parameters in EasyDel format
+	"""
+	shardings = shardings or {}
+	params = {}
+	for key_tuple, array in iter_safetensors_easydel_params(files, **kwargs):
+		if required_keys is not None and key_tuple not in required_keys:
+			logger.debug(f"skipping unexpected parameter {key_tuple}")
+			continue
+		sharding = shardings.get(".".join(map(str, key_tuple)))
+		if sharding is not None:
+			array = jax.device_put(array, sharding)
+		elif shard_fns and key_tuple in shard_fns:
+			array = shard_fns[key_tuple](jnp.asarray(array))
+		else:
+			array = jax.device_put(array, device)
+		params[key_tuple] = array
+	return unflatten_dict(params)
+
+
+def convert_safetensors_checkpoint(
+	files: tp.Union[str, os.PathLike, tp.Sequence[tp.Union[str, os.PathLike]]],
+	save_directory: tp.Union[str, os.PathLike],
+	max_shard_size: int = 2 * 1024**3,
+	**kwargs,
+) -> str:
+	"""
+	Converts a HuggingFace safetensors checkpoint to an EasyDeL checkpoint on disk without
+	loading it on device or importing torch. The output is split into files of about
+	`max_shard_size` bytes, listed in `easydel-model.parameters.index.json`, so at most one
+	output file is held in host memory.
+
+	Args:
+	    files: Safetensors files, an index or a checkpoint directory.
+	    save_directory: Directory the converted files are written to.
+	    max_shard_size: Maximum size in bytes of an output file.
+	    **kwargs: Arguments of `iter_safetensors_easydel_params`.
+
+	Returns:
+	    The path of the written index.
+	"""
+	from easydel.infra.mixins.bridge import FLAX_WEIGHTS_INDEX_NAME, FLAX_WEIGHTS_NAME
+
+	os.makedirs(save_directory, exist_ok=True)
+	stem = FLAX_WEIGHTS_NAME.replace(".parameters", "")
+	weight_map, shard, shard_bytes, names = {}, {}, 0, []
+
+	def flush():
+		nonlocal shard, shard_bytes
+		if not shard:
+			return
+		name = f"{stem}-{len(names) + 1:05d}.safetensors"
+		safetensors.numpy.save_file(shard, os.path.join(save_directory, name))
+		weight_map.update({key: name for key in shard})
+		names.append(name)
+		shard, shard_bytes = {}, 0
+
+	total_size = 0
+	for key_tuple, array in iter_safetensors_easydel_params(files, **kwargs):
+		if shard and shard_bytes + array.nbytes > max_shard_size:
+			flush()
+		shard[".".join(map(str, key_tuple))] = array
+		shard_bytes += array.nbytes
+		total_size += array.nbytes
+	flush()
+
+	index_path = os.path.join(save_directory, FLAX_WEIGHTS_INDEX_NAME)
+	with open(index_path, "w", encoding="utf-8") as stream:
+		json.dump(
+			{"metadata": {"total_size": total_size}, "weight_map": weight_map},
+			stream,
+			indent=2,
+		)
+	return index_path
+
+
 def module_to_torch(module: EasyDeLBaseModule, dtype: jnp.dtype = jnp.float16):
 	if dtype is None:
 		dtype = module.param_dtype
 
-	graphtree = unflatten_dict(module.parameters)
+	from easydel.layers.scan import unstack_layer_params
+
+	graphtree = unflatten_dict(unstack_layer_params(module.parameters))
 	model_parameters = flatten_dict(graphtree, sep=".")
 	torch_state_dict = {}
 	pbar = tqdm(
@@ -359,6 +597,8 @@ def module_to_huggingface_model(
 
 
 def jax2pt(x: jax.Array):
+	import torch
+
 	if os.environ.get("EASY_SAFE_TRANSFER", "true") in ["true", "yes", "1", "on"]:
 		x = jax.device_get(x)
 		return torch.from_numpy(np.array(x.tolist(), dtype=x.dtype))
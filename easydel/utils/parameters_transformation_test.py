@@ -0,0 +1,126 @@
+# Copyright 2023 The EASYDEL Author @erfanzar (Erfan Zare Chavoshi).
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import shutil
+
+import numpy as np
+import pytest
+from flax import nnx as nn
+from jax import numpy as jnp
+
+import easydel as ed
+from easydel.utils.traversals import flatten_dict
+
+from .parameters_transformation import (
+	convert_safetensors_checkpoint,
+	safetensors_checkpoint_files,
+)
+
+torch = pytest.importorskip("torch")
+transformers = pytest.importorskip("transformers")
+
+
+@pytest.fixture(scope="module")
+def hf_checkpoint(tmp_path_factory):
+	config = transformers.LlamaConfig(
+		vocab_size=128,
+		hidden_size=32,
+		intermediate_size=64,
+		num_hidden_layers=2,
+		num_attention_heads=4,
+		num_key_value_heads=2,
+		max_position_embeddings=64,
+	)
+	torch.manual_seed(0)
+	model = transformers.LlamaForCausalLM(config)
+	directory = str(tmp_path_factory.mktemp("hf"))
+	model.save_pretrained(directory, safe_serialization=True, max_shard_size="20KB")
+	return directory, model.state_dict()
+
+
+def params_of(model):
+	return {
+		key: value
+		for key, value in flatten_dict(nn.state(model, nn.Param).to_pure_dict()).items()
+		if value is not None
+	}
+
+
+def assert_matches_torch_conversion(params, state_dict, model):
+	expected = flatten_dict(
+		model.pure_transform_fn(state_dict, dtype=jnp.float32, verbose=False)
+	)
+	assert set(params) == set(expected)
+	for key, value in expected.items():
+		np.testing.assert_array_equal(params[key], value)
+
+
+def test_from_torch_pretrained_streams_safetensors(hf_checkpoint):
+	directory, state_dict = hf_checkpoint
+	assert len(safetensors_checkpoint_files(directory)) > 1
+	model = ed.AutoEasyDeLModelForCausalLM.from_pretrained(
+		directory,
+		dtype=jnp.float32,
+		param_dtype=jnp.float32,
+		auto_shard_model=True,
+		from_torch=True,
+		attn_mechanism=ed.AttentionMechanisms.VANILLA,
+	)
+	assert_matches_torch_conversion(params_of(model), state_dict, model)
+
+
+def test_convert_safetensors_checkpoint(hf_checkpoint, tmp_path):
+	directory, state_dict = hf_checkpoint
+	reference = ed.AutoEasyDeLModelForCausalLM.from_pretrained(
+		directory,
+		dtype=jnp.float32,
+		param_dtype=jnp.float32,
+		from_torch=True,
+	)
+	reference.config.save_pretrained(str(tmp_path))
+	convert_safetensors_checkpoint(
+		directory,
+		tmp_path,
+		max_shard_size=16 * 1024,
+		embedding_layer_names=["embed_tokens"],
+		dtype=jnp.float32,
+		verbose=False,
+	)
+	assert (
+		len([name for name in os.listdir(tmp_path) if name.endswith(".safetensors")]) > 1
+	)
+
+	model = ed.LlamaForCausalLM.from_pretrained(
+		str(tmp_path),
+		dtype=jnp.float32,
+		param_dtype=jnp.float32,
+	)
+	assert_matches_torch_conversion(params_of(model), state_dict, model)
+
+
+def test_from_torch_pretrained_reads_configs_from_the_same_subfolder(
+	hf_checkpoint, tmp_path
+):
+	directory, state_dict = hf_checkpoint
+	shutil.copytree(directory, tmp_path / "checkpoint")
+	model = ed.AutoEasyDeLModelForCausalLM.from_pretrained(
+		str(tmp_path),
+		dtype=jnp.float32,
+		param_dtype=jnp.float32,
+		from_torch=True,
+		subfolder="checkpoint",
+	)
+	assert model.config.vocab_size == 128
+	assert_matches_torch_conversion(params_of(model), state_dict, model)